@@ -0,0 +1,112 @@
+"""
+Async Database Read Path Benchmark
+Location: main-brain/benchmarks/bench_async_db.py
+
+Drives the API in process (httpx ASGI transport, no sockets) with N
+concurrent clients and compares the two read paths of the history and
+safety-analysis endpoints:
+
+- threads: run_blocking on db_pool (POOL_DB_WORKERS threads, psycopg2)
+- async:   async_db.py (asyncpg pool awaited on the event loop)
+
+For each concurrency level it prints requests/s, p50 / p99 latency and how
+many requests were rejected with 503 (db_pool queue full or admission
+control shedding). Users and recipes are taken from the database the
+SUPABASE_* settings point at; it needs recipe_events rows.
+
+Usage:
+    cd main-brain && python benchmarks/bench_async_db.py [--concurrency 16 64 256] [--requests 2000]
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from typing import List, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import httpx  # noqa: E402
+
+import async_db  # noqa: E402
+from db import connection  # noqa: E402
+from recommendation_api import app  # noqa: E402
+
+
+def sample_targets(count: int) -> Tuple[List[str], List[str]]:
+    """(user ids with history, recipe ids)"""
+    with connection() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT DISTINCT user_id FROM recipe_events LIMIT %s", (count,))
+        users = [str(row[0]) for row in cur.fetchall()]
+        cur.execute("SELECT id FROM recipes ORDER BY random() LIMIT %s", (count,))
+        recipes = [str(row[0]) for row in cur.fetchall()]
+        cur.close()
+    return users, recipes
+
+
+async def run(paths: List[str], concurrency: int, total: int) -> Tuple[float, List[float], int]:
+    """(seconds, latencies of 200 responses, 503 count)"""
+    latencies: List[float] = []
+    rejected = 0
+    next_request = 0
+
+    async def client(http: httpx.AsyncClient):
+        nonlocal next_request, rejected
+        while next_request < total:
+            path = paths[next_request % len(paths)]
+            next_request += 1
+            start = time.perf_counter()
+            response = await http.get(path)
+            if response.status_code == 503:
+                rejected += 1
+            elif response.status_code == 200:
+                latencies.append(time.perf_counter() - start)
+            else:
+                raise RuntimeError(f"{path}: {response.status_code} {response.text[:200]}")
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://bench') as http:
+        start = time.perf_counter()
+        await asyncio.gather(*(client(http) for _ in range(concurrency)))
+        return time.perf_counter() - start, latencies, rejected
+
+
+async def main_async(args):
+    users, recipes = sample_targets(200)
+    if not users or not recipes:
+        sys.exit("Needs recipes and recipe_events rows")
+    endpoints = {
+        'history': [f"/api/recommendations/{u}/history?limit=20" for u in users],
+        'safety-analysis': [f"/api/recipe/{r}/safety-analysis?user_id={users[i % len(users)]}"
+                            for i, r in enumerate(recipes)]
+    }
+
+    print(f"{'endpoint':<16} {'path':<8} {'clients':>7} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'503s':>6}")
+    for name, paths in endpoints.items():
+        for concurrency in args.concurrency:
+            for mode in ('threads', 'async'):
+                if mode == 'async':
+                    await async_db.start()
+                    if not async_db.enabled():
+                        continue
+                seconds, latencies, rejected = await run(paths, concurrency, args.requests)
+                await async_db.close()
+                latencies.sort()
+                p50 = statistics.median(latencies) * 1000 if latencies else 0.0
+                p99 = latencies[int(len(latencies) * 0.99) - 1] * 1000 if latencies else 0.0
+                print(f"{name:<16} {mode:<8} {concurrency:>7} {len(latencies) / seconds:>8.0f} "
+                      f"{p50:>8.1f} {p99:>8.1f} {rejected:>6}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[16, 64, 256])
+    parser.add_argument('--requests', type=int, default=2000)
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""
+Nutrition Goals Batch Benchmark
+Location: main-brain/benchmarks/bench_nutrition_goals.py
+
+Checks that the vectorized batch path (agents/nutrition_goals/batch_goals.py)
+returns exactly the same goals as the scalar NutritionGoalsAgent for randomized
+profiles, including unknown and mixed-case categories and edge-case
+weights. It then times both paths.
+
+Usage:
+    cd main-brain && python benchmarks/bench_nutrition_goals.py [--profiles 20000]
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from agents.nutrition_goals import nutrition_goals_agent, calculate_nutrition_goals_batch  # noqa: E402
+
+
+SEXES = ['male', 'female', 'M', 'm', 'F', 'other', 'Male']
+ACTIVITIES = ['sedentary', 'light', 'moderate', 'active', 'very_active', 'Active', 'unknown']
+GOALS = ['weight_loss', 'aggressive_loss', 'maintain', 'lean_gain', 'muscle_gain',
+         'general_health', 'Weight_Loss', 'MUSCLE_GAIN', 'something_else']
+DIETS = ['balanced', 'keto', 'low-carb', 'high-protein', 'vegan', 'vegetarian', 'KETO', 'Low-Carb']
+
+
+def random_profile(rng: random.Random) -> dict:
+    return {
+        'age': rng.randint(14, 95),
+        'sex': rng.choice(SEXES),
+        'weight_kg': rng.choice([rng.uniform(35, 180), round(rng.uniform(35, 180), 1), 70]),
+        'height_cm': rng.choice([rng.uniform(140, 210), round(rng.uniform(140, 210)), 165.5]),
+        'activity_level': rng.choice(ACTIVITIES),
+        'health_goal': rng.choice(GOALS),
+        'diet_style': rng.choice(DIETS)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Vectorized vs scalar nutrition goals')
+    parser.add_argument('--profiles', type=int, default=20000)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    profiles = [random_profile(rng) for _ in range(args.profiles)]
+
+    # The scalar path prints per call; keep the output readable
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        scalar = [nutrition_goals_agent.calculate_from_dict(p) for p in profiles]
+    scalar_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batch = calculate_nutrition_goals_batch(profiles)
+    batch_s = time.perf_counter() - start
+
+    mismatches = [(p, s, b) for p, s, b in zip(profiles, scalar, batch) if s != b]
+    if mismatches:
+        profile, expected, got = mismatches[0]
+        print(f"❌ {len(mismatches)} of {len(profiles)} profiles differ, e.g.\n"
+              f"  profile:  {profile}\n  scalar:   {expected}\n  batch:    {got}")
+        sys.exit(1)
+
+    print(f"✅ {len(profiles)} profiles identical")
+    print(f"  scalar: {scalar_s * 1000:9.1f} ms  ({scalar_s / len(profiles) * 1e6:.1f} us/profile)")
+    print(f"  batch:  {batch_s * 1000:9.1f} ms  ({batch_s / len(profiles) * 1e6:.1f} us/profile)"
+          f"  {scalar_s / batch_s:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
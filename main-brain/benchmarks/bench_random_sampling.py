@@ -0,0 +1,190 @@
+"""
+Random Candidate Sampling Benchmark
+Location: main-brain/benchmarks/bench_random_sampling.py
+
+Builds synthetic catalogs (recipes, 8 ingredients each, nutrients) of
+10k / 100k / 1M recipes in scratch schemas, then times the candidate query
+used by the agents:
+
+- legacy:     GROUP BY over the whole catalog, ORDER BY RANDOM() LIMIT 20
+- random_key: indexed range seek from a random pivot (recipe_sampling.py),
+              then aggregate only the sampled recipes
+- fallback:   ORDER BY random() over ids only (used before the migration)
+
+It also reports sample diversity: mean overlap between consecutive samples
+and the share of distinct recipes seen across all runs.
+
+Needs a database the SUPABASE_* settings point at, with rights to create
+schemas. Schemas are dropped afterwards unless --keep is given.
+
+Usage:
+    cd main-brain && python benchmarks/bench_random_sampling.py [--sizes 10000 100000 1000000]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+from typing import Callable, List, Set
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import db  # noqa: E402
+import recipe_sampling  # noqa: E402
+from db import connection  # noqa: E402
+
+RANDOM_KEY = ('recipes', 'random_key')
+
+
+SELECT_COLUMNS = """
+    r.id, r.title, r.category, r.area as cuisine,
+    r.instructions, r.image_url, r.servings,
+    COALESCE(rn.per_serving->>'kcal', '300') as calories,
+    COALESCE(rn.per_serving->>'protein_g', '15') as protein,
+    COALESCE(rn.per_serving->>'sodium_mg', '400') as sodium,
+    COALESCE(rn.per_serving->>'sugar_g', '5') as sugar,
+    json_agg(
+        json_build_object(
+            'name', ri.ingredient_name,
+            'amount', ri.measure_text
+        ) ORDER BY ri.position
+    ) as ingredients
+"""
+
+GROUP_BY = """
+    GROUP BY r.id, r.title, r.category, r.area,
+             r.instructions, r.image_url, r.servings, rn.per_serving
+"""
+
+LEGACY_QUERY = f"""
+    SELECT {SELECT_COLUMNS}
+    FROM recipes r
+    LEFT JOIN recipe_nutrients rn ON r.id = rn.recipe_id
+    LEFT JOIN recipe_ingredients ri ON r.id = ri.recipe_id
+    WHERE r.instructions IS NOT NULL
+    {GROUP_BY}
+    ORDER BY RANDOM()
+    LIMIT 20
+"""
+
+SAMPLED_QUERY = """
+    WITH sampled AS ({sample})
+    SELECT {columns}
+    FROM sampled s
+    JOIN recipes r ON r.id = s.id
+    LEFT JOIN recipe_nutrients rn ON r.id = rn.recipe_id
+    LEFT JOIN recipe_ingredients ri ON r.id = ri.recipe_id
+    {group_by}
+"""
+
+SCHEMA_DDL = """
+    CREATE SCHEMA {schema};
+    SET LOCAL search_path TO {schema}, public;
+    CREATE TABLE recipes (
+        id uuid PRIMARY KEY DEFAULT gen_random_uuid(),
+        title text, category text, area text, instructions text,
+        image_url text, servings int
+    );
+    CREATE TABLE recipe_nutrients (recipe_id uuid PRIMARY KEY, per_serving jsonb);
+    CREATE TABLE recipe_ingredients (
+        id bigserial PRIMARY KEY, recipe_id uuid, position int,
+        ingredient_name text, measure_text text
+    );
+    INSERT INTO recipes (title, category, area, instructions, image_url, servings)
+    SELECT 'Recipe ' || g,
+           (ARRAY['Beef','Chicken','Vegan','Dessert','Seafood','Pasta'])[1 + g % 6],
+           (ARRAY['Italian','Thai','Mexican','Indian','French'])[1 + g % 5],
+           CASE WHEN g % 20 = 0 THEN NULL ELSE 'Chop, season and cook until done. Serve warm.' END,
+           'https://example.com/' || g || '.jpg', 1 + g % 4
+    FROM generate_series(1, {size}) g;
+    INSERT INTO recipe_nutrients (recipe_id, per_serving)
+    SELECT id, jsonb_build_object('kcal', 300 + (random() * 500)::int, 'protein_g', (random() * 40)::int,
+                                  'sodium_mg', (random() * 1200)::int, 'sugar_g', (random() * 30)::int)
+    FROM recipes;
+    INSERT INTO recipe_ingredients (recipe_id, position, ingredient_name, measure_text)
+    SELECT r.id, p, 'ingredient ' || ((hashtext(r.id::text)::bigint + 2147483648 + p * 7919) % 2000), '100 g'
+    FROM recipes r, generate_series(1, 8) p;
+    CREATE INDEX ON recipe_ingredients (recipe_id);
+"""
+
+# migrations/002_recipes_random_key.sql, applied to the scratch schema
+MIGRATION = """
+    SET LOCAL search_path TO {schema}, public;
+    ALTER TABLE recipes ADD COLUMN IF NOT EXISTS random_key double precision NOT NULL DEFAULT random();
+    CREATE INDEX IF NOT EXISTS idx_recipes_random_key ON recipes (random_key) WHERE instructions IS NOT NULL;
+    ANALYZE recipes; ANALYZE recipe_nutrients; ANALYZE recipe_ingredients;
+"""
+
+
+def run_in_schema(schema: str, sql: str):
+    with connection(statement_timeout=3600) as conn:
+        cur = conn.cursor()
+        cur.execute(sql.format(schema=schema))
+        cur.close()
+
+
+def sample_once(schema: str, build_query: Callable) -> List[str]:
+    with connection(statement_timeout=600) as conn:
+        cur = conn.cursor()
+        cur.execute(f"SET LOCAL search_path TO {schema}, public")
+        cur.execute(build_query(cur))
+        ids = [row[0] for row in cur.fetchall()]
+        cur.close()
+    return ids
+
+
+def sampled_query(cur) -> str:
+    return SAMPLED_QUERY.format(
+        sample=recipe_sampling.sample_ids_sql(cur, 20), columns=SELECT_COLUMNS, group_by=GROUP_BY
+    )
+
+
+def measure(label: str, schema: str, build_query: Callable, runs: int):
+    timings: List[float] = []
+    samples: List[Set[str]] = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        ids = sample_once(schema, build_query)
+        timings.append((time.perf_counter() - start) * 1000)
+        samples.append(set(ids))
+
+    timings.sort()
+    p95 = timings[min(int(len(timings) * 0.95), len(timings) - 1)]
+    overlaps = [len(a & b) for a, b in zip(samples, samples[1:])]
+    seen = set().union(*samples)
+    drawn = sum(len(s) for s in samples)
+    print(f"  {label:<11} p50 {statistics.median(timings):9.2f} ms   p95 {p95:9.2f} ms   "
+          f"rows {len(samples[-1]):3d}   overlap {statistics.mean(overlaps) if overlaps else 0:4.2f}   "
+          f"distinct {len(seen) / max(drawn, 1):6.1%}   (runs {runs})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='ORDER BY RANDOM() vs indexed random-key sampling')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--runs', type=int, default=50)
+    parser.add_argument('--legacy-runs', type=int, default=10,
+                        help='runs for the full-aggregate query (slow on large catalogs)')
+    parser.add_argument('--keep', action='store_true', help='keep the scratch schemas')
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        schema = f"bench_sampling_{size}"
+        print(f"\n{size:,} recipes  (schema {schema})")
+        start = time.perf_counter()
+        run_in_schema(schema, f"DROP SCHEMA IF EXISTS {schema} CASCADE;" + SCHEMA_DDL.replace('{size}', str(size)))
+        run_in_schema(schema, MIGRATION)
+        print(f"  built in {time.perf_counter() - start:.1f}s")
+        try:
+            measure('legacy', schema, lambda cur: LEGACY_QUERY, args.legacy_runs)
+            db._columns.pop(RANDOM_KEY, None)      # re-detect the column in this schema
+            measure('random_key', schema, sampled_query, args.runs)
+            db._columns[RANDOM_KEY] = False        # pre-migration path
+            measure('fallback', schema, sampled_query, args.runs)
+        finally:
+            if not args.keep:
+                run_in_schema(schema, f"DROP SCHEMA {schema} CASCADE")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,225 @@
+"""
+Recipe Search Benchmark
+Location: main-brain/benchmarks/bench_recipe_search.py
+
+Builds synthetic catalogs (titles like "Spicy Chicken Curry", 8 ingredients
+per recipe from a ~100-name vocabulary, nutrients, allergen masks computed
+with allergens.py) of 100k / 1M recipes in scratch schemas, applies
+migrations/005_recipe_search.sql to each and times search_recipes() over a
+query mix, pages 1-3, with and without allergies:
+
+- broad:   one common word ("chicken", "garlic"), matching 5-35% of recipes
+- narrow:  several words or a phrase ("beef stew", "\"sweet potato\"")
+- negated: "pasta -mushroom"
+- typo:    "chiken curry" (fuzzy title fallback, needs pg_trgm)
+
+Each mix runs with SEARCH_MAX_MATCHES at its default and uncapped (0), to
+show what the cap buys on broad queries.
+
+Needs a database the SUPABASE_* settings point at, with rights to create
+schemas. The trigram index (and the typo queries) are skipped when pg_trgm
+is not available. Schemas are dropped afterwards unless --keep is given.
+
+Usage:
+    cd main-brain && python benchmarks/bench_recipe_search.py [--sizes 100000 1000000]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+from typing import Dict, List
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import db  # noqa: E402
+import recipe_search  # noqa: E402
+from allergens import recipe_allergen_mask  # noqa: E402
+from db import connection  # noqa: E402
+from recipe_search import search_recipes  # noqa: E402
+
+MIGRATION_FILE = os.path.join(os.path.dirname(__file__), '..', 'migrations', '005_recipe_search.sql')
+
+ADJECTIVES = ['Spicy', 'Creamy', 'Roasted', 'Grilled', 'Quick', 'Classic', 'Smoky', 'Garlic', 'Lemon',
+              'Honey', 'Crispy', 'Slow Cooked']
+PROTEINS = ['Chicken', 'Beef', 'Salmon', 'Tofu', 'Prawn', 'Lamb', 'Pork', 'Mushroom', 'Chickpea',
+            'Lentil', 'Turkey', 'Cod', 'Duck', 'Halloumi', 'Aubergine']
+DISHES = ['Curry', 'Stew', 'Salad', 'Pasta', 'Tacos', 'Stir Fry', 'Soup', 'Risotto', 'Bowl', 'Pie',
+          'Burger', 'Skewers', 'Traybake', 'Noodles', 'Wraps', 'Casserole', 'Flatbread', 'Bake',
+          'Chili', 'Sandwich']
+INGREDIENTS = [
+    'olive oil', 'garlic', 'onion', 'salt', 'black pepper', 'butter', 'chicken breast', 'chicken thighs',
+    'beef mince', 'salmon fillet', 'tofu', 'prawns', 'lamb shoulder', 'pork belly', 'mushrooms',
+    'chickpeas', 'red lentils', 'turkey mince', 'cod fillet', 'duck breast', 'halloumi', 'aubergine',
+    'tomatoes', 'tinned tomatoes', 'basil', 'parsley', 'coriander', 'cumin', 'paprika', 'turmeric',
+    'ginger', 'chilli flakes', 'soy sauce', 'honey', 'lemon', 'lime', 'rice', 'basmati rice',
+    'spaghetti', 'penne', 'noodles', 'potatoes', 'sweet potato', 'carrots', 'celery', 'spinach', 'kale',
+    'broccoli', 'peas', 'sweetcorn', 'red pepper', 'green pepper', 'courgette', 'cucumber', 'avocado',
+    'feta', 'cheddar', 'parmesan', 'mozzarella', 'cream', 'milk', 'yoghurt', 'eggs', 'flour',
+    'breadcrumbs', 'peanuts', 'cashews', 'almonds', 'sesame seeds', 'sesame oil', 'coconut milk',
+    'fish sauce', 'oyster sauce', 'vegetable stock', 'chicken stock', 'beef stock', 'red wine',
+    'white wine', 'vinegar', 'mustard', 'mayonnaise', 'ketchup', 'sugar', 'brown sugar', 'maple syrup',
+    'oats', 'quinoa', 'couscous', 'bulgur wheat', 'pitta bread', 'tortillas', 'black beans',
+    'kidney beans', 'cannellini beans', 'spring onions', 'leeks', 'shallots', 'thyme', 'rosemary',
+    'oregano', 'bay leaves'
+]
+
+QUERIES = {
+    'broad': ['chicken', 'garlic', 'salmon', 'rice', 'thai'],
+    'narrow': ['chicken curry', 'beef stew', 'salmon noodles', '"sweet potato"', 'spicy tofu stir fry'],
+    'negated': ['pasta -mushroom', 'curry -chicken'],
+    'typo': ['chiken curry', 'salmn salad']
+}
+ALLERGY_SETS = [None, ['peanuts'], ['dairy', 'gluten']]
+PAGES = 3
+
+SCHEMA_DDL = """
+    CREATE SCHEMA {schema};
+    SET LOCAL search_path TO {schema}, public;
+    CREATE TABLE recipes (
+        id uuid PRIMARY KEY DEFAULT gen_random_uuid(),
+        title text, category text, area text, instructions text,
+        image_url text, servings int, allergen_mask bigint
+    );
+    CREATE TABLE recipe_nutrients (recipe_id uuid PRIMARY KEY, per_serving jsonb);
+    CREATE TABLE recipe_ingredients (
+        id bigserial PRIMARY KEY, recipe_id uuid, position int,
+        ingredient_name text, measure_text text
+    );
+    CREATE TEMP TABLE vocab (i int, name text, mask bigint) ON COMMIT DROP;
+    INSERT INTO vocab SELECT v.i - 1, v.name, v.mask FROM unnest(%(names)s::text[], %(masks)s::bigint[])
+        WITH ORDINALITY AS v(name, mask, i);
+    INSERT INTO recipes (title, category, area, instructions, image_url, servings)
+    SELECT (%(adjectives)s::text[])[1 + g %% 12] || ' ' || (%(proteins)s::text[])[1 + (g / 12) %% 15] || ' '
+               || (%(dishes)s::text[])[1 + (g / 180) %% 20],
+           (ARRAY['Beef','Chicken','Vegan','Dessert','Seafood','Pasta','Vegetarian','Side'])[1 + g %% 8],
+           (ARRAY['Italian','Thai','Mexican','Indian','French','Japanese','British','Greek'])[1 + (g / 8) %% 8],
+           CASE WHEN g %% 20 = 0 THEN NULL ELSE 'Chop, season and cook until done. Serve warm.' END,
+           'https://example.com/' || g || '.jpg', 1 + g %% 4
+    FROM generate_series(1, %(size)s) g;
+    INSERT INTO recipe_nutrients (recipe_id, per_serving)
+    SELECT id, jsonb_build_object('kcal', 300 + (random() * 500)::int, 'protein_g', (random() * 40)::int)
+    FROM recipes;
+    INSERT INTO recipe_ingredients (recipe_id, position, ingredient_name, measure_text)
+    SELECT r.id, p, v.name, '100 g'
+    FROM recipes r
+    CROSS JOIN generate_series(1, 8) p
+    JOIN vocab v ON v.i = (hashtext(r.id::text || p)::bigint + 2147483648) %% %(vocab_size)s;
+    CREATE INDEX ON recipe_ingredients (recipe_id);
+    UPDATE recipes r SET allergen_mask = m.mask
+    FROM (
+        SELECT ri.recipe_id, bit_or(v.mask) AS mask
+        FROM recipe_ingredients ri JOIN vocab v ON v.name = ri.ingredient_name
+        GROUP BY ri.recipe_id
+    ) m
+    WHERE m.recipe_id = r.id;
+    ANALYZE recipes; ANALYZE recipe_ingredients;
+"""
+
+
+def run_in_schema(schema: str, sql: str, params: Dict = None):
+    with connection(statement_timeout=3600) as conn:
+        cur = conn.cursor()
+        cur.execute(f"SET LOCAL search_path TO {schema}, public")
+        cur.execute(sql, params)
+        cur.close()
+
+
+def migration_sql(with_trigram: bool) -> str:
+    """migrations/005 for the scratch schema: unqualified names, trigram parts optional"""
+    statements = [s.strip() for s in open(MIGRATION_FILE).read().replace('public.', '').split(';')]
+    keep = []
+    for statement in statements:
+        body = '\n'.join(line for line in statement.splitlines() if not line.startswith('--')).strip()
+        if body and (with_trigram or 'trgm' not in body):
+            keep.append(body)
+    return ';\n'.join(keep)
+
+
+def use_schema(schema: str):
+    """Point the shared pool (used by search_recipes) at a scratch schema"""
+    db.pool.close_all()
+    db.pool.dsn_kwargs = {**db.DB_CONFIG, 'options': f'-c search_path={schema},public'}
+    for cache in (db._columns, db._relations, db._extensions):
+        cache.clear()
+
+
+def run_mix(allergy_sets, queries: Dict[str, List[str]]) -> Dict[str, List[float]]:
+    timings: Dict[str, List[float]] = {kind: [] for kind in queries}
+    for kind, texts in queries.items():
+        for text in texts:
+            for allergies in allergy_sets:
+                cursor = None
+                for _ in range(PAGES):
+                    start = time.perf_counter()
+                    page = search_recipes(text, limit=20, cursor=cursor, allergies=allergies)
+                    timings[kind].append((time.perf_counter() - start) * 1000)
+                    cursor = page['next_cursor']
+                    if not cursor:
+                        break
+    return timings
+
+
+def report(label: str, timings: Dict[str, List[float]]):
+    every = sorted(t for values in timings.values() for t in values)
+    print(f"  {label}")
+    for kind, values in list(timings.items()) + [('all', every)]:
+        if not values:
+            continue
+        values = sorted(values)
+        p95 = values[min(int(len(values) * 0.95), len(values) - 1)]
+        print(f"    {kind:<8} p50 {statistics.median(values):8.2f} ms   p95 {p95:8.2f} ms   "
+              f"max {values[-1]:8.2f} ms   (calls {len(values)})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Full-text recipe search latency')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100000, 1000000])
+    parser.add_argument('--rounds', type=int, default=5, help='measured passes over the query mix')
+    parser.add_argument('--keep', action='store_true', help='keep the scratch schemas')
+    args = parser.parse_args()
+
+    with connection() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+        with_trigram = cur.fetchone() is not None
+        cur.close()
+    queries = {kind: texts for kind, texts in QUERIES.items() if with_trigram or kind != 'typo'}
+    if not with_trigram:
+        print("pg_trgm not available: no trigram index, typo queries skipped")
+
+    default_cap = recipe_search.SEARCH_MAX_MATCHES
+    for size in args.sizes:
+        schema = f"bench_search_{size}"
+        print(f"\n{size:,} recipes  (schema {schema})")
+        start = time.perf_counter()
+        run_in_schema(schema, f"DROP SCHEMA IF EXISTS {schema} CASCADE")
+        run_in_schema(schema, SCHEMA_DDL.format(schema=schema), {
+            'names': INGREDIENTS,
+            'masks': [recipe_allergen_mask([name]) for name in INGREDIENTS],
+            'adjectives': ADJECTIVES, 'proteins': PROTEINS, 'dishes': DISHES,
+            'size': size, 'vocab_size': len(INGREDIENTS)
+        })
+        run_in_schema(schema, migration_sql(with_trigram))
+        print(f"  built in {time.perf_counter() - start:.1f}s")
+        try:
+            use_schema(schema)
+            for label, cap in ((f'SEARCH_MAX_MATCHES={default_cap}', default_cap), ('uncapped', 0)):
+                recipe_search.SEARCH_MAX_MATCHES = cap
+                run_mix(ALLERGY_SETS, queries)  # warm-up
+                timings: Dict[str, List[float]] = {kind: [] for kind in queries}
+                for _ in range(args.rounds):
+                    for kind, values in run_mix(ALLERGY_SETS, queries).items():
+                        timings[kind].extend(values)
+                report(label, timings)
+        finally:
+            recipe_search.SEARCH_MAX_MATCHES = default_cap
+            db.pool.close_all()
+            db.pool.dsn_kwargs = db.DB_CONFIG
+            if not args.keep:
+                run_in_schema(schema, f"DROP SCHEMA {schema} CASCADE")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,248 @@
+"""
+Response Assembly Benchmark
+Location: main-brain/benchmarks/bench_response_assembly.py
+
+Per-response CPU time to turn agent output into JSON bytes for:
+- /api/recommendations with 20 recipes
+- /api/meal-plans/dspy-generate with a 7-day x 5-meal plan
+
+Compared paths:
+- legacy:    nested pydantic constructors, then FastAPI's response_model
+             re-validation and serialization, then json.dumps
+- validated: response_assembly with one TypeAdapter validation + dump_json
+- trusted:   response_assembly with validation skipped (orjson / json)
+
+Usage:
+    cd main-brain && python benchmarks/bench_response_assembly.py [--iterations 500]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import response_assembly  # noqa: E402
+import recommendation_api as api  # noqa: E402
+
+
+# ============================================
+# SYNTHETIC AGENT OUTPUT
+# ============================================
+
+def make_recipe(i: int) -> Dict[str, Any]:
+    return {
+        'id': f'recipe-{i}',
+        'title': f'Roasted Vegetable Bowl {i}',
+        'image_url': f'https://example.com/images/{i}.jpg',
+        'category': 'Vegetarian',
+        'cuisine': 'Mediterranean',
+        'calories': '520', 'protein': '18', 'carbs': '64', 'fat': '21',
+        'fiber': '11', 'sugar': '9', 'sodium': '640',
+        'servings': 2,
+        'instructions': 'Preheat the oven. ' * 20,
+        'structured_instructions': [
+            {'step': s, 'instruction': f'Step {s}: chop, season and roast the vegetables until golden.',
+             'time': '10 mins', 'equipment': ['oven', 'baking tray']}
+            for s in range(1, 9)
+        ],
+        'ingredients': [
+            {'ingredient_id': j, 'name': f'ingredient {j}', 'amount': '200', 'unit': 'g',
+             'category': 'Produce', 'notes': None}
+            for j in range(12)
+        ],
+        'recommendation_reason': 'High in fiber and fits your goals',
+        'tags': ['vegetarian', 'high-fiber', 'meal-prep'],
+        'safety_validated': True, 'safety_score': 95,
+        'safety_warnings': [], 'safety_modifications': ['Swapped feta for tofu'],
+        'adaptation_notes': ['Reduced salt'], 'portion_adapted': True,
+        'cooking_adapted': False, 'ingredients_adapted': True
+    }
+
+
+def make_meal(day: int, slot: str) -> Dict[str, Any]:
+    return {
+        'id': f'meal-{day}-{slot}',
+        'name': f'Lentil Salad ({slot})',
+        'image': None,
+        'cookTime': '25 mins', 'servings': 1, 'difficulty': 'Easy',
+        'tags': ['high-protein', 'vegan'],
+        'description': 'A bright lentil salad with herbs and lemon.',
+        'ingredients': [
+            {'name': f'ingredient {j}', 'amount': '1 cup', 'category': 'Produce'} for j in range(10)
+        ],
+        'instructions': [f'Step {s}: combine and season.' for s in range(1, 7)],
+        'nutrition': {'calories': 450, 'protein': 28, 'carbs': 52, 'fat': 14},
+        'meal_slot': slot,
+        'plan_date': f'2025-01-{day + 1:02d}'
+    }
+
+
+RECOMMENDATION_RESULT = {
+    'recommendations': [make_recipe(i) for i in range(20)],
+    'filters_applied': {'allergies': ['dairy'], 'diet': 'vegetarian'},
+    'messages': ['Found 20 recipes']
+}
+
+MEAL_PLAN_RESULT = {
+    'meals': [make_meal(d, slot) for d in range(7)
+              for slot in ('breakfast', 'snack_am', 'lunch', 'snack_pm', 'dinner')],
+    'summary': 'Created a 7-day meal plan',
+    'stats': {'total_meals': 35, 'avg_calories': 450}
+}
+
+
+# ============================================
+# LEGACY ASSEMBLY (before response_assembly)
+# ============================================
+
+def _fastapi_serialize(model_cls, content) -> bytes:
+    """What FastAPI does with a returned model: re-validate, dump, json.dumps"""
+    validated = response_assembly.adapter(model_cls).validate_python(
+        content.model_dump() if hasattr(content, 'model_dump') else content
+    )
+    data = response_assembly.adapter(model_cls).dump_python(validated, mode='json')
+    return json.dumps(data, ensure_ascii=False, allow_nan=False, separators=(',', ':')).encode('utf-8')
+
+
+def legacy_recommendations(result: Dict[str, Any]) -> bytes:
+    recommendations = []
+    for rec in result['recommendations']:
+        ingredients = [
+            api.RecipeIngredient(
+                ingredient_id=ing.get('ingredient_id'), name=ing.get('name', 'Unknown ingredient'),
+                amount=ing.get('amount'), unit=ing.get('unit'),
+                category=ing.get('category'), notes=ing.get('notes')
+            )
+            for ing in rec.get('ingredients', []) if ing
+        ]
+        steps = [
+            api.InstructionStep(
+                step=s.get('step', 1), instruction=s.get('instruction', ''),
+                time=s.get('time', 'varies'), equipment=s.get('equipment', [])
+            )
+            for s in rec.get('structured_instructions', []) if isinstance(s, dict)
+        ]
+        recommendations.append(api.EnhancedRecipeRecommendation(
+            id=rec['id'], title=rec['title'], image_url=rec.get('image_url'),
+            category=rec.get('category'), cuisine=rec.get('cuisine'),
+            calories=rec.get('calories'), protein=rec.get('protein'), carbs=rec.get('carbs'),
+            fat=rec.get('fat'), fiber=rec.get('fiber'), sugar=rec.get('sugar'),
+            sodium=rec.get('sodium'), servings=rec.get('servings'),
+            instructions=rec.get('instructions'), structured_instructions=steps,
+            ingredients=ingredients,
+            recommendation_reason=rec.get('recommendation_reason', 'Matches your preferences'),
+            tags=rec.get('tags', []) or [],
+            safety_info=api.SafetyInfo(
+                validated=rec.get('safety_validated', False), score=rec.get('safety_score', 100),
+                warnings=rec.get('safety_warnings', []), modifications=rec.get('safety_modifications', [])
+            ),
+            adaptation_info=api.AdaptationInfo(
+                notes=rec.get('adaptation_notes', []), portion_adapted=rec.get('portion_adapted', False),
+                cooking_adapted=rec.get('cooking_adapted', False),
+                ingredients_adapted=rec.get('ingredients_adapted', False)
+            )
+        ))
+    response = api.EnhancedRecommendationResponse(
+        user_id='bench-user', recommendations=recommendations,
+        filters_applied=result.get('filters_applied', {}), messages=result.get('messages', []),
+        generated_at=datetime.now(), total_adapted=0, total_safety_validated=0
+    )
+    return _fastapi_serialize(api.EnhancedRecommendationResponse, response)
+
+
+def legacy_meal_plan(result: Dict[str, Any]) -> bytes:
+    meals = []
+    for meal in result['meals']:
+        nutrition = meal.get('nutrition', {})
+        meals.append(api.DSPyMeal(
+            id=meal.get('id', ''), name=meal.get('name', 'Delicious Meal'), image=meal.get('image'),
+            cookTime=meal.get('cookTime', '30 mins'), servings=meal.get('servings', 1),
+            difficulty=meal.get('difficulty', 'Easy'), rating=4.5, tags=meal.get('tags', []),
+            description=meal.get('description', ''),
+            ingredients=[
+                api.DSPyIngredient(name=i.get('name', ''), amount=i.get('amount', ''),
+                                   category=i.get('category', 'Other'))
+                for i in meal.get('ingredients', []) if isinstance(i, dict)
+            ],
+            instructions=meal.get('instructions', []),
+            nutrition=api.DSPyNutrition(
+                calories=nutrition.get('calories', 400), protein=nutrition.get('protein', 25),
+                carbs=nutrition.get('carbs', 40), fat=nutrition.get('fat', 15)
+            ),
+            meal_slot=meal.get('meal_slot', 'lunch'), plan_date=meal.get('plan_date', '')
+        ))
+    response = api.DSPyMealPlanResponse(meals=meals, summary=result['summary'], stats=result.get('stats'))
+    return _fastapi_serialize(api.DSPyMealPlanResponse, response)
+
+
+# ============================================
+# NEW ASSEMBLY
+# ============================================
+
+def fast_recommendations(result: Dict[str, Any]) -> bytes:
+    recommendations = [api._recommendation_payload(rec) for rec in result['recommendations']]
+    return response_assembly.render(api.EnhancedRecommendationResponse, {
+        'user_id': 'bench-user', 'recommendations': recommendations,
+        'filters_applied': result.get('filters_applied', {}), 'messages': result.get('messages', []),
+        'generated_at': datetime.now(), 'total_adapted': 0, 'total_safety_validated': 0
+    })
+
+
+def fast_meal_plan(result: Dict[str, Any]) -> bytes:
+    return response_assembly.render(api.DSPyMealPlanResponse, api._dspy_meal_plan_payload(result, 7))
+
+
+# ============================================
+# RUNNER
+# ============================================
+
+def cpu_time_per_call(fn: Callable[[], Any], iterations: int) -> float:
+    for _ in range(min(20, iterations)):
+        fn()
+    start = time.process_time()
+    for _ in range(iterations):
+        fn()
+    return (time.process_time() - start) / iterations * 1000
+
+
+def run_case(label: str, legacy: Callable, fast: Callable, result: Dict[str, Any], iterations: int):
+    # Same document either way (generated_at aside)
+    def strip(body: bytes) -> Any:
+        data = json.loads(body)
+        data.pop('generated_at', None)
+        return data
+    assert strip(legacy(result)) == strip(fast(result)), f"{label}: outputs differ"
+
+    timings: List = [('legacy', cpu_time_per_call(lambda: legacy(result), iterations))]
+    response_assembly.TRUSTED = False
+    timings.append(('validated', cpu_time_per_call(lambda: fast(result), iterations)))
+    response_assembly.TRUSTED = True
+    timings.append(('trusted', cpu_time_per_call(lambda: fast(result), iterations)))
+    response_assembly.TRUSTED = False
+
+    baseline = timings[0][1]
+    print(f"\n{label}  ({len(legacy(result)) / 1024:.1f} KiB)")
+    for name, ms in timings:
+        print(f"  {name:<10} {ms:8.3f} ms/response   {baseline / ms:5.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--iterations', type=int, default=500)
+    args = parser.parse_args()
+
+    encoder = 'orjson' if response_assembly.orjson is not None else 'json (orjson not installed)'
+    print(f"JSON encoder for trusted path: {encoder}")
+    run_case('recommendations, 20 recipes', legacy_recommendations, fast_recommendations,
+             RECOMMENDATION_RESULT, args.iterations)
+    run_case('meal plan, 7 days x 5 meals', legacy_meal_plan, fast_meal_plan,
+             MEAL_PLAN_RESULT, args.iterations)
+
+
+if __name__ == '__main__':
+    main()
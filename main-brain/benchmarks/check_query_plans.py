@@ -0,0 +1,268 @@
+"""
+Hot Query Plan Check
+Location: main-brain/benchmarks/check_query_plans.py
+
+Creates the brain's tables in a scratch schema with only the constraints
+they have without main-brain/migrations (primary keys, the upsert keys),
+migrates them with src/schema_migrations.py, loads a large synthetic
+dataset (as a fresh install would after migrating), then EXPLAIN ANALYZEs
+every hot read the agents and API run, built by the same modules that run
+them:
+
+- user_profiles.USER_PROFILE_QUERY (profile cache misses)
+- recipe_history.HISTORY_QUERY, first page and a filtered later page of a
+  user with 100k events
+- recipe cards by id, from the view and from the live query
+- candidate samples (recipe_sampling.py) joined to the cards, with and
+  without allergen / ingredient-term exclusions
+
+Exits 1 if any plan contains a sequential scan or a HOT_PATH_INDEXES entry
+is missing. --schema checks an existing schema (e.g. public, after
+`python src/schema_migrations.py migrate`) instead of building one; its
+tables may be too small for the planner to pick an index at all, so there
+the plans are made with enable_seqscan off, and a sequential scan means no
+index can answer the query.
+
+Needs a database the SUPABASE_* settings point at, with rights to create
+schemas. The scratch schema is dropped afterwards unless --keep is given.
+
+Usage:
+    cd main-brain && python benchmarks/check_query_plans.py [--recipes 200000 --events 2000000]
+    cd main-brain && python benchmarks/check_query_plans.py --schema public
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Any, Dict, List, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import schema_migrations  # noqa: E402
+from allergens import allergy_exclusions, recipe_allergen_mask  # noqa: E402
+from recipe_cards import CARD_COLUMNS, SAMPLED_CARDS_QUERY, cards_source  # noqa: E402
+from recipe_history import HISTORY_QUERY  # noqa: E402
+from recipe_sampling import allergen_exclusion_sql, sample_ids_sql  # noqa: E402
+from user_profiles import USER_PROFILE_QUERY  # noqa: E402
+
+SCHEMA = 'plan_check'
+
+INGREDIENTS = [
+    'olive oil', 'garlic', 'onion', 'salt', 'black pepper', 'butter', 'chicken breast', 'beef mince',
+    'salmon fillet', 'tofu', 'prawns', 'mushrooms', 'chickpeas', 'tomatoes', 'basil', 'coriander',
+    'cumin', 'ginger', 'soy sauce', 'honey', 'lemon', 'rice', 'spaghetti', 'potatoes', 'carrots',
+    'spinach', 'peas', 'red pepper', 'feta', 'cheddar', 'parmesan', 'cream', 'milk', 'yoghurt', 'eggs',
+    'flour', 'peanuts', 'cashews', 'almonds', 'sesame oil', 'coconut milk', 'fish sauce',
+    'vegetable stock', 'white wine', 'mustard', 'sugar', 'oats', 'quinoa', 'black beans', 'thyme'
+]
+
+TABLES_DDL = """
+    CREATE SCHEMA {schema};
+    SET LOCAL search_path TO {schema}, public;
+    CREATE TABLE recipes (
+        id uuid PRIMARY KEY DEFAULT gen_random_uuid(),
+        source_id text UNIQUE, title text, category text, area text, instructions text,
+        image_url text, servings int
+    );
+    CREATE TABLE recipe_nutrients (recipe_id uuid PRIMARY KEY, per_serving jsonb);
+    CREATE TABLE recipe_ingredients (
+        id bigserial PRIMARY KEY, recipe_id uuid, position int,
+        ingredient_name text, measure_text text
+    );
+    CREATE TABLE recipe_events (
+        id uuid PRIMARY KEY DEFAULT gen_random_uuid(),
+        user_id uuid, recipe_id uuid, event text, created_at timestamptz
+    );
+    CREATE TABLE user_profiles (
+        id uuid PRIMARY KEY DEFAULT gen_random_uuid(),
+        user_id uuid NOT NULL, full_name text, email text
+    );
+    CREATE TABLE user_health_profiles (
+        id uuid PRIMARY KEY DEFAULT gen_random_uuid(),
+        user_id uuid NOT NULL, cooking_skill text, diet_style text, allergies text[],
+        medical_conditions text[], health_goals text[], daily_calorie_goal int
+    );
+"""
+
+# Loaded after the migrations, as a fresh install gets its data from
+# fetch_recipes.py and the app once the schema is in place
+DATA_SQL = """
+    SET LOCAL search_path TO {schema}, public;
+    CREATE TEMP TABLE vocab (i int, name text, mask bigint) ON COMMIT DROP;
+    INSERT INTO vocab SELECT v.i - 1, v.name, v.mask FROM unnest(%(names)s::text[], %(masks)s::bigint[])
+        WITH ORDINALITY AS v(name, mask, i);
+    INSERT INTO recipes (source_id, title, category, area, instructions, image_url, servings)
+    SELECT 'synthetic-' || g, 'Recipe ' || g,
+           (ARRAY['Beef','Chicken','Vegan','Dessert','Seafood','Pasta','Vegetarian','Side'])[1 + g %% 8],
+           (ARRAY['Italian','Thai','Mexican','Indian','French','Japanese','British','Greek'])[1 + (g / 8) %% 8],
+           CASE WHEN g %% 20 = 0 THEN NULL ELSE 'Chop, season and cook until done.' END,
+           'https://example.com/' || g || '.jpg', 1 + g %% 4
+    FROM generate_series(1, %(recipes)s) g;
+    INSERT INTO recipe_nutrients (recipe_id, per_serving)
+    SELECT id, jsonb_build_object('kcal', 300 + (random() * 500)::int, 'protein_g', (random() * 40)::int,
+                                  'sodium_mg', (random() * 1200)::int, 'sugar_g', (random() * 30)::int)
+    FROM recipes;
+    INSERT INTO recipe_ingredients (recipe_id, position, ingredient_name, measure_text)
+    SELECT r.id, p, v.name, '100 g'
+    FROM recipes r
+    CROSS JOIN generate_series(1, 8) p
+    JOIN vocab v ON v.i = (hashtext(r.id::text || p)::bigint + 2147483648) %% %(vocab_size)s;
+    UPDATE recipes r SET allergen_mask = m.mask
+    FROM (
+        SELECT ri.recipe_id, bit_or(v.mask) AS mask
+        FROM recipe_ingredients ri JOIN vocab v ON v.name = ri.ingredient_name
+        GROUP BY ri.recipe_id
+    ) m
+    WHERE m.recipe_id = r.id;
+    INSERT INTO user_profiles (user_id, full_name, email)
+    SELECT gen_random_uuid(), 'User ' || g, 'user' || g || '@example.com'
+    FROM generate_series(1, %(users)s) g;
+    INSERT INTO user_health_profiles (user_id, cooking_skill, diet_style, allergies, medical_conditions,
+                                      health_goals, daily_calorie_goal)
+    SELECT user_id, 'beginner', 'balanced', ARRAY['peanuts'], ARRAY[]::text[], ARRAY['maintain'], 2000
+    FROM user_profiles;
+    CREATE TEMP TABLE numbered_users ON COMMIT DROP AS
+        SELECT row_number() OVER (ORDER BY id) - 1 AS n, user_id FROM user_profiles;
+    CREATE TEMP TABLE numbered_recipes ON COMMIT DROP AS
+        SELECT row_number() OVER (ORDER BY id) - 1 AS n, id FROM recipes;
+    -- One heavy user with 1 in 20 events, the rest spread over everyone
+    INSERT INTO recipe_events (user_id, recipe_id, event, created_at)
+    SELECT u.user_id, r.id,
+           (ARRAY['view','like','save','hide','cook_now','share_family'])[1 + (g / 7) %% 6],
+           now() - g * interval '1 second'
+    FROM generate_series(1, %(events)s) g
+    JOIN numbered_users u ON u.n = CASE WHEN g %% 20 = 0 THEN 0 ELSE g %% %(users)s END
+    JOIN numbered_recipes r ON r.n = (g::bigint * 7919) %% %(recipes)s;
+"""
+
+TABLES = ('recipes', 'recipe_ingredients', 'recipe_nutrients', 'recipe_events',
+          'user_profiles', 'user_health_profiles')
+
+
+def build(args):
+    """Empty tables, migrations, then data, view refreshes and statistics"""
+    conn = schema_migrations.connect()
+    cur = conn.cursor()
+    cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+    cur.execute(f"BEGIN; {TABLES_DDL.format(schema=SCHEMA)} COMMIT;")
+    schema_migrations.migrate(SCHEMA)
+    cur.execute(f"BEGIN; {DATA_SQL.format(schema=SCHEMA)} COMMIT;", {
+        'names': INGREDIENTS,
+        'masks': [recipe_allergen_mask([name]) for name in INGREDIENTS],
+        'recipes': args.recipes, 'users': args.users, 'events': args.events,
+        'vocab_size': len(INGREDIENTS)
+    })
+    for view in ('recipe_cards', 'recipe_search'):
+        cur.execute(f"REFRESH MATERIALIZED VIEW {SCHEMA}.{view}")
+    for table in TABLES:
+        cur.execute(f"VACUUM ANALYZE {SCHEMA}.{table}")
+    cur.close()
+    conn.close()
+
+
+def scans(plan: Dict[str, Any]) -> List[Tuple[str, str]]:
+    """(node type, relation) of every scan node in a JSON plan tree"""
+    found = []
+    if 'Relation Name' in plan:
+        found.append((plan['Node Type'], plan['Relation Name']))
+    for child in plan.get('Plans', []):
+        found += scans(child)
+    return found
+
+
+def hot_queries(cur) -> List[Tuple[str, str, Any]]:
+    """(name, query, params) for each hot read, with ids taken from the dataset"""
+    cur.execute("""
+        SELECT user_id, count(*) FROM recipe_events GROUP BY user_id ORDER BY count(*) DESC LIMIT 1
+    """)
+    heavy_user, events = cur.fetchone()
+    cur.execute("""
+        SELECT created_at, id FROM recipe_events WHERE user_id = %s
+        ORDER BY created_at DESC, id DESC OFFSET %s LIMIT 1
+    """, (heavy_user, events // 2))
+    cursor_created_at, cursor_id = cur.fetchone()
+    cur.execute("SELECT id FROM recipes WHERE instructions IS NOT NULL ORDER BY id OFFSET 1000 LIMIT 1")
+    recipe_id = cur.fetchone()[0]
+
+    exclusion, exclusion_params = allergen_exclusion_sql(cur, *allergy_exclusions(['peanuts', 'dairy', 'coriander']))
+    return [
+        ('user profile', USER_PROFILE_QUERY, (heavy_user,)),
+        ('history, first page',
+         HISTORY_QUERY.format(event_filter='', after_cursor=''),
+         {'user_id': heavy_user, 'limit': 51}),
+        ('history, later page of likes',
+         HISTORY_QUERY.format(
+             event_filter="AND e.event = ANY(%(events)s)",
+             after_cursor="AND (e.created_at, e.id) < (%(cursor_created_at)s, %(cursor_id)s)"
+         ),
+         {'user_id': heavy_user, 'limit': 51, 'events': ['like'],
+          'cursor_created_at': cursor_created_at, 'cursor_id': cursor_id}),
+        ('recipe card',
+         f"SELECT {CARD_COLUMNS} FROM {cards_source(cur)} c WHERE c.id = %s", (recipe_id,)),
+        ('recipe card, live query',
+         f"SELECT {CARD_COLUMNS} FROM {cards_source(cur, live=True)} c WHERE c.id = %s", (recipe_id,)),
+        ('candidate sample',
+         SAMPLED_CARDS_QUERY.format(sample=sample_ids_sql(cur, 20), columns=CARD_COLUMNS, source=cards_source(cur)),
+         None),
+        ('candidate sample, allergies',
+         SAMPLED_CARDS_QUERY.format(sample=sample_ids_sql(cur, 50, exclusion, exclusion_params),
+                                   columns=CARD_COLUMNS, source=cards_source(cur)),
+         None),
+    ]
+
+
+def check(cur) -> bool:
+    ok = True
+    for name, query, params in hot_queries(cur):
+        cur.execute(f"EXPLAIN (ANALYZE, FORMAT JSON) {query}", params)
+        result = cur.fetchone()[0]
+        result = result[0] if isinstance(result, list) else json.loads(result)[0]
+        nodes = scans(result['Plan'])
+        seq = [relation for node, relation in nodes if node == 'Seq Scan']
+        ok = ok and not seq
+        described = ', '.join(sorted({f"{node} {relation}" for node, relation in nodes}))
+        print(f"  {'❌' if seq else '✅'} {name:<30} {result['Execution Time']:9.2f} ms   {described}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fail if a hot query plans a sequential scan')
+    parser.add_argument('--recipes', type=int, default=200000)
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--events', type=int, default=2000000)
+    parser.add_argument('--schema', help='check an existing, migrated schema instead of building one')
+    parser.add_argument('--keep', action='store_true', help='keep the scratch schema')
+    args = parser.parse_args()
+
+    schema = args.schema or SCHEMA
+    if not args.schema:
+        start = time.perf_counter()
+        build(args)
+        print(f"\n{args.recipes:,} recipes, {args.users:,} users, {args.events:,} events "
+              f"(schema {SCHEMA}, built in {time.perf_counter() - start:.1f}s)\n")
+
+    conn = schema_migrations.connect(schema)
+    try:
+        indexes_ok = schema_migrations.report(schema)
+        cur = conn.cursor()
+        if args.schema:
+            cur.execute("SET enable_seqscan = off")
+        plans_ok = check(cur)
+        cur.close()
+    finally:
+        conn.close()
+        if not args.schema and not args.keep:
+            conn = schema_migrations.connect()
+            conn.cursor().execute(f"DROP SCHEMA {SCHEMA} CASCADE")
+            conn.close()
+
+    if not (indexes_ok and plans_ok):
+        print("\n❌ hot queries need an index (see above)")
+        sys.exit(1)
+    print("\n✅ no sequential scans")
+
+
+if __name__ == '__main__':
+    main()
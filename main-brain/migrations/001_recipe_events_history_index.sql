@@ -0,0 +1,14 @@
+-- Recommendation history: keyset pagination over recipe_events
+-- Used by GET /api/recommendations/{user_id}/history (src/recipe_history.py)
+--
+-- Pages are read with
+--   WHERE user_id = $1 AND (created_at, id) < ($2, $3)
+--   ORDER BY created_at DESC, id DESC LIMIT n
+-- which this index answers with a single backwards-ordered range scan, no
+-- sort and no OFFSET, regardless of how many events the user has.
+--
+-- CONCURRENTLY avoids locking writes to recipe_events while the index
+-- builds; it must run outside a transaction block.
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_recipe_events_user_created_id
+    ON public.recipe_events (user_id, created_at DESC, id DESC);
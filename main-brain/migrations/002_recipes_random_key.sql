@@ -0,0 +1,22 @@
+-- Indexed random sampling of candidate recipes
+-- Used by src/recipe_sampling.py (LangGraph, DSPy and meal-planner agents)
+--
+-- Each recipe gets a persisted uniform random key; a sample of n recipes is
+--   WHERE instructions IS NOT NULL AND random_key >= <random pivot>
+--   ORDER BY random_key LIMIT n
+-- which this partial index answers with one range seek, instead of
+-- aggregating and sorting the whole catalog with ORDER BY RANDOM().
+--
+-- The volatile default gives every existing row its own key (one table
+-- rewrite) and every recipe inserted later (fetch_recipes.py) a fresh one.
+-- Run the ALTER and ANALYZE in a transaction and the CREATE INDEX
+-- CONCURRENTLY on its own, outside a transaction block.
+
+ALTER TABLE public.recipes
+    ADD COLUMN IF NOT EXISTS random_key double precision NOT NULL DEFAULT random();
+
+ANALYZE public.recipes;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_recipes_random_key
+    ON public.recipes (random_key)
+    WHERE instructions IS NOT NULL;
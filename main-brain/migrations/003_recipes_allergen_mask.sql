@@ -0,0 +1,29 @@
+-- Precomputed per-recipe allergen bitmask
+-- Used by DSPyRecipeAgent._fetch_recipes via src/recipe_sampling.py
+--
+-- Bit i is set when one of the recipe's ingredients matches allergen key i
+-- of src/allergens.py (ALLERGEN_KEYS, from ALLERGEN_DERIVATIVES). Excluding
+-- a user's allergens is then one parameterized predicate
+--   (allergen_mask & $user_mask) = 0
+-- instead of a NOT EXISTS (... LIKE '%term%') scan per allergen.
+--
+-- NULL means "not computed yet" and fails that predicate, so a recipe is
+-- never recommended to an allergic user before its mask exists.
+-- fetch_recipes.py sets the mask whenever it writes a recipe's ingredients;
+-- fill existing rows with its "Recompute allergen masks" option after
+-- running the ALTER.
+--
+-- The sampling index is replaced by one that carries allergen_mask, so the
+-- random-key seek evaluates the predicate from the index alone. Run each
+-- CONCURRENTLY statement on its own, outside a transaction block.
+
+ALTER TABLE public.recipes
+    ADD COLUMN IF NOT EXISTS allergen_mask bigint;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_recipes_random_key_allergen_mask
+    ON public.recipes (random_key) INCLUDE (allergen_mask)
+    WHERE instructions IS NOT NULL;
+
+DROP INDEX CONCURRENTLY IF EXISTS public.idx_recipes_random_key;
+
+ANALYZE public.recipes;
@@ -0,0 +1,44 @@
+-- Materialized recipe cards
+-- Used by src/recipe_cards.py (LangGraph, DSPy and meal-planner agents,
+-- personalize-for-cooking, recipe safety and the in-memory catalog)
+--
+-- One row per recipe with typed per-serving nutrients and the ingredients
+-- as a jsonb array in position order, so read paths no longer join
+-- recipe_ingredients and recipe_nutrients and json_agg ... GROUP BY on
+-- every request. Keep the definition in sync with CARDS_QUERY.
+--
+-- fetch_recipes.py refreshes the view (CONCURRENTLY, which needs the
+-- unique index) after every ingest run.
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS public.recipe_cards AS
+    SELECT
+        r.id, r.title, r.category, r.area AS cuisine,
+        r.instructions, r.image_url, r.servings,
+        CASE WHEN jsonb_typeof(rn.per_serving->'kcal') = 'number'
+             THEN (rn.per_serving->>'kcal')::double precision END AS kcal,
+        CASE WHEN jsonb_typeof(rn.per_serving->'protein_g') = 'number'
+             THEN (rn.per_serving->>'protein_g')::double precision END AS protein,
+        CASE WHEN jsonb_typeof(rn.per_serving->'sodium_mg') = 'number'
+             THEN (rn.per_serving->>'sodium_mg')::double precision END AS sodium,
+        CASE WHEN jsonb_typeof(rn.per_serving->'sugar_g') = 'number'
+             THEN (rn.per_serving->>'sugar_g')::double precision END AS sugar,
+        CASE WHEN jsonb_typeof(rn.per_serving->'carbs_g') = 'number'
+             THEN (rn.per_serving->>'carbs_g')::double precision END AS carbs,
+        CASE WHEN jsonb_typeof(rn.per_serving->'fat_g') = 'number'
+             THEN (rn.per_serving->>'fat_g')::double precision END AS fat,
+        COALESCE(ing.ingredients, '[]'::jsonb) AS ingredients
+    FROM public.recipes r
+    LEFT JOIN public.recipe_nutrients rn ON rn.recipe_id = r.id
+    LEFT JOIN LATERAL (
+        SELECT jsonb_agg(
+                   jsonb_build_object('name', ri.ingredient_name, 'amount', ri.measure_text)
+                   ORDER BY ri.position
+               ) AS ingredients
+        FROM public.recipe_ingredients ri
+        WHERE ri.recipe_id = r.id
+    ) ing ON true;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_recipe_cards_id
+    ON public.recipe_cards (id);
+
+ANALYZE public.recipe_cards;
@@ -0,0 +1,65 @@
+-- Recipe search: full-text + trigram index over the browsable catalog
+-- Used by GET /api/recipes/search (src/recipe_search.py)
+--
+-- One narrow row per recipe with instructions: the card fields a result
+-- list shows, the allergen mask (migrations/003) and a weighted tsvector
+--   A: title   B: ingredient names   C: category and area
+-- Keeping the searched rows this small (no instructions, no ingredient
+-- jsonb) is what keeps ranking cheap: every match is ranked from this heap.
+--
+-- Queries match `document @@ websearch_to_tsquery(...)` (GIN, below). When
+-- that finds nothing, e.g. for a typo, the title is matched by trigram word
+-- similarity instead (pg_trgm GIN). Keep the definition in sync with
+-- SEARCH_QUERY in src/recipe_search.py (used until this has run).
+--
+-- bucket (0-511, from a hash of the id) splits the catalog into fixed
+-- random samples. A query matching too many recipes to rank within budget
+-- (e.g. "chicken") is ranked within 1/8, 1/64 or 1/512 of the catalog,
+-- `bucket < 64 / 8 / 1`, each with its own partial GIN index so the scan
+-- only reads that sample's postings.
+--
+-- fetch_recipes.py refreshes the view (CONCURRENTLY, which needs the unique
+-- index) after every ingest run and after recomputing allergen masks.
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS public.recipe_search AS
+    SELECT
+        r.id, r.title, r.category, r.area AS cuisine, r.image_url,
+        r.allergen_mask,
+        (hashtext(r.id::text) & 511)::smallint AS bucket,
+        CASE WHEN jsonb_typeof(rn.per_serving->'kcal') = 'number'
+             THEN (rn.per_serving->>'kcal')::double precision END AS kcal,
+        CASE WHEN jsonb_typeof(rn.per_serving->'protein_g') = 'number'
+             THEN (rn.per_serving->>'protein_g')::double precision END AS protein,
+        setweight(to_tsvector('english', COALESCE(r.title, '')), 'A')
+            || setweight(to_tsvector('english', COALESCE(ing.names, '')), 'B')
+            || setweight(to_tsvector('english', concat_ws(' ', r.category, r.area)), 'C') AS document
+    FROM public.recipes r
+    LEFT JOIN public.recipe_nutrients rn ON rn.recipe_id = r.id
+    LEFT JOIN LATERAL (
+        SELECT string_agg(ri.ingredient_name, ' ') AS names
+        FROM public.recipe_ingredients ri
+        WHERE ri.recipe_id = r.id
+    ) ing ON true
+    WHERE r.instructions IS NOT NULL;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_recipe_search_id
+    ON public.recipe_search (id);
+
+CREATE INDEX IF NOT EXISTS idx_recipe_search_document
+    ON public.recipe_search USING gin (document);
+
+CREATE INDEX IF NOT EXISTS idx_recipe_search_document_sample_8
+    ON public.recipe_search USING gin (document) WHERE bucket < 64;
+
+CREATE INDEX IF NOT EXISTS idx_recipe_search_document_sample_64
+    ON public.recipe_search USING gin (document) WHERE bucket < 8;
+
+CREATE INDEX IF NOT EXISTS idx_recipe_search_document_sample_512
+    ON public.recipe_search USING gin (document) WHERE bucket < 1;
+
+CREATE INDEX IF NOT EXISTS idx_recipe_search_title_trgm
+    ON public.recipe_search USING gin (title gin_trgm_ops);
+
+ANALYZE public.recipe_search;
@@ -0,0 +1,32 @@
+-- Hot-path indexes for the brain's recipe and profile reads
+-- Checked by src/schema_migrations.py (HOT_PATH_INDEXES) and
+-- benchmarks/check_query_plans.py
+--
+-- recipe_ingredients is read by recipe_id in position order: the live
+-- recipe card (CARDS_QUERY in src/recipe_cards.py, and every refresh of the
+-- 004 / 005 views), the ingredient-term exclusion of src/recipe_sampling.py
+-- (NOT EXISTS ... LIKE ANY) and the ingest's delete / nutrition rollup.
+-- Carrying ingredient_name and measure_text lets those run as index-only
+-- scans instead of one heap fetch per ingredient row.
+--
+-- user_profiles and user_health_profiles are read by user_id for every
+-- recommendation (the agents' profile query, src/recipe_safety.py). The
+-- front-end's Supabase migrations create indexes with these names on some
+-- deployments; IF NOT EXISTS keeps them from being built twice.
+--
+-- recipe_nutrients needs nothing here: fetch_recipes.py upserts
+-- ON CONFLICT (recipe_id), which already requires a unique index on it.
+-- recipe_events by user is migrations/001.
+--
+-- Run each CONCURRENTLY statement on its own, outside a transaction block.
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_recipe_ingredients_recipe_position
+    ON public.recipe_ingredients (recipe_id, position) INCLUDE (ingredient_name, measure_text);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_user_profiles_user_id
+    ON public.user_profiles (user_id);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_user_health_profiles_user_id
+    ON public.user_health_profiles (user_id);
+
+ANALYZE public.recipe_ingredients;
@@ -0,0 +1,36 @@
+-- Profile change notifications for the brain's profile cache
+-- Used by src/user_profiles.py (PROFILE_CHANNEL, ProfileCache.on_notify)
+--
+-- API workers cache each user's user_profiles + user_health_profiles row.
+-- Profiles are written by the TS backend and directly by the app through
+-- Supabase, so instead of relying on every writer to call the brain's
+-- invalidation endpoint, each write NOTIFYs user_profile_changed with the
+-- user id and every worker LISTENing on it drops that user.
+--
+-- NOTIFY is sent on commit (not at all on rollback), and identical
+-- notifications within one transaction are delivered once, so a bulk
+-- update costs one message per user.
+
+CREATE OR REPLACE FUNCTION public.notify_user_profile_changed() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        PERFORM pg_notify('user_profile_changed', OLD.user_id::text);
+    ELSE
+        PERFORM pg_notify('user_profile_changed', NEW.user_id::text);
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS user_profiles_notify_changed ON public.user_profiles;
+
+CREATE TRIGGER user_profiles_notify_changed
+    AFTER INSERT OR UPDATE OR DELETE ON public.user_profiles
+    FOR EACH ROW EXECUTE FUNCTION public.notify_user_profile_changed();
+
+DROP TRIGGER IF EXISTS user_health_profiles_notify_changed ON public.user_health_profiles;
+
+CREATE TRIGGER user_health_profiles_notify_changed
+    AFTER INSERT OR UPDATE OR DELETE ON public.user_health_profiles
+    FOR EACH ROW EXECUTE FUNCTION public.notify_user_profile_changed();
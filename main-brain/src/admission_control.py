@@ -0,0 +1,269 @@
+"""
+Admission Control for Expensive Endpoint Classes
+Location: main-brain/src/admission_control.py
+
+The worker pools bound how much work can be queued, but not how long it
+waits. When the LLM backend slows down, a full queue of meal plans can take
+minutes to drain, and clients time out long before their request starts.
+
+Before expensive work is queued, the admission controller estimates how
+long it would wait and rejects it (503 + Retry-After) if that exceeds the
+class's budget. Work within budget is queued as before.
+
+For each controlled pool (llm, meal_plan) it tracks:
+- service time: EWMA of how long completed calls took, raised to the mean
+  age of the calls still running (so a slowdown shows up before those
+  calls finish)
+- LLM backend latency: a fast and a slow EWMA over every LLM call
+  (metrics.track_llm_call); when the fast one rises above the slow one, the
+  service-time estimate is scaled up by the same factor
+- in-flight work from the pool itself
+
+    estimated_wait = ceil((in_flight - max_workers + 1) / max_workers) * service_time
+
+Pools without a policy (db: feedback, nutrition goals, job polling) are
+never rejected by this module.
+
+Settings (env), per class NAME in {LLM, MEAL_PLAN}:
+- ADMISSION_<NAME>_BUDGET_SECONDS:   max estimated queue wait
+- ADMISSION_<NAME>_DEFAULT_SECONDS:  service time assumed before any samples
+- ADMISSION_ENABLED:                 set to 0 to disable (pools still bound work)
+"""
+
+import math
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, Optional
+
+import metrics
+from worker_pools import WorkerPool, llm_pool, meal_plan_pool
+
+
+class AdmissionRejectedError(Exception):
+    """Raised when a request's estimated queue wait exceeds its class budget"""
+
+    def __init__(self, pool_name: str, estimated_wait: float, budget: float, retry_after: int):
+        self.pool_name = pool_name
+        self.estimated_wait = estimated_wait
+        self.budget = budget
+        self.retry_after = retry_after
+        super().__init__(
+            f"Admission rejected for '{pool_name}': estimated wait {estimated_wait:.1f}s "
+            f"exceeds budget {budget:.0f}s"
+        )
+
+
+class Ewma:
+    """Exponentially weighted moving average (None until the first sample)"""
+
+    def __init__(self, alpha: float):
+        self.alpha = alpha
+        self.value: Optional[float] = None
+
+    def update(self, sample: float):
+        if self.value is None:
+            self.value = sample
+        else:
+            self.value += self.alpha * (sample - self.value)
+
+
+# ============================================
+# LLM BACKEND LATENCY
+# ============================================
+
+class LLMLatencyTracker:
+    """Fast vs slow EWMA of LLM call latency across all call sites"""
+
+    def __init__(self, fast_alpha: float = 0.3, slow_alpha: float = 0.02, max_factor: float = 10.0):
+        self._fast = Ewma(fast_alpha)
+        self._slow = Ewma(slow_alpha)
+        self._max_factor = max_factor
+        self._lock = threading.Lock()
+
+    def observe(self, call_site: str, seconds: float, status: str):
+        with self._lock:
+            self._fast.update(seconds)
+            self._slow.update(seconds)
+
+    def slowdown_factor(self) -> float:
+        """How much slower recent LLM calls are than the long-run average (>= 1)"""
+        with self._lock:
+            fast, slow = self._fast.value, self._slow.value
+        if not fast or not slow:
+            return 1.0
+        return min(max(fast / slow, 1.0), self._max_factor)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            fast, slow = self._fast.value, self._slow.value
+        return {
+            'recent_seconds': round(fast, 3) if fast is not None else None,
+            'baseline_seconds': round(slow, 3) if slow is not None else None,
+            'slowdown_factor': round(self.slowdown_factor(), 2)
+        }
+
+
+# ============================================
+# PER-CLASS POLICY
+# ============================================
+
+class ClassPolicy:
+    """Service-time tracking and wait budget for one pool"""
+
+    def __init__(self, pool: WorkerPool, budget_seconds: float, default_service_seconds: float):
+        self.pool = pool
+        self.budget_seconds = budget_seconds
+        self.service = Ewma(alpha=0.2)
+        self.default_service_seconds = default_service_seconds
+        self._running: Dict[int, float] = {}
+        self._next_token = 0
+        self._lock = threading.Lock()
+        self.admitted = 0
+        self.rejected = 0
+
+    def started(self) -> int:
+        with self._lock:
+            self._next_token += 1
+            self._running[self._next_token] = time.monotonic()
+            return self._next_token
+
+    def finished(self, token: int):
+        with self._lock:
+            started_at = self._running.pop(token, None)
+            if started_at is not None:
+                self.service.update(time.monotonic() - started_at)
+
+    def service_estimate(self, llm_factor: float) -> float:
+        with self._lock:
+            completed = self.service.value
+            now = time.monotonic()
+            ages = [now - started_at for started_at in self._running.values()]
+        estimate = (completed if completed is not None else self.default_service_seconds) * llm_factor
+        if ages:
+            estimate = max(estimate, sum(ages) / len(ages))
+        return estimate
+
+    def estimated_wait(self, llm_factor: float) -> float:
+        stats = self.pool.stats()
+        waiting_ahead = stats['in_flight'] - self.pool.max_workers + 1
+        if waiting_ahead <= 0:
+            return 0.0
+        waves = math.ceil(waiting_ahead / self.pool.max_workers)
+        return waves * self.service_estimate(llm_factor)
+
+
+def _policy_from_env(pool: WorkerPool, default_budget: float, default_service: float) -> ClassPolicy:
+    prefix = f"ADMISSION_{pool.name.upper()}"
+    return ClassPolicy(
+        pool,
+        budget_seconds=float(os.getenv(f"{prefix}_BUDGET_SECONDS", str(default_budget))),
+        default_service_seconds=float(os.getenv(f"{prefix}_DEFAULT_SECONDS", str(default_service)))
+    )
+
+
+# ============================================
+# CONTROLLER
+# ============================================
+
+class AdmissionController:
+    """Admits or rejects work for the pools that have a policy"""
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.llm_latency = LLMLatencyTracker()
+        self._policies: Dict[str, ClassPolicy] = {}
+
+    def add_policy(self, policy: ClassPolicy):
+        self._policies[policy.pool.name] = policy
+
+    def estimated_wait(self, pool: WorkerPool) -> float:
+        policy = self._policies.get(pool.name)
+        if policy is None:
+            return 0.0
+        return policy.estimated_wait(self.llm_latency.slowdown_factor())
+
+    def retry_after(self, pool: WorkerPool) -> int:
+        """Seconds until this pool's estimated wait is likely back within budget"""
+        policy = self._policies.get(pool.name)
+        if policy is None:
+            return 5
+        excess = self.estimated_wait(pool) - policy.budget_seconds
+        return int(min(max(math.ceil(excess), 1), 300))
+
+    def admit(self, pool: WorkerPool):
+        """Raise AdmissionRejectedError if new work on this pool would wait too long"""
+        policy = self._policies.get(pool.name)
+        if policy is None or not self.enabled:
+            return
+        wait = self.estimated_wait(pool)
+        if wait > policy.budget_seconds:
+            policy.rejected += 1
+            admission_rejections.inc(pool.name)
+            retry_after = int(min(max(math.ceil(wait - policy.budget_seconds), 1), 300))
+            raise AdmissionRejectedError(pool.name, wait, policy.budget_seconds, retry_after)
+        policy.admitted += 1
+
+    def track(self, pool: WorkerPool, fn: Callable) -> Callable:
+        """Wrap a blocking callable so its run time feeds the pool's service estimate"""
+        policy = self._policies.get(pool.name)
+        if policy is None:
+            return fn
+
+        def tracked(*args, **kwargs):
+            token = policy.started()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                policy.finished(token)
+
+        return tracked
+
+    def track_iter(self, pool: WorkerPool, gen_fn: Callable[..., Iterator[Any]]) -> Callable[..., Iterator[Any]]:
+        """Like track(), for a blocking generator (streamed responses)"""
+        policy = self._policies.get(pool.name)
+        if policy is None:
+            return gen_fn
+
+        def tracked(*args, **kwargs):
+            token = policy.started()
+            try:
+                yield from gen_fn(*args, **kwargs)
+            finally:
+                policy.finished(token)
+
+        return tracked
+
+    def stats(self) -> Dict[str, Any]:
+        factor = self.llm_latency.slowdown_factor()
+        return {
+            'enabled': self.enabled,
+            'llm_latency': self.llm_latency.stats(),
+            'classes': {
+                name: {
+                    'budget_seconds': policy.budget_seconds,
+                    'service_estimate_seconds': round(policy.service_estimate(factor), 2),
+                    'estimated_wait_seconds': round(policy.estimated_wait(factor), 2),
+                    'admitted': policy.admitted,
+                    'rejected': policy.rejected
+                }
+                for name, policy in self._policies.items()
+            }
+        }
+
+
+admission_rejections = metrics.counter(
+    'admission_rejections_total',
+    'Requests shed by admission control, by endpoint class',
+    ('pool',)
+)
+
+admission = AdmissionController(enabled=os.getenv('ADMISSION_ENABLED', '1').lower() not in ('0', 'false', 'no'))
+admission.add_policy(_policy_from_env(llm_pool, default_budget=30, default_service=8))
+admission.add_policy(_policy_from_env(meal_plan_pool, default_budget=90, default_service=60))
+metrics.add_llm_call_listener(admission.llm_latency.observe)
+
+metrics.register_gauge(
+    'admission_estimated_wait_seconds', 'Estimated queue wait for new work, by endpoint class', ('pool',),
+    lambda: {(name,): stats['estimated_wait_seconds'] for name, stats in admission.stats()['classes'].items()}
+)
@@ -0,0 +1,190 @@
+"""
+Lazy Agent Registry
+Location: main-brain/src/agent_registry.py
+
+Importing the agents pulls in langchain, langgraph and dspy, and constructing
+them builds LLM clients. Doing all of that at import time made cold start
+several seconds and built duplicate clients for agents a replica might never
+serve.
+
+Agents are registered here by module path and factory name. Nothing is
+imported or constructed until the first get(); the module import and the
+construction are each timed, and report() returns a startup-time breakdown:
+- imports: milliseconds spent importing each module (including its deps)
+- agents:  milliseconds spent in each agent's constructor
+
+Usage:
+    from agent_registry import registry
+    planner = registry.get('dspy_meal_planner')
+
+Set PRELOAD_AGENTS=all (or a comma-separated list of names) to construct
+agents during startup instead of on first request.
+"""
+
+import importlib
+import os
+import sys
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+
+class AgentUnavailableError(Exception):
+    """Raised when an agent's module fails to import or its factory raises"""
+
+    def __init__(self, name: str, error: Exception):
+        self.name = name
+        self.error = error
+        super().__init__(f"Agent '{name}' unavailable: {error}")
+
+
+# ============================================
+# IMPORT TIMING
+# ============================================
+
+_import_times: Dict[str, float] = {}
+_import_lock = threading.RLock()
+
+
+def timed_import(module_name: str):
+    """Import a module, recording how long the first import took"""
+    if module_name in sys.modules:
+        return sys.modules[module_name]
+    with _import_lock:
+        if module_name in sys.modules:
+            return sys.modules[module_name]
+        start = time.perf_counter()
+        module = importlib.import_module(module_name)
+        _import_times[module_name] = round((time.perf_counter() - start) * 1000, 1)
+        return module
+
+
+def record_import(module_name: str, elapsed_ms: float):
+    """Record an import that was timed by the caller"""
+    _import_times[module_name] = round(elapsed_ms, 1)
+
+
+# ============================================
+# REGISTRY
+# ============================================
+
+class _Entry:
+    def __init__(self, name: str, module: str, factory: str):
+        self.name = name
+        self.module = module
+        self.factory = factory
+        self.instance: Any = None
+        self.init_ms: Optional[float] = None
+        self.error: Optional[str] = None
+        self.lock = threading.Lock()
+
+
+class AgentRegistry:
+    """Builds each registered agent once, on first use, and times it"""
+
+    def __init__(self):
+        self._entries: Dict[str, _Entry] = {}
+        self._created_at = time.perf_counter()
+        self._ready_ms: Optional[float] = None
+
+    def register(self, name: str, module: str, factory: str):
+        """Register an agent built by calling `module.factory()` on first use"""
+        self._entries[name] = _Entry(name, module, factory)
+
+    def is_initialized(self, name: str) -> bool:
+        entry = self._entries.get(name)
+        return entry is not None and entry.instance is not None
+
+    def error(self, name: str) -> Optional[str]:
+        """Why the last import or construction of an agent failed, if it did"""
+        entry = self._entries.get(name)
+        return entry.error if entry is not None else None
+
+    def get(self, name: str) -> Any:
+        """Return the agent, importing and constructing it on first call"""
+        entry = self._entries.get(name)
+        if entry is None:
+            raise KeyError(f"No agent registered as '{name}'")
+        if entry.instance is not None:
+            return entry.instance
+
+        with entry.lock:
+            if entry.instance is not None:
+                return entry.instance
+            try:
+                module = timed_import(entry.module)
+                factory = getattr(module, entry.factory)
+                start = time.perf_counter()
+                instance = factory()
+                entry.init_ms = round((time.perf_counter() - start) * 1000, 1)
+            except Exception as e:
+                # Not cached: the next call retries (e.g. after env is fixed)
+                entry.error = str(e)
+                print(f"Failed to initialize agent '{name}': {e}")
+                raise AgentUnavailableError(name, e) from e
+            entry.instance = instance
+            entry.error = None
+            print(f"Agent '{name}' initialized in {entry.init_ms} ms")
+            return instance
+
+    def get_or_none(self, name: str) -> Any:
+        """Like get(), but returns None when the agent cannot be built"""
+        try:
+            return self.get(name)
+        except AgentUnavailableError:
+            return None
+
+    def preload(self, names: Optional[List[str]] = None):
+        """Construct agents now (all registered ones if names is None)"""
+        for name in names or list(self._entries):
+            self.get_or_none(name)
+
+    def import_modules(self, names: Optional[List[str]] = None):
+        """Import agent modules without constructing the agents (prefork preload)"""
+        for name in names or list(self._entries):
+            entry = self._entries[name]
+            try:
+                timed_import(entry.module)
+            except Exception as e:
+                entry.error = str(e)
+                print(f"Failed to import agent module '{entry.module}': {e}")
+
+    def mark_ready(self):
+        """Record the time from registry creation to the app being importable"""
+        self._ready_ms = round((time.perf_counter() - self._created_at) * 1000, 1)
+
+    def report(self) -> Dict[str, Any]:
+        """Startup-time report: per-module import ms and per-agent init ms"""
+        return {
+            'ready_ms': self._ready_ms,
+            'imports': dict(sorted(_import_times.items(), key=lambda kv: -kv[1])),
+            'agents': {
+                name: {
+                    'module': entry.module,
+                    'initialized': entry.instance is not None,
+                    'init_ms': entry.init_ms,
+                    'error': entry.error
+                }
+                for name, entry in self._entries.items()
+            }
+        }
+
+
+registry = AgentRegistry()
+
+registry.register('langgraph_recipe_agent', 'langgraph_recommendation_agent', 'LangGraphRecipeAgent')
+registry.register('meal_planner_agent', 'meal_planner_agent', 'MealPlannerAgent')
+registry.register('dspy_meal_planner', 'agents.meal_planner.dspy_meal_planner', 'DSPyMealPlannerService')
+registry.register('personalized_recipe_agent', 'agents.recipe_recommendation.personalized_recipe_agent', 'PersonalizedRecipeAgent')
+registry.register('host_agent', 'agents.host_agent', 'HostAgent')
+
+
+def preload_from_env():
+    """Construct the agents named in PRELOAD_AGENTS ('all' for every agent)"""
+    value = os.getenv('PRELOAD_AGENTS', '').strip()
+    if not value:
+        return
+    if value.lower() == 'all':
+        registry.preload()
+    else:
+        registry.preload([name.strip() for name in value.split(',') if name.strip()])
@@ -1,8 +1,11 @@
 """
 WellNoosh AI Agents
 A modular agent architecture with a Host Agent orchestrating specialized agents.
+
+Agent instances are created lazily through agent_registry; use the get_*
+accessors rather than importing module-level singletons.
 """
 
-from .host_agent import HostAgent, host_agent
+from .host_agent import HostAgent, get_host_agent
 
-__all__ = ['HostAgent', 'host_agent']
+__all__ = ['HostAgent', 'get_host_agent']
@@ -37,30 +37,23 @@ class HostAgent:
     - Grocery List Agent: Manages shopping lists
     """
 
+    # Specialized agents are built on first use by the agent registry,
+    # so routing to one agent never pays for importing the others.
+    AGENT_REGISTRY_NAMES = {
+        AgentType.MEAL_PLANNER: 'dspy_meal_planner',
+        AgentType.RECIPE_RECOMMENDATION: 'personalized_recipe_agent',
+    }
+
     def __init__(self):
-        self._agents = {}
-        self._initialize_agents()
         print("HostAgent initialized - orchestrating all specialized agents")
 
-    def _initialize_agents(self):
-        """Initialize all specialized agents"""
-        try:
-            from .meal_planner import dspy_meal_planner
-            self._agents[AgentType.MEAL_PLANNER] = dspy_meal_planner
-            print("  - Meal Planner Agent: Ready")
-        except Exception as e:
-            print(f"  - Meal Planner Agent: Failed to load ({e})")
-        
-        try:
-            from .recipe_recommendation import personalized_recipe_agent
-            self._agents[AgentType.RECIPE_RECOMMENDATION] = personalized_recipe_agent
-            print("  - Recipe Recommendation Agent: Ready")
-        except Exception as e:
-            print(f"  - Recipe Recommendation Agent: Failed to load ({e})")
-
     def get_agent(self, agent_type: AgentType) -> Any:
-        """Get a specific agent by type"""
-        return self._agents.get(agent_type)
+        """Get a specific agent by type, constructing it on first use"""
+        name = self.AGENT_REGISTRY_NAMES.get(agent_type)
+        if name is None:
+            return None
+        from agent_registry import registry
+        return registry.get_or_none(name)
 
     def classify_request(self, user_message: str) -> AgentType:
         """
@@ -205,10 +198,14 @@ class HostAgent:
 
     def get_available_agents(self) -> List[str]:
         """Get list of available agents"""
-        return [agent_type.value for agent_type in self._agents.keys()]
+        return [agent_type.value for agent_type in self.AGENT_REGISTRY_NAMES.keys()]
 
     def get_agent_status(self) -> Dict[str, str]:
-        """Get status of all agents"""
+        """
+        Get status of all agents: active once built, error if building it
+        failed, not_initialized before first use, not_implemented otherwise
+        """
+        from agent_registry import registry
         all_agents = [
             AgentType.MEAL_PLANNER,
             AgentType.RECIPE_RECOMMENDATION,
@@ -218,12 +215,20 @@ class HostAgent:
         
         status = {}
         for agent_type in all_agents:
-            if agent_type in self._agents:
+            name = self.AGENT_REGISTRY_NAMES.get(agent_type)
+            if name is None:
+                status[agent_type.value] = "not_implemented"
+            elif registry.is_initialized(name):
                 status[agent_type.value] = "active"
+            elif registry.error(name):
+                status[agent_type.value] = "error"
             else:
-                status[agent_type.value] = "not_implemented"
+                status[agent_type.value] = "not_initialized"
         
         return status
 
 
-host_agent = HostAgent()
+def get_host_agent() -> HostAgent:
+    """Shared HostAgent, built on first use"""
+    from agent_registry import registry
+    return registry.get('host_agent')
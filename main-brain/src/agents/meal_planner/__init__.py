@@ -1,8 +1,18 @@
 """
 Meal Planner Agent
 Generates personalized meal plans using DSPy with strict allergy enforcement.
+
+dspy is only imported when the service is first requested.
 """
 
-from .dspy_meal_planner import DSPyMealPlannerService, dspy_meal_planner
+_LAZY_EXPORTS = ('DSPyMealPlannerService', 'get_dspy_meal_planner')
+
+
+def __getattr__(name):
+    if name in _LAZY_EXPORTS:
+        from . import dspy_meal_planner as module
+        return getattr(module, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
-__all__ = ['DSPyMealPlannerService', 'dspy_meal_planner']
+__all__ = ['DSPyMealPlannerService', 'get_dspy_meal_planner']
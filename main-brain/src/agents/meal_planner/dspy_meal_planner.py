@@ -8,106 +8,23 @@ import json
 import re
 import uuid
 from datetime import datetime, timedelta
-from typing import List, Dict, Optional, Any
+from typing import List, Dict, Optional, Any, Callable, Iterator, Tuple
 from dotenv import load_dotenv
 import dspy
 from pydantic import BaseModel, Field
 
+from allergens import ALLERGEN_DERIVATIVES, contains_allergen, get_forbidden_ingredients
+from llm_cache import dspy_lm
+from metrics import record_fallback, track_llm_call
+
 # Load environment variables
 load_dotenv()
 
 
 # ============================================================================
-# ALLERGEN DERIVATIVES MAPPING - Super Strict Enforcement
+# ALLERGEN VALIDATION (table and matching helpers live in allergens.py)
 # ============================================================================
 
-ALLERGEN_DERIVATIVES = {
-    "dairy": [
-        "milk", "cheese", "yogurt", "yoghurt", "greek yogurt", "butter", "cream", "sour cream",
-        "whipped cream", "ice cream", "ghee", "paneer", "cottage cheese", "ricotta", "mozzarella",
-        "parmesan", "cheddar", "feta", "gouda", "brie", "cream cheese", "mascarpone", "custard",
-        "pudding", "whey", "casein", "lactose", "kefir", "half-and-half", "evaporated milk",
-        "condensed milk", "buttermilk", "goat cheese", "goat milk", "sheep milk"
-    ],
-    "milk": [
-        "milk", "cheese", "yogurt", "yoghurt", "greek yogurt", "butter", "cream", "sour cream",
-        "whipped cream", "ice cream", "ghee", "paneer", "cottage cheese", "ricotta", "mozzarella",
-        "parmesan", "cheddar", "feta", "gouda", "brie", "cream cheese", "mascarpone", "custard",
-        "pudding", "whey", "casein", "lactose", "kefir", "half-and-half", "evaporated milk",
-        "condensed milk", "buttermilk"
-    ],
-    "gluten": [
-        "wheat", "bread", "pasta", "flour", "barley", "rye", "couscous", "bulgur", "semolina",
-        "seitan", "breadcrumbs", "croutons", "tortilla", "pita", "naan", "bagel", "croissant",
-        "muffin", "cake", "cookie", "crackers", "soy sauce", "beer", "malt", "farro", "spelt"
-    ],
-    "wheat": [
-        "wheat", "bread", "pasta", "flour", "couscous", "bulgur", "semolina", "seitan",
-        "breadcrumbs", "croutons", "tortilla", "pita", "naan", "bagel", "croissant", "muffin"
-    ],
-    "eggs": [
-        "egg", "eggs", "egg whites", "egg yolks", "mayonnaise", "meringue", "custard",
-        "hollandaise", "aioli", "egg noodles", "french toast", "quiche", "frittata", "omelette"
-    ],
-    "peanuts": [
-        "peanut", "peanuts", "peanut butter", "peanut oil", "groundnut", "arachis oil"
-    ],
-    "tree nuts": [
-        "almond", "almonds", "cashew", "cashews", "walnut", "walnuts", "pecan", "pecans",
-        "pistachio", "pistachios", "macadamia", "hazelnut", "hazelnuts", "brazil nut",
-        "pine nut", "pine nuts", "chestnut", "chestnuts", "almond butter", "almond milk",
-        "cashew milk", "walnut oil"
-    ],
-    "nuts": [
-        "almond", "almonds", "cashew", "cashews", "walnut", "walnuts", "pecan", "pecans",
-        "pistachio", "pistachios", "macadamia", "hazelnut", "hazelnuts", "brazil nut",
-        "pine nut", "pine nuts", "chestnut", "chestnuts", "peanut", "peanuts", "peanut butter"
-    ],
-    "soy": [
-        "soy", "soya", "soybeans", "soy sauce", "tofu", "tempeh", "edamame", "miso",
-        "soy milk", "soy protein", "soybean oil"
-    ],
-    "fish": [
-        "fish", "salmon", "tuna", "cod", "tilapia", "halibut", "mackerel", "sardines",
-        "anchovy", "anchovies", "trout", "bass", "fish sauce", "worcestershire"
-    ],
-    "shellfish": [
-        "shrimp", "prawns", "lobster", "crab", "scallops", "clams", "mussels", "oysters",
-        "crawfish", "crayfish", "shellfish"
-    ],
-    "sesame": [
-        "sesame", "sesame seeds", "sesame oil", "tahini", "hummus"
-    ]
-}
-
-
-def get_forbidden_ingredients(allergies: List[str]) -> List[str]:
-    """Get complete list of ingredients to avoid based on user allergies"""
-    forbidden = set()
-    for allergy in allergies:
-        allergy_lower = allergy.lower().strip()
-        # Add the allergy itself
-        forbidden.add(allergy_lower)
-        # Add all derivatives
-        if allergy_lower in ALLERGEN_DERIVATIVES:
-            forbidden.update(ALLERGEN_DERIVATIVES[allergy_lower])
-        # Check partial matches (e.g., "dairy allergy" should match "dairy")
-        for key, derivatives in ALLERGEN_DERIVATIVES.items():
-            if key in allergy_lower or allergy_lower in key:
-                forbidden.add(key)
-                forbidden.update(derivatives)
-    return list(forbidden)
-
-
-def contains_allergen(ingredient_name: str, forbidden_ingredients: List[str]) -> bool:
-    """Check if an ingredient contains any forbidden allergens"""
-    ingredient_lower = ingredient_name.lower()
-    for forbidden in forbidden_ingredients:
-        if forbidden in ingredient_lower or ingredient_lower in forbidden:
-            return True
-    return False
-
-
 def validate_meal_allergens(meal_data: dict, forbidden_ingredients: List[str]) -> tuple[bool, List[str]]:
     """
     Validate that a meal doesn't contain any allergens.
@@ -338,14 +255,16 @@ RULES:
         profile_dict["requested_meal_slots"] = meal_slots
         profile_json = json.dumps(profile_dict)
 
-        result = self.generate_day(
-            user_profile=profile_json,
-            plan_date=plan_date,
-            context=context + slots_instruction + allergy_warning,
-            previous_days_summary=previous_days_summary,
-            variety_seed=variety_seed,
-            target_calories=user_profile.daily_calorie_goal
-        )
+        with track_llm_call('meal_plan.day') as call, dspy.context(track_usage=True):
+            result = self.generate_day(
+                user_profile=profile_json,
+                plan_date=plan_date,
+                context=context + slots_instruction + allergy_warning,
+                previous_days_summary=previous_days_summary,
+                variety_seed=variety_seed,
+                target_calories=user_profile.daily_calorie_goal
+            )
+            call.record_dspy_usage(result)
 
         try:
             meals_data = json.loads(result.day_meals_json)
@@ -361,6 +280,7 @@ RULES:
                 else:
                     print(f"⚠️ ALLERGEN VIOLATION DETECTED in {meal_data.get('name', 'Unknown')}: {violations}")
                     print(f"   Skipping this meal and using safe fallback")
+                    record_fallback('allergen')
                     # Create a safe fallback for this meal slot
                     fallback = self._create_safe_fallback_meal(user_profile, meal_data.get('meal_slot', 'lunch'), plan_date)
                     if fallback:
@@ -418,7 +338,9 @@ RULES:
             print(f"Error parsing day meals: {e}")
             import traceback
             traceback.print_exc()
-            return self._create_fallback_day(user_profile, plan_date)
+            fallback_day = self._create_fallback_day(user_profile, plan_date)
+            record_fallback('parse_error', len(fallback_day))
+            return fallback_day
     
     def _create_fallback_day(self, user_profile: UserProfile, plan_date: str) -> List[GeneratedMeal]:
         """Create fallback meals for a day if generation fails"""
@@ -705,11 +627,13 @@ class MealPlanOrchestrator(dspy.Module):
         else:
             return ['breakfast', 'lunch', 'dinner']
 
-    def forward(self, user_profile: UserProfile, start_date: str,
-                number_of_days: int = 7, context: str = "",
-                meals_per_day: int = 3, fasting_option: str = 'none') -> Dict[str, Any]:
+    def iter_days(self, user_profile: UserProfile, start_date: str,
+                  number_of_days: int = 7, context: str = "",
+                  meals_per_day: int = 3, fasting_option: str = 'none'
+                  ) -> Iterator[Tuple[int, str, List[GeneratedMeal]]]:
+        """Generate the plan one day at a time, yielding (day_index, date, meals)
+        as soon as each day's DayMealGenerator call finishes."""
 
-        all_meals = []
         previous_days_summary = []
 
         start = datetime.strptime(start_date, '%Y-%m-%d')
@@ -752,12 +676,17 @@ class MealPlanOrchestrator(dspy.Module):
                 if meal.meal_slot in ['lunch', 'dinner']:
                     previous_days_summary.append(f"{meal.meal_slot}: {meal.name}")
             
-            all_meals.extend(day_meals)
             print(f"    Generated {len(day_meals)} meals for day {day_offset + 1}")
-
-        # Calculate summary stats
-        total_meals = len(all_meals)
-        avg_daily_calories = sum(m.nutrition.calories for m in all_meals) / number_of_days if all_meals else 0
+            yield day_offset, current_date, day_meals
+
+    def summarize(self, user_profile: UserProfile, meals: List[Dict[str, Any]],
+                  number_of_days: int) -> Tuple[str, Dict[str, int]]:
+        """Build the plan summary text and stats from the generated meal dicts"""
+        total_meals = len(meals)
+        avg_daily_calories = (
+            sum(m.get('nutrition', {}).get('calories', 0) for m in meals) / number_of_days
+            if meals else 0
+        )
 
         summary = f"Created a {number_of_days}-day meal plan with {total_meals} meals. "
         summary += f"Average daily calories: {int(avg_daily_calories)}. "
@@ -768,14 +697,37 @@ class MealPlanOrchestrator(dspy.Module):
         if user_profile.allergies:
             summary += f"Strictly avoided allergens: {', '.join(user_profile.allergies)}."
 
+        stats = {
+            'total_meals': total_meals,
+            'average_daily_calories': int(avg_daily_calories),
+            'days_planned': number_of_days
+        }
+        return summary, stats
+
+    def forward(self, user_profile: UserProfile, start_date: str,
+                number_of_days: int = 7, context: str = "",
+                meals_per_day: int = 3, fasting_option: str = 'none',
+                progress_callback: Optional[Callable[[int, int], None]] = None) -> Dict[str, Any]:
+
+        all_meals = []
+        for day_offset, _, day_meals in self.iter_days(
+            user_profile=user_profile,
+            start_date=start_date,
+            number_of_days=number_of_days,
+            context=context,
+            meals_per_day=meals_per_day,
+            fasting_option=fasting_option
+        ):
+            all_meals.extend(meal.model_dump() for meal in day_meals)
+            if progress_callback:
+                progress_callback(day_offset + 1, number_of_days)
+
+        summary, stats = self.summarize(user_profile, all_meals, number_of_days)
+
         return {
-            'meals': [meal.model_dump() for meal in all_meals],
+            'meals': all_meals,
             'summary': summary,
-            'stats': {
-                'total_meals': total_meals,
-                'average_daily_calories': int(avg_daily_calories),
-                'days_planned': number_of_days
-            }
+            'stats': stats
         }
 
 
@@ -788,49 +740,45 @@ class DSPyMealPlannerService:
 
     def __init__(self, llm_provider: Optional[str] = None):
         self.llm_provider = llm_provider or os.getenv('LLM_PROVIDER', 'openai').lower()
-        self._configure_dspy()
+        self.lm = self._configure_dspy()
         self.orchestrator = MealPlanOrchestrator()
+        self.orchestrator.set_lm(self.lm)
         print(f"DSPyMealPlannerService initialized with {self.llm_provider}")
 
-    def _configure_dspy(self):
-        """Configure DSPy with the appropriate LLM and max tokens"""
+    def _configure_dspy(self) -> dspy.LM:
+        """Build the DSPy LM with the appropriate model and max tokens.
+
+        The LM is attached to this service's modules with set_lm() rather than
+        dspy.configure(), which may only be called from one thread and would
+        also replace the LM used by other agents.
+        """
         max_tokens = int(os.getenv('DSPY_MAX_TOKENS', '2000'))
         
         if self.llm_provider == 'gemini':
             api_key = os.getenv('GOOGLE_API_KEY')
             if not api_key:
                 raise ValueError("GOOGLE_API_KEY not set")
-            lm = dspy.LM('google/gemini-1.5-flash', api_key=api_key, max_tokens=max_tokens)
+            lm = dspy_lm('google/gemini-1.5-flash', api_key=api_key, max_tokens=max_tokens)
         else:
             api_key = os.getenv('AI_INTEGRATIONS_OPENAI_API_KEY') or os.getenv('OPENAI_API_KEY')
             base_url = os.getenv('AI_INTEGRATIONS_OPENAI_BASE_URL')
             if not api_key:
                 raise ValueError("OPENAI_API_KEY not set")
             if base_url:
-                lm = dspy.LM('openai/gpt-4o-mini', api_key=api_key, api_base=base_url, max_tokens=max_tokens)
+                lm = dspy_lm('openai/gpt-4o-mini', api_key=api_key, api_base=base_url, max_tokens=max_tokens)
             else:
-                lm = dspy.LM('openai/gpt-4o-mini', api_key=api_key, max_tokens=max_tokens)
+                lm = dspy_lm('openai/gpt-4o-mini', api_key=api_key, max_tokens=max_tokens)
 
-        dspy.configure(lm=lm)
         print(f"  - Max tokens per request: {max_tokens}")
+        return lm
 
-    def generate_meal_plan(
+    def _build_user_profile(
         self,
-        user_id: str,
         messages: List[Dict],
         health_context: Dict,
-        start_date: str,
-        number_of_days: int = 7,
-        meals_per_day: int = 3,
         fasting_option: str = 'none'
-    ) -> Dict[str, Any]:
-        """Generate a complete meal plan"""
-
-        print(f"\n{'='*60}")
-        print(f"DSPy Meal Plan Generation")
-        print(f"{'='*60}")
-        print(f"User: {user_id}, Days: {number_of_days}, Start: {start_date}")
-        print(f"🍽️ Meals per day: {meals_per_day}, Fasting: {fasting_option}")
+    ) -> Tuple[UserProfile, str]:
+        """Build the UserProfile and prompt context for a plan request"""
 
         # Build user profile from health context
         allergies = health_context.get('allergies', []) or []
@@ -867,7 +815,59 @@ class DSPyMealPlannerService:
         )
 
         # Extract conversation context
-        context = preferences
+        return user_profile, preferences
+
+    def _final_allergen_check(
+        self,
+        meals: List[Dict],
+        allergies: List[str],
+        forbidden_ingredients: List[str],
+        start_date: str
+    ) -> List[Dict]:
+        """FINAL ALLERGEN VALIDATION - Critical safety check before returning meals"""
+        validated_meals = []
+        for meal_data in meals:
+            is_safe, violations = validate_meal_allergens(meal_data, forbidden_ingredients)
+            if is_safe:
+                validated_meals.append(meal_data)
+            else:
+                print(f"⚠️ FINAL CHECK: Allergen found in '{meal_data.get('name', 'Unknown')}': {violations}")
+                record_fallback('final_check')
+                # Replace with safe fallback
+                safe_meal = self._create_safe_meal(
+                    meal_data.get('meal_slot', 'lunch'),
+                    meal_data.get('plan_date', start_date),
+                    allergies
+                )
+                validated_meals.append(safe_meal)
+                print(f"✅ Replaced with safe meal: {safe_meal.get('name', 'Safe Meal')}")
+        return validated_meals
+
+    def generate_meal_plan(
+        self,
+        user_id: str,
+        messages: List[Dict],
+        health_context: Dict,
+        start_date: str,
+        number_of_days: int = 7,
+        meals_per_day: int = 3,
+        fasting_option: str = 'none',
+        progress_callback: Optional[Callable[[int, int], None]] = None
+    ) -> Dict[str, Any]:
+        """Generate a complete meal plan.
+
+        progress_callback, if given, is called as (days_done, days_total)
+        after each day is generated.
+        """
+
+        print(f"\n{'='*60}")
+        print(f"DSPy Meal Plan Generation")
+        print(f"{'='*60}")
+        print(f"User: {user_id}, Days: {number_of_days}, Start: {start_date}")
+        print(f"🍽️ Meals per day: {meals_per_day}, Fasting: {fasting_option}")
+
+        user_profile, context = self._build_user_profile(messages, health_context, fasting_option)
+        allergies = user_profile.allergies
 
         try:
             result = self.orchestrator(
@@ -876,7 +876,8 @@ class DSPyMealPlannerService:
                 number_of_days=number_of_days,
                 context=context,
                 meals_per_day=meals_per_day,
-                fasting_option=fasting_option
+                fasting_option=fasting_option,
+                progress_callback=progress_callback
             )
 
             print(f"Generated {len(result['meals'])} meals")
@@ -886,21 +887,9 @@ class DSPyMealPlannerService:
                 forbidden_ingredients = get_forbidden_ingredients(allergies)
                 print(f"🔒 Running final allergen validation with {len(forbidden_ingredients)} forbidden items")
                 
-                validated_meals = []
-                for meal_data in result['meals']:
-                    is_safe, violations = validate_meal_allergens(meal_data, forbidden_ingredients)
-                    if is_safe:
-                        validated_meals.append(meal_data)
-                    else:
-                        print(f"⚠️ FINAL CHECK: Allergen found in '{meal_data.get('name', 'Unknown')}': {violations}")
-                        # Replace with safe fallback
-                        safe_meal = self._create_safe_meal(
-                            meal_data.get('meal_slot', 'lunch'),
-                            meal_data.get('plan_date', start_date),
-                            allergies
-                        )
-                        validated_meals.append(safe_meal)
-                        print(f"✅ Replaced with safe meal: {safe_meal.get('name', 'Safe Meal')}")
+                validated_meals = self._final_allergen_check(
+                    result['meals'], allergies, forbidden_ingredients, start_date
+                )
                 
                 result['meals'] = validated_meals
                 print(f"🔒 Final validation complete: {len(validated_meals)} safe meals")
@@ -917,6 +906,66 @@ class DSPyMealPlannerService:
                 'error': str(e)
             }
 
+    def stream_meal_plan(
+        self,
+        user_id: str,
+        messages: List[Dict],
+        health_context: Dict,
+        start_date: str,
+        number_of_days: int = 7,
+        meals_per_day: int = 3,
+        fasting_option: str = 'none'
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Generate a meal plan day by day, yielding one frame per finished day.
+
+        Frames:
+        - {'type': 'day', 'day': 1, 'date': '2024-01-01', 'meals': [...]}
+          meals have already passed the final allergen validation
+        - {'type': 'summary', 'summary': '...', 'stats': {...}} once all days are done
+        - {'type': 'error', 'error': '...'} if generation fails part way
+        """
+
+        print(f"\n{'='*60}")
+        print(f"DSPy Meal Plan Generation (streaming)")
+        print(f"{'='*60}")
+        print(f"User: {user_id}, Days: {number_of_days}, Start: {start_date}")
+        print(f"🍽️ Meals per day: {meals_per_day}, Fasting: {fasting_option}")
+
+        user_profile, context = self._build_user_profile(messages, health_context, fasting_option)
+        allergies = user_profile.allergies
+        forbidden_ingredients = get_forbidden_ingredients(allergies) if allergies else []
+
+        all_meals = []
+        try:
+            for day_offset, current_date, day_meals in self.orchestrator.iter_days(
+                user_profile=user_profile,
+                start_date=start_date,
+                number_of_days=number_of_days,
+                context=context,
+                meals_per_day=meals_per_day,
+                fasting_option=fasting_option
+            ):
+                meals = [meal.model_dump() for meal in day_meals]
+                if allergies:
+                    meals = self._final_allergen_check(meals, allergies, forbidden_ingredients, start_date)
+                all_meals.extend(meals)
+                yield {
+                    'type': 'day',
+                    'day': day_offset + 1,
+                    'date': current_date,
+                    'meals': meals
+                }
+
+            summary, stats = self.orchestrator.summarize(user_profile, all_meals, number_of_days)
+            yield {'type': 'summary', 'summary': summary, 'stats': stats}
+
+        except Exception as e:
+            print(f"Error in streaming meal plan generation: {e}")
+            import traceback
+            traceback.print_exc()
+            yield {'type': 'error', 'error': str(e)}
+
     def _extract_preferences(self, messages: List[Dict]) -> str:
         """Extract user preferences from conversation messages"""
         user_messages = [
@@ -1059,6 +1108,7 @@ class DSPyMealPlannerService:
         )
 
         day_generator = DayMealGenerator()
+        day_generator.set_lm(self.lm)
         meals = day_generator(
             user_profile=user_profile,
             plan_date=plan_date,
@@ -1074,8 +1124,17 @@ class DSPyMealPlannerService:
         return meals[0].model_dump() if meals else {}
 
 
-# Create singleton instance
-dspy_meal_planner = DSPyMealPlannerService()
+def get_dspy_meal_planner() -> DSPyMealPlannerService:
+    """Shared DSPyMealPlannerService, built on first use by the agent registry"""
+    from agent_registry import registry
+    return registry.get('dspy_meal_planner')
+
+
+def __getattr__(name):
+    # Backwards-compatible lazy access to the old module-level singleton
+    if name == 'dspy_meal_planner':
+        return get_dspy_meal_planner()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 # ============================================================================
@@ -1102,7 +1161,7 @@ def test_meal_planner():
         {'role': 'user', 'content': 'I prefer Mediterranean style food'}
     ]
 
-    result = dspy_meal_planner.generate_meal_plan(
+    result = get_dspy_meal_planner().generate_meal_plan(
         user_id='test-user',
         messages=messages,
         health_context=health_context,
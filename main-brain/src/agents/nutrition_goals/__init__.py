@@ -3,7 +3,8 @@ from .nutrition_goals_agent import (
     UserPhysicalProfile,
     NutritionGoals,
     nutrition_goals_agent,
-    calculate_nutrition_goals
+    calculate_nutrition_goals,
+    calculate_nutrition_goals_batch
 )
 
 __all__ = [
@@ -11,5 +12,6 @@ __all__ = [
     'UserPhysicalProfile', 
     'NutritionGoals',
     'nutrition_goals_agent',
-    'calculate_nutrition_goals'
+    'calculate_nutrition_goals',
+    'calculate_nutrition_goals_batch'
 ]
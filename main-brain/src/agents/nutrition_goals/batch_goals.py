@@ -0,0 +1,173 @@
+"""
+Vectorized Nutrition Goals
+Location: main-brain/src/agents/nutrition_goals/batch_goals.py
+
+NumPy version of NutritionGoalsAgent.calculate_goals for many profiles at
+once (e.g. backfilling every user's goals after a formula change). Each
+step mirrors the scalar method operation for operation, in the same order
+and in float64, and int() truncation is reproduced with np.trunc, so every
+result is identical to the scalar path.
+
+String fields (sex, activity, goal, diet) are mapped to numbers once per
+distinct value; all arithmetic is done on whole columns.
+"""
+
+from typing import Any, Callable, Dict, List, Sequence, Tuple
+
+import numpy as np
+from pydantic import TypeAdapter
+
+from .nutrition_goals_agent import NutritionGoalsAgent, UserPhysicalProfile
+
+
+# Same table as NutritionGoalsAgent.calculate_water
+WATER_ACTIVITY_ADJUSTMENTS = {
+    "sedentary": 1.0,
+    "light": 1.1,
+    "moderate": 1.2,
+    "active": 1.3,
+    "very_active": 1.4
+}
+
+DIET_BALANCED, DIET_KETO, DIET_LOW_CARB = 0, 1, 2
+
+_profiles_adapter = TypeAdapter(List[UserPhysicalProfile])
+
+
+def validate_profiles(profiles_data: List[Dict[str, Any]]) -> List[UserPhysicalProfile]:
+    """Validate a whole list of profile dicts in one pydantic-core call"""
+    return _profiles_adapter.validate_python(profiles_data)
+
+
+def _factorize(values: Sequence[str]) -> Tuple[np.ndarray, List[str]]:
+    """(codes, distinct values) for a string column"""
+    index: Dict[str, int] = {}
+    codes = np.fromiter((index.setdefault(v, len(index)) for v in values), dtype=np.intp, count=len(values))
+    return codes, list(index)
+
+
+def _map(column: Tuple[np.ndarray, List[str]], fn: Callable[[str], Any], dtype=np.float64) -> np.ndarray:
+    """Apply fn once per distinct value and broadcast the results to the column"""
+    codes, distinct = column
+    return np.array([fn(value) for value in distinct], dtype=dtype)[codes]
+
+
+def _table(table: Dict[str, Any], default: Any) -> Callable[[str], Any]:
+    return lambda value: table.get(value.lower(), default)
+
+
+def _trunc_int(values: np.ndarray) -> np.ndarray:
+    """int() semantics (truncate toward zero) for a float64 column"""
+    if not np.all(np.isfinite(values)):
+        raise ValueError("cannot convert non-finite nutrition value to integer")
+    return np.trunc(values).astype(np.int64)
+
+
+def _protein_per_kg(goal: str) -> float:
+    goal = goal.lower()
+    if goal in ['muscle_gain', 'lean_gain']:
+        return 2.0
+    if goal in ['weight_loss', 'aggressive_loss']:
+        return 1.8
+    return 1.4
+
+
+def _diet_code(diet: str) -> int:
+    diet = diet.lower()
+    if diet == 'keto':
+        return DIET_KETO
+    if diet == 'low-carb':
+        return DIET_LOW_CARB
+    return DIET_BALANCED
+
+
+def calculate_goal_arrays(profiles: Sequence[UserPhysicalProfile]) -> Dict[str, np.ndarray]:
+    """All goals for a batch of profiles, one int64 column per goal"""
+    sexes = _factorize([p.sex for p in profiles])
+    activities = _factorize([p.activity_level for p in profiles])
+    goals = _factorize([p.health_goal for p in profiles])
+    diets = _factorize([p.diet_style for p in profiles])
+
+    weight = np.fromiter((p.weight_kg for p in profiles), dtype=np.float64, count=len(profiles))
+    height = np.fromiter((p.height_cm for p in profiles), dtype=np.float64, count=len(profiles))
+    age = np.fromiter((p.age for p in profiles), dtype=np.int64, count=len(profiles))
+    is_male = _map(sexes, lambda s: s.lower() in ['male', 'm'], dtype=bool)
+
+    # Step 1: BMR (Mifflin-St Jeor)
+    base = (10 * weight) + (6.25 * height) - (5 * age)
+    bmr = np.where(is_male, base + 5, base - 161)
+
+    # Step 2: TDEE
+    tdee = bmr * _map(activities, _table(NutritionGoalsAgent.ACTIVITY_MULTIPLIERS, 1.55))
+
+    # Step 3: goal adjustment (the minimum uses the goal as given, not lower-cased)
+    adjustment = _map(goals, _table(NutritionGoalsAgent.GOAL_CALORIE_ADJUSTMENTS, 0.0))
+    adjusted = tdee * (1 + adjustment)
+    min_calories = _map(goals, lambda g: 1200 if g in ['weight_loss', 'aggressive_loss'] else 1500,
+                        dtype=np.int64)
+    calorie_goal = np.maximum(_trunc_int(adjusted), min_calories)
+
+    # Step 4: macros
+    protein_per_kg = _map(goals, _protein_per_kg)
+    high_protein = _map(diets, lambda d: d.lower() == 'high-protein', dtype=bool)
+    protein_per_kg = np.where(high_protein, np.maximum(protein_per_kg, 2.0), protein_per_kg)
+    protein_g = _trunc_int(weight * protein_per_kg)
+    protein_calories = protein_g * 4
+
+    diet = _map(diets, _diet_code, dtype=np.int8)
+    fat_percent = np.select([diet == DIET_KETO, diet == DIET_LOW_CARB], [0.70, 0.35], 0.28)
+    fat_calories = calorie_goal * fat_percent
+    fat_g = _trunc_int(fat_calories / 9)
+    carbs_g = _trunc_int(((calorie_goal - protein_calories) - fat_calories) / 4)
+    carbs_g = np.where(diet == DIET_KETO, np.maximum(carbs_g, 20), carbs_g)
+    fat_g = np.maximum(fat_g, 40)
+    carbs_g = np.maximum(carbs_g, 50)
+
+    # Step 5: fiber
+    base_fiber = _trunc_int((calorie_goal / 1000) * 14)
+    fiber_g = np.maximum(base_fiber, np.where(is_male, 30, 25))
+
+    # Step 6: water
+    water_ml = _trunc_int((weight * 33) * _map(activities, _table(WATER_ACTIVITY_ADJUSTMENTS, 1.2)))
+
+    return {
+        'calorie_goal': calorie_goal,
+        'protein_goal_g': protein_g,
+        'carbs_goal_g': carbs_g,
+        'fat_goal_g': fat_g,
+        'fiber_goal_g': fiber_g,
+        'water_goal_ml': water_ml
+    }
+
+
+def _notes(health_goal: str, diet_style: str) -> str:
+    """Same notes as NutritionGoalsAgent.calculate_goals"""
+    notes = []
+    if health_goal == 'weight_loss':
+        notes.append("20% calorie deficit for sustainable weight loss (~0.5kg/week)")
+    elif health_goal == 'muscle_gain':
+        notes.append("15% calorie surplus for muscle building")
+    if diet_style == 'keto':
+        notes.append("Keto diet: High fat, very low carb (<50g)")
+    return "; ".join(notes) if notes else "Balanced nutrition based on your profile"
+
+
+def calculate_goals_batch(profiles: Sequence[UserPhysicalProfile]) -> List[Dict[str, Any]]:
+    """NutritionGoals dicts (same as calculate_goals(...).model_dump()) for each profile"""
+    if not profiles:
+        return []
+    columns = calculate_goal_arrays(profiles)
+    names = list(columns)
+    rows = zip(*(columns[name].tolist() for name in names))
+    notes_cache: Dict[tuple, str] = {}
+    results = []
+    for profile, values in zip(profiles, rows):
+        key = (profile.health_goal, profile.diet_style)
+        notes = notes_cache.get(key)
+        if notes is None:
+            notes = notes_cache[key] = _notes(*key)
+        goals = dict(zip(names, values))
+        goals['calculation_method'] = "mifflin_st_jeor"
+        goals['notes'] = notes
+        results.append(goals)
+    return results
@@ -4,7 +4,7 @@ Calculates personalized daily nutrition goals based on user profile, health goal
 Uses Mifflin-St Jeor equation for BMR and adjusts macros based on health goals.
 """
 
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 from pydantic import BaseModel, Field
 import math
 
@@ -237,23 +237,37 @@ class NutritionGoalsAgent:
             notes="; ".join(notes) if notes else "Balanced nutrition based on your profile"
         )
     
+    @staticmethod
+    def _profile_fields(profile_data: Dict[str, Any]) -> Dict[str, Any]:
+        """UserPhysicalProfile fields from API-style keys (weight/height/goal aliases)"""
+        return {
+            'age': profile_data.get('age', 30),
+            'sex': profile_data.get('sex', 'female'),
+            'weight_kg': profile_data.get('weight_kg', profile_data.get('weight', 70)),
+            'height_cm': profile_data.get('height_cm', profile_data.get('height', 165)),
+            'activity_level': profile_data.get('activity_level', 'moderate'),
+            'health_goal': profile_data.get('health_goal', profile_data.get('goal', 'maintain')),
+            'diet_style': profile_data.get('diet_style', 'balanced')
+        }
+    
+    def profile_from_dict(self, profile_data: Dict[str, Any]) -> UserPhysicalProfile:
+        return UserPhysicalProfile(**self._profile_fields(profile_data))
+    
     def calculate_from_dict(self, profile_data: Dict[str, Any]) -> Dict[str, Any]:
         """
         Convenience method to calculate goals from a dictionary.
         Useful for API endpoints.
         """
-        profile = UserPhysicalProfile(
-            age=profile_data.get('age', 30),
-            sex=profile_data.get('sex', 'female'),
-            weight_kg=profile_data.get('weight_kg', profile_data.get('weight', 70)),
-            height_cm=profile_data.get('height_cm', profile_data.get('height', 165)),
-            activity_level=profile_data.get('activity_level', 'moderate'),
-            health_goal=profile_data.get('health_goal', profile_data.get('goal', 'maintain')),
-            diet_style=profile_data.get('diet_style', 'balanced')
-        )
-        
-        goals = self.calculate_goals(profile)
+        goals = self.calculate_goals(self.profile_from_dict(profile_data))
         return goals.model_dump()
+    
+    def calculate_batch_from_dicts(self, profiles_data: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Goals for many profiles in one vectorized NumPy pass (see batch_goals.py).
+        Results are identical to calling calculate_from_dict on each profile.
+        """
+        from .batch_goals import calculate_goals_batch, validate_profiles
+        return calculate_goals_batch(validate_profiles([self._profile_fields(data) for data in profiles_data]))
 
 
 # Singleton instance for easy import
@@ -263,3 +277,8 @@ nutrition_goals_agent = NutritionGoalsAgent()
 def calculate_nutrition_goals(profile_data: Dict[str, Any]) -> Dict[str, Any]:
     """Convenience function to calculate nutrition goals from profile data"""
     return nutrition_goals_agent.calculate_from_dict(profile_data)
+
+
+def calculate_nutrition_goals_batch(profiles_data: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Convenience function to calculate nutrition goals for many profiles at once"""
+    return nutrition_goals_agent.calculate_batch_from_dicts(profiles_data)
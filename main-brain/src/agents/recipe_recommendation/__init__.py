@@ -1,18 +1,28 @@
 """
 Recipe Recommendation Agent Package
 Provides personalized recipe recommendations based on user profile and goals.
+
+dspy is only imported when the agent is first requested.
 """
 
-from .personalized_recipe_agent import (
-    personalized_recipe_agent,
-    PersonalizedRecipeAgent,
-    PersonalizedRecipe,
-    RecipeIngredient,
-    RecipeNutrition
+_LAZY_EXPORTS = (
+    'get_personalized_recipe_agent',
+    'PersonalizedRecipeAgent',
+    'PersonalizedRecipe',
+    'RecipeIngredient',
+    'RecipeNutrition'
 )
 
+
+def __getattr__(name):
+    if name in _LAZY_EXPORTS:
+        from . import personalized_recipe_agent as module
+        return getattr(module, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
 __all__ = [
-    'personalized_recipe_agent',
+    'get_personalized_recipe_agent',
     'PersonalizedRecipeAgent',
     'PersonalizedRecipe',
     'RecipeIngredient',
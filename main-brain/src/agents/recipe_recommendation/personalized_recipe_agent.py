@@ -10,6 +10,9 @@ from typing import List, Dict, Any, Optional, Tuple
 from pydantic import BaseModel, Field
 from dotenv import load_dotenv
 
+from llm_cache import dspy_lm
+from metrics import track_llm_call
+
 load_dotenv()
 
 try:
@@ -225,12 +228,14 @@ class PersonalizedRecipeAgent:
             max_tokens = int(os.getenv('DSPY_MAX_TOKENS', '2000'))
             
             if base_url:
-                lm = dspy.LM('openai/gpt-4o', api_key=api_key, api_base=base_url, max_tokens=max_tokens)
+                lm = dspy_lm('openai/gpt-4o', api_key=api_key, api_base=base_url, max_tokens=max_tokens)
             else:
-                lm = dspy.LM('openai/gpt-4o', api_key=api_key, max_tokens=max_tokens)
+                lm = dspy_lm('openai/gpt-4o', api_key=api_key, max_tokens=max_tokens)
             
-            dspy.configure(lm=lm)
+            # Per-module LM rather than dspy.configure(): configure may only be
+            # called from one thread and would replace the meal planner's LM
             self.recipe_generator = dspy.ChainOfThought(RecipeGeneratorSignature)
+            self.recipe_generator.set_lm(lm)
             self.initialized = True
             print("PersonalizedRecipeAgent initialized successfully")
         except Exception as e:
@@ -286,11 +291,13 @@ class PersonalizedRecipeAgent:
         allergies = health_context.get('allergies', [])
         
         try:
-            result = self.recipe_generator(
-                user_profile=user_profile,
-                meal_type=meal_type,
-                preferences=preferences or f"Create a delicious {meal_type} recipe"
-            )
+            with track_llm_call('personalized_recipe') as call, dspy.context(track_usage=True):
+                result = self.recipe_generator(
+                    user_profile=user_profile,
+                    meal_type=meal_type,
+                    preferences=preferences or f"Create a delicious {meal_type} recipe"
+                )
+                call.record_dspy_usage(result)
             
             import json
             
@@ -495,7 +502,17 @@ class PersonalizedRecipeAgent:
         return fallbacks.get(meal_type, fallbacks['lunch'])
 
 
-personalized_recipe_agent = PersonalizedRecipeAgent()
+def get_personalized_recipe_agent() -> PersonalizedRecipeAgent:
+    """Shared PersonalizedRecipeAgent, built on first use by the agent registry"""
+    from agent_registry import registry
+    return registry.get('personalized_recipe_agent')
+
+
+def __getattr__(name):
+    # Backwards-compatible lazy access to the old module-level singleton
+    if name == 'personalized_recipe_agent':
+        return get_personalized_recipe_agent()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def generate_personalized_recipe(
@@ -504,7 +521,7 @@ def generate_personalized_recipe(
     preferences: str = ""
 ) -> Dict[str, Any]:
     """Convenience function to generate a recipe and return as dict"""
-    recipe = personalized_recipe_agent.generate_recipe(health_context, meal_type, preferences)
+    recipe = get_personalized_recipe_agent().generate_recipe(health_context, meal_type, preferences)
     return recipe.model_dump()
 
 
@@ -513,5 +530,5 @@ def generate_personalized_recipes(
     count: int = 3
 ) -> List[Dict[str, Any]]:
     """Convenience function to generate multiple recipes"""
-    recipes = personalized_recipe_agent.generate_multiple_recipes(health_context, count)
+    recipes = get_personalized_recipe_agent().generate_multiple_recipes(health_context, count)
     return [r.model_dump() for r in recipes]
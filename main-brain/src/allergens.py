@@ -0,0 +1,215 @@
+"""
+Allergen Tables
+Location: main-brain/src/allergens.py
+
+The allergen -> derivative ingredient table and the matching helpers used to
+enforce allergies. Kept in a dependency-free module so the prefork launcher
+(serve.py) can load it, and the catalog's per-recipe allergen hits, once in
+the master process and share them with every worker copy-on-write.
+
+Allergen masks encode a set of allergen keys as a bigint (bit i =
+ALLERGEN_KEYS[i]). fetch_recipes.py stores each recipe's mask in
+recipes.allergen_mask at ingest (migrations/003_recipes_allergen_mask.sql),
+so excluding a user's allergens is one parameterized predicate,
+(r.allergen_mask & %s) = 0, instead of a LIKE scan over ingredients.
+
+Matching fails closed: a forbidden term matches an ingredient when it
+appears anywhere in the ingredient name, so compounds like "cheesecake",
+"soymilk" or "eggnog" are caught. It is one-way, so a short ingredient
+name like "oil" or "sauce" never matches a longer term such as "sesame
+oil". Known false positives ("eggplant", "butternut squash") are listed in
+SAFE_PHRASES. Changing the matching changes what stored masks mean:
+re-run fetch_recipes.py's "Recompute allergen masks" option afterwards.
+"""
+
+from functools import lru_cache
+from typing import Dict, FrozenSet, Iterable, List, Tuple
+
+
+# ============================================================================
+# ALLERGEN DERIVATIVES MAPPING - Super Strict Enforcement
+# ============================================================================
+
+ALLERGEN_DERIVATIVES = {
+    "dairy": [
+        "milk", "cheese", "yogurt", "yoghurt", "greek yogurt", "butter", "cream", "sour cream",
+        "whipped cream", "ice cream", "ghee", "paneer", "cottage cheese", "ricotta", "mozzarella",
+        "parmesan", "cheddar", "feta", "gouda", "brie", "cream cheese", "mascarpone", "custard",
+        "pudding", "whey", "casein", "lactose", "kefir", "half-and-half", "evaporated milk",
+        "condensed milk", "buttermilk", "goat cheese", "goat milk", "sheep milk"
+    ],
+    "milk": [
+        "milk", "cheese", "yogurt", "yoghurt", "greek yogurt", "butter", "cream", "sour cream",
+        "whipped cream", "ice cream", "ghee", "paneer", "cottage cheese", "ricotta", "mozzarella",
+        "parmesan", "cheddar", "feta", "gouda", "brie", "cream cheese", "mascarpone", "custard",
+        "pudding", "whey", "casein", "lactose", "kefir", "half-and-half", "evaporated milk",
+        "condensed milk", "buttermilk"
+    ],
+    "gluten": [
+        "wheat", "bread", "pasta", "flour", "barley", "rye", "couscous", "bulgur", "semolina",
+        "seitan", "breadcrumbs", "croutons", "tortilla", "pita", "naan", "bagel", "croissant",
+        "muffin", "cake", "cookie", "crackers", "soy sauce", "beer", "malt", "farro", "spelt"
+    ],
+    "wheat": [
+        "wheat", "bread", "pasta", "flour", "couscous", "bulgur", "semolina", "seitan",
+        "breadcrumbs", "croutons", "tortilla", "pita", "naan", "bagel", "croissant", "muffin"
+    ],
+    "eggs": [
+        "egg", "eggs", "egg whites", "egg yolks", "mayonnaise", "meringue", "custard",
+        "hollandaise", "aioli", "egg noodles", "french toast", "quiche", "frittata", "omelette"
+    ],
+    "peanuts": [
+        "peanut", "peanuts", "peanut butter", "peanut oil", "groundnut", "arachis oil"
+    ],
+    "tree nuts": [
+        "almond", "almonds", "cashew", "cashews", "walnut", "walnuts", "pecan", "pecans",
+        "pistachio", "pistachios", "macadamia", "hazelnut", "hazelnuts", "brazil nut",
+        "pine nut", "pine nuts", "chestnut", "chestnuts", "almond butter", "almond milk",
+        "cashew milk", "walnut oil"
+    ],
+    "nuts": [
+        "almond", "almonds", "cashew", "cashews", "walnut", "walnuts", "pecan", "pecans",
+        "pistachio", "pistachios", "macadamia", "hazelnut", "hazelnuts", "brazil nut",
+        "pine nut", "pine nuts", "chestnut", "chestnuts", "peanut", "peanuts", "peanut butter"
+    ],
+    "soy": [
+        "soy", "soya", "soybeans", "soy sauce", "tofu", "tempeh", "edamame", "miso",
+        "soy milk", "soy protein", "soybean oil"
+    ],
+    "fish": [
+        "fish", "salmon", "tuna", "cod", "tilapia", "halibut", "mackerel", "sardines",
+        "anchovy", "anchovies", "trout", "bass", "fish sauce", "worcestershire"
+    ],
+    "shellfish": [
+        "shrimp", "prawns", "lobster", "crab", "scallops", "clams", "mussels", "oysters",
+        "crawfish", "crayfish", "shellfish"
+    ],
+    "sesame": [
+        "sesame", "sesame seeds", "sesame oil", "tahini", "hummus"
+    ]
+}
+
+
+def get_forbidden_ingredients(allergies: List[str]) -> List[str]:
+    """Get complete list of ingredients to avoid based on user allergies"""
+    forbidden = set()
+    for allergy in allergies:
+        allergy_lower = allergy.lower().strip()
+        # Add the allergy itself
+        forbidden.add(allergy_lower)
+        # Add all derivatives
+        if allergy_lower in ALLERGEN_DERIVATIVES:
+            forbidden.update(ALLERGEN_DERIVATIVES[allergy_lower])
+        # Check partial matches (e.g., "dairy allergy" should match "dairy")
+        for key, derivatives in ALLERGEN_DERIVATIVES.items():
+            if key in allergy_lower or allergy_lower in key:
+                forbidden.add(key)
+                forbidden.update(derivatives)
+    return list(forbidden)
+
+
+# Ingredient names that contain a forbidden term but not the allergen. They
+# are blanked out before matching, so the rest of the name is still checked
+# ("eggplant parmesan" is still dairy). Only add phrases that can never
+# contain the allergen they spell.
+SAFE_PHRASES: Tuple[str, ...] = (
+    "eggplant", "butternut", "butterhead", "butter bean", "cocoa butter", "shea butter",
+    "apple butter", "cream of tartar", "water chestnut", "crab apple", "crabapple",
+    "custard apple"
+)
+
+
+def contains_allergen(ingredient_name: str, forbidden_ingredients: List[str]) -> bool:
+    """Check if a forbidden term appears anywhere in an ingredient name (SAFE_PHRASES aside)"""
+    ingredient_lower = ingredient_name.lower()
+    for phrase in SAFE_PHRASES:
+        if phrase in ingredient_lower:
+            ingredient_lower = ingredient_lower.replace(phrase, ' ')
+    for forbidden in forbidden_ingredients:
+        term = forbidden.lower().strip()
+        if term and term in ingredient_lower:
+            return True
+    return False
+
+
+@lru_cache(maxsize=65536)
+def ingredient_allergens(ingredient_name: str) -> FrozenSet[str]:
+    """Allergen keys matched by one ingredient name (cached: names repeat across recipes)"""
+    return frozenset(
+        allergen
+        for allergen, forbidden in FORBIDDEN_BY_ALLERGEN.items()
+        if contains_allergen(ingredient_name, forbidden)
+    )
+
+
+def allergen_matches(ingredient_names: Iterable[str]) -> Dict[str, Tuple[str, ...]]:
+    """Allergen key -> the recipe ingredients that match it"""
+    matches: Dict[str, List[str]] = {}
+    for name in ingredient_names:
+        if not name:
+            continue
+        for allergen in ingredient_allergens(name):
+            matches.setdefault(allergen, []).append(name)
+    return {allergen: tuple(names) for allergen, names in matches.items()}
+
+
+def allergen_hits(ingredient_names: Iterable[str]) -> FrozenSet[str]:
+    """Allergen keys (e.g. 'dairy') matched by any of a recipe's ingredients"""
+    return frozenset(allergen_matches(ingredient_names))
+
+
+def allergy_keys(allergy: str) -> FrozenSet[str]:
+    """Allergen keys a user's allergy refers to (same partial matching as get_forbidden_ingredients)"""
+    allergy_lower = allergy.lower().strip()
+    if not allergy_lower:
+        return frozenset()
+    return frozenset(
+        key for key in ALLERGEN_DERIVATIVES
+        if key == allergy_lower or key in allergy_lower or allergy_lower in key
+    )
+
+
+# Forbidden terms per allergen key: the key and its own derivatives only. A
+# user's allergy is widened to related keys by allergy_keys ("nuts" -> nuts,
+# peanuts, tree nuts); expanding here as well would set the peanuts bit for
+# almonds.
+FORBIDDEN_BY_ALLERGEN: Dict[str, List[str]] = {
+    allergen: [allergen, *derivatives] for allergen, derivatives in ALLERGEN_DERIVATIVES.items()
+}
+
+
+# Bit positions of allergen masks. Masks are persisted in recipes.allergen_mask,
+# so only ever append keys to ALLERGEN_DERIVATIVES (then re-run the backfill in
+# fetch_recipes.py); reordering would silently change what stored bits mean.
+ALLERGEN_KEYS: Tuple[str, ...] = tuple(ALLERGEN_DERIVATIVES)
+ALLERGEN_BITS: Dict[str, int] = {key: 1 << bit for bit, key in enumerate(ALLERGEN_KEYS)}
+
+
+def allergen_mask(allergens: Iterable[str]) -> int:
+    """Bitmask of allergen keys (unknown keys are ignored)"""
+    mask = 0
+    for allergen in allergens:
+        mask |= ALLERGEN_BITS.get(allergen, 0)
+    return mask
+
+
+def recipe_allergen_mask(ingredient_names: Iterable[str]) -> int:
+    """Mask of the allergens in a recipe's ingredients (the value stored at ingest)"""
+    return allergen_mask(allergen_hits(ingredient_names))
+
+
+def allergy_exclusions(allergies: Iterable[str]) -> Tuple[FrozenSet[str], List[str]]:
+    """
+    (allergen keys, other terms) to exclude for a user's allergies. Allergies
+    that match no allergen key (e.g. 'strawberry') can't be expressed as a
+    mask and are returned as lowercased ingredient terms.
+    """
+    keys = set()
+    terms = []
+    for allergy in allergies:
+        matched = allergy_keys(allergy or '')
+        if matched:
+            keys.update(matched)
+        elif allergy and allergy.strip():
+            terms.append(allergy.lower().strip())
+    return frozenset(keys), terms
@@ -0,0 +1,303 @@
+"""
+Async Database Access (asyncpg)
+Location: main-brain/src/async_db.py
+
+The API runs psycopg2 calls on worker_pools threads, so every request
+waiting on Postgres holds a thread, and the db pool's thread count caps how
+many requests can wait at once. This module is an asyncio path for the
+cheap read paths: an asyncpg pool whose queries are awaited on the event
+loop, so a request waiting on the database holds no thread and one worker
+can keep hundreds of them in flight. Only ASYNC_DB_POOL_MAX_SIZE of them
+hold a connection; the rest wait for one, up to DB_POOL_CHECKOUT_TIMEOUT,
+then get PoolTimeoutError (503), as with db.py.
+
+Used by (see *_async functions in user_profiles.py, recipe_cards.py,
+recipe_history.py and recipe_safety.py):
+- the user-profile load and recipe-card fetch of /api/personalize-for-cooking
+- candidate samples of /api/recommendations when the catalog is not loaded
+- /api/recommendations/{user_id}/history and /api/recipe/{id}/safety-analysis
+Event writes keep going through event_log.py's write-behind buffer; async
+handlers enqueue with event_log.record_many_async, which never blocks the
+loop.
+
+Queries are the psycopg2 ones, shared with the sync path: %s / %(name)s
+placeholders are rewritten to asyncpg's $n. Rows come back as dicts shaped
+like RealDictCursor's (uuid as str, json / jsonb decoded).
+
+listen() keeps one extra connection open for LISTEN, so a NOTIFY sent by
+any process or host (user_profiles.py's invalidations) reaches every worker.
+
+Optional: without asyncpg installed, with ASYNC_DB=0, or when the pool
+cannot start, enabled() is False and the API uses run_blocking as before.
+
+Settings (env):
+- ASYNC_DB:                       1 to use asyncpg when installed (default 1)
+- ASYNC_DB_POOL_MIN_SIZE:         connections opened at startup (default 2)
+- ASYNC_DB_POOL_MAX_SIZE:         connections per worker process (default 20)
+- ASYNC_DB_STATEMENT_CACHE_SIZE:  prepared statements per connection
+  (default 100; 0 behind a transaction-mode pgbouncer, e.g. Supabase port 6543)
+- ASYNC_DB_LISTEN_RETRY_SECONDS:  delay before reopening a lost LISTEN
+  connection (default 5)
+- DB_POOL_CHECKOUT_TIMEOUT, DB_STATEMENT_TIMEOUT_MS, DB_POOL_IDLE_TIMEOUT:
+  as for db.py
+
+Usage:
+    rows = await async_db.fetch("SELECT ... WHERE user_id = %(user_id)s", {'user_id': user_id})
+
+Metrics: async_db_connections{state}, async_db_checkout_timeouts_total.
+"""
+
+import asyncio
+import json
+import os
+import re
+import uuid
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+import metrics
+from db import DB_CONFIG, PoolTimeoutError, _columns, _relations
+
+try:
+    import asyncpg
+    DataError = asyncpg.DataError
+except ImportError:  # optional dependency
+    asyncpg = None
+
+    class DataError(Exception):
+        """Stand-in so callers can catch asyncpg.DataError without asyncpg installed"""
+
+ASYNC_DB = os.getenv('ASYNC_DB', '1') == '1'
+MIN_SIZE = int(os.getenv('ASYNC_DB_POOL_MIN_SIZE', '2'))
+MAX_SIZE = int(os.getenv('ASYNC_DB_POOL_MAX_SIZE', '20'))
+STATEMENT_CACHE_SIZE = int(os.getenv('ASYNC_DB_STATEMENT_CACHE_SIZE', '100'))
+CHECKOUT_TIMEOUT = float(os.getenv('DB_POOL_CHECKOUT_TIMEOUT', '10'))
+STATEMENT_TIMEOUT_MS = int(os.getenv('DB_STATEMENT_TIMEOUT_MS', '30000'))
+LISTEN_RETRY_SECONDS = float(os.getenv('ASYNC_DB_LISTEN_RETRY_SECONDS', '5'))
+
+# Optional-migration objects the shared query builders check (recipe_cards,
+# recipe_sampling, recipe_search); see check_objects()
+CHECKED_RELATIONS = ('recipe_cards', 'recipe_search')
+CHECKED_COLUMNS = (('recipes', 'random_key'), ('recipes', 'allergen_mask'))
+
+Params = Union[Sequence[Any], Dict[str, Any], None]
+
+_PLACEHOLDER = re.compile(r'%\((\w+)\)s|%s|%%')
+
+_pool = None
+_checked = False
+_listeners: Dict[str, Callable[[Optional[str]], None]] = {}
+_listen_task: Optional[asyncio.Task] = None
+
+
+@lru_cache(maxsize=512)
+def _convert(query: str) -> Tuple[str, Tuple[str, ...]]:
+    """(query with $n placeholders, parameter names in $n order)"""
+    names: List[str] = []
+    positional = 0
+
+    def replace(match) -> str:
+        nonlocal positional
+        if match.group(0) == '%%':
+            return '%'
+        name = match.group(1)
+        if name is None:
+            positional += 1
+            return f'${positional}'
+        if name not in names:
+            names.append(name)
+        return f'${names.index(name) + 1}'
+
+    converted = _PLACEHOLDER.sub(replace, query)
+    return converted, tuple(names)
+
+
+def _args(query: str, params: Params) -> Tuple[str, List[Any]]:
+    converted, names = _convert(query)
+    if isinstance(params, dict):
+        return converted, [params[name] for name in names]
+    return converted, list(params or ())
+
+
+def _row(record) -> Dict[str, Any]:
+    """RealDictCursor-shaped row: uuid values as str, as psycopg2 returns them"""
+    return {k: str(v) if isinstance(v, uuid.UUID) else v for k, v in record.items()}
+
+
+def _connect_args() -> Dict[str, Any]:
+    return {
+        'host': DB_CONFIG['host'],
+        'port': int(DB_CONFIG['port']),
+        'database': DB_CONFIG['database'],
+        'user': DB_CONFIG['user'],
+        'password': DB_CONFIG['password'],
+        'ssl': DB_CONFIG['sslmode']
+    }
+
+
+async def _init_connection(conn):
+    for type_name in ('json', 'jsonb'):
+        await conn.set_type_codec(type_name, encoder=json.dumps, decoder=json.loads, schema='pg_catalog')
+
+
+async def start():
+    """Open the pool (FastAPI startup, in each worker process); leaves enabled() False on failure"""
+    global _pool
+    if _pool is not None or not ASYNC_DB:
+        return
+    if asyncpg is None:
+        print("ℹ️ asyncpg not installed: database reads run on worker threads")
+        return
+    try:
+        _pool = await asyncpg.create_pool(
+            **_connect_args(),
+            min_size=min(MIN_SIZE, MAX_SIZE),
+            max_size=MAX_SIZE,
+            max_inactive_connection_lifetime=float(os.getenv('DB_POOL_IDLE_TIMEOUT', '300')),
+            max_queries=50000,
+            statement_cache_size=STATEMENT_CACHE_SIZE,
+            server_settings={'statement_timeout': str(STATEMENT_TIMEOUT_MS)},
+            init=_init_connection
+        )
+        await check_objects()
+        print(f"✅ Async database pool ready ({MIN_SIZE}-{MAX_SIZE} connections)")
+    except Exception as e:
+        print(f"⚠️ Async database pool failed to start (reads run on worker threads): {e}")
+        if _pool is not None:
+            _pool.terminate()
+        _pool = None
+
+
+async def close():
+    """Close the pool and the LISTEN connection (FastAPI shutdown)"""
+    global _pool, _listen_task
+    task, _listen_task = _listen_task, None
+    if task is not None:
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+    pool, _pool = _pool, None
+    if pool is not None:
+        await pool.close()
+
+
+def enabled() -> bool:
+    return _pool is not None
+
+
+@asynccontextmanager
+async def connection() -> AsyncIterator[Any]:
+    """Checkout from the pool, waiting up to DB_POOL_CHECKOUT_TIMEOUT (then PoolTimeoutError)"""
+    pool = _pool
+    try:
+        conn = await pool.acquire(timeout=CHECKOUT_TIMEOUT)
+    except asyncio.TimeoutError:
+        checkout_timeouts.inc()
+        raise PoolTimeoutError(CHECKOUT_TIMEOUT, MAX_SIZE)
+    try:
+        yield conn
+    finally:
+        await pool.release(conn)
+
+
+async def fetch(query: str, params: Params = None) -> List[Dict[str, Any]]:
+    """All rows of a psycopg2-style query"""
+    sql, args = _args(query, params)
+    async with connection() as conn:
+        return [_row(r) for r in await conn.fetch(sql, *args)]
+
+
+async def fetchrow(query: str, params: Params = None) -> Optional[Dict[str, Any]]:
+    """First row of a psycopg2-style query, or None"""
+    sql, args = _args(query, params)
+    async with connection() as conn:
+        row = await conn.fetchrow(sql, *args)
+    return _row(row) if row is not None else None
+
+
+async def notify(channel: str, payload: str):
+    """NOTIFY channel (delivered to listen() callbacks in every process)"""
+    await fetchrow("SELECT pg_notify(%s, %s)", (channel, payload))
+
+
+async def listen(channel: str, callback: Callable[[Optional[str]], None]):
+    """
+    Call callback(payload) on the event loop for each NOTIFY on channel.
+    callback(None) is called on every (re)connect: notifications sent while
+    the connection was down are lost, so listeners should drop what they
+    cached. No-op when the pool is not enabled.
+    """
+    global _listen_task
+    if _pool is None:
+        return
+    _listeners[channel] = callback
+    if _listen_task is not None:
+        _listen_task.cancel()
+    _listen_task = asyncio.get_running_loop().create_task(_listen_loop())
+
+
+async def _listen_loop():
+    """Hold one LISTEN connection for every registered channel, reopening it when lost"""
+    while True:
+        conn = None
+        try:
+            conn = await asyncpg.connect(**_connect_args())
+            lost = asyncio.get_running_loop().create_future()
+            conn.add_termination_listener(lambda _: lost.done() or lost.set_result(None))
+            for channel, callback in _listeners.items():
+                await conn.add_listener(channel, lambda _c, _pid, _ch, payload, cb=callback: cb(payload))
+                callback(None)
+            await lost
+            print("⚠️ LISTEN connection lost, reconnecting")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"⚠️ LISTEN connection failed: {e}")
+        finally:
+            if conn is not None and not conn.is_closed():
+                conn.terminate()
+        await asyncio.sleep(LISTEN_RETRY_SECONDS)
+
+
+async def check_objects():
+    """
+    Fill db.py's existence caches for the optional-migration objects, so
+    the shared sync query builders (cards_source, sample_ids_sql) answer
+    from the cache and never touch the cursor they are given.
+    """
+    global _checked
+    if _checked:
+        return
+    for name in CHECKED_RELATIONS:
+        if name not in _relations:
+            row = await fetchrow("SELECT to_regclass(%s) IS NOT NULL AS present", (name,))
+            _relations[name] = row['present']
+    for key in CHECKED_COLUMNS:
+        if key not in _columns:
+            row = await fetchrow("""
+                SELECT 1 FROM information_schema.columns
+                WHERE table_schema = current_schema() AND table_name = %s AND column_name = %s
+            """, key)
+            _columns[key] = row is not None
+    _checked = True
+
+
+def stats() -> Dict[str, Any]:
+    if _pool is None:
+        return {'enabled': False}
+    size, idle = _pool.get_size(), _pool.get_idle_size()
+    return {'enabled': True, 'min_size': MIN_SIZE, 'max_size': MAX_SIZE, 'in_use': size - idle, 'idle': idle}
+
+
+checkout_timeouts = metrics.counter(
+    'async_db_checkout_timeouts_total',
+    'Async checkouts that gave up waiting for a database connection'
+)
+
+metrics.register_gauge(
+    'async_db_connections', 'Open asyncpg connections, by state', ('state',),
+    lambda: {('in_use',): stats().get('in_use', 0), ('idle',): stats().get('idle', 0)}
+)
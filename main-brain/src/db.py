@@ -0,0 +1,382 @@
+"""
+Shared PostgreSQL Connection Pool
+Location: main-brain/src/db.py
+
+One process-wide pool of psycopg2 connections to Supabase, used by every
+agent instead of a fresh psycopg2.connect() (TCP + TLS handshake + auth)
+per query.
+
+- min/max sizing: up to DB_POOL_MAX_SIZE connections; idle ones beyond
+  DB_POOL_MIN_SIZE are closed after DB_POOL_IDLE_TIMEOUT seconds
+- checkout blocks while the pool is at max size, up to
+  DB_POOL_CHECKOUT_TIMEOUT seconds, then raises PoolTimeoutError
+- health checks: a connection idle for more than DB_POOL_HEALTH_CHECK_IDLE
+  seconds is pinged (SELECT 1) before it is handed out; connections are
+  recycled after DB_POOL_MAX_LIFETIME seconds, and broken ones are dropped
+- statement timeout: DB_STATEMENT_TIMEOUT_MS for every session, or a
+  per-checkout override (SET LOCAL, reset when the transaction ends)
+- fork safety: a worker forked from a process that already had connections
+  opens its own instead of sharing the parent's sockets
+
+Usage:
+    from db import connection
+
+    with connection() as conn:
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+        cur.execute(...)
+    # committed on success, rolled back on error, returned to the pool
+
+Metrics: db_pool_checkout_wait_seconds, db_pool_checkout_timeouts_total,
+db_pool_connections{state}, db_pool_waiting, db_pool_saturation.
+"""
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import psycopg2
+import psycopg2.extensions
+from dotenv import load_dotenv
+
+import metrics
+
+load_dotenv()
+
+DB_CONFIG = {
+    'host': os.getenv('SUPABASE_HOST'),
+    'port': os.getenv('SUPABASE_PORT', 5432),
+    'database': os.getenv('SUPABASE_DB', 'postgres'),
+    'user': os.getenv('SUPABASE_USER', 'postgres'),
+    'password': os.getenv('SUPABASE_PASSWORD'),
+    'sslmode': os.getenv('SUPABASE_SSLMODE', 'require')
+}
+
+
+# (table, column) / relation / extension -> exists, for objects added by optional migrations
+_columns: Dict[Tuple[str, str], bool] = {}
+_relations: Dict[str, bool] = {}
+_extensions: Dict[str, bool] = {}
+
+
+class PoolTimeoutError(Exception):
+    """Raised when no connection became free within the checkout timeout"""
+
+    def __init__(self, timeout: float, max_size: int):
+        self.timeout = timeout
+        self.max_size = max_size
+        super().__init__(f"No database connection free after {timeout:.1f}s ({max_size} in use)")
+
+
+class _PooledConnection:
+    """A connection plus the bookkeeping the pool needs"""
+
+    __slots__ = ('conn', 'created_at', 'last_used')
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+
+
+class ConnectionPool:
+    """Thread-safe psycopg2 pool with blocking, timed checkout"""
+
+    def __init__(self, dsn_kwargs: Dict[str, Any], min_size: int = 1, max_size: int = 10,
+                 checkout_timeout: float = 10.0, statement_timeout_ms: int = 30000,
+                 health_check_idle: float = 30.0, idle_timeout: float = 300.0,
+                 max_lifetime: float = 1800.0):
+        self.dsn_kwargs = dsn_kwargs
+        self.min_size = min_size
+        self.max_size = max(max_size, 1)
+        self.checkout_timeout = checkout_timeout
+        self.statement_timeout_ms = statement_timeout_ms
+        self.health_check_idle = health_check_idle
+        self.idle_timeout = idle_timeout
+        self.max_lifetime = max_lifetime
+
+        self._cond = threading.Condition()
+        self._idle: List[_PooledConnection] = []   # most recently used last
+        self._size = 0                             # open connections, idle + in use
+        self._waiting = 0
+        self._pid = os.getpid()
+        self._inherited: List[Any] = []
+        self.opened = 0
+        self.discarded = 0
+        self.timeouts = 0
+
+    # ----- connection lifecycle -----
+
+    def _connect(self) -> _PooledConnection:
+        conn = psycopg2.connect(**self.dsn_kwargs)
+        if self.statement_timeout_ms:
+            cur = conn.cursor()
+            cur.execute("SET statement_timeout = %s", (self.statement_timeout_ms,))
+            cur.close()
+            conn.commit()
+        return _PooledConnection(conn)
+
+    def _close(self, pooled: _PooledConnection):
+        try:
+            pooled.conn.close()
+        except Exception:
+            pass
+
+    def _healthy(self, pooled: _PooledConnection, now: float) -> bool:
+        if pooled.conn.closed:
+            return False
+        if now - pooled.created_at > self.max_lifetime:
+            return False
+        if now - pooled.last_used > self.health_check_idle:
+            try:
+                cur = pooled.conn.cursor()
+                cur.execute("SELECT 1")
+                cur.close()
+                pooled.conn.rollback()
+            except Exception:
+                return False
+        return True
+
+    def _check_fork(self):
+        """Called with the lock held: drop connections inherited from a parent process"""
+        if self._pid == os.getpid():
+            return
+        # Closing them would terminate the parent's sessions on the shared
+        # sockets, so keep references (no close on garbage collection) and
+        # start an empty pool
+        self._inherited.extend(p.conn for p in self._idle)
+        self._idle = []
+        self._size = 0
+        self._waiting = 0
+        self._pid = os.getpid()
+
+    def _prune(self, now: float) -> List[_PooledConnection]:
+        """Called with the lock held: remove idle connections beyond min_size that sat unused too long"""
+        expired = []
+        while len(self._idle) > self.min_size and now - self._idle[0].last_used > self.idle_timeout:
+            expired.append(self._idle.pop(0))
+        self._size -= len(expired)
+        self.discarded += len(expired)
+        return expired
+
+    # ----- checkout / checkin -----
+
+    def _checkout(self) -> _PooledConnection:
+        start = time.monotonic()
+        deadline = start + self.checkout_timeout
+        while True:
+            with self._cond:
+                self._check_fork()
+                expired = self._prune(time.monotonic())
+                pooled = None
+                create = False
+                while pooled is None and not create:
+                    if self._idle:
+                        pooled = self._idle.pop()
+                    elif self._size < self.max_size:
+                        self._size += 1
+                        create = True
+                    else:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self.timeouts += 1
+                            checkout_timeouts.inc()
+                            raise PoolTimeoutError(self.checkout_timeout, self.max_size)
+                        self._waiting += 1
+                        try:
+                            self._cond.wait(remaining)
+                        finally:
+                            self._waiting -= 1
+
+            for stale in expired:
+                self._close(stale)
+
+            if create:
+                try:
+                    pooled = self._connect()
+                except BaseException:
+                    self._release_slot()
+                    raise
+                self.opened += 1
+            elif not self._healthy(pooled, time.monotonic()):
+                self._close(pooled)
+                self._release_slot()
+                continue
+
+            checkout_wait.observe(value=time.monotonic() - start)
+            return pooled
+
+    def _release_slot(self):
+        with self._cond:
+            self._size -= 1
+            self.discarded += 1
+            self._cond.notify()
+
+    def _checkin(self, pooled: _PooledConnection, broken: bool):
+        conn = pooled.conn
+        if not broken and not conn.closed:
+            try:
+                if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except Exception:
+                broken = True
+        if broken or conn.closed:
+            self._close(pooled)
+            self._release_slot()
+            return
+        pooled.last_used = time.monotonic()
+        with self._cond:
+            if self._pid != os.getpid():
+                return
+            self._idle.append(pooled)
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self, statement_timeout: Optional[float] = None) -> Iterator[Any]:
+        """
+        Check out a connection; commit on success, roll back on error, and
+        return it to the pool. statement_timeout (seconds) overrides the
+        session default for this checkout's transaction.
+        """
+        pooled = self._checkout()
+        conn = pooled.conn
+        broken = False
+        try:
+            if statement_timeout is not None:
+                cur = conn.cursor()
+                cur.execute("SET LOCAL statement_timeout = %s", (max(int(statement_timeout * 1000), 1),))
+                cur.close()
+            yield conn
+            if not conn.closed:
+                conn.commit()
+        except BaseException as e:
+            broken = isinstance(e, (psycopg2.OperationalError, psycopg2.InterfaceError))
+            if not conn.closed:
+                try:
+                    conn.rollback()
+                except Exception:
+                    broken = True
+            raise
+        finally:
+            self._checkin(pooled, broken)
+
+    # ----- management -----
+
+    def warm(self):
+        """Open connections up to min_size (e.g. at startup)"""
+        with self._cond:
+            self._check_fork()
+            missing = max(self.min_size - self._size, 0)
+            self._size += missing
+        for opened in range(missing):
+            try:
+                pooled = self._connect()
+            except BaseException:
+                for _ in range(missing - opened):
+                    self._release_slot()
+                raise
+            self.opened += 1
+            self._checkin(pooled, broken=False)
+
+    def close_all(self):
+        """Close idle connections (e.g. in the prefork master before forking)"""
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+        for pooled in idle:
+            self._close(pooled)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            if self._pid != os.getpid():
+                in_use, idle = 0, 0
+            else:
+                idle = len(self._idle)
+                in_use = self._size - idle
+            return {
+                'min_size': self.min_size,
+                'max_size': self.max_size,
+                'in_use': in_use,
+                'idle': idle,
+                'waiting': self._waiting if self._pid == os.getpid() else 0,
+                'saturation': round(in_use / self.max_size, 3),
+                'opened': self.opened,
+                'discarded': self.discarded,
+                'timeouts': self.timeouts
+            }
+
+
+def _pool_from_env() -> ConnectionPool:
+    return ConnectionPool(
+        DB_CONFIG,
+        min_size=int(os.getenv('DB_POOL_MIN_SIZE', '1')),
+        max_size=int(os.getenv('DB_POOL_MAX_SIZE', '10')),
+        checkout_timeout=float(os.getenv('DB_POOL_CHECKOUT_TIMEOUT', '10')),
+        statement_timeout_ms=int(os.getenv('DB_STATEMENT_TIMEOUT_MS', '30000')),
+        health_check_idle=float(os.getenv('DB_POOL_HEALTH_CHECK_IDLE', '30')),
+        idle_timeout=float(os.getenv('DB_POOL_IDLE_TIMEOUT', '300')),
+        max_lifetime=float(os.getenv('DB_POOL_MAX_LIFETIME', '1800'))
+    )
+
+
+# Checkouts are usually sub-millisecond; the upper buckets show saturation
+checkout_wait = metrics.histogram(
+    'db_pool_checkout_wait_seconds',
+    'Time spent waiting for a pooled database connection',
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+)
+
+checkout_timeouts = metrics.counter(
+    'db_pool_checkout_timeouts_total',
+    'Checkouts that gave up waiting for a database connection'
+)
+
+pool = _pool_from_env()
+
+
+def connection(statement_timeout: Optional[float] = None):
+    """Context-managed checkout from the shared pool (see ConnectionPool.connection)"""
+    return pool.connection(statement_timeout)
+
+
+def has_column(cur, table: str, column: str) -> bool:
+    """Whether a column exists in the current schema (checked once per process)"""
+    key = (table, column)
+    if key not in _columns:
+        cur.execute("""
+            SELECT 1 FROM information_schema.columns
+            WHERE table_schema = current_schema() AND table_name = %s AND column_name = %s
+        """, key)
+        _columns[key] = cur.fetchone() is not None
+    return _columns[key]
+
+
+def has_relation(cur, name: str) -> bool:
+    """Whether a table or (materialized) view exists on the search path (checked once per process)"""
+    if name not in _relations:
+        cur.execute("SELECT 1 WHERE to_regclass(%s) IS NOT NULL", (name,))
+        _relations[name] = cur.fetchone() is not None
+    return _relations[name]
+
+
+def has_extension(cur, name: str) -> bool:
+    """Whether a Postgres extension (e.g. pg_trgm) is installed (checked once per process)"""
+    if name not in _extensions:
+        cur.execute("SELECT 1 FROM pg_extension WHERE extname = %s", (name,))
+        _extensions[name] = cur.fetchone() is not None
+    return _extensions[name]
+
+
+metrics.register_gauge(
+    'db_pool_connections', 'Open pooled database connections, by state', ('state',),
+    lambda: {('in_use',): pool.stats()['in_use'], ('idle',): pool.stats()['idle']}
+)
+metrics.register_gauge(
+    'db_pool_waiting', 'Threads waiting for a pooled database connection', (),
+    lambda: {(): pool.stats()['waiting']}
+)
+metrics.register_gauge(
+    'db_pool_saturation', 'Fraction of the pool max size currently in use', (),
+    lambda: {(): pool.stats()['saturation']}
+)
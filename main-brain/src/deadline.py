@@ -0,0 +1,89 @@
+"""
+Per-Request Deadlines
+Location: main-brain/src/deadline.py
+
+A Deadline is created once per request and passed down through every
+pipeline stage. Before doing expensive work a stage asks whether its
+expected cost still fits in the remaining budget; if not, it takes its
+rule-based fallback and records itself as degraded. The report is
+returned with the response so clients (and logs) can see which stages
+were skipped and why.
+
+Database work uses the remaining budget as its statement timeout, and LLM
+calls use it as their request timeout, so a single slow call cannot run
+far past the deadline either.
+
+Usage:
+    deadline = Deadline(15.0)
+    if deadline.allows('safety_validation', 6.0):
+        with deadline.stage('safety_validation'):
+            ...
+    else:
+        ...  # rule-based path
+    result['deadline'] = deadline.report()
+"""
+
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List
+
+# Floor for timeouts handed to the database / LLM client, so work that must
+# still happen after the deadline (e.g. saving events) gets a short window
+# instead of an already-expired one
+MIN_TIMEOUT_SECONDS = 1.0
+
+
+class Deadline:
+    """Time budget for one request, shared by all of its stages"""
+
+    def __init__(self, budget_seconds: float):
+        self.budget_seconds = budget_seconds
+        self._started_at = time.monotonic()
+        self._expires_at = self._started_at + budget_seconds
+        self.degraded: List[Dict[str, str]] = []
+        self.stage_seconds: Dict[str, float] = {}
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self._started_at
+
+    def remaining(self) -> float:
+        return max(self._expires_at - time.monotonic(), 0.0)
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def timeout(self) -> float:
+        """Remaining budget as a timeout for one call (never below MIN_TIMEOUT_SECONDS)"""
+        return max(self.remaining(), MIN_TIMEOUT_SECONDS)
+
+    def allows(self, stage: str, estimate_seconds: float) -> bool:
+        """Whether a stage expected to take estimate_seconds fits; records it as degraded if not"""
+        remaining = self.remaining()
+        if remaining >= estimate_seconds:
+            return True
+        self.degrade(stage, f"{remaining:.1f}s left, needs ~{estimate_seconds:.0f}s")
+        return False
+
+    def degrade(self, stage: str, reason: str):
+        """Record that a stage fell back to its rule-based path"""
+        self.degraded.append({'stage': stage, 'reason': reason})
+        print(f"⏱️ Degraded {stage}: {reason}")
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Time a stage for the report"""
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.stage_seconds[name] = round(time.monotonic() - start, 3)
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            'budget_seconds': self.budget_seconds,
+            'elapsed_seconds': round(self.elapsed(), 3),
+            'degraded_stages': [entry['stage'] for entry in self.degraded],
+            'degraded': self.degraded,
+            'stage_seconds': self.stage_seconds
+        }
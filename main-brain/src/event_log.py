@@ -0,0 +1,364 @@
+"""
+Write-Behind Recipe Event Log
+Location: main-brain/src/event_log.py
+
+Recording recipe_events (view / like / save / hide / ...) used to cost one
+INSERT per event inside the request: a feed load of 20 recommendations
+meant 20 round trips before the response went out. record() now only
+appends to an in-process buffer; a background thread writes the buffer
+with one multi-row INSERT per batch, when BATCH_SIZE events are pending or
+the oldest has waited FLUSH_INTERVAL seconds.
+
+- created_at is taken when the event is recorded, not when it is written,
+  so history order is unchanged
+- backpressure: at most MAX_PENDING events are buffered; record() then
+  blocks up to ENQUEUE_TIMEOUT seconds for the writer to catch up and
+  raises EventLogFullError if it doesn't (mapped to 503 by the API);
+  record_many_async waits the same way without blocking the event loop
+- a batch that fails on a connection problem is retried (with backoff) and
+  keeps its place at the front of the buffer; a batch rejected by the
+  database (e.g. an unknown recipe id) is retried row by row so only the
+  bad rows are dropped
+- stop() (API shutdown, and at exit) flushes everything still buffered
+
+Settings (env):
+- EVENT_LOG_BATCH_SIZE:              events per INSERT (default 200)
+- EVENT_LOG_FLUSH_INTERVAL_SECONDS:  max time an event waits (default 1.0)
+- EVENT_LOG_MAX_PENDING:             buffer bound (default 10000)
+- EVENT_LOG_ENQUEUE_TIMEOUT_SECONDS: how long record() waits when full (default 0.5)
+
+Usage:
+    from event_log import event_log
+    event_log.record_many([(user_id, recipe_id, 'view') for ...])
+
+Metrics: recipe_events_total{outcome}, recipe_events_pending,
+recipe_events_flush_seconds.
+"""
+
+import asyncio
+import atexit
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, Deque, Dict, Iterable, List, Optional, Tuple
+
+import psycopg2
+from psycopg2.extras import execute_values
+
+import metrics
+from db import PoolTimeoutError, connection
+
+VALID_EVENTS = frozenset({'like', 'hide', 'save', 'view', 'cook_now', 'share_family'})
+
+INSERT_EVENTS = """
+    INSERT INTO recipe_events (user_id, recipe_id, event, created_at)
+    VALUES %s
+    ON CONFLICT DO NOTHING
+"""
+
+# Retry delays for batches that failed on the connection, capped at the last one
+RETRY_BACKOFF_SECONDS = (0.5, 1.0, 2.0, 5.0)
+
+# How often record_many_async re-checks a full buffer
+ASYNC_POLL_SECONDS = 0.01
+
+# (user_id, recipe_id, event, created_at)
+EventRow = Tuple[str, str, str, datetime]
+
+
+class EventLogFullError(Exception):
+    """Raised when the buffer stayed full for the whole enqueue timeout"""
+
+    def __init__(self, pending: int, timeout: float):
+        self.pending = pending
+        self.timeout = timeout
+        super().__init__(f"Event log full ({pending} events pending after {timeout:.1f}s)")
+
+
+class EventLog:
+    """Bounded in-process buffer of recipe_events, written in batches by one thread"""
+
+    def __init__(self, batch_size: int = 200, flush_interval: float = 1.0,
+                 max_pending: int = 10000, enqueue_timeout: float = 0.5):
+        self.batch_size = max(batch_size, 1)
+        self.flush_interval = flush_interval
+        self.max_pending = max(max_pending, self.batch_size)
+        self.enqueue_timeout = enqueue_timeout
+
+        self._cond = threading.Condition()
+        self._pending: Deque[EventRow] = deque()
+        self._oldest_at = 0.0      # monotonic time the oldest pending event was recorded
+        self._writing = 0          # events taken by the writer but not yet written
+        self._thread: Optional[threading.Thread] = None
+        self._stop = False
+        self._pid = os.getpid()
+        self._atexit_registered = False
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
+
+    # ----- recording -----
+
+    def record(self, user_id: str, recipe_id: str, event: str, timeout: Optional[float] = None):
+        """Buffer one event (see record_many)"""
+        self.record_many([(user_id, recipe_id, event)], timeout)
+
+    def record_many(self, events: Iterable[Tuple[str, str, str]], timeout: Optional[float] = None):
+        """
+        Buffer events for the background writer. Raises ValueError for an
+        unknown event type and EventLogFullError if the buffer has no room
+        within timeout (default ENQUEUE_TIMEOUT).
+        """
+        rows = self._rows(events)
+        if not rows:
+            return
+
+        timeout = self.enqueue_timeout if timeout is None else timeout
+        give_up_at = time.monotonic() + timeout
+        with self._cond:
+            self._ensure_started()
+            # Backpressure: wait for the writer to drain below the bound
+            while not self._append(rows):
+                remaining = give_up_at - time.monotonic()
+                if remaining <= 0:
+                    events_total.inc('rejected', amount=len(rows))
+                    raise EventLogFullError(len(self._pending), timeout)
+                self._cond.notify_all()
+                self._cond.wait(remaining)
+
+    async def record_async(self, user_id: str, recipe_id: str, event: str, timeout: Optional[float] = None):
+        """Buffer one event from a coroutine (see record_many_async)"""
+        await self.record_many_async([(user_id, recipe_id, event)], timeout)
+
+    async def record_many_async(self, events: Iterable[Tuple[str, str, str]], timeout: Optional[float] = None):
+        """
+        record_many for async handlers: the lock is only taken to append, and
+        a full buffer is waited on with asyncio.sleep instead of blocking the
+        event loop. Same errors as record_many.
+        """
+        rows = self._rows(events)
+        if not rows:
+            return
+
+        timeout = self.enqueue_timeout if timeout is None else timeout
+        give_up_at = time.monotonic() + timeout
+        while True:
+            with self._cond:
+                self._ensure_started()
+                if self._append(rows):
+                    return
+                if time.monotonic() >= give_up_at:
+                    events_total.inc('rejected', amount=len(rows))
+                    raise EventLogFullError(len(self._pending), timeout)
+                self._cond.notify_all()
+            await asyncio.sleep(ASYNC_POLL_SECONDS)
+
+    def _rows(self, events: Iterable[Tuple[str, str, str]]) -> List[EventRow]:
+        now = datetime.now(timezone.utc)
+        rows: List[EventRow] = []
+        for user_id, recipe_id, event in events:
+            if event not in VALID_EVENTS:
+                raise ValueError(f"Invalid event type: {event}")
+            rows.append((str(user_id), str(recipe_id), event, now))
+        return rows
+
+    def _append(self, rows: List[EventRow]) -> bool:
+        """Called with the lock held: buffer rows if they fit under MAX_PENDING"""
+        if len(self._pending) + len(rows) > self.max_pending:
+            return False
+        if not self._pending:
+            self._oldest_at = time.monotonic()
+        self._pending.extend(rows)
+        if len(self._pending) >= self.batch_size:
+            self._cond.notify_all()
+        return True
+
+    # ----- writer -----
+
+    def _ensure_started(self):
+        """Called with the lock held: start the writer thread (again in a forked child)"""
+        if self._pid != os.getpid():
+            # The parent's thread does not exist here, and its buffer is the parent's to write
+            self._pending.clear()
+            self._writing = 0
+            self._thread = None
+            self._pid = os.getpid()
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop = False
+        self._thread = threading.Thread(target=self._writer_loop, name='recipe-event-log', daemon=True)
+        self._thread.start()
+        if not self._atexit_registered:
+            atexit.register(self.stop)
+            self._atexit_registered = True
+
+    def _take_batch(self) -> List[EventRow]:
+        """Wait until a batch is due (full, old enough, or stopping) and take it"""
+        with self._cond:
+            while True:
+                if self._pending:
+                    due_in = self._oldest_at + self.flush_interval - time.monotonic()
+                    if self._stop or len(self._pending) >= self.batch_size or due_in <= 0:
+                        break
+                    self._cond.wait(due_in)
+                elif self._stop:
+                    return []
+                else:
+                    self._cond.wait()
+            batch = [self._pending.popleft() for _ in range(min(self.batch_size, len(self._pending)))]
+            # Events left behind are no older than _oldest_at, so it stays a safe bound
+            self._writing = len(batch)
+            self._cond.notify_all()  # room for blocked record() calls
+            return batch
+
+    def _writer_loop(self):
+        failures = 0
+        while True:
+            batch = self._take_batch()
+            if not batch:
+                return
+            try:
+                self._write(batch)
+                failures = 0
+            except (psycopg2.OperationalError, psycopg2.InterfaceError, PoolTimeoutError) as e:
+                # Database unreachable: put the batch back in front and retry later
+                with self._cond:
+                    self._pending.extendleft(reversed(batch))
+                    self._writing = 0
+                    stopping = self._stop
+                delay = RETRY_BACKOFF_SECONDS[min(failures, len(RETRY_BACKOFF_SECONDS) - 1)]
+                failures += 1
+                print(f"⚠️ Event log flush failed ({len(batch)} events kept, retry in {delay}s): {e}")
+                if stopping and failures > len(RETRY_BACKOFF_SECONDS):
+                    with self._cond:
+                        lost = len(self._pending)
+                        self._pending.clear()
+                    self._drop(lost, 'database unavailable at shutdown')
+                    return
+                time.sleep(delay)
+            except Exception as e:
+                print(f"⚠️ Event batch rejected, retrying row by row: {e}")
+                self._write_rows(batch)
+            finally:
+                with self._cond:
+                    self._writing = 0
+                    self._cond.notify_all()
+
+    def _write(self, batch: List[EventRow]):
+        start = time.monotonic()
+        with connection() as conn:
+            cur = conn.cursor()
+            execute_values(cur, INSERT_EVENTS, batch, page_size=len(batch))
+            cur.close()
+        flush_seconds.observe(value=time.monotonic() - start)
+        self.batches += 1
+        self.written += len(batch)
+        events_total.inc('written', amount=len(batch))
+
+    def _write_rows(self, batch: List[EventRow]):
+        """Fallback for a rejected batch: one savepoint per row, dropping rows that fail"""
+        bad = 0
+        try:
+            with connection() as conn:
+                cur = conn.cursor()
+                for row in batch:
+                    cur.execute("SAVEPOINT event_row")
+                    try:
+                        execute_values(cur, INSERT_EVENTS, [row])
+                        cur.execute("RELEASE SAVEPOINT event_row")
+                    except psycopg2.Error:
+                        cur.execute("ROLLBACK TO SAVEPOINT event_row")
+                        bad += 1
+                cur.close()
+        except Exception as e:
+            self._drop(len(batch), f"row-by-row write failed: {e}")
+            return
+        self.written += len(batch) - bad
+        events_total.inc('written', amount=len(batch) - bad)
+        if bad:
+            self._drop(bad, 'rejected by the database')
+
+    def _drop(self, count: int, reason: str):
+        if count:
+            self.dropped += count
+            events_total.inc('dropped', amount=count)
+            print(f"❌ Dropped {count} recipe event(s): {reason}")
+
+    # ----- management -----
+
+    def flush(self, timeout: float = 10.0) -> bool:
+        """Wait until everything recorded so far is written; False on timeout"""
+        give_up_at = time.monotonic() + timeout
+        with self._cond:
+            if self._thread is None or self._pid != os.getpid():
+                return not self._pending
+            self._oldest_at = 0.0  # make the pending events due now
+            self._cond.notify_all()
+            while self._pending or self._writing:
+                remaining = give_up_at - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(min(remaining, 0.1))
+                self._oldest_at = 0.0
+        return True
+
+    def stop(self, timeout: float = 10.0):
+        """Flush what is buffered and stop the writer (shutdown)"""
+        with self._cond:
+            thread = self._thread
+            if thread is None or self._pid != os.getpid():
+                return
+            self._stop = True
+            self._cond.notify_all()
+        thread.join(timeout)
+        with self._cond:
+            left = len(self._pending)
+            self._thread = None
+        if left:
+            print(f"⚠️ Event log stopped with {left} unwritten event(s)")
+        elif self.written:
+            print(f"📝 Event log flushed ({self.written} events in {self.batches} batches)")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            pending = len(self._pending) + self._writing if self._pid == os.getpid() else 0
+        return {
+            'pending': pending,
+            'max_pending': self.max_pending,
+            'batch_size': self.batch_size,
+            'flush_interval_seconds': self.flush_interval,
+            'written': self.written,
+            'dropped': self.dropped,
+            'batches': self.batches
+        }
+
+
+def _event_log_from_env() -> EventLog:
+    return EventLog(
+        batch_size=int(os.getenv('EVENT_LOG_BATCH_SIZE', '200')),
+        flush_interval=float(os.getenv('EVENT_LOG_FLUSH_INTERVAL_SECONDS', '1.0')),
+        max_pending=int(os.getenv('EVENT_LOG_MAX_PENDING', '10000')),
+        enqueue_timeout=float(os.getenv('EVENT_LOG_ENQUEUE_TIMEOUT_SECONDS', '0.5'))
+    )
+
+
+events_total = metrics.counter(
+    'recipe_events_total',
+    'Recipe events by outcome (written, dropped by the database, rejected when the buffer was full)',
+    ('outcome',)
+)
+
+flush_seconds = metrics.histogram(
+    'recipe_events_flush_seconds',
+    'Time to write one batch of recipe events',
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+)
+
+event_log = _event_log_from_env()
+
+metrics.register_gauge(
+    'recipe_events_pending', 'Recipe events buffered and not yet written', (),
+    lambda: {(): event_log.stats()['pending']}
+)
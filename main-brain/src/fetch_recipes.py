@@ -14,7 +14,7 @@ import time
 import json
 import requests
 import psycopg2
-from psycopg2.extras import Json
+from psycopg2.extras import Json, execute_values
 from datetime import datetime
 from typing import Dict, List, Optional, Tuple
 from pathlib import Path
@@ -43,6 +43,9 @@ except ImportError:
     print("   pip install python-dotenv")
     sys.exit(1)
 
+from allergens import recipe_allergen_mask
+from db import has_column, has_relation
+
 # ============================
 # SECTION 2: CONFIGURATION
 # ============================
@@ -668,6 +671,7 @@ def upsert_ingredients(conn, recipe_id: str, meal: Dict, source: str = 'TheMealD
     
     try:
         cur.execute("DELETE FROM recipe_ingredients WHERE recipe_id = %s", (recipe_id,))
+        names = []
         
         if source == 'TheMealDB':
             # Original MealDB logic
@@ -676,6 +680,7 @@ def upsert_ingredients(conn, recipe_id: str, meal: Dict, source: str = 'TheMealD
                 measure = (meal.get(f'strMeasure{i}') or '').strip()
                 
                 if ingredient:
+                    names.append(ingredient)
                     qty, unit, grams = parse_quantity_unit(measure)
                     raw_text = f"{measure} {ingredient}".strip() if measure else ingredient
                     
@@ -698,6 +703,7 @@ def upsert_ingredients(conn, recipe_id: str, meal: Dict, source: str = 'TheMealD
             parsed = parse_edamam_ingredients(meal)
             
             for ing in parsed:
+                names.append(ing['ingredient_name'])
                 cur.execute("""
                     INSERT INTO recipe_ingredients (
                         recipe_id, position, raw, ingredient_name, 
@@ -715,6 +721,14 @@ def upsert_ingredients(conn, recipe_id: str, meal: Dict, source: str = 'TheMealD
                     None  # Edamam provides nutrition at recipe level, not ingredient
                 ))
         
+        # Allergen bitmask from the canonical derivative lists, in the same
+        # transaction as the ingredients it is computed from
+        if has_column(cur, 'recipes', 'allergen_mask'):
+            cur.execute(
+                "UPDATE recipes SET allergen_mask = %s WHERE id = %s",
+                (recipe_allergen_mask(names), recipe_id)
+            )
+        
         conn.commit()
         
     except Exception as e:
@@ -723,6 +737,83 @@ def upsert_ingredients(conn, recipe_id: str, meal: Dict, source: str = 'TheMealD
     finally:
         cur.close()
 
+# Materialized views read by the API, with the migration that creates each
+READ_VIEWS = {
+    'recipe_cards': '004_recipe_cards.sql',
+    'recipe_search': '005_recipe_search.sql'
+}
+
+def refresh_read_views(conn, views=tuple(READ_VIEWS)):
+    """Rebuild the materialized views (migrations/004, 005) from the ingested tables"""
+    cur = conn.cursor()
+    
+    try:
+        for view in views:
+            if not has_relation(cur, view):
+                print(f"⚠️  {view} view missing (run migrations/{READ_VIEWS[view]})")
+                continue
+            
+            start = time.time()
+            # CONCURRENTLY: readers keep seeing the previous rows while it rebuilds
+            cur.execute(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {view}")
+            conn.commit()
+            print(f"✅ {view} refreshed in {time.time() - start:.1f}s")
+        
+    except Exception as e:
+        conn.rollback()
+        print(f"❌ Error refreshing views: {e}")
+    finally:
+        cur.close()
+
+ALLERGEN_MASK_UPDATE = """
+    UPDATE recipes r SET allergen_mask = v.mask
+    FROM (VALUES %s) AS v(id, mask)
+    WHERE r.id = v.id
+"""
+
+def update_allergen_masks(conn, batch_size: int = 5000) -> int:
+    """
+    Recompute recipes.allergen_mask for every recipe from its ingredients
+    (backfill after migrations/003, or after ALLERGEN_DERIVATIVES changed)
+    """
+    read = conn.cursor(name='allergen_mask_backfill')  # server-side: streams the catalog
+    read.itersize = batch_size
+    write = conn.cursor()
+    updated = 0
+    
+    try:
+        read.execute("""
+            SELECT r.id, array_remove(array_agg(ri.ingredient_name), NULL)
+            FROM recipes r
+            LEFT JOIN recipe_ingredients ri ON ri.recipe_id = r.id
+            GROUP BY r.id
+        """)
+        
+        batch = []
+        for recipe_id, names in read:
+            batch.append((recipe_id, recipe_allergen_mask(names)))
+            if len(batch) >= batch_size:
+                execute_values(write, ALLERGEN_MASK_UPDATE, batch, template="(%s::uuid, %s::bigint)")
+                updated += len(batch)
+                batch = []
+                print(f"    Progress: {updated} recipes")
+        
+        if batch:
+            execute_values(write, ALLERGEN_MASK_UPDATE, batch, template="(%s::uuid, %s::bigint)")
+            updated += len(batch)
+        
+        read.close()
+        conn.commit()
+        print(f"✅ Allergen masks computed for {updated} recipes")
+        return updated
+        
+    except Exception as e:
+        conn.rollback()
+        print(f"❌ Error computing allergen masks: {e}")
+        return 0
+    finally:
+        write.close()
+
 # ============================
 # SECTION 9: MAIN FETCHING FUNCTIONS
 # ============================
@@ -773,6 +864,7 @@ def fetch_all_mealdb_recipes(with_nutrition: bool = False):
                     total_recipes += 1
         
         print(f"\n✅ Fetched {total_recipes} recipes from TheMealDB")
+        refresh_read_views(conn)
         
     except Exception as e:
         print(f"\n❌ Fatal error: {e}")
@@ -837,6 +929,7 @@ def fetch_edamam_recipes_diverse(max_per_query: int = 20):
         print("✅ EDAMAM FETCH COMPLETE!")
         print("=" * 60)
         print(f"📊 Total recipes from Edamam: {total_recipes}")
+        refresh_read_views(conn)
         
     except Exception as e:
         print(f"\n❌ Fatal error: {e}")
@@ -938,9 +1031,10 @@ if __name__ == "__main__":
     print("4. Fetch Edamam recipes (with built-in nutrition)")
     print("5. 🌟 FETCH ALL SOURCES (MealDB + Edamam)")
     print("6. Quick test (5 recipes from each source)")
+    print("7. Recompute allergen masks (after migrations/003 or allergen list changes)")
     print("=" * 60)
     
-    choice = input("\nSelect option (1-6): ").strip()
+    choice = input("\nSelect option (1-7): ").strip()
     
     if choice == "1":
         test_connection()
@@ -1008,9 +1102,17 @@ if __name__ == "__main__":
                     store_edamam_nutrition(conn, rid, recipe)
                     print(f"  ✅ {recipe['label']}")
             
+            refresh_read_views(conn)
             conn.close()
             print("\n✅ Test complete! Check your database.")
     
+    elif choice == "7":
+        if test_connection():
+            conn = get_db_connection()
+            update_allergen_masks(conn)
+            refresh_read_views(conn, views=('recipe_search',))  # carries the masks
+            conn.close()
+    
     else:
         print("❌ Invalid option")
     
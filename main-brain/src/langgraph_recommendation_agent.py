@@ -10,12 +10,12 @@ Uses LangGraph for workflow orchestration with:
 
 import os
 import json
-import psycopg2
 from psycopg2.extras import RealDictCursor
 from typing import Dict, List, Optional, TypedDict, Annotated
 from datetime import datetime
 import re
 import operator
+from functools import lru_cache
 
 from langgraph.graph import StateGraph, START, END
 from langchain_openai import ChatOpenAI
@@ -24,17 +24,17 @@ from langchain_core.messages import HumanMessage, SystemMessage
 from langchain_core.prompts import ChatPromptTemplate
 from dotenv import load_dotenv
 
+from db import connection
+from event_log import VALID_EVENTS, EventLogFullError, event_log
+from llm_cache import langchain_cache
+from metrics import timed_node, timed_query, track_llm_call
+from recipe_cards import CARD_COLUMNS, SAMPLED_CARDS_QUERY, cards_source, fetch_card
+from recipe_catalog import catalog
+from recipe_sampling import sample_ids_sql
+from user_profiles import get_user_profile
+
 load_dotenv()
 
-# Database config
-DB_CONFIG = {
-    'host': os.getenv('SUPABASE_HOST'),
-    'port': os.getenv('SUPABASE_PORT', 5432),
-    'database': os.getenv('SUPABASE_DB', 'postgres'),
-    'user': os.getenv('SUPABASE_USER', 'postgres'),
-    'password': os.getenv('SUPABASE_PASSWORD'),
-    'sslmode': os.getenv('SUPABASE_SSLMODE', 'require')
-}
 
 # ============================================
 # STATE DEFINITION
@@ -69,10 +69,14 @@ class RecipeState(TypedDict):
 # ============================================
 
 def get_llm(provider: str = None):
-    """Get the LLM based on provider configuration"""
+    """Get the LLM based on provider configuration (one shared client per provider)"""
     if provider is None:
         provider = os.getenv('LLM_PROVIDER', 'openai').lower()
+    return _build_llm(provider)
+
 
+@lru_cache(maxsize=None)
+def _build_llm(provider: str):
     if provider == 'openai':
         api_key = os.getenv('OPENAI_API_KEY')
         if not api_key:
@@ -81,7 +85,8 @@ def get_llm(provider: str = None):
             model="gpt-4o-mini",
             api_key=api_key,
             max_tokens=2000,
-            temperature=0.3
+            temperature=0.3,
+            cache=langchain_cache()
         )
 
     elif provider == 'gemini':
@@ -92,7 +97,8 @@ def get_llm(provider: str = None):
             model="gemini-1.5-flash",
             google_api_key=api_key,
             max_tokens=2000,
-            temperature=0.3
+            temperature=0.3,
+            cache=langchain_cache()
         )
 
     else:
@@ -103,32 +109,17 @@ def get_llm(provider: str = None):
 # NODE FUNCTIONS
 # ============================================
 
+@timed_node
 def load_user_profile(state: RecipeState) -> RecipeState:
     """Load user profile from database"""
     user_id = state["user_id"]
     print(f"\n[Node: load_user_profile] Loading profile for user: {user_id}")
 
     try:
-        conn = psycopg2.connect(**DB_CONFIG)
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-
-        cur.execute("""
-            SELECT
-                up.user_id, up.full_name, up.email,
-                uhp.cooking_skill, uhp.diet_style,
-                uhp.allergies, uhp.medical_conditions,
-                uhp.health_goals, uhp.daily_calorie_goal
-            FROM user_profiles up
-            LEFT JOIN user_health_profiles uhp ON up.user_id = uhp.user_id
-            WHERE up.user_id = %s
-        """, (user_id,))
-
-        profile = cur.fetchone()
-        cur.close()
-        conn.close()
-
-        if profile:
-            user_profile = dict(profile)
+        # Shared profile cache (user_profiles.py)
+        user_profile = get_user_profile(user_id)
+
+        if user_profile:
             print(f"  Loaded profile: {user_profile.get('full_name', user_profile.get('email'))}")
             return {
                 **state,
@@ -151,6 +142,7 @@ def load_user_profile(state: RecipeState) -> RecipeState:
         }
 
 
+@timed_node
 def create_filters(state: RecipeState) -> RecipeState:
     """Create dietary filters from user profile"""
     print(f"\n[Node: create_filters] Creating dietary filters")
@@ -187,6 +179,7 @@ def create_filters(state: RecipeState) -> RecipeState:
     }
 
 
+@timed_node
 def fetch_recipes(state: RecipeState) -> RecipeState:
     """Fetch diverse recipes from database (no personalization/filtering)"""
     print(f"\n[Node: fetch_recipes] Fetching diverse recipes from database")
@@ -195,38 +188,27 @@ def fetch_recipes(state: RecipeState) -> RecipeState:
         return state
 
     try:
-        conn = psycopg2.connect(**DB_CONFIG)
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-
-        # Simple query - just fetch diverse recipes, no filtering
-        query = """
-            SELECT
-                r.id, r.title, r.category, r.area as cuisine,
-                r.instructions, r.image_url, r.servings,
-                COALESCE(rn.per_serving->>'kcal', '300') as calories,
-                COALESCE(rn.per_serving->>'protein_g', '15') as protein,
-                COALESCE(rn.per_serving->>'sodium_mg', '400') as sodium,
-                COALESCE(rn.per_serving->>'sugar_g', '5') as sugar,
-                json_agg(
-                    json_build_object(
-                        'name', ri.ingredient_name,
-                        'amount', ri.measure_text
-                    ) ORDER BY ri.position
-                ) as ingredients
-            FROM recipes r
-            LEFT JOIN recipe_nutrients rn ON r.id = rn.recipe_id
-            LEFT JOIN recipe_ingredients ri ON r.id = ri.recipe_id
-            WHERE r.instructions IS NOT NULL
-            GROUP BY r.id, r.title, r.category, r.area,
-                     r.instructions, r.image_url, r.servings, rn.per_serving
-            ORDER BY RANDOM()
-            LIMIT 20
-        """
-
-        cur.execute(query)
-        recipes = cur.fetchall()
-        cur.close()
-        conn.close()
+        if catalog.loaded:
+            # Columnar in-memory snapshot, no database round trip
+            recipes = catalog.candidates(20)
+        else:
+            with connection() as conn:
+                cur = conn.cursor(cursor_factory=RealDictCursor)
+
+                # Simple query - just fetch diverse recipes, no filtering
+                # (indexed random sample, see recipe_sampling.py)
+                sample = sample_ids_sql(cur, 20)
+                query = f"""
+                    WITH sampled AS ({sample})
+                    SELECT {CARD_COLUMNS}
+                    FROM sampled s
+                    JOIN {cards_source(cur)} c ON c.id = s.id
+                """
+
+                with timed_query('recipes_filtered'):
+                    cur.execute(query)
+                recipes = cur.fetchall()
+                cur.close()
 
         recipe_list = [dict(r) for r in recipes]
         print(f"  Found {len(recipe_list)} recipes")
@@ -249,6 +231,7 @@ def fetch_recipes(state: RecipeState) -> RecipeState:
         }
 
 
+@timed_node
 def validate_safety(state: RecipeState) -> RecipeState:
     """Validate recipe safety using LLM"""
     print(f"\n[Node: validate_safety] Validating recipe safety")
@@ -308,7 +291,9 @@ Return ONLY a JSON object mapping recipe_id to safety info:
 
 Example: {{"123": {{"safe": true, "score": 90}}, "456": {{"safe": false, "score": 40}}}}"""
 
-        response = llm.invoke([HumanMessage(content=prompt)])
+        with track_llm_call('langgraph.validate_safety') as call:
+            response = llm.invoke([HumanMessage(content=prompt)])
+            call.record_langchain_usage(response)
 
         # Parse results
         try:
@@ -367,6 +352,7 @@ Example: {{"123": {{"safe": true, "score": 90}}, "456": {{"safe": false, "score"
         }
 
 
+@timed_node
 def rank_recipes(state: RecipeState) -> RecipeState:
     """Rank recipes based on user preferences and nutrition"""
     print(f"\n[Node: rank_recipes] Ranking recipes")
@@ -428,6 +414,7 @@ def rank_recipes(state: RecipeState) -> RecipeState:
     }
 
 
+@timed_node
 def adapt_recipes(state: RecipeState) -> RecipeState:
     """Adapt all top recipes in ONE batched LLM call"""
     print(f"\n[Node: adapt_recipes] Adapting recipes (batched LLM call)")
@@ -471,7 +458,9 @@ Return JSON with adaptations for each recipe:
 
 Keep substitutions brief (max 2-3 per recipe). Only suggest substitutions if needed for allergies or diet."""
 
-        response = llm.invoke([HumanMessage(content=prompt)])
+        with track_llm_call('langgraph.adapt_recipes') as call:
+            response = llm.invoke([HumanMessage(content=prompt)])
+            call.record_langchain_usage(response)
         response_text = response.content
 
         # Parse JSON response
@@ -513,6 +502,7 @@ Keep substitutions brief (max 2-3 per recipe). Only suggest substitutions if nee
         }
 
 
+@timed_node
 def parse_instructions(state: RecipeState) -> RecipeState:
     """Parse all instructions in ONE batched LLM call"""
     print(f"\n[Node: parse_instructions] Parsing instructions (batched LLM call)")
@@ -561,7 +551,9 @@ Return JSON with steps for each recipe:
 
 Keep each step concise (1 sentence). Max 8 steps per recipe."""
 
-        response = llm.invoke([HumanMessage(content=prompt)])
+        with track_llm_call('langgraph.parse_instructions') as call:
+            response = llm.invoke([HumanMessage(content=prompt)])
+            call.record_langchain_usage(response)
         response_text = response.content
 
         # Parse JSON response
@@ -622,6 +614,7 @@ Keep each step concise (1 sentence). Max 8 steps per recipe."""
         }
 
 
+@timed_node
 def save_results(state: RecipeState) -> RecipeState:
     """Save adapted recipes and events to database"""
     print(f"\n[Node: save_results] Saving results to database")
@@ -633,20 +626,8 @@ def save_results(state: RecipeState) -> RecipeState:
     recipes = state["final_recommendations"]
 
     try:
-        conn = psycopg2.connect(**DB_CONFIG)
-        cur = conn.cursor()
-
-        # Save events
-        for recipe in recipes:
-            cur.execute("""
-                INSERT INTO recipe_events (user_id, recipe_id, event, created_at)
-                VALUES (%s, %s, 'view', NOW())
-                ON CONFLICT DO NOTHING
-            """, (user_id, recipe['id']))
-
-        conn.commit()
-        cur.close()
-        conn.close()
+        # Buffered and written in batches in the background (event_log.py)
+        event_log.record_many([(user_id, recipe['id'], 'view') for recipe in recipes])
 
         print(f"  Saved {len(recipes)} recommendation events")
 
@@ -751,42 +732,30 @@ def build_recommendation_graph() -> StateGraph:
     return workflow.compile()
 
 
+@timed_node
 def fetch_recipes_simple(state: RecipeState) -> RecipeState:
     """Simplified fetch - just get diverse recipes from database"""
     print(f"\n[Node: fetch_recipes_simple] Fetching diverse recipes")
 
     try:
-        conn = psycopg2.connect(**DB_CONFIG)
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-
-        query = """
-            SELECT
-                r.id, r.title, r.category, r.area as cuisine,
-                r.instructions, r.image_url, r.servings,
-                COALESCE(rn.per_serving->>'kcal', '300') as calories,
-                COALESCE(rn.per_serving->>'protein_g', '15') as protein,
-                COALESCE(rn.per_serving->>'sodium_mg', '400') as sodium,
-                COALESCE(rn.per_serving->>'sugar_g', '5') as sugar,
-                json_agg(
-                    json_build_object(
-                        'name', ri.ingredient_name,
-                        'amount', ri.measure_text
-                    ) ORDER BY ri.position
-                ) as ingredients
-            FROM recipes r
-            LEFT JOIN recipe_nutrients rn ON r.id = rn.recipe_id
-            LEFT JOIN recipe_ingredients ri ON r.id = ri.recipe_id
-            WHERE r.instructions IS NOT NULL
-            GROUP BY r.id, r.title, r.category, r.area,
-                     r.instructions, r.image_url, r.servings, rn.per_serving
-            ORDER BY RANDOM()
-            LIMIT 20
-        """
+        if state["candidate_recipes"]:
+            # Sampled by the caller (recipe_cards.sample_cards_async on the async pool)
+            recipes = state["candidate_recipes"]
+        elif catalog.loaded:
+            # Shared in-memory snapshot (preloaded by serve.py / RECIPE_CATALOG_PRELOAD)
+            recipes = catalog.candidates(20)
+        else:
+            with connection() as conn:
+                cur = conn.cursor(cursor_factory=RealDictCursor)
 
-        cur.execute(query)
-        recipes = cur.fetchall()
-        cur.close()
-        conn.close()
+                query = SAMPLED_CARDS_QUERY.format(
+                    sample=sample_ids_sql(cur, 20), columns=CARD_COLUMNS, source=cards_source(cur)
+                )
+
+                with timed_query('recipes_browse'):
+                    cur.execute(query)
+                recipes = cur.fetchall()
+                cur.close()
 
         recipe_list = []
         for r in recipes:
@@ -841,8 +810,11 @@ class LangGraphRecipeAgent:
         except Exception as e:
             print(f"Warning: LLM initialization issue: {e}")
 
-    def get_recommendations(self, user_id: str) -> Dict:
-        """Get diverse recipe recommendations (no personalization)"""
+    def get_recommendations(self, user_id: str, candidates: Optional[List[Dict]] = None) -> Dict:
+        """
+        Get diverse recipe recommendations (no personalization).
+        candidates: recipe cards already sampled by the caller; sampled here when omitted
+        """
         print(f"\n{'='*60}")
         print(f"Recipe Recommendation Agent (Browse Mode)")
         print(f"{'='*60}")
@@ -853,7 +825,7 @@ class LangGraphRecipeAgent:
             "user_id": user_id,
             "user_profile": None,
             "filters": None,
-            "candidate_recipes": [],
+            "candidate_recipes": candidates or [],
             "validated_recipes": [],
             "ranked_recipes": [],
             "adapted_recipes": [],
@@ -896,10 +868,12 @@ class LangGraphRecipeAgent:
                 'recommendations': []
             }
 
-    def personalize_for_cooking(self, user_id: str, recipe_id: str) -> Dict:
+    def personalize_for_cooking(self, user_id: str, recipe_id: str,
+                                user_profile: Optional[Dict] = None, recipe: Optional[Dict] = None) -> Dict:
         """
         Personalize a specific recipe when user clicks 'Cook Now'
         This applies all personalization: safety validation, adaptations, substitutions
+        user_profile / recipe: already loaded by the caller (async_db read path); loaded here when omitted
         """
         print(f"\n{'='*60}")
         print(f"Personalizing Recipe for Cooking")
@@ -907,60 +881,29 @@ class LangGraphRecipeAgent:
         print(f"User: {user_id}, Recipe: {recipe_id}")
 
         try:
-            conn = psycopg2.connect(**DB_CONFIG)
-            cur = conn.cursor(cursor_factory=RealDictCursor)
-
-            # 1. Load user profile
-            cur.execute("""
-                SELECT
-                    up.user_id, up.full_name, up.email,
-                    uhp.cooking_skill, uhp.diet_style,
-                    uhp.allergies, uhp.medical_conditions,
-                    uhp.health_goals, uhp.daily_calorie_goal
-                FROM user_profiles up
-                LEFT JOIN user_health_profiles uhp ON up.user_id = uhp.user_id
-                WHERE up.user_id = %s
-            """, (user_id,))
-            profile = cur.fetchone()
-
-            if not profile:
-                return {'error': 'User profile not found', 'recipe': None}
-
-            user_profile = dict(profile)
-            print(f"  Loaded profile: {user_profile.get('full_name', 'User')}")
-
-            # 2. Load the recipe
-            cur.execute("""
-                SELECT
-                    r.id, r.title, r.category, r.area as cuisine,
-                    r.instructions, r.image_url, r.servings,
-                    COALESCE(rn.per_serving->>'kcal', '300') as calories,
-                    COALESCE(rn.per_serving->>'protein_g', '15') as protein,
-                    COALESCE(rn.per_serving->>'sodium_mg', '400') as sodium,
-                    COALESCE(rn.per_serving->>'sugar_g', '5') as sugar,
-                    json_agg(
-                        json_build_object(
-                            'name', ri.ingredient_name,
-                            'amount', ri.measure_text
-                        ) ORDER BY ri.position
-                    ) as ingredients
-                FROM recipes r
-                LEFT JOIN recipe_nutrients rn ON r.id = rn.recipe_id
-                LEFT JOIN recipe_ingredients ri ON r.id = ri.recipe_id
-                WHERE r.id = %s
-                GROUP BY r.id, r.title, r.category, r.area,
-                         r.instructions, r.image_url, r.servings, rn.per_serving
-            """, (recipe_id,))
-            recipe_row = cur.fetchone()
-
-            if not recipe_row:
-                cur.close()
-                conn.close()
-                return {'error': 'Recipe not found', 'recipe': None}
+            if user_profile is None:
+                # 1. Load user profile (user_profiles.py cache)
+                user_profile = get_user_profile(user_id)
+
+                if not user_profile:
+                    return {'error': 'User profile not found', 'recipe': None}
 
-            recipe = dict(recipe_row)
-            cur.close()
-            conn.close()
+                print(f"  Loaded profile: {user_profile.get('full_name', 'User')}")
+
+            if recipe is None:
+                with connection() as conn:
+                    cur = conn.cursor(cursor_factory=RealDictCursor)
+
+                    # 2. Load the recipe card (recipe_cards.py)
+                    with timed_query('recipe_detail'):
+                        recipe_row = fetch_card(cur, recipe_id)
+
+                    if not recipe_row:
+                        cur.close()
+                        return {'error': 'Recipe not found', 'recipe': None}
+
+                    recipe = dict(recipe_row)
+                    cur.close()
 
             # 3. Perform personalization using LLM
             llm = get_llm()
@@ -1056,7 +999,9 @@ Return ONLY a valid JSON object:
     "personalization_summary": "2-3 sentence summary of all adaptations made for this user"
 }}"""
 
-            response = llm.invoke([HumanMessage(content=prompt)])
+            with track_llm_call('langgraph.personalize_for_cooking') as call:
+                response = llm.invoke([HumanMessage(content=prompt)])
+                call.record_langchain_usage(response)
             response_text = response.content
 
             # Parse the LLM response
@@ -1161,26 +1106,18 @@ Return ONLY a valid JSON object:
     def record_feedback(self, user_id: str, recipe_id: str, event_type: str) -> bool:
         """Record user feedback on a recipe"""
         try:
-            conn = psycopg2.connect(**DB_CONFIG)
-            cur = conn.cursor()
-
-            valid_events = {'like', 'hide', 'save', 'view', 'cook_now', 'share_family'}
-            if event_type not in valid_events:
+            if event_type not in VALID_EVENTS:
                 print(f"Invalid event type: {event_type}")
                 return False
 
-            cur.execute("""
-                INSERT INTO recipe_events (user_id, recipe_id, event, created_at)
-                VALUES (%s, %s, %s, NOW())
-            """, (user_id, recipe_id, event_type))
-
-            conn.commit()
-            cur.close()
-            conn.close()
+            # Buffered and written in batches in the background (event_log.py)
+            event_log.record(user_id, recipe_id, event_type)
 
             print(f"Recorded {event_type} for recipe {recipe_id}")
             return True
 
+        except EventLogFullError:
+            raise
         except Exception as e:
             print(f"Error recording feedback: {e}")
             return False
@@ -0,0 +1,395 @@
+"""
+LLM Response Cache
+Location: main-brain/src/llm_cache.py
+
+The same prompts reach the providers over and over: validate_safety for an
+unchanged candidate set, DayMealGenerator for the same profile / date /
+seed, personalize_for_cooking for a popular recipe and a common allergy
+set. This module keeps their responses in a local SQLite database, so a
+repeated prompt is answered from disk instead of paying the provider's
+latency and tokens again.
+
+- entries are content-addressed: the key is a sha256 of the model, the
+  request parameters (credentials and endpoints excluded) and the prompt /
+  messages, so any change to the prompt or the model settings is a miss
+- the database runs in WAL mode and every worker process opens its own
+  connections (as meal_plan_jobs.py does), so all workers on a host share
+  one cache
+- entries live LLM_CACHE_TTL_SECONDS; expired entries count as misses and
+  are deleted
+- the database is kept under LLM_CACHE_MAX_MB by evicting least recently
+  used entries (checked every EVICT_EVERY writes per process)
+- a cache error (locked or unreadable database) is logged once and the
+  call goes to the provider as if the cache were empty
+
+Two adapters, imported lazily so this module needs neither library:
+- langchain_cache(): a LangChain BaseCache for ChatOpenAI /
+  ChatGoogleGenerativeAI(cache=...) in the agents' _build_llm
+- dspy_lm(model, **kwargs): a dspy.LM whose calls go through the cache
+  (dspy's own per-process request cache is turned off for it)
+
+Hits and misses are attributed to the track_llm_call call site running the
+request, else to the innermost DSPy module of the repo making it (e.g.
+dspy.DayMealGenerator). A track_llm_call answered only from the cache is
+reported with status 'cached' and without tokens or admission-control
+latency (see metrics.py).
+
+Settings (env):
+- LLM_CACHE:              1 to cache LLM responses (default 1)
+- LLM_CACHE_PATH:         SQLite path (default main-brain/data/llm_responses.db)
+- LLM_CACHE_TTL_SECONDS:  entry lifetime (default 86400)
+- LLM_CACHE_MAX_MB:       database size bound (default 256)
+
+Usage:
+    ChatOpenAI(model="gpt-4o-mini", ..., cache=langchain_cache())
+    lm = dspy_lm('openai/gpt-4o-mini', api_key=api_key, max_tokens=2000)
+
+Metrics: llm_cache_lookups_total{call_site,result}.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from functools import lru_cache
+from typing import Any, Dict, Optional
+
+import metrics
+
+DEFAULT_DB_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    'data',
+    'llm_responses.db'
+)
+
+LLM_CACHE = os.getenv('LLM_CACHE', '1') == '1'
+
+# Request parameters left out of the key: credentials and endpoints do not
+# change the response
+EXCLUDED_PARAMS = ('api_key', 'api_base', 'base_url')
+
+# Writes between two eviction passes, per process
+EVICT_EVERY = 50
+
+# last_used is only rewritten when older than this, so hot entries do not
+# turn every hit into a write
+TOUCH_INTERVAL_SECONDS = 60
+
+
+def cache_key(kind: str, model: str, request: Dict[str, Any]) -> str:
+    """Stable hash of one LLM request"""
+    canonical = json.dumps({'kind': kind, 'model': model, 'request': request},
+                           sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def _call_site() -> str:
+    """The track_llm_call site running, else the innermost app DSPy module, else 'unknown'"""
+    call_site = metrics.current_call_site.get()
+    if call_site:
+        return call_site
+    if 'dspy' in sys.modules:
+        modules = sys.modules['dspy'].settings.caller_modules or []
+        for module in reversed(modules):
+            if not type(module).__module__.startswith('dspy'):
+                return f"dspy.{type(module).__name__}"
+    return 'unknown'
+
+
+class LLMResponseCache:
+    """SQLite-backed (WAL) response cache with a TTL and a size-bounded LRU, shared by processes"""
+
+    def __init__(self, db_path: Optional[str] = None, ttl_seconds: Optional[float] = None,
+                 max_bytes: Optional[int] = None):
+        self.db_path = db_path or os.getenv('LLM_CACHE_PATH', DEFAULT_DB_PATH)
+        self.ttl_seconds = ttl_seconds or float(os.getenv('LLM_CACHE_TTL_SECONDS', '86400'))
+        self.max_bytes = max_bytes or int(float(os.getenv('LLM_CACHE_MAX_MB', '256')) * 1024 * 1024)
+
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._ready = False
+        self._warned = False
+        self._writes = 0
+        self._sites: Dict[str, Dict[str, int]] = {}
+        self._evictions = 0
+        self._errors = 0
+
+    # ============================================
+    # STORAGE
+    # ============================================
+
+    def _conn(self) -> sqlite3.Connection:
+        """One connection per thread (and per process: never reused across fork)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            if not self._ready:
+                self._init_db()
+            conn = self._connect()
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=5, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    def _init_db(self):
+        db_dir = os.path.dirname(self.db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        conn = self._connect()
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS llm_responses (
+                key TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                expires_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_llm_responses_last_used ON llm_responses (last_used);
+            CREATE INDEX IF NOT EXISTS idx_llm_responses_expires_at ON llm_responses (expires_at);
+        """)
+        conn.close()
+        self._ready = True
+
+    def _failed(self, action: str, error: Exception):
+        with self._lock:
+            self._errors += 1
+            warn, self._warned = not self._warned, True
+        if warn:
+            print(f"⚠️ LLM response cache {action} failed (calls go to the provider): {error}")
+
+    # ============================================
+    # LOOKUP / STORE
+    # ============================================
+
+    def get(self, key: str, call_site: Optional[str] = None) -> Optional[Any]:
+        """The cached value for key, or None; counted as a hit or miss for call_site"""
+        value = None
+        try:
+            conn = self._conn()
+            row = conn.execute(
+                "SELECT value, expires_at, last_used FROM llm_responses WHERE key = ?", (key,)
+            ).fetchone()
+            now = time.time()
+            if row is not None and row[1] <= now:
+                conn.execute("DELETE FROM llm_responses WHERE key = ? AND expires_at <= ?", (key, now))
+            elif row is not None:
+                value = json.loads(row[0])
+                if row[2] < now - TOUCH_INTERVAL_SECONDS:
+                    conn.execute("UPDATE llm_responses SET last_used = ? WHERE key = ?", (now, key))
+        except (sqlite3.Error, OSError, ValueError) as e:
+            self._failed('lookup', e)
+            value = None
+        self._record(call_site or _call_site(), value is not None)
+        return value
+
+    def put(self, key: str, kind: str, value: Any):
+        """Store a JSON-serializable value (others are skipped)"""
+        try:
+            text = json.dumps(value, separators=(',', ':'))
+        except (TypeError, ValueError):
+            return
+        now = time.time()
+        try:
+            self._conn().execute(
+                "INSERT OR REPLACE INTO llm_responses "
+                "(key, kind, value, size, created_at, expires_at, last_used) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, kind, text, len(text), now, now + self.ttl_seconds, now)
+            )
+        except (sqlite3.Error, OSError) as e:
+            self._failed('store', e)
+            return
+        with self._lock:
+            self._writes += 1
+            evict = self._writes % EVICT_EVERY == 0
+        if evict:
+            self.evict()
+
+    def evict(self) -> int:
+        """Delete expired entries, then least recently used ones beyond max_bytes; returns how many"""
+        try:
+            conn = self._conn()
+            deleted = conn.execute("DELETE FROM llm_responses WHERE expires_at <= ?", (time.time(),)).rowcount
+            deleted += conn.execute("""
+                DELETE FROM llm_responses WHERE key IN (
+                    SELECT key FROM (
+                        SELECT key, SUM(size) OVER (ORDER BY last_used DESC, key) AS kept
+                        FROM llm_responses
+                    ) WHERE kept > ?
+                )
+            """, (self.max_bytes,)).rowcount
+        except (sqlite3.Error, OSError) as e:
+            self._failed('eviction', e)
+            return 0
+        with self._lock:
+            self._evictions += deleted
+        return deleted
+
+    def clear(self):
+        try:
+            self._conn().execute("DELETE FROM llm_responses")
+        except (sqlite3.Error, OSError) as e:
+            self._failed('clear', e)
+
+    def _record(self, call_site: str, hit: bool):
+        result = 'hit' if hit else 'miss'
+        lookups.inc(call_site, result)
+        with self._lock:
+            site = self._sites.setdefault(call_site, {'hits': 0, 'misses': 0})
+            site['hits' if hit else 'misses'] += 1
+        call = metrics.current_llm_call.get()
+        if call is not None:
+            if hit:
+                call.cache_hits += 1
+            else:
+                call.cache_misses += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit rate per call site (this process) plus the shared database's size"""
+        with self._lock:
+            sites = {
+                name: {**counts, 'hit_rate': round(counts['hits'] / (counts['hits'] + counts['misses']), 4)}
+                for name, counts in sorted(self._sites.items())
+            }
+            hits = sum(c['hits'] for c in self._sites.values())
+            lookups_total = hits + sum(c['misses'] for c in self._sites.values())
+            stats = {
+                'enabled': LLM_CACHE,
+                'path': self.db_path,
+                'ttl_seconds': self.ttl_seconds,
+                'max_bytes': self.max_bytes,
+                'hits': hits,
+                'misses': lookups_total - hits,
+                'hit_rate': round(hits / lookups_total, 4) if lookups_total else 0.0,
+                'evictions': self._evictions,
+                'errors': self._errors,
+                'call_sites': sites
+            }
+        if LLM_CACHE:
+            try:
+                entries, size = self._conn().execute(
+                    "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_responses"
+                ).fetchone()
+                stats.update({'entries': entries, 'bytes': size})
+            except (sqlite3.Error, OSError) as e:
+                self._failed('stats', e)
+        return stats
+
+
+response_cache = LLMResponseCache()
+
+
+# ============================================
+# LANGCHAIN
+# ============================================
+
+@lru_cache(maxsize=None)
+def _langchain_cache():
+    from langchain_core.caches import BaseCache
+    from langchain_core.load import dumps, loads
+    from langchain_core.messages import AIMessage, AIMessageChunk
+    from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, Generation
+
+    allowed = [AIMessage, AIMessageChunk, ChatGeneration, ChatGenerationChunk, Generation]
+
+    class LangChainResponseCache(BaseCache):
+        """LangChain cache backed by response_cache; hits carry no token usage"""
+
+        def _key(self, prompt: str, llm_string: str) -> str:
+            return cache_key('langchain', llm_string, {'prompt': prompt})
+
+        def lookup(self, prompt: str, llm_string: str):
+            value = response_cache.get(self._key(prompt, llm_string))
+            if value is None:
+                return None
+            try:
+                generations = [loads(text, allowed_objects=allowed) for text in value]
+            except Exception as e:
+                response_cache._failed('decode', e)
+                return None
+            for generation in generations:
+                message = getattr(generation, 'message', None)
+                if message is not None:
+                    message.usage_metadata = None
+                    message.response_metadata.pop('token_usage', None)
+            return generations
+
+        def update(self, prompt: str, llm_string: str, return_val):
+            response_cache.put(self._key(prompt, llm_string), 'langchain',
+                               [dumps(generation) for generation in return_val])
+
+        def clear(self, **kwargs):
+            response_cache.clear()
+
+    return LangChainResponseCache()
+
+
+def langchain_cache():
+    """BaseCache for a LangChain chat model's cache= argument, or None when LLM_CACHE is off"""
+    return _langchain_cache() if LLM_CACHE else None
+
+
+# ============================================
+# DSPY
+# ============================================
+
+@lru_cache(maxsize=None)
+def _dspy_lm_class():
+    import asyncio
+
+    import dspy
+
+    class CachedLM(dspy.LM):
+        """dspy.LM answering repeated requests from response_cache"""
+
+        def _cache_key(self, prompt, messages, kwargs) -> str:
+            params = {k: v for k, v in {**self.kwargs, **kwargs}.items() if k not in EXCLUDED_PARAMS}
+            return cache_key('dspy', self.model, {
+                'model_type': self.model_type, 'prompt': prompt, 'messages': messages, 'params': params
+            })
+
+        def __call__(self, prompt=None, *, messages=None, **kwargs):
+            key = self._cache_key(prompt, messages, kwargs)
+            outputs = response_cache.get(key)
+            if outputs is not None:
+                return outputs
+            outputs = super().__call__(prompt, messages=messages, **kwargs)
+            if isinstance(outputs, list):
+                response_cache.put(key, 'dspy', outputs)
+            return outputs
+
+        async def acall(self, prompt=None, *, messages=None, **kwargs):
+            key = self._cache_key(prompt, messages, kwargs)
+            call_site = _call_site()
+            outputs = await asyncio.to_thread(response_cache.get, key, call_site)
+            if outputs is not None:
+                return outputs
+            outputs = await super().acall(prompt, messages=messages, **kwargs)
+            if isinstance(outputs, list):
+                await asyncio.to_thread(response_cache.put, key, 'dspy', outputs)
+            return outputs
+
+    return CachedLM
+
+
+def dspy_lm(model: str, **kwargs):
+    """dspy.LM(model, **kwargs) going through response_cache (a plain dspy.LM when LLM_CACHE is off)"""
+    if not LLM_CACHE:
+        import dspy
+        return dspy.LM(model, **kwargs)
+    return _dspy_lm_class()(model, cache=False, **kwargs)
+
+
+lookups = metrics.counter(
+    'llm_cache_lookups_total',
+    'LLM response cache lookups by call site and result (hit, miss)',
+    ('call_site', 'result')
+)
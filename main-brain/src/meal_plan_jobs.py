@@ -0,0 +1,384 @@
+"""
+Meal Plan Job Queue
+Location: main-brain/src/meal_plan_jobs.py
+
+Long meal plans (14-30 days) take minutes to generate, which is longer than
+mobile clients and proxies will hold a request open. This module runs those
+generations as background jobs:
+
+- submit() stores the request in a local SQLite database and returns a job id
+- worker threads claim queued jobs and run the meal plan generator, recording
+  progress (days done / total) after each day
+- get() / result() let the API poll status and fetch the finished plan
+
+Identical requests that are still queued or running are deduplicated onto the
+same job. Finished jobs (done or failed) are kept for MEAL_PLAN_JOB_TTL_SECONDS
+and then purged.
+
+Several processes (API workers) share the database. A claimed job records
+its owner's pid and a lease that a heartbeat thread in the owning process
+renews while the job runs. A job whose owner died (killed on reload, or by
+the worker health check) stops being renewed, and any process claims it
+again once the lease has expired; a live owner's jobs are never taken over.
+Each API worker calls start() from its startup hook, so jobs left behind by a
+restart are picked up without waiting for the next submit().
+
+Settings (env):
+- MEAL_PLAN_JOBS_DB:          SQLite path (default main-brain/data/meal_plan_jobs.db)
+- MEAL_PLAN_JOB_WORKERS:      worker threads (default 2)
+- MEAL_PLAN_JOB_TTL_SECONDS:  how long finished jobs are kept (default 3600)
+- MEAL_PLAN_JOB_LEASE_SECONDS: how long a running job survives without a
+  heartbeat from its owner (default 60)
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, Optional
+
+
+DEFAULT_DB_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    'data',
+    'meal_plan_jobs.db'
+)
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_DONE = 'done'
+JOB_FAILED = 'failed'
+
+PENDING_STATUSES = (JOB_QUEUED, JOB_RUNNING)
+FINISHED_STATUSES = (JOB_DONE, JOB_FAILED)
+
+
+def request_hash(params: Dict[str, Any]) -> str:
+    """Stable hash of a generation request, used to deduplicate pending jobs"""
+    canonical = json.dumps(params, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+class MealPlanJobQueue:
+    """SQLite-backed job queue that runs meal plan generation on worker threads"""
+
+    def __init__(
+        self,
+        run_fn: Callable[..., Dict[str, Any]],
+        db_path: Optional[str] = None,
+        workers: Optional[int] = None,
+        ttl_seconds: Optional[int] = None,
+        lease_seconds: Optional[float] = None
+    ):
+        """
+        Args:
+            run_fn: generator to call for each job, e.g.
+                DSPyMealPlannerService.generate_meal_plan. It is called with the
+                submitted params plus a progress_callback(days_done, days_total).
+        """
+        self.run_fn = run_fn
+        self.db_path = db_path or os.getenv('MEAL_PLAN_JOBS_DB', DEFAULT_DB_PATH)
+        self.workers = workers or int(os.getenv('MEAL_PLAN_JOB_WORKERS', '2'))
+        self.ttl_seconds = ttl_seconds or int(os.getenv('MEAL_PLAN_JOB_TTL_SECONDS', '3600'))
+        self.lease_seconds = lease_seconds or float(os.getenv('MEAL_PLAN_JOB_LEASE_SECONDS', '60'))
+
+        self._local = threading.local()
+        self._wakeup = threading.Condition()
+        self._stop = threading.Event()
+        self._threads = []
+        self._running = set()  # ids of the jobs this process is running
+        self._running_lock = threading.Lock()
+        self._started = False
+        self._start_lock = threading.Lock()
+
+        db_dir = os.path.dirname(self.db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self._init_db()
+
+    # ============================================
+    # STORAGE
+    # ============================================
+
+    def _conn(self) -> sqlite3.Connection:
+        """One connection per thread (and per process: never reused across fork)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _init_db(self):
+        conn = self._conn()
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS meal_plan_jobs (
+                id TEXT PRIMARY KEY,
+                request_hash TEXT NOT NULL,
+                user_id TEXT,
+                status TEXT NOT NULL,
+                params TEXT NOT NULL,
+                days_done INTEGER NOT NULL DEFAULT 0,
+                days_total INTEGER NOT NULL DEFAULT 0,
+                result TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                finished_at REAL,
+                owner_pid INTEGER,
+                lease_expires_at REAL
+            );
+            CREATE INDEX IF NOT EXISTS idx_meal_plan_jobs_hash_status
+                ON meal_plan_jobs (request_hash, status);
+            CREATE INDEX IF NOT EXISTS idx_meal_plan_jobs_status_created
+                ON meal_plan_jobs (status, created_at);
+        """)
+        # Databases created before leases existed
+        columns = {row['name'] for row in conn.execute("PRAGMA table_info(meal_plan_jobs)")}
+        for column, column_type in (('owner_pid', 'INTEGER'), ('lease_expires_at', 'REAL')):
+            if column not in columns:
+                conn.execute(f"ALTER TABLE meal_plan_jobs ADD COLUMN {column} {column_type}")
+
+    def _row_to_job(self, row: sqlite3.Row) -> Dict[str, Any]:
+        return {
+            'job_id': row['id'],
+            'user_id': row['user_id'],
+            'status': row['status'],
+            'progress': {
+                'days_done': row['days_done'],
+                'days_total': row['days_total']
+            },
+            'error': row['error'],
+            'created_at': row['created_at'],
+            'updated_at': row['updated_at'],
+            'finished_at': row['finished_at']
+        }
+
+    def purge_expired(self) -> int:
+        """Delete finished jobs older than the TTL"""
+        cutoff = time.time() - self.ttl_seconds
+        return self._conn().execute(
+            "DELETE FROM meal_plan_jobs WHERE status IN (?, ?) AND finished_at < ?",
+            (*FINISHED_STATUSES, cutoff)
+        ).rowcount
+
+    # ============================================
+    # PUBLIC API
+    # ============================================
+
+    def submit(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Queue a generation, or attach to an identical pending job.
+
+        Returns the job dict plus 'deduplicated': True when an existing job
+        was reused.
+        """
+        self.start()
+        digest = request_hash(params)
+        now = time.time()
+        conn = self._conn()
+
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute(
+                "SELECT * FROM meal_plan_jobs WHERE request_hash = ? AND status IN (?, ?) "
+                "ORDER BY created_at LIMIT 1",
+                (digest, *PENDING_STATUSES)
+            ).fetchone()
+            if row is None:
+                job_id = str(uuid.uuid4())
+                conn.execute(
+                    "INSERT INTO meal_plan_jobs "
+                    "(id, request_hash, user_id, status, params, days_total, created_at, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        job_id, digest, params.get('user_id'), JOB_QUEUED,
+                        json.dumps(params, default=str),
+                        int(params.get('number_of_days') or 0), now, now
+                    )
+                )
+                row = conn.execute("SELECT * FROM meal_plan_jobs WHERE id = ?", (job_id,)).fetchone()
+                deduplicated = False
+            else:
+                deduplicated = True
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+        if not deduplicated:
+            with self._wakeup:
+                self._wakeup.notify()
+
+        job = self._row_to_job(row)
+        job['deduplicated'] = deduplicated
+        return job
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Job status and progress, or None if unknown or expired"""
+        row = self._conn().execute("SELECT * FROM meal_plan_jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None or self._is_expired(row):
+            return None
+        return self._row_to_job(row)
+
+    def result(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """The generator's result dict for a finished job, or None if not done"""
+        row = self._conn().execute(
+            "SELECT status, result, finished_at FROM meal_plan_jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+        if row is None or row['status'] != JOB_DONE or self._is_expired(row):
+            return None
+        return json.loads(row['result'])
+
+    def _is_expired(self, row: sqlite3.Row) -> bool:
+        finished_at = row['finished_at']
+        return finished_at is not None and finished_at < time.time() - self.ttl_seconds
+
+    # ============================================
+    # WORKERS
+    # ============================================
+
+    def start(self):
+        """Start worker threads (idempotent)"""
+        with self._start_lock:
+            if self._started:
+                return
+            self._stop.clear()
+            for i in range(self.workers):
+                thread = threading.Thread(
+                    target=self._worker_loop,
+                    name=f"meal-plan-job-{i}",
+                    daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+            heartbeat = threading.Thread(target=self._heartbeat_loop, name="meal-plan-job-heartbeat", daemon=True)
+            heartbeat.start()
+            self._threads.append(heartbeat)
+            self._started = True
+            print(f"🧵 Meal plan job queue started with {self.workers} worker(s) at {self.db_path}")
+
+    def stop(self, timeout: float = 5.0):
+        """Ask workers to exit after their current job"""
+        self._stop.set()
+        with self._wakeup:
+            self._wakeup.notify_all()
+        for thread in self._threads:
+            thread.join(timeout=timeout)
+        self._threads = []
+        self._started = False
+
+    def _claim(self) -> Optional[sqlite3.Row]:
+        """
+        Atomically take the oldest queued job, or a running job whose owner's
+        lease has expired, and lease it to this process
+        """
+        conn = self._conn()
+        now = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute(
+                "SELECT * FROM meal_plan_jobs WHERE status = ? "
+                "OR (status = ? AND (lease_expires_at IS NULL OR lease_expires_at < ?)) "
+                "ORDER BY created_at LIMIT 1",
+                (JOB_QUEUED, JOB_RUNNING, now)
+            ).fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE meal_plan_jobs SET status = ?, days_done = 0, owner_pid = ?, "
+                    "lease_expires_at = ?, updated_at = ? WHERE id = ?",
+                    (JOB_RUNNING, os.getpid(), now + self.lease_seconds, now, row['id'])
+                )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        if row is not None and row['status'] == JOB_RUNNING:
+            print(f"🔁 Reclaimed meal plan job {row['id']} from expired owner pid {row['owner_pid']}")
+        return row
+
+    def _renew_leases(self) -> int:
+        """Extend the lease of every job this process is running; returns how many"""
+        with self._running_lock:
+            job_ids = list(self._running)
+        if not job_ids:
+            return 0
+        return self._conn().execute(
+            f"UPDATE meal_plan_jobs SET lease_expires_at = ? "
+            f"WHERE status = ? AND owner_pid = ? AND id IN ({', '.join('?' * len(job_ids))})",
+            (time.time() + self.lease_seconds, JOB_RUNNING, os.getpid(), *job_ids)
+        ).rowcount
+
+    def _update_progress(self, job_id: str, days_done: int, days_total: int):
+        self._conn().execute(
+            "UPDATE meal_plan_jobs SET days_done = ?, days_total = ?, updated_at = ? "
+            "WHERE id = ? AND owner_pid = ?",
+            (days_done, days_total, time.time(), job_id, os.getpid())
+        )
+
+    def _finish(self, job_id: str, status: str, result: Optional[Dict] = None, error: Optional[str] = None):
+        """Record the outcome, unless another process reclaimed the job meanwhile"""
+        now = time.time()
+        self._conn().execute(
+            "UPDATE meal_plan_jobs SET status = ?, result = ?, error = ?, updated_at = ?, finished_at = ?, "
+            "lease_expires_at = NULL WHERE id = ? AND status = ? AND owner_pid = ?",
+            (status, json.dumps(result, default=str) if result is not None else None, error, now, now,
+             job_id, JOB_RUNNING, os.getpid())
+        )
+
+    def _run_job(self, row: sqlite3.Row):
+        job_id = row['id']
+        params = json.loads(row['params'])
+        print(f"▶️ Running meal plan job {job_id} ({params.get('number_of_days')} days)")
+        with self._running_lock:
+            self._running.add(job_id)
+        try:
+            result = self.run_fn(
+                **params,
+                progress_callback=lambda done, total: self._update_progress(job_id, done, total)
+            )
+            if result.get('error'):
+                self._finish(job_id, JOB_FAILED, error=result['error'])
+            else:
+                self._finish(job_id, JOB_DONE, result=result)
+            print(f"✅ Meal plan job {job_id} finished")
+        except Exception as e:
+            print(f"❌ Meal plan job {job_id} failed: {e}")
+            self._finish(job_id, JOB_FAILED, error=str(e))
+        finally:
+            with self._running_lock:
+                self._running.discard(job_id)
+
+    def _heartbeat_loop(self):
+        """Renew this process's leases a few times per lease period"""
+        while not self._stop.wait(self.lease_seconds / 3):
+            try:
+                self._renew_leases()
+            except Exception as e:
+                print(f"Meal plan job heartbeat error: {e}")
+
+    def _worker_loop(self):
+        last_purge = 0.0
+        while not self._stop.is_set():
+            try:
+                if time.time() - last_purge > 60:
+                    purged = self.purge_expired()
+                    if purged:
+                        print(f"🧹 Purged {purged} expired meal plan job(s)")
+                    last_purge = time.time()
+
+                row = self._claim()
+                if row is None:
+                    with self._wakeup:
+                        self._wakeup.wait(timeout=1.0)
+                    continue
+                self._run_job(row)
+            except Exception as e:
+                print(f"Meal plan job worker error: {e}")
+                time.sleep(1.0)
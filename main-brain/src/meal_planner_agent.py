@@ -7,33 +7,41 @@ import os
 import json
 import re
 from datetime import datetime, timedelta
+from functools import lru_cache
 from typing import Dict, List, Optional, Any
 from dotenv import load_dotenv
 
-import psycopg2
 from psycopg2.extras import RealDictCursor
 
 from langchain_openai import ChatOpenAI
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.messages import HumanMessage, SystemMessage
 
+from db import connection
+from llm_cache import langchain_cache
+from metrics import timed_query, track_llm_call
+from recipe_cards import cards_source
+from recipe_catalog import catalog
+from recipe_sampling import sample_ids_sql
+from user_profiles import get_user_profile
+
 # Load environment variables
 load_dotenv()
 
-# Database configuration
-DB_CONFIG = {
-    'host': os.getenv('SUPABASE_HOST'),
-    'port': os.getenv('SUPABASE_PORT', '5432'),
-    'database': os.getenv('SUPABASE_DB', 'postgres'),
-    'user': os.getenv('SUPABASE_USER', 'postgres'),
-    'password': os.getenv('SUPABASE_PASSWORD')
-}
+# Recipe fields the planner uses (same columns as the get_available_recipes query)
+MEAL_PLANNER_FIELDS = ('id', 'title', 'category', 'cuisine', 'image_url', 'servings',
+                       'calories', 'protein', 'carbs', 'fat')
+
 
 
 def get_llm(provider: str = None):
-    """Get the configured LLM instance"""
+    """Get the configured LLM instance (one shared client per provider)"""
     provider = provider or os.getenv('LLM_PROVIDER', 'openai').lower()
+    return _build_llm(provider)
+
 
+@lru_cache(maxsize=None)
+def _build_llm(provider: str):
     if provider == 'gemini':
         api_key = os.getenv('GOOGLE_API_KEY')
         if not api_key:
@@ -41,7 +49,8 @@ def get_llm(provider: str = None):
         return ChatGoogleGenerativeAI(
             model="gemini-1.5-flash",
             google_api_key=api_key,
-            temperature=0.7
+            temperature=0.7,
+            cache=langchain_cache()
         )
     else:
         api_key = os.getenv('OPENAI_API_KEY')
@@ -50,7 +59,8 @@ def get_llm(provider: str = None):
         return ChatOpenAI(
             model="gpt-4o-mini",
             api_key=api_key,
-            temperature=0.7
+            temperature=0.7,
+            cache=langchain_cache()
         )
 
 
@@ -67,27 +77,9 @@ class MealPlannerAgent:
             self.llm = None
 
     def get_user_profile(self, user_id: str) -> Optional[Dict]:
-        """Load user profile from database"""
+        """Load user profile (shared cache, user_profiles.py)"""
         try:
-            conn = psycopg2.connect(**DB_CONFIG)
-            cur = conn.cursor(cursor_factory=RealDictCursor)
-
-            cur.execute("""
-                SELECT
-                    up.user_id, up.full_name,
-                    uhp.cooking_skill, uhp.diet_style,
-                    uhp.allergies, uhp.medical_conditions,
-                    uhp.health_goals, uhp.daily_calorie_goal
-                FROM user_profiles up
-                LEFT JOIN user_health_profiles uhp ON up.user_id = uhp.user_id
-                WHERE up.user_id = %s
-            """, (user_id,))
-
-            profile = cur.fetchone()
-            cur.close()
-            conn.close()
-
-            return dict(profile) if profile else None
+            return get_user_profile(user_id)
         except Exception as e:
             print(f"Error loading user profile: {e}")
             return None
@@ -95,28 +87,35 @@ class MealPlannerAgent:
     def get_available_recipes(self, filters: Dict = None, limit: int = 50) -> List[Dict]:
         """Get recipes from database with optional filtering"""
         try:
-            conn = psycopg2.connect(**DB_CONFIG)
-            cur = conn.cursor(cursor_factory=RealDictCursor)
-
-            query = """
-                SELECT
-                    r.id, r.title, r.category, r.area as cuisine,
-                    r.image_url, r.servings,
-                    COALESCE(rn.per_serving->>'kcal', '400') as calories,
-                    COALESCE(rn.per_serving->>'protein_g', '20') as protein,
-                    COALESCE(rn.per_serving->>'carbs_g', '40') as carbs,
-                    COALESCE(rn.per_serving->>'fat_g', '15') as fat
-                FROM recipes r
-                LEFT JOIN recipe_nutrients rn ON r.id = rn.recipe_id
-                WHERE r.instructions IS NOT NULL
-                ORDER BY RANDOM()
-                LIMIT %s
-            """
-
-            cur.execute(query, (limit,))
-            recipes = cur.fetchall()
-            cur.close()
-            conn.close()
+            if catalog.loaded:
+                # Columnar in-memory snapshot, no database round trip
+                return [
+                    {field: r.get(field) for field in MEAL_PLANNER_FIELDS}
+                    for r in catalog.candidates(limit)
+                ]
+
+            with connection() as conn:
+                cur = conn.cursor(cursor_factory=RealDictCursor)
+
+                # Indexed random sample, see recipe_sampling.py
+                sample = sample_ids_sql(cur, limit)
+                query = f"""
+                    WITH sampled AS ({sample})
+                    SELECT
+                        c.id, c.title, c.category, c.cuisine,
+                        c.image_url, c.servings,
+                        COALESCE(c.kcal::text, '400') as calories,
+                        COALESCE(c.protein::text, '20') as protein,
+                        COALESCE(c.carbs::text, '40') as carbs,
+                        COALESCE(c.fat::text, '15') as fat
+                    FROM sampled s
+                    JOIN {cards_source(cur)} c ON c.id = s.id
+                """
+
+                with timed_query('meal_planner_recipes'):
+                    cur.execute(query)
+                recipes = cur.fetchall()
+                cur.close()
 
             return [dict(r) for r in recipes]
         except Exception as e:
@@ -159,7 +158,9 @@ GUIDELINES:
                 langchain_messages.append(HumanMessage(content=msg['content']))
 
         try:
-            response = self.llm.invoke(langchain_messages)
+            with track_llm_call('meal_planner.chat') as call:
+                response = self.llm.invoke(langchain_messages)
+                call.record_langchain_usage(response)
             return response.content
         except Exception as e:
             print(f"Chat error: {e}")
@@ -271,7 +272,9 @@ Create 3-4 meals per day (breakfast, lunch, dinner, and optionally snack).
 Use ONLY recipe IDs from the provided list."""
 
         try:
-            response = self.llm.invoke([HumanMessage(content=prompt)])
+            with track_llm_call('meal_planner.generate_meal_plan') as call:
+                response = self.llm.invoke([HumanMessage(content=prompt)])
+                call.record_langchain_usage(response)
             response_text = response.content
 
             # Parse JSON response
@@ -345,45 +348,45 @@ Use ONLY recipe IDs from the provided list."""
     def save_meal_plan(self, user_id: str, meals: List[Dict]) -> bool:
         """Save generated meal plan to database"""
         try:
-            conn = psycopg2.connect(**DB_CONFIG)
-            cur = conn.cursor()
-
-            for meal in meals:
-                cur.execute("""
-                    INSERT INTO meal_plans (
-                        user_id, plan_date, meal_slot, recipe_id, recipe_title,
-                        recipe_image, notes, servings, calories, protein_g, carbs_g, fat_g
-                    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                    ON CONFLICT (user_id, plan_date, meal_slot)
-                    DO UPDATE SET
-                        recipe_id = EXCLUDED.recipe_id,
-                        recipe_title = EXCLUDED.recipe_title,
-                        recipe_image = EXCLUDED.recipe_image,
-                        notes = EXCLUDED.notes,
-                        servings = EXCLUDED.servings,
-                        calories = EXCLUDED.calories,
-                        protein_g = EXCLUDED.protein_g,
-                        carbs_g = EXCLUDED.carbs_g,
-                        fat_g = EXCLUDED.fat_g,
-                        updated_at = NOW()
-                """, (
-                    user_id,
-                    meal.get('plan_date'),
-                    meal.get('meal_slot'),
-                    meal.get('recipe_id'),
-                    meal.get('recipe_title'),
-                    meal.get('recipe_image'),
-                    meal.get('notes'),
-                    meal.get('servings', 1),
-                    meal.get('calories'),
-                    meal.get('protein_g'),
-                    meal.get('carbs_g'),
-                    meal.get('fat_g')
-                ))
-
-            conn.commit()
-            cur.close()
-            conn.close()
+            with connection() as conn:
+                cur = conn.cursor()
+
+                for meal in meals:
+                    with timed_query('meal_plan_insert'):
+                        cur.execute("""
+                            INSERT INTO meal_plans (
+                                user_id, plan_date, meal_slot, recipe_id, recipe_title,
+                                recipe_image, notes, servings, calories, protein_g, carbs_g, fat_g
+                            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                            ON CONFLICT (user_id, plan_date, meal_slot)
+                            DO UPDATE SET
+                                recipe_id = EXCLUDED.recipe_id,
+                                recipe_title = EXCLUDED.recipe_title,
+                                recipe_image = EXCLUDED.recipe_image,
+                                notes = EXCLUDED.notes,
+                                servings = EXCLUDED.servings,
+                                calories = EXCLUDED.calories,
+                                protein_g = EXCLUDED.protein_g,
+                                carbs_g = EXCLUDED.carbs_g,
+                                fat_g = EXCLUDED.fat_g,
+                                updated_at = NOW()
+                        """, (
+                            user_id,
+                            meal.get('plan_date'),
+                            meal.get('meal_slot'),
+                            meal.get('recipe_id'),
+                            meal.get('recipe_title'),
+                            meal.get('recipe_image'),
+                            meal.get('notes'),
+                            meal.get('servings', 1),
+                            meal.get('calories'),
+                            meal.get('protein_g'),
+                            meal.get('carbs_g'),
+                            meal.get('fat_g')
+                        ))
+
+                conn.commit()
+                cur.close()
 
             print(f"  Saved {len(meals)} meals to database")
             return True
@@ -393,5 +396,14 @@ Use ONLY recipe IDs from the provided list."""
             return False
 
 
-# Create singleton instance
-meal_planner_agent = MealPlannerAgent()
+def get_meal_planner_agent() -> MealPlannerAgent:
+    """Shared MealPlannerAgent, built on first use by the agent registry"""
+    from agent_registry import registry
+    return registry.get('meal_planner_agent')
+
+
+def __getattr__(name):
+    # Backwards-compatible lazy access to the old module-level singleton
+    if name == 'meal_planner_agent':
+        return get_meal_planner_agent()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
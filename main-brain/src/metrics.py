@@ -0,0 +1,464 @@
+"""
+Service Metrics (Prometheus text format)
+Location: main-brain/src/metrics.py
+
+In-process counters and histograms rendered at /metrics in the Prometheus
+text exposition format, with no client library or external service needed.
+
+What is recorded:
+- http_request_duration_seconds     per endpoint (route template), method, status
+- langgraph_node_duration_seconds   per LangGraph node (@timed_node)
+- llm_calls_total / llm_call_duration_seconds / llm_tokens_total
+                                    per call site (track_llm_call)
+- llm_cache_lookups_total           response cache hits / misses per call
+                                    site (llm_cache.py)
+- db_query_duration_seconds         per named query (timed_query)
+- meal_fallbacks_total              fallback-meal substitutions, per reason
+- gauges sampled at scrape time (worker pools, caches) via register_gauge,
+  and since-start counts kept elsewhere (pool rejections, cache lookups)
+  via register_counter
+
+Hot-path cost: every series keeps one shard per thread, and a thread only
+ever writes its own shard, so observe()/inc() take no lock once a thread
+has written to a series. Locks are only taken to create a new series or
+shard, and when /metrics merges the shards.
+"""
+
+import bisect
+import contextvars
+import functools
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+
+# Latency buckets sized for this service: sub-ms DB reads up to multi-minute
+# meal plan generations.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = '') -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+# ============================================
+# SERIES (one label combination)
+# ============================================
+
+class _ShardedSeries:
+    """Per-thread shards of a fixed-size list of floats"""
+
+    def __init__(self, width: int):
+        self._width = width
+        self._local = threading.local()
+        self._shards: List[List[float]] = []
+        self._lock = threading.Lock()
+
+    def _shard(self) -> List[float]:
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = [0.0] * self._width
+            with self._lock:
+                self._shards.append(shard)
+            self._local.shard = shard
+        return shard
+
+    def merged(self) -> List[float]:
+        with self._lock:
+            shards = list(self._shards)
+        total = [0.0] * self._width
+        for shard in shards:
+            for i, value in enumerate(shard):
+                total[i] += value
+        return total
+
+
+class _CounterSeries(_ShardedSeries):
+    def __init__(self):
+        super().__init__(1)
+
+    def inc(self, amount: float = 1.0):
+        self._shard()[0] += amount
+
+    def value(self) -> float:
+        return self.merged()[0]
+
+
+class _HistogramSeries(_ShardedSeries):
+    # Layout: [bucket_0 .. bucket_n-1, +Inf bucket, sum, count]
+    def __init__(self, bounds: Tuple[float, ...]):
+        self._bounds = bounds
+        super().__init__(len(bounds) + 3)
+
+    def observe(self, value: float):
+        shard = self._shard()
+        shard[bisect.bisect_left(self._bounds, value)] += 1
+        shard[-2] += value
+        shard[-1] += 1
+
+
+# ============================================
+# METRIC FAMILIES
+# ============================================
+
+class _Family:
+    kind = ''
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self._series: Dict[Tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+
+    def _new_series(self):
+        raise NotImplementedError
+
+    def labels(self, *values: Any):
+        key = tuple(str(v) for v in values)
+        series = self._series.get(key)
+        if series is None:
+            if len(key) != len(self.label_names):
+                raise ValueError(f"{self.name} expects labels {self.label_names}, got {key}")
+            with self._lock:
+                series = self._series.get(key)
+                if series is None:
+                    series = self._new_series()
+                    self._series[key] = series
+        return series
+
+    def _items(self):
+        with self._lock:
+            return list(self._series.items())
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Family):
+    kind = 'counter'
+
+    def _new_series(self):
+        return _CounterSeries()
+
+    def inc(self, *label_values: Any, amount: float = 1.0):
+        self.labels(*label_values).inc(amount)
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        for key, series in self._items():
+            lines.append(f'{self.name}{_format_labels(self.label_names, key)} {_format_value(series.value())}')
+        return lines
+
+
+class Histogram(_Family):
+    kind = 'histogram'
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.bounds = tuple(sorted(buckets))
+
+    def _new_series(self):
+        return _HistogramSeries(self.bounds)
+
+    def observe(self, *label_values: Any, value: float):
+        self.labels(*label_values).observe(value)
+
+    @contextmanager
+    def time(self, *label_values: Any) -> Iterator[None]:
+        series = self.labels(*label_values)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            series.observe(time.perf_counter() - start)
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        for key, series in self._items():
+            merged = series.merged()
+            cumulative = 0.0
+            for bound, count in zip(self.bounds + (float('inf'),), merged[:-2]):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(
+                    f'{self.name}_bucket{_format_labels(self.label_names, key, le)} {_format_value(cumulative)}'
+                )
+            labels = _format_labels(self.label_names, key)
+            lines.append(f'{self.name}_sum{labels} {_format_value(merged[-2])}')
+            lines.append(f'{self.name}_count{labels} {_format_value(merged[-1])}')
+        return lines
+
+
+class _CallbackGauge:
+    """Gauge whose values are read from a callback when /metrics is scraped"""
+    kind = 'gauge'
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...],
+                 callback: Callable[[], Dict[Tuple[str, ...], float]]):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self.callback = callback
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        try:
+            values = self.callback()
+        except Exception as e:
+            print(f"Metrics {self.kind} {self.name} failed: {e}")
+            return lines
+        for key, value in values.items():
+            key = key if isinstance(key, tuple) else (key,)
+            lines.append(f'{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}')
+        return lines
+
+
+class _CallbackCounter(_CallbackGauge):
+    """Counter read from a callback at scrape time; the callback must only ever increase"""
+    kind = 'counter'
+
+
+# ============================================
+# REGISTRY
+# ============================================
+
+_families: Dict[str, Any] = {}
+_families_lock = threading.Lock()
+
+
+def _register(family):
+    with _families_lock:
+        existing = _families.get(family.name)
+        if existing is not None:
+            return existing
+        _families[family.name] = family
+        return family
+
+
+def counter(name: str, help_text: str, labels: Tuple[str, ...] = ()) -> Counter:
+    return _register(Counter(name, help_text, labels))
+
+
+def histogram(name: str, help_text: str, labels: Tuple[str, ...] = (),
+              buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+    return _register(Histogram(name, help_text, labels, buckets))
+
+
+def register_gauge(name: str, help_text: str, labels: Tuple[str, ...],
+                   callback: Callable[[], Dict[Tuple[str, ...], float]]):
+    """Register a gauge sampled at scrape time; callback returns {label_values: value}"""
+    with _families_lock:
+        _families[name] = _CallbackGauge(name, help_text, labels, callback)
+
+
+def register_counter(name: str, help_text: str, labels: Tuple[str, ...],
+                     callback: Callable[[], Dict[Tuple[str, ...], float]]):
+    """
+    Register a counter sampled at scrape time, for monotonic since-start
+    counts another object already keeps (name it *_total)
+    """
+    with _families_lock:
+        _families[name] = _CallbackCounter(name, help_text, labels, callback)
+
+
+def render() -> str:
+    """All metrics in Prometheus text exposition format (0.0.4)"""
+    with _families_lock:
+        families = list(_families.values())
+    lines: List[str] = []
+    for family in families:
+        lines.extend(family.render())
+    return '\n'.join(lines) + '\n'
+
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+# ============================================
+# SERVICE METRICS
+# ============================================
+
+http_request_duration = histogram(
+    'http_request_duration_seconds',
+    'HTTP request latency by route template, method and status',
+    ('route', 'method', 'status')
+)
+
+node_duration = histogram(
+    'langgraph_node_duration_seconds',
+    'Time spent in each LangGraph node',
+    ('node',)
+)
+
+llm_calls = counter(
+    'llm_calls_total',
+    'LLM calls by call site and outcome',
+    ('call_site', 'status')
+)
+
+llm_call_duration = histogram(
+    'llm_call_duration_seconds',
+    'LLM call latency by call site',
+    ('call_site',)
+)
+
+llm_tokens = counter(
+    'llm_tokens_total',
+    'LLM tokens by call site and kind (prompt/completion)',
+    ('call_site', 'kind')
+)
+
+db_query_duration = histogram(
+    'db_query_duration_seconds',
+    'Database query time by query name',
+    ('query',)
+)
+
+meal_fallbacks = counter(
+    'meal_fallbacks_total',
+    'Generated meals replaced by a fallback meal, by reason',
+    ('reason',)
+)
+
+
+# ============================================
+# INSTRUMENTATION HELPERS
+# ============================================
+
+# The LLM call site currently executing on this thread / task, for code
+# further down the stack that wants to attribute work to it.
+current_call_site: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar(
+    'current_call_site', default=None
+)
+
+# The tracked call itself, so the response cache (llm_cache.py) can mark it
+# as served from cache
+current_llm_call: contextvars.ContextVar[Optional['LLMCall']] = contextvars.ContextVar(
+    'current_llm_call', default=None
+)
+
+
+# Called as fn(call_site, seconds, status) after every tracked LLM call
+# (e.g. admission control's backend latency tracker)
+_llm_call_listeners: List[Callable[[str, float, str], None]] = []
+
+
+def add_llm_call_listener(fn: Callable[[str, float, str], None]):
+    _llm_call_listeners.append(fn)
+
+
+def timed_node(fn: Callable) -> Callable:
+    """Decorator recording a LangGraph node's duration under its function name"""
+    series = node_duration.labels(fn.__name__)
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            series.observe(time.perf_counter() - start)
+
+    return wrapper
+
+
+@contextmanager
+def timed_query(name: str) -> Iterator[None]:
+    """Record the time of one database query (or short group of queries)"""
+    with db_query_duration.time(name):
+        yield
+
+
+class LLMCall:
+    """Handle yielded by track_llm_call for reporting token usage"""
+
+    def __init__(self, call_site: str):
+        self.call_site = call_site
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    @property
+    def cached(self) -> bool:
+        """Every LLM request of this call was answered by llm_cache.py"""
+        return self.cache_hits > 0 and self.cache_misses == 0
+
+    def record_tokens(self, prompt_tokens: Optional[int], completion_tokens: Optional[int]):
+        if self.cached:
+            return  # usage replayed with a cached response was not spent again
+        if prompt_tokens:
+            llm_tokens.inc(self.call_site, 'prompt', amount=prompt_tokens)
+        if completion_tokens:
+            llm_tokens.inc(self.call_site, 'completion', amount=completion_tokens)
+
+    def record_langchain_usage(self, message: Any):
+        """Token usage from a LangChain AIMessage (usage_metadata or response_metadata)"""
+        usage = getattr(message, 'usage_metadata', None) or {}
+        if usage:
+            self.record_tokens(usage.get('input_tokens'), usage.get('output_tokens'))
+            return
+        token_usage = (getattr(message, 'response_metadata', None) or {}).get('token_usage') or {}
+        self.record_tokens(token_usage.get('prompt_tokens'), token_usage.get('completion_tokens'))
+
+    def record_dspy_usage(self, prediction: Any):
+        """Token usage from a dspy.Prediction produced with track_usage enabled"""
+        get_usage = getattr(prediction, 'get_lm_usage', None)
+        usage = get_usage() if callable(get_usage) else None
+        for model_usage in (usage or {}).values():
+            self.record_tokens(model_usage.get('prompt_tokens'), model_usage.get('completion_tokens'))
+
+
+@contextmanager
+def track_llm_call(call_site: str) -> Iterator[LLMCall]:
+    """
+    Count and time one LLM call. A call answered entirely from the response
+    cache is counted with status 'cached' and kept out of the duration
+    histogram and the listeners, since its latency says nothing about the
+    provider's.
+
+        with track_llm_call('langgraph.validate_safety') as call:
+            response = llm.invoke(...)
+            call.record_langchain_usage(response)
+    """
+    call = LLMCall(call_site)
+    token = current_call_site.set(call_site)
+    call_token = current_llm_call.set(call)
+    start = time.perf_counter()
+    status = 'ok'
+    try:
+        yield call
+    except BaseException:
+        status = 'error'
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        current_llm_call.reset(call_token)
+        current_call_site.reset(token)
+        if status == 'ok' and call.cached:
+            status = 'cached'
+        llm_calls.inc(call_site, status)
+        if status != 'cached':
+            llm_call_duration.observe(call_site, value=elapsed)
+            for listener in _llm_call_listeners:
+                listener(call_site, elapsed, status)
+
+
+def record_fallback(reason: str, count: int = 1):
+    meal_fallbacks.inc(reason, amount=count)
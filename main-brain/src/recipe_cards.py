@@ -0,0 +1,121 @@
+"""
+Recipe Cards
+Location: main-brain/src/recipe_cards.py
+
+Every read path used to rebuild the same recipe representation per request:
+recipes JOIN recipe_nutrients JOIN recipe_ingredients, GROUP BY with a
+json_agg(... ORDER BY position) over the ingredients. recipe_cards
+(migrations/004_recipe_cards.sql) is that representation materialized once
+per ingest, one row per recipe with typed nutrients and a jsonb ingredient
+array, unique on id. A read is then an index lookup (by id, or by the ids a
+random sample picked) or a plain scan, with no join or aggregate.
+
+fetch_recipes.py refreshes the view after it writes recipes. Recipes
+written in between (e.g. adapted recipes saved by the DSPy agent) are not
+in it yet, so lookups by id retry against the live query on a miss.
+
+Until the migration has run, cards_source() returns the same query inline
+(CARDS_QUERY, kept in sync with the migration), so callers have one code
+path either way.
+
+fetch_card_async and sample_cards_async are the same reads on the async
+pool (async_db.py).
+
+Usage:
+    cur.execute(f"SELECT {CARD_COLUMNS} FROM {cards_source(cur)} c WHERE c.id = %s", (recipe_id,))
+    card = await fetch_card_async(recipe_id)
+"""
+
+from typing import Any, Dict, List, Optional
+
+import async_db
+from db import has_relation
+from metrics import timed_query
+from recipe_sampling import sample_ids_sql
+
+# Definition of the recipe_cards materialized view (migrations/004_recipe_cards.sql)
+CARDS_QUERY = """
+    SELECT
+        r.id, r.title, r.category, r.area AS cuisine,
+        r.instructions, r.image_url, r.servings,
+        CASE WHEN jsonb_typeof(rn.per_serving->'kcal') = 'number'
+             THEN (rn.per_serving->>'kcal')::double precision END AS kcal,
+        CASE WHEN jsonb_typeof(rn.per_serving->'protein_g') = 'number'
+             THEN (rn.per_serving->>'protein_g')::double precision END AS protein,
+        CASE WHEN jsonb_typeof(rn.per_serving->'sodium_mg') = 'number'
+             THEN (rn.per_serving->>'sodium_mg')::double precision END AS sodium,
+        CASE WHEN jsonb_typeof(rn.per_serving->'sugar_g') = 'number'
+             THEN (rn.per_serving->>'sugar_g')::double precision END AS sugar,
+        CASE WHEN jsonb_typeof(rn.per_serving->'carbs_g') = 'number'
+             THEN (rn.per_serving->>'carbs_g')::double precision END AS carbs,
+        CASE WHEN jsonb_typeof(rn.per_serving->'fat_g') = 'number'
+             THEN (rn.per_serving->>'fat_g')::double precision END AS fat,
+        COALESCE(ing.ingredients, '[]'::jsonb) AS ingredients
+    FROM recipes r
+    LEFT JOIN recipe_nutrients rn ON rn.recipe_id = r.id
+    LEFT JOIN LATERAL (
+        SELECT jsonb_agg(
+                   jsonb_build_object('name', ri.ingredient_name, 'amount', ri.measure_text)
+                   ORDER BY ri.position
+               ) AS ingredients
+        FROM recipe_ingredients ri
+        WHERE ri.recipe_id = r.id
+    ) ing ON true
+"""
+
+# The agents' recipe row shape; nutrients are rendered as text with the
+# same defaults as the per_serving->>'...' queries they replace
+CARD_COLUMNS = """
+    c.id, c.title, c.category, c.cuisine,
+    c.instructions, c.image_url, c.servings,
+    COALESCE(c.kcal::text, '300') as calories,
+    COALESCE(c.protein::text, '15') as protein,
+    COALESCE(c.sodium::text, '400') as sodium,
+    COALESCE(c.sugar::text, '5') as sugar,
+    c.ingredients
+"""
+
+SAMPLED_CARDS_QUERY = """
+    WITH sampled AS ({sample})
+    SELECT {columns}
+    FROM sampled s
+    JOIN {source} c ON c.id = s.id
+"""
+
+
+def cards_source(cur, live: bool = False) -> str:
+    """FROM-clause source of recipe cards: the materialized view, or the live query"""
+    if not live and has_relation(cur, 'recipe_cards'):
+        return "recipe_cards"
+    return f"({CARDS_QUERY})"
+
+
+def fetch_card(cur, recipe_id: str, columns: str = CARD_COLUMNS) -> Optional[Dict[str, Any]]:
+    """One recipe card by id; falls back to the live query for recipes not yet in the view"""
+    query = f"SELECT {columns} FROM {{source}} c WHERE c.id = %s"
+    cur.execute(query.format(source=cards_source(cur)), (recipe_id,))
+    row = cur.fetchone()
+    if row is None and has_relation(cur, 'recipe_cards'):
+        cur.execute(query.format(source=cards_source(cur, live=True)), (recipe_id,))
+        row = cur.fetchone()
+    return dict(row) if row else None
+
+
+async def fetch_card_async(recipe_id: str, columns: str = CARD_COLUMNS) -> Optional[Dict[str, Any]]:
+    """fetch_card on the async pool; raises async_db.DataError for an id that is not a uuid"""
+    await async_db.check_objects()
+    query = f"SELECT {columns} FROM {{source}} c WHERE c.id = %s"
+    row = await async_db.fetchrow(query.format(source=cards_source(None)), (recipe_id,))
+    if row is None and has_relation(None, 'recipe_cards'):
+        row = await async_db.fetchrow(query.format(source=cards_source(None, live=True)), (recipe_id,))
+    return row
+
+
+async def sample_cards_async(limit: int, columns: str = CARD_COLUMNS) -> List[Dict[str, Any]]:
+    """limit random recipe cards (recipe_sampling.sample_ids_sql) on the async pool"""
+    await async_db.check_objects()
+    query = SAMPLED_CARDS_QUERY.format(
+        sample=sample_ids_sql(None, limit), columns=columns, source=cards_source(None)
+    )
+    with timed_query('recipes_browse'):
+        return await async_db.fetch(query)
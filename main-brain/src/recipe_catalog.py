@@ -0,0 +1,286 @@
+"""
+Shared Recipe Catalog
+Location: main-brain/src/recipe_catalog.py
+
+Read-only, in-memory snapshot of the browsable recipe catalog (the recipe
+cards with instructions, see recipe_cards.py) plus each recipe's allergen
+hits from allergens.py.
+
+Next to the row dicts every snapshot keeps a columnar view for candidate
+selection, so agents filter the whole catalog with a few vectorized NumPy
+operations (microseconds) instead of a database round trip:
+
+- per-serving kcal / protein / sodium / sugar / carbs / fat as float32 arrays
+- category and cuisine interned to int32 codes (-1 when missing)
+- ingredients as CSR: ingredient_ptr[i]:ingredient_ptr[i + 1] slices
+  ingredient_ids, which index the snapshot's ingredient vocabulary
+- an allergen bitmask per recipe (same encoding as recipes.allergen_mask,
+  see allergens.py)
+
+The prefork launcher (serve.py) loads it once in the master process before
+forking, so every worker shares the same pages copy-on-write instead of
+each one querying and holding its own copy. In single-process mode it is
+loaded at startup when RECIPE_CATALOG_PRELOAD is set; while it is not
+loaded, callers fall back to querying the database.
+
+A reload (startup, or SIGHUP to serve.py after fetch_recipes.py has run)
+builds a complete new snapshot, rows and arrays together, and swaps it in
+with one assignment, so readers always see either the old or the new
+catalog.
+
+Usage:
+    from recipe_catalog import catalog
+    if catalog.loaded:
+        recipes = catalog.candidates(50, exclude_terms=['peanut'], max_sodium=800)
+"""
+
+import os
+import random
+import time
+from datetime import datetime
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+import numpy as np
+from psycopg2.extras import RealDictCursor
+
+from allergens import allergen_mask, allergen_matches
+from db import connection
+from metrics import timed_query
+from recipe_cards import CARD_COLUMNS, cards_source
+
+# Row field -> nutrient array name
+NUTRIENT_FIELDS = {
+    'calories': 'kcal', 'protein': 'protein', 'sodium': 'sodium',
+    'sugar': 'sugar', 'carbs': 'carbs', 'fat': 'fat'
+}
+
+# Ingredient terms (e.g. allergen patterns) whose matching recipes are cached per snapshot
+TERM_CACHE_SIZE = 1024
+
+# Same row shape as the agents' card queries (recipe_cards.py), plus carbs/fat
+CATALOG_QUERY = """
+    SELECT {columns},
+        COALESCE(c.carbs::text, '40') as carbs,
+        COALESCE(c.fat::text, '15') as fat
+    FROM {source} c
+    WHERE c.instructions IS NOT NULL
+"""
+
+
+def ingredient_names(recipe: Dict[str, Any]) -> List[str]:
+    return [ing.get('name') for ing in recipe.get('ingredients') or [] if ing and ing.get('name')]
+
+
+def _to_float(value: Any) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return float('nan')
+
+
+def _intern(values: List[Optional[str]]) -> Tuple[np.ndarray, Tuple[str, ...], Dict[str, int]]:
+    """(codes, vocabulary, lowercased value -> code); missing values get -1"""
+    vocab: Dict[str, int] = {}
+    codes = np.fromiter(
+        (vocab.setdefault(v, len(vocab)) if v else -1 for v in values), dtype=np.int32, count=len(values)
+    )
+    lookup: Dict[str, int] = {}
+    for value, code in vocab.items():
+        lookup.setdefault(value.lower(), code)
+    return codes, tuple(vocab), lookup
+
+
+def _frozen(array: np.ndarray) -> np.ndarray:
+    array.setflags(write=False)
+    return array
+
+
+class _Snapshot:
+    """One immutable generation of the catalog"""
+
+    def __init__(self, recipes: List[Dict[str, Any]], load_ms: float):
+        self.recipes = recipes
+        self.by_id: Dict[str, Dict[str, Any]] = {str(r['id']): r for r in recipes}
+        # Precomputed allergen hit table: recipe id -> allergen key -> matching ingredients
+        self.allergen_matches: Dict[str, Dict[str, Tuple[str, ...]]] = {
+            str(r['id']): allergen_matches(ingredient_names(r)) for r in recipes
+        }
+        self.allergen_hits: Dict[str, FrozenSet[str]] = {
+            recipe_id: frozenset(matches) for recipe_id, matches in self.allergen_matches.items()
+        }
+        self._build_columns()
+        self.loaded_at = datetime.now()
+        self.load_ms = load_ms
+
+    def _build_columns(self):
+        recipes = self.recipes
+        n = len(recipes)
+
+        self.nutrients: Dict[str, np.ndarray] = {
+            column: _frozen(np.fromiter((_to_float(r.get(field)) for r in recipes), dtype=np.float32, count=n))
+            for field, column in NUTRIENT_FIELDS.items()
+        }
+
+        category_codes, self.categories, self._category_lookup = _intern([r.get('category') for r in recipes])
+        cuisine_codes, self.cuisines, self._cuisine_lookup = _intern([r.get('cuisine') for r in recipes])
+        self.category_codes = _frozen(category_codes)
+        self.cuisine_codes = _frozen(cuisine_codes)
+
+        # Ingredient ids in CSR form over a lowercased name vocabulary
+        vocab: Dict[str, int] = {}
+        ids: List[int] = []
+        ptr = np.zeros(n + 1, dtype=np.int64)
+        for i, recipe in enumerate(recipes):
+            for name in ingredient_names(recipe):
+                ids.append(vocab.setdefault(name.lower().strip(), len(vocab)))
+            ptr[i + 1] = len(ids)
+        self.ingredient_vocab: Tuple[str, ...] = tuple(vocab)
+        self.ingredient_ids = _frozen(np.array(ids, dtype=np.int32))
+        self.ingredient_ptr = _frozen(ptr)
+        # Owning recipe of every ingredient_ids entry, to map ingredient hits back to recipes
+        self.ingredient_owner = _frozen(np.repeat(np.arange(n, dtype=np.int32), np.diff(ptr)))
+
+        self.allergen_masks = _frozen(np.fromiter(
+            (allergen_mask(self.allergen_matches[str(r['id'])]) for r in recipes), dtype=np.uint64, count=n
+        ))
+        self._term_rows: Dict[str, np.ndarray] = {}
+
+    def ingredient_ids_matching(self, term: str) -> np.ndarray:
+        """Vocabulary ids of ingredients containing term (case-insensitive substring, like SQL LIKE '%term%')"""
+        term = term.lower().strip()
+        return np.array([i for i, name in enumerate(self.ingredient_vocab) if term in name], dtype=np.int32)
+
+    def recipes_containing(self, term: str) -> np.ndarray:
+        """Row indices of recipes with an ingredient containing term (cached per term)"""
+        term = term.lower().strip()
+        rows = self._term_rows.get(term)
+        if rows is None:
+            matching = np.zeros(len(self.ingredient_vocab), dtype=bool)
+            matching[self.ingredient_ids_matching(term)] = True
+            rows = _frozen(np.unique(self.ingredient_owner[matching[self.ingredient_ids]]))
+            if len(self._term_rows) < TERM_CACHE_SIZE:
+                self._term_rows[term] = rows
+        return rows
+
+    def select(self, exclude_allergens: Iterable[str] = (), exclude_terms: Iterable[str] = (),
+               categories: Optional[Iterable[str]] = None, cuisines: Optional[Iterable[str]] = None,
+               max_kcal: Optional[float] = None, max_sodium: Optional[float] = None,
+               max_sugar: Optional[float] = None, min_protein: Optional[float] = None) -> np.ndarray:
+        """Row indices of recipes passing every filter"""
+        keep = np.ones(len(self.recipes), dtype=bool)
+
+        mask = allergen_mask(exclude_allergens)
+        if mask:
+            keep &= (self.allergen_masks & np.uint64(mask)) == 0
+
+        for term in exclude_terms:
+            if term and term.strip():
+                keep[self.recipes_containing(term)] = False
+
+        for values, codes, lookup in ((categories, self.category_codes, self._category_lookup),
+                                      (cuisines, self.cuisine_codes, self._cuisine_lookup)):
+            if values is not None:
+                wanted = [lookup[v.lower()] for v in values if v and v.lower() in lookup]
+                keep &= np.isin(codes, wanted)
+
+        # NaN (unparseable value) fails every bound, as it would in SQL
+        for column, bound, upper in (('kcal', max_kcal, True), ('sodium', max_sodium, True),
+                                     ('sugar', max_sugar, True), ('protein', min_protein, False)):
+            if bound is not None:
+                values = self.nutrients[column]
+                keep &= (values <= bound) if upper else (values >= bound)
+
+        return np.flatnonzero(keep)
+
+
+class RecipeCatalog:
+    """Process-wide recipe snapshot, swapped atomically on reload"""
+
+    def __init__(self):
+        self._snapshot: Optional[_Snapshot] = None
+
+    @property
+    def loaded(self) -> bool:
+        return self._snapshot is not None
+
+    def load(self) -> int:
+        """Fetch the catalog and swap it in; returns the number of recipes"""
+        start = time.perf_counter()
+        with connection() as conn:
+            cur = conn.cursor(cursor_factory=RealDictCursor)
+            with timed_query('recipe_catalog'):
+                cur.execute(CATALOG_QUERY.format(columns=CARD_COLUMNS, source=cards_source(cur)))
+            recipes = [dict(r) for r in cur.fetchall()]
+            cur.close()
+
+        snapshot = _Snapshot(recipes, round((time.perf_counter() - start) * 1000, 1))
+        self._snapshot = snapshot
+        print(f"📚 Recipe catalog loaded: {len(recipes)} recipes in {snapshot.load_ms} ms")
+        return len(recipes)
+
+    def get(self, recipe_id: str) -> Optional[Dict[str, Any]]:
+        snapshot = self._snapshot
+        return snapshot.by_id.get(str(recipe_id)) if snapshot else None
+
+    def allergens_for(self, recipe_id: str) -> FrozenSet[str]:
+        """Allergen keys (e.g. 'dairy', 'nuts') present in a recipe's ingredients"""
+        snapshot = self._snapshot
+        return snapshot.allergen_hits.get(str(recipe_id), frozenset()) if snapshot else frozenset()
+
+    def allergen_matches_for(self, recipe_id: str) -> Optional[Dict[str, Tuple[str, ...]]]:
+        """Allergen key -> matching ingredients, or None if the recipe is not in the catalog"""
+        snapshot = self._snapshot
+        return snapshot.allergen_matches.get(str(recipe_id)) if snapshot else None
+
+    def sample(self, k: int) -> List[Dict[str, Any]]:
+        """k random recipes (shared rows: copy before mutating)"""
+        snapshot = self._snapshot
+        if not snapshot:
+            return []
+        return random.sample(snapshot.recipes, min(k, len(snapshot.recipes)))
+
+    def candidates(self, k: int, **filters) -> List[Dict[str, Any]]:
+        """
+        Up to k random recipes passing the filters of _Snapshot.select
+        (exclude_allergens, exclude_terms, categories, cuisines, max_kcal,
+        max_sodium, max_sugar, min_protein), as copies safe to mutate.
+        Empty if the catalog is not loaded.
+        """
+        snapshot = self._snapshot
+        if not snapshot:
+            return []
+        matched = snapshot.select(**filters)
+        picks = random.sample(range(len(matched)), min(k, len(matched)))
+        return [dict(snapshot.recipes[matched[i]]) for i in picks]
+
+    def stats(self) -> Dict[str, Any]:
+        snapshot = self._snapshot
+        if not snapshot:
+            return {'loaded': False, 'recipes': 0}
+        return {
+            'loaded': True,
+            'recipes': len(snapshot.recipes),
+            'ingredients': len(snapshot.ingredient_vocab),
+            'categories': len(snapshot.categories),
+            'cuisines': len(snapshot.cuisines),
+            'column_bytes': int(
+                sum(a.nbytes for a in snapshot.nutrients.values())
+                + sum(a.nbytes for a in (snapshot.category_codes, snapshot.cuisine_codes, snapshot.ingredient_ids,
+                                         snapshot.ingredient_ptr, snapshot.ingredient_owner, snapshot.allergen_masks))
+            ),
+            'loaded_at': snapshot.loaded_at.isoformat(),
+            'load_ms': snapshot.load_ms
+        }
+
+
+catalog = RecipeCatalog()
+
+
+def load_from_env():
+    """Load the catalog at startup if RECIPE_CATALOG_PRELOAD is set and it is not loaded yet"""
+    if catalog.loaded or os.getenv('RECIPE_CATALOG_PRELOAD', '').lower() not in ('1', 'true', 'yes'):
+        return
+    try:
+        catalog.load()
+    except Exception as e:
+        print(f"⚠️ Recipe catalog preload failed, falling back to database queries: {e}")
@@ -0,0 +1,147 @@
+"""
+Recommendation History (recipe_events)
+Location: main-brain/src/recipe_history.py
+
+A user's recipe events (view / like / save / hide ...) joined with a
+recipe card, newest first.
+
+Pages use keyset pagination on (created_at, id) instead of OFFSET: each
+page resumes strictly after the last row of the previous one, so page 500
+costs the same as page 1, even for users with 100k+ events. With the
+(user_id, created_at DESC, id DESC) index from
+migrations/001_recipe_events_history_index.sql, each page is one index
+range scan.
+
+The cursor handed to clients is an opaque URL-safe token encoding the last
+row's (created_at, id).
+"""
+
+import base64
+import json
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from psycopg2.extras import RealDictCursor
+
+import async_db
+from db import connection
+from metrics import timed_query
+
+MAX_PAGE_SIZE = 200
+
+
+class InvalidCursorError(ValueError):
+    """The cursor token is malformed or was not produced by this endpoint"""
+
+
+def encode_cursor(created_at: datetime, event_id: Any) -> str:
+    payload = json.dumps([created_at.isoformat(), str(event_id)], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, event_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        return datetime.fromisoformat(created_at), str(event_id)
+    except (ValueError, TypeError) as e:
+        raise InvalidCursorError(f"Invalid history cursor: {cursor!r}") from e
+
+
+HISTORY_QUERY = """
+    SELECT
+        e.id AS event_id, e.event, e.created_at,
+        r.id AS recipe_id, r.title, r.image_url, r.category, r.area AS cuisine,
+        COALESCE(rn.per_serving->>'kcal', '300') AS calories,
+        COALESCE(rn.per_serving->>'protein_g', '15') AS protein
+    FROM recipe_events e
+    JOIN recipes r ON r.id = e.recipe_id
+    LEFT JOIN recipe_nutrients rn ON rn.recipe_id = e.recipe_id
+    WHERE e.user_id = %(user_id)s
+      {event_filter}
+      {after_cursor}
+    ORDER BY e.created_at DESC, e.id DESC
+    LIMIT %(limit)s
+"""
+
+
+def history_query(user_id: str, limit: int, cursor: Optional[str] = None,
+                  events: Optional[List[str]] = None) -> Tuple[str, Dict[str, Any]]:
+    """(query, params) for one page of limit + 1 rows; raises InvalidCursorError"""
+    params: Dict[str, Any] = {'user_id': user_id, 'limit': limit + 1}
+
+    after_cursor = ''
+    if cursor:
+        params['cursor_created_at'], params['cursor_id'] = decode_cursor(cursor)
+        # Row comparison keeps this a single range scan on the composite index
+        after_cursor = "AND (e.created_at, e.id) < (%(cursor_created_at)s, %(cursor_id)s)"
+
+    event_filter = ''
+    if events:
+        params['events'] = list(events)
+        event_filter = "AND e.event = ANY(%(events)s)"
+
+    return HISTORY_QUERY.format(event_filter=event_filter, after_cursor=after_cursor), params
+
+
+def history_page(rows: List[Dict[str, Any]], limit: int) -> Dict[str, Any]:
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    history = [
+        {
+            'event_id': str(row['event_id']),
+            'event': row['event'],
+            'created_at': row['created_at'],
+            'recipe': {
+                'id': str(row['recipe_id']),
+                'title': row['title'],
+                'image_url': row['image_url'],
+                'category': row['category'],
+                'cuisine': row['cuisine'],
+                'calories': row['calories'],
+                'protein': row['protein']
+            }
+        }
+        for row in rows
+    ]
+
+    next_cursor = None
+    if has_more and rows:
+        last = rows[-1]
+        next_cursor = encode_cursor(last['created_at'], last['event_id'])
+
+    return {'history': history, 'next_cursor': next_cursor, 'has_more': has_more}
+
+
+def fetch_history(user_id: str, limit: int = 50, cursor: Optional[str] = None,
+                  events: Optional[List[str]] = None) -> Dict[str, Any]:
+    """
+    One page of a user's history, newest first.
+
+    Returns {"history": [...], "next_cursor": str | None, "has_more": bool}.
+    Raises InvalidCursorError for a malformed cursor.
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    query, params = history_query(user_id, limit, cursor, events)
+
+    with connection() as conn:
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+        with timed_query('recipe_history'):
+            cur.execute(query, params)
+        rows = cur.fetchall()
+        cur.close()
+
+    return history_page(rows, limit)
+
+
+async def fetch_history_async(user_id: str, limit: int = 50, cursor: Optional[str] = None,
+                              events: Optional[List[str]] = None) -> Dict[str, Any]:
+    """fetch_history on the async pool (async_db.py)"""
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    query, params = history_query(user_id, limit, cursor, events)
+
+    with timed_query('recipe_history'):
+        rows = await async_db.fetch(query, params)
+
+    return history_page(rows, limit)
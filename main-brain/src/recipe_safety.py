@@ -0,0 +1,171 @@
+"""
+Recipe Safety Analysis
+Location: main-brain/src/recipe_safety.py
+
+Rule-based safety analysis of one recipe, optionally for one user, with no
+LLM call.
+
+Allergens come from the precomputed allergen hit table in the recipe
+catalog (recipe -> allergen key -> matching ingredients, built once from
+recipe_ingredients and ALLERGEN_DERIVATIVES when the catalog loads). A
+user's allergies are mapped to allergen keys and intersected with that
+table, so a request never rescans derivative lists against ingredients.
+Recipes not in the catalog (or when it is not loaded) are read from the
+recipe cards (recipe_cards.py) and their hits computed once, through the
+same cached per-ingredient lookup. The user's allergies and conditions
+come from the shared profile cache (user_profiles.py).
+
+Medical thresholds match SafeRecommendationAgent._quick_safety_check:
+- diabetes:                     sugar > 15 g per serving
+- hypertension / blood pressure: sodium > 800 mg per serving
+
+analyze_recipe_safety_async does the same reads on the async pool
+(async_db.py).
+"""
+
+from typing import Any, Dict, List, Optional, Tuple
+
+import psycopg2
+from psycopg2.extras import RealDictCursor
+
+import async_db
+from allergens import allergen_matches, allergy_keys, contains_allergen
+from db import connection
+from metrics import timed_query
+from recipe_cards import fetch_card, fetch_card_async
+from recipe_catalog import catalog, ingredient_names
+from user_profiles import get_user_profile, get_user_profile_async
+
+# (condition keywords, nutrient field, threshold)
+MEDICAL_THRESHOLDS = [
+    (('diabetes',), 'sugar', 15.0),
+    (('hypertension', 'blood pressure'), 'sodium', 800.0)
+]
+
+
+class RecipeNotFoundError(LookupError):
+    """No recipe with this id"""
+
+
+RECIPE_COLUMNS = """
+    c.id, c.title,
+    COALESCE(c.sodium::text, '400') as sodium,
+    COALESCE(c.sugar::text, '5') as sugar,
+    c.ingredients
+"""
+
+def _load_recipe(recipe_id: str) -> Tuple[Dict[str, Any], Dict[str, Tuple[str, ...]], str]:
+    """(recipe, allergen hit table row, source)"""
+    recipe = catalog.get(recipe_id)
+    if recipe is not None:
+        return recipe, catalog.allergen_matches_for(recipe_id) or {}, 'catalog'
+
+    try:
+        with connection() as conn:
+            cur = conn.cursor(cursor_factory=RealDictCursor)
+            with timed_query('recipe_safety_recipe'):
+                recipe = fetch_card(cur, recipe_id, RECIPE_COLUMNS)
+            cur.close()
+    except psycopg2.DataError:
+        recipe = None  # not a valid uuid
+    if recipe is None:
+        raise RecipeNotFoundError(f"Recipe {recipe_id} not found")
+    return recipe, allergen_matches(ingredient_names(recipe)), 'database'
+
+
+async def _load_recipe_async(recipe_id: str) -> Tuple[Dict[str, Any], Dict[str, Tuple[str, ...]], str]:
+    """_load_recipe on the async pool"""
+    recipe = catalog.get(recipe_id)
+    if recipe is not None:
+        return recipe, catalog.allergen_matches_for(recipe_id) or {}, 'catalog'
+
+    try:
+        with timed_query('recipe_safety_recipe'):
+            recipe = await fetch_card_async(recipe_id, RECIPE_COLUMNS)
+    except async_db.DataError:
+        recipe = None  # not a valid uuid
+    if recipe is None:
+        raise RecipeNotFoundError(f"Recipe {recipe_id} not found")
+    return recipe, allergen_matches(ingredient_names(recipe)), 'database'
+
+
+def _to_float(value: Any) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _recipe_analysis(recipe: Dict[str, Any], matches: Dict[str, Tuple[str, ...]], source: str) -> Dict[str, Any]:
+    return {
+        'recipe_id': str(recipe['id']),
+        'title': recipe.get('title'),
+        'allergens_present': {allergen: list(names) for allergen, names in sorted(matches.items())},
+        'nutrition': {'sugar': _to_float(recipe.get('sugar')), 'sodium': _to_float(recipe.get('sodium'))},
+        'source': source
+    }
+
+
+def _add_user_analysis(analysis: Dict[str, Any], recipe: Dict[str, Any], matches: Dict[str, Tuple[str, ...]],
+                       user_id: str, profile: Dict[str, Any]) -> Dict[str, Any]:
+    allergies = profile.get('allergies') or []
+    conditions = profile.get('medical_conditions') or []
+
+    conflicts: List[Dict[str, Any]] = []
+    for allergy in allergies:
+        keys = allergy_keys(allergy)
+        if keys:
+            names = sorted({name for key in keys for name in matches.get(key, ())})
+        else:
+            # Not a known allergen: match the allergy itself against this recipe's ingredients
+            term = allergy.lower().strip()
+            names = [name for name in ingredient_names(recipe) if term and contains_allergen(name, [term])]
+        if names:
+            conflicts.append({'allergy': allergy, 'ingredients': names})
+
+    conditions_text = str(conditions).lower()
+    medical_flags: List[Dict[str, Any]] = []
+    for keywords, nutrient, threshold in MEDICAL_THRESHOLDS:
+        condition = next((k for k in keywords if k in conditions_text), None)
+        value = analysis['nutrition'][nutrient]
+        if condition and value is not None and value > threshold:
+            medical_flags.append({
+                'condition': condition, 'nutrient': nutrient, 'value': value, 'threshold': threshold
+            })
+
+    analysis.update({
+        'user_id': user_id,
+        'safe': not conflicts and not medical_flags,
+        'allergy_conflicts': conflicts,
+        'medical_flags': medical_flags,
+        'user_allergies': allergies,
+        'user_medical_conditions': conditions
+    })
+    return analysis
+
+
+def analyze_recipe_safety(recipe_id: str, user_id: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Allergens present in a recipe and, when user_id is given, the user's
+    allergy conflicts and medical threshold violations.
+
+    Raises RecipeNotFoundError if the recipe does not exist.
+    """
+    recipe, matches, source = _load_recipe(recipe_id)
+    analysis = _recipe_analysis(recipe, matches, source)
+    if not user_id:
+        return analysis
+
+    profile = get_user_profile(user_id) or {}
+    return _add_user_analysis(analysis, recipe, matches, user_id, profile)
+
+
+async def analyze_recipe_safety_async(recipe_id: str, user_id: Optional[str] = None) -> Dict[str, Any]:
+    """analyze_recipe_safety on the async pool (async_db.py)"""
+    recipe, matches, source = await _load_recipe_async(recipe_id)
+    analysis = _recipe_analysis(recipe, matches, source)
+    if not user_id:
+        return analysis
+
+    profile = await get_user_profile_async(user_id) or {}
+    return _add_user_analysis(analysis, recipe, matches, user_id, profile)
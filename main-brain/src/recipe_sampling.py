@@ -0,0 +1,130 @@
+"""
+Random Candidate Sampling
+Location: main-brain/src/recipe_sampling.py
+
+The agents pick candidate recipes at random. Done as
+    GROUP BY recipes x ingredients x nutrients ... ORDER BY RANDOM() LIMIT n
+this aggregates and sorts the whole catalog on every request, so the cost
+grows linearly with the number of recipes.
+
+Instead every recipe carries a persisted uniform random key
+(migrations/002_recipes_random_key.sql) with a partial index. A sample is
+an index range seek from a random pivot:
+
+    random_key >= pivot ORDER BY random_key LIMIT n   (wrapping to 0 if short)
+
+Consecutive keys belong to independent random recipes, so every window is
+a uniform random sample, and two requests overlap no more than they did
+with ORDER BY RANDOM(). Only the n sampled ids are then joined to their
+ingredients and nutrients, so a request costs O(n log N) instead of O(N).
+
+Extra filters (e.g. the allergen mask predicate) are applied during the
+seek; the index scan simply continues until n recipes pass. Their
+parameters are bound with cur.mogrify, never formatted into the SQL.
+
+Until the migration has run (no random_key column), sampling falls back to
+ORDER BY random() over recipe ids only, which still skips the catalog-wide
+aggregate.
+
+Usage:
+    sample = sample_ids_sql(cur, 50, "(r.allergen_mask & %s) = 0", (user_mask,))
+    cur.execute(f"WITH sampled AS ({sample}) SELECT ... FROM sampled s JOIN recipes r ON r.id = s.id ...")
+"""
+
+import random
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+from allergens import FORBIDDEN_BY_ALLERGEN, allergen_mask
+from db import has_column
+
+BASE_WHERE = "r.instructions IS NOT NULL"
+
+RANDOM_KEY_SAMPLE = """
+    SELECT id FROM (
+        (SELECT r.id FROM recipes r
+         WHERE {where} AND r.random_key >= {pivot!r}
+         ORDER BY r.random_key LIMIT {limit})
+        UNION ALL
+        (SELECT r.id FROM recipes r
+         WHERE {where} AND r.random_key < {pivot!r}
+         ORDER BY r.random_key LIMIT {limit})
+    ) wrapped
+    LIMIT {limit}
+"""
+
+FALLBACK_SAMPLE = """
+    SELECT r.id FROM recipes r
+    WHERE {where}
+    ORDER BY random()
+    LIMIT {limit}
+"""
+
+# Pre-migration allergen exclusion: any ingredient name containing a term
+TERM_EXCLUSION = """
+    NOT EXISTS (
+        SELECT 1 FROM recipe_ingredients ri
+        WHERE ri.recipe_id = r.id AND LOWER(ri.ingredient_name) LIKE ANY(%s)
+    )
+"""
+
+_warned = False
+
+
+def has_random_key(cur) -> bool:
+    """Whether recipes.random_key exists (checked once per process)"""
+    global _warned
+    exists = has_column(cur, 'recipes', 'random_key')
+    if not exists and not _warned:
+        _warned = True
+        print("⚠️ recipes.random_key missing (run migrations/002_recipes_random_key.sql); "
+              "sampling with ORDER BY random()")
+    return exists
+
+
+def sample_ids_sql(cur, limit: int, extra_where: Optional[str] = None, params: Sequence = ()) -> str:
+    """
+    SQL selecting `limit` random recipe ids (with instructions, plus extra_where
+    with its %s params bound), for use as a CTE. Pivot, limit and params are
+    inlined as literals, so the result can be combined with queries that
+    take no parameters.
+    """
+    if extra_where and params:
+        extra_where = cur.mogrify(extra_where, tuple(params)).decode()
+    where = BASE_WHERE if not extra_where else f"{BASE_WHERE} AND {extra_where}"
+    limit = int(limit)
+    if has_random_key(cur):
+        return RANDOM_KEY_SAMPLE.format(where=where, pivot=random.random(), limit=limit)
+    return FALLBACK_SAMPLE.format(where=where, limit=limit)
+
+
+def _like_pattern(term: str) -> str:
+    escaped = term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f"%{escaped}%"
+
+
+def allergen_exclusion_sql(cur, allergens: Iterable[str], terms: Iterable[str] = ()) -> Tuple[Optional[str], tuple]:
+    """
+    (predicate on recipes r, params) excluding recipes that contain any of the
+    allergen keys, or an ingredient containing any of the extra terms
+    (see allergens.allergy_exclusions). (None, ()) when nothing is excluded.
+
+    With recipes.allergen_mask (migrations/003_recipes_allergen_mask.sql) the
+    keys are one bitwise test; recipes whose mask was never computed (NULL)
+    are excluded too. Without it, every derivative becomes a LIKE term.
+    """
+    allergens = list(allergens)
+    patterns: List[str] = [_like_pattern(t.lower()) for t in terms if t and t.strip()]
+    conditions: List[str] = []
+    params: list = []
+    if allergens:
+        if has_column(cur, 'recipes', 'allergen_mask'):
+            conditions.append("(r.allergen_mask & %s) = 0")
+            params.append(allergen_mask(allergens))
+        else:
+            patterns += [_like_pattern(t) for key in allergens for t in FORBIDDEN_BY_ALLERGEN.get(key, [key])]
+    if patterns:
+        conditions.append(TERM_EXCLUSION)
+        params.append(sorted(set(patterns)))
+    if not conditions:
+        return None, ()
+    return " AND ".join(conditions), tuple(params)
@@ -0,0 +1,261 @@
+"""
+Recipe Search
+Location: main-brain/src/recipe_search.py
+
+Ranked search over recipe titles, ingredient names, category and area for
+GET /api/recipes/search.
+
+Recipes are matched against the recipe_search materialized view
+(migrations/005_recipe_search.sql): one narrow row per browsable recipe
+with a weighted tsvector (title A, ingredients B, category / area C) under
+a GIN index. The query text is parsed with websearch_to_tsquery, so
+"chicken curry", "\"sweet potato\"" and "pasta -mushroom" behave as users
+expect, and results are ordered by ts_rank_cd (weighted cover density,
+which unlike ts_rank also scores queries with a negated word).
+
+- typos: when the full-text query matches nothing (e.g. "chiken"), titles
+  are matched by pg_trgm word similarity instead; the response says which
+  ("match": "fulltext" or "fuzzy")
+- allergies: excluded with the allergen mask predicate of
+  recipe_sampling.allergen_exclusion_sql, inside the index scan
+- pagination: keyset on (rank, id), as in recipe_history.py
+- broad queries: ranking is O(matches), and a word like "chicken" can
+  match a third of the catalog. The first page estimates how many recipes
+  the query matches; above SEARCH_MAX_MATCHES it is ranked within a fixed
+  random sample of the catalog (1/8, 1/64 or 1/512, the view's bucket
+  column, each with a partial index) small enough to stay under that.
+  Narrower queries are ranked over all their matches.
+
+The cursor carries the match mode and sample, so every page of a search
+ranks the same rows.
+
+Until the migration has run, the same rows are built inline (SEARCH_QUERY),
+which is correct but scans the whole catalog.
+
+Settings (env):
+- SEARCH_MAX_MATCHES: estimated matches above which a query is ranked
+  within a sample (default 2000, 0 = never sample)
+
+Usage:
+    page = search_recipes("chicken curry", limit=20, allergies=['peanuts'])
+    page = search_recipes("chicken curry", cursor=page['next_cursor'])
+"""
+
+import base64
+import json
+import os
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Tuple
+
+from psycopg2.extras import RealDictCursor
+
+from allergens import allergy_exclusions
+from db import connection, has_column, has_extension, has_relation
+from metrics import timed_query
+from recipe_history import InvalidCursorError
+from recipe_sampling import allergen_exclusion_sql
+
+MAX_PAGE_SIZE = 100
+MAX_QUERY_LENGTH = 200
+
+SEARCH_MAX_MATCHES = int(os.getenv('SEARCH_MAX_MATCHES', '2000'))
+
+# Sample sizes (1/n of the catalog) with a partial index in migrations/005;
+# bucket is 0-511, so 1/n is `bucket < 512 / n`
+SAMPLES = (1, 8, 64, 512)
+BUCKETS = 512
+
+# Definition of the recipe_search materialized view (migrations/005_recipe_search.sql)
+SEARCH_QUERY = """
+    SELECT
+        r.id, r.title, r.category, r.area AS cuisine, r.image_url,
+        {allergen_mask} AS allergen_mask,
+        (hashtext(r.id::text) & 511)::smallint AS bucket,
+        CASE WHEN jsonb_typeof(rn.per_serving->'kcal') = 'number'
+             THEN (rn.per_serving->>'kcal')::double precision END AS kcal,
+        CASE WHEN jsonb_typeof(rn.per_serving->'protein_g') = 'number'
+             THEN (rn.per_serving->>'protein_g')::double precision END AS protein,
+        setweight(to_tsvector('english', COALESCE(r.title, '')), 'A')
+            || setweight(to_tsvector('english', COALESCE(ing.names, '')), 'B')
+            || setweight(to_tsvector('english', concat_ws(' ', r.category, r.area)), 'C') AS document
+    FROM recipes r
+    LEFT JOIN recipe_nutrients rn ON rn.recipe_id = r.id
+    LEFT JOIN LATERAL (
+        SELECT string_agg(ri.ingredient_name, ' ') AS names
+        FROM recipe_ingredients ri
+        WHERE ri.recipe_id = r.id
+    ) ing ON true
+    WHERE r.instructions IS NOT NULL
+"""
+
+# Match predicate and rank per mode; %(q)s is the raw query text
+MODES = {
+    'fulltext': (
+        "r.document @@ websearch_to_tsquery('english', %(q)s)",
+        "ts_rank_cd(r.document, websearch_to_tsquery('english', %(q)s))"
+    ),
+    'fuzzy': (
+        "%(q)s <%% r.title",
+        "word_similarity(%(q)s, r.title)"
+    )
+}
+
+ESTIMATE_QUERY = "SELECT count(*) FROM recipe_search r WHERE {match} AND r.bucket < {buckets}"
+
+RESULTS_QUERY = """
+    SELECT * FROM (
+        SELECT
+            r.id, r.title, r.image_url, r.category, r.cuisine,
+            COALESCE(r.kcal::text, '300') AS calories,
+            COALESCE(r.protein::text, '15') AS protein,
+            round(({rank})::numeric, 6) AS rank
+        FROM {source} r
+        WHERE {match}
+          {filters}
+    ) ranked
+    {after_cursor}
+    ORDER BY ranked.rank DESC, ranked.id DESC
+    LIMIT %(limit)s
+"""
+
+_warned = False
+
+
+def encode_cursor(mode: str, sample: int, rank: Decimal, recipe_id: Any) -> str:
+    payload = json.dumps([mode, sample, str(rank), str(recipe_id)], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Tuple[str, int, Decimal, str]:
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        mode, sample, rank, recipe_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        if mode not in MODES or sample not in SAMPLES:
+            raise ValueError(mode, sample)
+        return mode, sample, Decimal(rank), str(recipe_id)
+    except (ValueError, TypeError, ArithmeticError) as e:
+        raise InvalidCursorError(f"Invalid search cursor: {cursor!r}") from e
+
+
+def search_source(cur) -> str:
+    """FROM-clause source of searchable recipes: the materialized view, or the live query"""
+    global _warned
+    if has_relation(cur, 'recipe_search'):
+        return "recipe_search"
+    if not _warned:
+        _warned = True
+        print("⚠️ recipe_search view missing (run migrations/005_recipe_search.sql); "
+              "searching without an index")
+    mask = "r.allergen_mask" if has_column(cur, 'recipes', 'allergen_mask') else "NULL::bigint"
+    return f"({SEARCH_QUERY.format(allergen_mask=mask)})"
+
+
+def choose_sample(cur, params: Dict[str, Any]) -> int:
+    """
+    Smallest n such that 1/n of the query's matches fits SEARCH_MAX_MATCHES.
+    Matches are estimated by counting them in the 1/512 sample (a small
+    partial index), which unlike the planner's estimate follows correlated
+    words ("sweet potato") and phrases. Filters are left out: every text
+    match is read before they apply, so they don't reduce the work.
+    """
+    if SEARCH_MAX_MATCHES <= 0 or not has_relation(cur, 'recipe_search'):
+        return 1
+    smallest = SAMPLES[-1]
+    with timed_query('recipe_search_estimate'):
+        cur.execute(ESTIMATE_QUERY.format(match=MODES['fulltext'][0], buckets=BUCKETS // smallest), params)
+    estimate = next(iter(cur.fetchone().values())) * smallest
+    return next((n for n in SAMPLES if estimate / n <= SEARCH_MAX_MATCHES), smallest)
+
+
+def _page(cur, mode: str, sample: int, params: Dict[str, Any], filters: str,
+          after_cursor: str) -> List[Dict[str, Any]]:
+    match, rank = MODES[mode]
+    if sample > 1:
+        # A literal bound, so the planner can use that sample's partial index
+        match = f"{match} AND r.bucket < {BUCKETS // sample}"
+    query = RESULTS_QUERY.format(
+        rank=rank, match=match, source=search_source(cur), filters=filters, after_cursor=after_cursor
+    )
+    with timed_query(f'recipe_search_{mode}'):
+        cur.execute(query, params)
+    return cur.fetchall()
+
+
+def search_recipes(query: str, limit: int = 20, cursor: Optional[str] = None,
+                   allergies: Optional[List[str]] = None, categories: Optional[List[str]] = None,
+                   cuisines: Optional[List[str]] = None) -> Dict[str, Any]:
+    """
+    One page of recipes matching query, best match first, without recipes
+    containing any of the allergies.
+
+    Returns {"results": [...], "match": "fulltext" | "fuzzy", "sampled": bool,
+    "next_cursor": str | None, "has_more": bool}. Raises InvalidCursorError
+    for a malformed cursor.
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    params: Dict[str, Any] = {'q': query.strip()[:MAX_QUERY_LENGTH], 'limit': limit + 1}
+
+    after_cursor = ''
+    if cursor:
+        mode, sample, params['cursor_rank'], params['cursor_id'] = decode_cursor(cursor)
+        after_cursor = "WHERE (ranked.rank, ranked.id) < (%(cursor_rank)s, %(cursor_id)s)"
+
+    with connection() as conn:
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+
+        conditions = []
+        if allergies:
+            predicate, predicate_params = allergen_exclusion_sql(cur, *allergy_exclusions(allergies))
+            if predicate:
+                # Bound here: the rest of the query uses named parameters
+                conditions.append(cur.mogrify(predicate, predicate_params).decode().replace('%', '%%'))
+        for column, values in (('category', categories), ('cuisine', cuisines)):
+            wanted = [v.lower() for v in values or [] if v and v.strip()]
+            if wanted:
+                params[column] = wanted
+                conditions.append(f"lower(r.{column}) = ANY(%({column})s)")
+        filters = ''.join(f"AND {condition}\n" for condition in conditions)
+
+        if cursor:
+            rows = _page(cur, mode, sample, params, filters, after_cursor)
+        else:
+            mode, sample = 'fulltext', choose_sample(cur, params)
+            rows = _page(cur, mode, sample, params, filters, after_cursor)
+            # Filters can leave nothing in a small sample: widen it before giving up
+            while not rows and sample > 1:
+                sample = SAMPLES[SAMPLES.index(sample) - 1]
+                rows = _page(cur, mode, sample, params, filters, after_cursor)
+            if not rows and has_extension(cur, 'pg_trgm'):
+                mode, sample = 'fuzzy', 1
+                rows = _page(cur, mode, sample, params, filters, after_cursor)
+        cur.close()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    results = [
+        {
+            'id': str(row['id']),
+            'title': row['title'],
+            'image_url': row['image_url'],
+            'category': row['category'],
+            'cuisine': row['cuisine'],
+            'calories': row['calories'],
+            'protein': row['protein'],
+            'rank': float(row['rank'])
+        }
+        for row in rows
+    ]
+
+    next_cursor = None
+    if has_more and rows:
+        last = rows[-1]
+        next_cursor = encode_cursor(mode, sample, last['rank'], last['id'])
+
+    return {
+        'results': results,
+        'match': mode,
+        'sampled': sample > 1,
+        'next_cursor': next_cursor,
+        'has_more': has_more
+    }
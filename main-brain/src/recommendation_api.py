@@ -3,20 +3,48 @@ Enhanced Recommendation API Server
 Location: main-brain/src/recommendation_api.py
 """
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, AsyncIterator, Awaitable, Callable
 from datetime import datetime
+import asyncio
+import time
 import uvicorn
 import os
 from dotenv import load_dotenv
 
-from langgraph_recommendation_agent import LangGraphRecipeAgent
-from meal_planner_agent import MealPlannerAgent
-from agents.meal_planner import DSPyMealPlannerService, dspy_meal_planner as dspy_meal_planner_instance
-from agents import host_agent
-from agents.nutrition_goals import nutrition_goals_agent, calculate_nutrition_goals
+# Agents (and langchain / langgraph / dspy behind them) are imported and
+# constructed on first use through the registry; see /api/startup-report.
+from agent_registry import registry, preload_from_env, record_import
+
+_t0 = time.perf_counter()
+from agents.nutrition_goals import nutrition_goals_agent, calculate_nutrition_goals, calculate_nutrition_goals_batch
+record_import('agents.nutrition_goals', (time.perf_counter() - _t0) * 1000)
+from meal_plan_jobs import MealPlanJobQueue
+from response_assembly import JSONBytesResponse, dumps, json_response, to_jsonable
+from recipe_cards import fetch_card_async, sample_cards_async
+from recipe_history import InvalidCursorError, fetch_history, fetch_history_async
+from recipe_safety import RecipeNotFoundError, analyze_recipe_safety, analyze_recipe_safety_async
+from recipe_search import MAX_QUERY_LENGTH, search_recipes
+from recommendation_cache import (
+    recommendation_cache, make_signature, invalidate_user_async, listen_for_recommendation_invalidations
+)
+from single_flight import flight_key, flight_stats, meal_plan_flights, personalized_recipe_flights
+import async_db
+import metrics
+import worker_health
+from recipe_catalog import catalog, load_from_env as load_catalog_from_env
+from admission_control import AdmissionRejectedError, admission
+from db import PoolTimeoutError, pool as db_connections
+from event_log import EventLogFullError, event_log
+from llm_cache import response_cache
+from user_profiles import (
+    get_user_profile_async, invalidate_user_profile, invalidate_user_profile_async,
+    listen_for_invalidations, profile_cache
+)
+from worker_pools import POOLS, WorkerPool, PoolSaturatedError, cpu_pool, db_pool, llm_pool, meal_plan_pool, pool_stats, shutdown_pools
 
 load_dotenv()
 
@@ -35,25 +63,174 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize the recommendation agent
-try:
-    agent = LangGraphRecipeAgent()
-    print("LangGraph recommendation agent initialized successfully")
-except Exception as e:
-    print(f"Failed to initialize recommendation agent: {e}")
-    agent = None
 
-# Initialize the meal planner agent
+def _run_meal_plan_job(**params) -> Dict[str, Any]:
+    return registry.get('dspy_meal_planner').generate_meal_plan(**params)
+
+
+# Background job queue for long meal plan generations
 try:
-    meal_planner = MealPlannerAgent()
-    print("Meal planner agent initialized successfully")
+    meal_plan_jobs = MealPlanJobQueue(_run_meal_plan_job)
+    print("Meal plan job queue initialized successfully")
 except Exception as e:
-    print(f"Failed to initialize meal planner agent: {e}")
-    meal_planner = None
+    print(f"Failed to initialize meal plan job queue: {e}")
+    meal_plan_jobs = None
+
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """Request latency per endpoint (route template, so path params don't explode cardinality)"""
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get('route')
+        metrics.http_request_duration.observe(
+            getattr(route, 'path', 'unmatched'),
+            request.method,
+            status,
+            value=time.perf_counter() - start
+        )
+
+
+def _pool_busy(e: PoolSaturatedError) -> HTTPException:
+    print(f"Rejecting request: {e}")
+    return HTTPException(
+        status_code=503,
+        detail=f"Service busy, please retry shortly ({e.pool_name} pool full)",
+        headers={"Retry-After": str(admission.retry_after(POOLS[e.pool_name]))}
+    )
+
+
+def _db_busy(e: Exception) -> HTTPException:
+    print(f"Rejecting request: {e}")
+    return HTTPException(
+        status_code=503,
+        detail="Database busy, please retry shortly",
+        headers={"Retry-After": "5"}
+    )
+
+
+def _shed(e: AdmissionRejectedError) -> HTTPException:
+    print(f"Shedding request: {e}")
+    return HTTPException(
+        status_code=503,
+        detail=f"Service busy, estimated wait {e.estimated_wait:.0f}s, please retry later",
+        headers={"Retry-After": str(e.retry_after)}
+    )
+
+
+async def run_blocking(pool: WorkerPool, fn: Callable, *args, **kwargs) -> Any:
+    """
+    Run a blocking agent call on a worker pool. Returns 503 + Retry-After when
+    the pool is full or its estimated queue wait is over budget.
+    """
+    try:
+        admission.admit(pool)
+        return await pool.run(admission.track(pool, fn), *args, **kwargs)
+    except AdmissionRejectedError as e:
+        raise _shed(e)
+    except PoolSaturatedError as e:
+        raise _pool_busy(e)
+    except (PoolTimeoutError, EventLogFullError) as e:
+        raise _db_busy(e)
+
+
+async def run_async(awaitable: Awaitable) -> Any:
+    """
+    Await a database read on the async pool (async_db.py) or an event log
+    enqueue; 503 + Retry-After when no connection / buffer room frees up in time.
+    """
+    try:
+        return await awaitable
+    except (PoolTimeoutError, EventLogFullError) as e:
+        raise _db_busy(e)
+
+
+def stream_blocking(pool: WorkerPool, gen_fn: Callable, *args, **kwargs) -> AsyncIterator[Any]:
+    """Run a blocking generator on a worker pool, with the same admission checks as run_blocking"""
+    try:
+        admission.admit(pool)
+        return pool.iterate(admission.track_iter(pool, gen_fn), *args, **kwargs)
+    except AdmissionRejectedError as e:
+        raise _shed(e)
+    except PoolSaturatedError as e:
+        raise _pool_busy(e)
+
+
+async def require_agent(name: str, label: str) -> Any:
+    """
+    Get an agent from the registry, returning 503 if it cannot be built.
+    The first call constructs the agent on a worker thread so the event loop
+    is not blocked by imports and LLM client setup.
+    """
+    if registry.is_initialized(name):
+        return registry.get(name)
+    instance = await run_blocking(llm_pool, registry.get_or_none, name)
+    if instance is None:
+        raise HTTPException(status_code=503, detail=f"{label} service unavailable")
+    return instance
+
+
+@app.on_event("startup")
+def _preload_agents():
+    preload_from_env()
+
+
+@app.on_event("startup")
+def _preload_catalog():
+    # Already loaded (and shared) when the master in serve.py forked us
+    load_catalog_from_env()
+
+
+@app.on_event("startup")
+def _warm_db_pool():
+    try:
+        db_connections.warm()
+    except Exception as e:
+        print(f"⚠️ Database pool warm-up failed (connections open on first use): {e}")
+
+
+@app.on_event("startup")
+async def _start_async_db():
+    # Per worker process: asyncpg pools are bound to this event loop
+    await async_db.start()
+    await listen_for_invalidations()
+    await listen_for_recommendation_invalidations()
+
+
+@app.on_event("startup")
+def _start_meal_plan_jobs():
+    # Per worker process: claims jobs left queued (or with an expired lease)
+    # by a restart or reload, not only after the next submit
+    if meal_plan_jobs:
+        meal_plan_jobs.start()
+
+
+@app.on_event("shutdown")
+async def _close_async_db():
+    await async_db.close()
+
+
+@app.on_event("shutdown")
+def _stop_meal_plan_jobs():
+    if meal_plan_jobs:
+        meal_plan_jobs.stop()
+
+
+@app.on_event("shutdown")
+def _shutdown_worker_pools():
+    shutdown_pools(wait=False)
+
+
+@app.on_event("shutdown")
+def _flush_event_log():
+    # Write buffered recipe_events before the process exits
+    event_log.stop()
 
-# Use the DSPy meal planner from the agents module
-dspy_meal_planner = dspy_meal_planner_instance
-print("DSPy meal planner initialized successfully")
 
 # Enhanced Request/Response models
 
@@ -146,6 +323,7 @@ class HealthCheckResponse(BaseModel):
     version: str
     agent_available: bool
     features: List[str]
+    worker_pools: Optional[Dict[str, Dict[str, int]]] = None
 
 # Meal Planner Request/Response models
 class MealPlanChatMessage(BaseModel):
@@ -233,6 +411,23 @@ class DSPyMealPlanResponse(BaseModel):
     error: Optional[str] = None
 
 
+class MealPlanJobProgress(BaseModel):
+    days_done: int
+    days_total: int
+
+
+class MealPlanJobResponse(BaseModel):
+    """Status of an asynchronous meal plan generation job"""
+    job_id: str
+    status: str  # queued | running | done | failed
+    progress: MealPlanJobProgress
+    error: Optional[str] = None
+    deduplicated: Optional[bool] = None
+    created_at: float
+    updated_at: float
+    finished_at: Optional[float] = None
+
+
 # API Endpoints
 @app.get("/health", response_model=HealthCheckResponse)
 async def health_check():
@@ -251,115 +446,119 @@ async def health_check():
         timestamp=datetime.now(),
         service="enhanced-recommendation-api",
         version="2.0.0",
-        agent_available=agent is not None,
-        features=features
+        agent_available=registry.report()['agents']['langgraph_recipe_agent']['error'] is None,
+        features=features,
+        worker_pools=pool_stats()
     )
 
+def _recommendation_payload(rec: Dict[str, Any]) -> Dict[str, Any]:
+    """One agent recommendation as an EnhancedRecipeRecommendation-shaped dict"""
+    return {
+        'id': rec['id'],
+        'title': rec['title'],
+        'image_url': rec.get('image_url'),
+        'category': rec.get('category'),
+        'cuisine': rec.get('cuisine'),
+        'calories': rec.get('calories'),
+        'protein': rec.get('protein'),
+        'carbs': rec.get('carbs'),
+        'fat': rec.get('fat'),
+        'fiber': rec.get('fiber'),
+        'sugar': rec.get('sugar'),
+        'sodium': rec.get('sodium'),
+        'servings': rec.get('servings'),
+        'instructions': rec.get('instructions'),
+        'structured_instructions': [
+            {
+                'step': step.get('step', 1),
+                'instruction': step.get('instruction', ''),
+                'time': step.get('time', 'varies'),
+                'equipment': step.get('equipment', [])
+            }
+            for step in rec.get('structured_instructions', [])
+            if isinstance(step, dict)
+        ],
+        'ingredients': [
+            {
+                'ingredient_id': ing.get('ingredient_id'),
+                'name': ing.get('name', 'Unknown ingredient'),
+                'amount': ing.get('amount'),
+                'unit': ing.get('unit'),
+                'category': ing.get('category'),
+                'notes': ing.get('notes')
+            }
+            for ing in rec.get('ingredients', [])
+            if ing  # Skip None/empty ingredients
+        ],
+        'recommendation_reason': rec.get('recommendation_reason', 'Matches your preferences'),
+        'tags': rec.get('tags', []) or [],
+        'safety_info': {
+            'validated': rec.get('safety_validated', False),
+            'score': rec.get('safety_score', 100),
+            'warnings': rec.get('safety_warnings', []),
+            'modifications': rec.get('safety_modifications', [])
+        },
+        'adaptation_info': {
+            'notes': rec.get('adaptation_notes', []),
+            'portion_adapted': rec.get('portion_adapted', False),
+            'cooking_adapted': rec.get('cooking_adapted', False),
+            'ingredients_adapted': rec.get('ingredients_adapted', False)
+        }
+    }
+
+
 @app.post("/api/recommendations", response_model=EnhancedRecommendationResponse)
 async def get_recommendations(request: RecommendationRequest):
     """Get personalized recipe recommendations with safety validation and adaptation"""
     
-    if not agent:
-        raise HTTPException(status_code=503, detail="Recommendation service unavailable")
+    agent = await require_agent('langgraph_recipe_agent', "Recommendation")
     
     try:
-        # Get recommendations from the enhanced agent
-        result = agent.get_recommendations(request.user_id)
-        
-        if result.get('error'):
-            raise HTTPException(status_code=400, detail=result['error'])
-        
-        # Transform the response to match our enhanced API model
-        recommendations = []
-        total_adapted = 0
-        total_safety_validated = 0
-        
-        for rec in result.get('recommendations', []):
-            # Process ingredients
-            ingredients = []
-            for ing in rec.get('ingredients', []):
-                if ing:  # Skip None/empty ingredients
-                    ingredient = RecipeIngredient(
-                        ingredient_id=ing.get('ingredient_id'),
-                        name=ing.get('name', 'Unknown ingredient'),
-                        amount=ing.get('amount'),
-                        unit=ing.get('unit'),
-                        category=ing.get('category'),
-                        notes=ing.get('notes')
-                    )
-                    ingredients.append(ingredient)
-            
-            # Process structured instructions
-            structured_instructions = []
-            for step_data in rec.get('structured_instructions', []):
-                if isinstance(step_data, dict):
-                    step = InstructionStep(
-                        step=step_data.get('step', 1),
-                        instruction=step_data.get('instruction', ''),
-                        time=step_data.get('time', 'varies'),
-                        equipment=step_data.get('equipment', [])
-                    )
-                    structured_instructions.append(step)
-            
-            # Create safety info
-            safety_info = SafetyInfo(
-                validated=rec.get('safety_validated', False),
-                score=rec.get('safety_score', 100),
-                warnings=rec.get('safety_warnings', []),
-                modifications=rec.get('safety_modifications', [])
-            )
-            
-            if safety_info.validated:
-                total_safety_validated += 1
-            
-            # Create adaptation info
-            adaptation_info = AdaptationInfo(
-                notes=rec.get('adaptation_notes', []),
-                portion_adapted=rec.get('portion_adapted', False),
-                cooking_adapted=rec.get('cooking_adapted', False),
-                ingredients_adapted=rec.get('ingredients_adapted', False)
-            )
-            
-            if any([adaptation_info.portion_adapted, adaptation_info.cooking_adapted, adaptation_info.ingredients_adapted]):
-                total_adapted += 1
+        # Serve a recent payload for this user unless the client asked for a refresh
+        signature = make_signature(
+            include_safety_details=request.include_safety_details,
+            include_adaptations=request.include_adaptations
+        )
+        result = None if request.refresh else recommendation_cache.get(request.user_id, signature)
+
+        if result is None:
+            candidates = None
+            if not catalog.loaded and async_db.enabled():
+                # Sample on the event loop; the worker thread then never waits on Postgres
+                candidates = await run_async(sample_cards_async(20))
+
+            # Get recommendations from the enhanced agent
+            result = await run_blocking(db_pool, agent.get_recommendations, request.user_id, candidates)
             
-            # Create the enhanced recipe recommendation
-            recipe_data = EnhancedRecipeRecommendation(
-                id=rec['id'],
-                title=rec['title'],
-                image_url=rec.get('image_url'),
-                category=rec.get('category'),
-                cuisine=rec.get('cuisine'),
-                calories=rec.get('calories'),
-                protein=rec.get('protein'),
-                carbs=rec.get('carbs'),
-                fat=rec.get('fat'),
-                fiber=rec.get('fiber'),
-                sugar=rec.get('sugar'),
-                sodium=rec.get('sodium'),
-                servings=rec.get('servings'),
-                instructions=rec.get('instructions'),
-                structured_instructions=structured_instructions,
-                ingredients=ingredients,
-                recommendation_reason=rec.get('recommendation_reason', 'Matches your preferences'),
-                tags=rec.get('tags', []) or [],
-                safety_info=safety_info,
-                adaptation_info=adaptation_info
-            )
-            recommendations.append(recipe_data)
+            if result.get('error'):
+                raise HTTPException(status_code=400, detail=result['error'])
+
+            recommendation_cache.put(request.user_id, signature, result)
+        
+        # Transform the response to match our enhanced API model (validated
+        # once as a whole and encoded in one step; see response_assembly.py)
+        recommendations = [
+            _recommendation_payload(rec)
+            for rec in result.get('recommendations', [])
+        ]
+        total_adapted = sum(
+            1 for rec in recommendations
+            if any(rec['adaptation_info'][flag] for flag in ('portion_adapted', 'cooking_adapted', 'ingredients_adapted'))
+        )
+        total_safety_validated = sum(1 for rec in recommendations if rec['safety_info']['validated'])
         
         # Limit results as requested
         limited_recommendations = recommendations[:request.limit]
         
-        return EnhancedRecommendationResponse(
-            user_id=request.user_id,
-            recommendations=limited_recommendations,
-            filters_applied=result.get('filters_applied', {}),
-            messages=result.get('messages', []),
-            generated_at=datetime.now(),
-            total_adapted=total_adapted,
-            total_safety_validated=total_safety_validated
-        )
+        return json_response(EnhancedRecommendationResponse, {
+            'user_id': request.user_id,
+            'recommendations': limited_recommendations,
+            'filters_applied': result.get('filters_applied', {}),
+            'messages': result.get('messages', []),
+            'generated_at': datetime.now(),
+            'total_adapted': total_adapted,
+            'total_safety_validated': total_safety_validated
+        })
         
     except HTTPException:
         raise
@@ -371,9 +570,6 @@ async def get_recommendations(request: RecommendationRequest):
 async def record_feedback(request: FeedbackRequest):
     """Record user feedback on recommendations"""
 
-    if not agent:
-        raise HTTPException(status_code=503, detail="Recommendation service unavailable")
-
     # Map frontend events to agent events
     event_mapping = {
         'like': 'like',
@@ -392,15 +588,16 @@ async def record_feedback(request: FeedbackRequest):
     if event_type not in valid_events:
         raise HTTPException(status_code=400, detail=f"Invalid event type. Must be one of: {valid_events}")
 
+    # Events that change what we should recommend to this user
+    invalidating_events = {'like', 'hide', 'save'}
+
     try:
-        success = agent.record_feedback(
-            request.user_id,
-            request.recipe_id,
-            event_type
-        )
+        # Buffered for the background writer (event_log.py); no thread or connection held
+        await run_async(event_log.record_async(request.user_id, request.recipe_id, event_type))
 
-        if not success:
-            raise HTTPException(status_code=400, detail="Failed to record feedback")
+        if event_type in invalidating_events:
+            # Every worker's cache, not just this one's (recommendation_cache.py)
+            await invalidate_user_async(request.user_id)
 
         return {
             "success": True,
@@ -408,6 +605,8 @@ async def record_feedback(request: FeedbackRequest):
             "event_recorded": event_type
         }
 
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error recording feedback: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to record feedback: {str(e)}")
@@ -419,11 +618,25 @@ async def personalize_for_cooking(request: PersonalizeForCookingRequest):
     This applies all personalization: safety validation, adaptations, substitutions
     """
 
-    if not agent:
-        raise HTTPException(status_code=503, detail="Recommendation service unavailable")
+    agent = await require_agent('langgraph_recipe_agent', "Recommendation")
 
     try:
-        result = agent.personalize_for_cooking(request.user_id, request.recipe_id)
+        if async_db.enabled():
+            # Reads on the event loop; only the LLM call takes an llm_pool thread
+            profile = await run_async(get_user_profile_async(request.user_id))
+            if profile is None:
+                raise HTTPException(status_code=400, detail='User profile not found')
+            try:
+                recipe = await run_async(fetch_card_async(request.recipe_id))
+            except async_db.DataError:
+                recipe = None  # not a valid uuid
+            if recipe is None:
+                raise HTTPException(status_code=400, detail='Recipe not found')
+            result = await run_blocking(
+                llm_pool, agent.personalize_for_cooking, request.user_id, request.recipe_id, profile, recipe
+            )
+        else:
+            result = await run_blocking(llm_pool, agent.personalize_for_cooking, request.user_id, request.recipe_id)
 
         if result.get('error'):
             raise HTTPException(status_code=400, detail=result['error'])
@@ -442,30 +655,72 @@ async def personalize_for_cooking(request: PersonalizeForCookingRequest):
         raise HTTPException(status_code=500, detail=f"Failed to personalize recipe: {str(e)}")
 
 @app.get("/api/recommendations/{user_id}/history")
-async def get_recommendation_history(user_id: str, limit: int = 50):
-    """Get user's recommendation history"""
-    
-    if not agent:
-        raise HTTPException(status_code=503, detail="Recommendation service unavailable")
-    
+async def get_recommendation_history(
+    user_id: str,
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    event: Optional[List[str]] = Query(default=None)
+):
+    """
+    User's recipe event history (views, likes, saves, ...) with recipe cards,
+    newest first.
+
+    Paginate by passing the returned `next_cursor` back as `cursor`; filter
+    by event type with repeated `event=` parameters (e.g. ?event=like&event=save).
+    """
     try:
-        # This would need to be implemented in the agent
-        # For now, return empty history with helpful message
-        return {
-            "user_id": user_id,
-            "history": [],
-            "message": "History endpoint not yet implemented",
-            "note": "Check recipe_events table for user interaction history"
-        }
+        if async_db.enabled():
+            page = await run_async(fetch_history_async(user_id, limit=limit, cursor=cursor, events=event))
+        else:
+            page = await run_blocking(
+                db_pool, fetch_history, user_id, limit=limit, cursor=cursor, events=event
+            )
+        return {"user_id": user_id, **page}
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except HTTPException:
+        raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        print(f"Error fetching recommendation history: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to fetch history: {str(e)}")
+
+@app.get("/api/recipes/search")
+async def search_recipe_catalog(
+    q: str = Query(..., min_length=1, max_length=MAX_QUERY_LENGTH),
+    limit: int = 20,
+    cursor: Optional[str] = None,
+    allergy: Optional[List[str]] = Query(default=None),
+    category: Optional[List[str]] = Query(default=None),
+    cuisine: Optional[List[str]] = Query(default=None)
+):
+    """
+    Search recipes by title, ingredients, category and cuisine, best match
+    first (no LLM).
+
+    Recipes containing any of the repeated `allergy=` values are excluded
+    (e.g. ?q=curry&allergy=peanuts&allergy=dairy); `category=` / `cuisine=`
+    narrow the results. Paginate by passing the returned `next_cursor` back
+    as `cursor`.
+    """
+    try:
+        page = await run_blocking(
+            db_pool, search_recipes, q, limit=limit, cursor=cursor,
+            allergies=allergy, categories=category, cuisines=cuisine
+        )
+        return {"query": q, **page}
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error searching recipes: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to search recipes: {str(e)}")
 
 @app.get("/api/user/{user_id}/safety-profile")
 async def get_user_safety_profile(user_id: str):
     """Get user's safety profile for debugging"""
     
-    if not agent:
-        raise HTTPException(status_code=503, detail="Recommendation service unavailable")
+    agent = await require_agent('langgraph_recipe_agent', "Recommendation")
     
     try:
         # This could be extracted from the agent's user profile loading
@@ -477,23 +732,40 @@ async def get_user_safety_profile(user_id: str):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/users/{user_id}/profile/invalidate")
+async def invalidate_profile(user_id: str):
+    """
+    Drop a user's cached profile (user_profiles.py) and cached
+    recommendations in every worker. Called by the TS backend after it
+    updates user_profiles / user_health_profiles.
+    """
+    try:
+        if async_db.enabled():
+            cached = await run_async(invalidate_user_profile_async(user_id))
+        else:
+            cached = await run_blocking(db_pool, invalidate_user_profile, user_id)
+        return {"user_id": user_id, "invalidated": True, "was_cached": cached}
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error invalidating user profile: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to invalidate profile: {str(e)}")
+
 @app.get("/api/recipe/{recipe_id}/safety-analysis")
-async def analyze_recipe_safety(recipe_id: str, user_id: Optional[str] = None):
-    """Analyze safety of a specific recipe"""
-    
-    if not agent:
-        raise HTTPException(status_code=503, detail="Recommendation service unavailable")
-    
+async def get_recipe_safety_analysis(recipe_id: str, user_id: Optional[str] = None):
+    """Allergens in a recipe and, with user_id, the user's allergy and medical conflicts (no LLM)"""
+
     try:
-        # This would require implementing a specific safety analysis endpoint
-        return {
-            "recipe_id": recipe_id,
-            "user_id": user_id,
-            "message": "Recipe safety analysis endpoint",
-            "note": "This would provide detailed safety analysis for a specific recipe"
-        }
+        if async_db.enabled():
+            return await run_async(analyze_recipe_safety_async(recipe_id, user_id))
+        return await run_blocking(db_pool, analyze_recipe_safety, recipe_id, user_id)
+    except RecipeNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except HTTPException:
+        raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        print(f"Error analyzing recipe safety: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to analyze recipe safety: {str(e)}")
 
 @app.get("/api/adaptations/options")
 async def get_adaptation_options():
@@ -525,8 +797,7 @@ async def meal_plan_chat(request: MealPlanChatRequest):
     Chat with the meal planning AI assistant.
     The assistant helps users plan their meals based on preferences.
     """
-    if not meal_planner:
-        raise HTTPException(status_code=503, detail="Meal planner service unavailable")
+    meal_planner = await require_agent('meal_planner_agent', "Meal planner")
 
     try:
         # Convert messages to the format expected by the agent
@@ -543,7 +814,9 @@ async def meal_plan_chat(request: MealPlanChatRequest):
         }
 
         # Call the meal planner agent
-        response = meal_planner.chat(
+        response = await run_blocking(
+            llm_pool,
+            meal_planner.chat,
             user_id=request.user_id,
             messages=messages,
             health_context=health_context
@@ -551,6 +824,8 @@ async def meal_plan_chat(request: MealPlanChatRequest):
 
         return {"content": response}
 
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error in meal plan chat: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Chat failed: {str(e)}")
@@ -561,8 +836,7 @@ async def generate_meal_plan(request: MealPlanGenerateRequest):
     Generate a complete meal plan based on conversation and user profile.
     This creates a weekly meal plan and saves it to the database.
     """
-    if not meal_planner:
-        raise HTTPException(status_code=503, detail="Meal planner service unavailable")
+    meal_planner = await require_agent('meal_planner_agent', "Meal planner")
 
     try:
         # Convert messages to the format expected by the agent
@@ -579,7 +853,9 @@ async def generate_meal_plan(request: MealPlanGenerateRequest):
         }
 
         # Generate the meal plan
-        result = meal_planner.generate_meal_plan(
+        result = await run_blocking(
+            meal_plan_pool,
+            meal_planner.generate_meal_plan,
             user_id=request.user_id,
             messages=messages,
             health_context=health_context,
@@ -597,7 +873,7 @@ async def generate_meal_plan(request: MealPlanGenerateRequest):
         # Save the meal plan to database
         meals = result.get('meals', [])
         if meals:
-            save_success = meal_planner.save_meal_plan(request.user_id, meals)
+            save_success = await run_blocking(db_pool, meal_planner.save_meal_plan, request.user_id, meals)
             if not save_success:
                 print("Warning: Failed to save meal plan to database")
 
@@ -623,6 +899,8 @@ async def generate_meal_plan(request: MealPlanGenerateRequest):
             summary=result.get('summary', f'Created a {request.numberOfDays}-day meal plan')
         )
 
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error generating meal plan: {str(e)}")
         import traceback
@@ -630,6 +908,83 @@ async def generate_meal_plan(request: MealPlanGenerateRequest):
         raise HTTPException(status_code=500, detail=f"Failed to generate meal plan: {str(e)}")
 
 
+def _dspy_plan_settings(request: MealPlanGenerateRequest):
+    """Messages, health context, meals per day and fasting option for a DSPy plan request"""
+    # Convert messages to the format expected by the service
+    messages = [{"role": msg.role, "content": msg.content} for msg in request.messages]
+    
+    # Get fasting and meals per day settings
+    fasting_option = request.fastingOption or 'none'
+    meals_per_day = request.mealsPerDay or request.healthContext.mealsPerDay or 3
+    
+    print(f"🍽️ DSPy Generation settings: {meals_per_day} meals/day, fasting: {fasting_option}")
+
+    # Convert health context to dict including fasting info
+    health_context = {
+        "allergies": request.healthContext.allergies,
+        "medicalConditions": request.healthContext.medicalConditions,
+        "dietStyle": request.healthContext.dietStyle,
+        "healthGoals": request.healthContext.healthGoals,
+        "dailyCalorieGoal": request.healthContext.dailyCalorieGoal,
+        "cookingSkill": request.healthContext.cookingSkill,
+        "fastingSchedule": fasting_option if fasting_option != 'none' else None,
+        "mealsPerDay": meals_per_day
+    }
+    return messages, health_context, meals_per_day, fasting_option
+
+
+def _dspy_meal_payload(meal: Dict[str, Any]) -> Dict[str, Any]:
+    """A generated meal dict as a DSPyMeal-shaped dict (matching RecommendationCard)"""
+    nutrition_data = meal.get('nutrition', {})
+    return {
+        'id': meal.get('id', ''),
+        'name': meal.get('name', 'Delicious Meal'),
+        'image': meal.get('image'),
+        'cookTime': meal.get('cookTime', '30 mins'),
+        'servings': meal.get('servings', 1),
+        'difficulty': meal.get('difficulty', 'Easy'),
+        'rating': 4.5,
+        'tags': meal.get('tags', []),
+        'description': meal.get('description', ''),
+        'ingredients': [
+            {
+                'name': ing.get('name', ''),
+                'amount': ing.get('amount', ''),
+                'category': ing.get('category', 'Other')
+            }
+            for ing in meal.get('ingredients', [])
+            if isinstance(ing, dict)
+        ],
+        'instructions': meal.get('instructions', []),
+        'nutrition': {
+            'calories': nutrition_data.get('calories', 400),
+            'protein': nutrition_data.get('protein', 25),
+            'carbs': nutrition_data.get('carbs', 40),
+            'fat': nutrition_data.get('fat', 15)
+        },
+        'meal_slot': meal.get('meal_slot', 'lunch'),
+        'plan_date': meal.get('plan_date', '')
+    }
+
+
+def _dspy_meal_plan_payload(result: Dict[str, Any], number_of_days: int) -> Dict[str, Any]:
+    """A DSPyMealPlannerService result dict as a DSPyMealPlanResponse-shaped dict"""
+    if result.get('error'):
+        return {
+            'meals': [],
+            'summary': result.get('summary', 'Error generating meal plan'),
+            'stats': None,
+            'error': result.get('error')
+        }
+
+    return {
+        'meals': [_dspy_meal_payload(meal) for meal in result.get('meals', [])],
+        'summary': result.get('summary', f'Created a {number_of_days}-day meal plan'),
+        'stats': result.get('stats'),
+        'error': None
+    }
+
+
 @app.post("/api/meal-plans/dspy-generate", response_model=DSPyMealPlanResponse)
 async def generate_dspy_meal_plan(request: MealPlanGenerateRequest):
     """
@@ -637,33 +992,27 @@ async def generate_dspy_meal_plan(request: MealPlanGenerateRequest):
     Returns meals with ingredients, instructions, and accurate nutrition.
     This is the enhanced version that matches the RecommendationCard format.
     """
-    if not dspy_meal_planner:
-        raise HTTPException(status_code=503, detail="DSPy meal planner service unavailable")
+    dspy_meal_planner = await require_agent('dspy_meal_planner', "DSPy meal planner")
 
     try:
-        # Convert messages to the format expected by the service
-        messages = [{"role": msg.role, "content": msg.content} for msg in request.messages]
-        
-        # Get fasting and meals per day settings
-        fasting_option = request.fastingOption or 'none'
-        meals_per_day = request.mealsPerDay or request.healthContext.mealsPerDay or 3
-        
-        print(f"🍽️ DSPy Generation settings: {meals_per_day} meals/day, fasting: {fasting_option}")
+        messages, health_context, meals_per_day, fasting_option = _dspy_plan_settings(request)
 
-        # Convert health context to dict including fasting info
-        health_context = {
-            "allergies": request.healthContext.allergies,
-            "medicalConditions": request.healthContext.medicalConditions,
-            "dietStyle": request.healthContext.dietStyle,
-            "healthGoals": request.healthContext.healthGoals,
-            "dailyCalorieGoal": request.healthContext.dailyCalorieGoal,
-            "cookingSkill": request.healthContext.cookingSkill,
-            "fastingSchedule": fasting_option if fasting_option != 'none' else None,
-            "mealsPerDay": meals_per_day
-        }
+        # Identical plans already being generated (shared family plan, client
+        # retries) are joined rather than regenerated. user_id only affects
+        # logging, so it is not part of the key.
+        key = flight_key(
+            health_context=health_context,
+            start_date=request.startDate,
+            number_of_days=request.numberOfDays,
+            meals_per_day=meals_per_day,
+            fasting_option=fasting_option,
+            preferences=[m['content'] for m in messages if m.get('role') == 'user']
+        )
 
         # Generate the meal plan with DSPy
-        result = dspy_meal_planner.generate_meal_plan(
+        result = await meal_plan_flights.do(key, lambda: run_blocking(
+            meal_plan_pool,
+            dspy_meal_planner.generate_meal_plan,
             user_id=request.user_id,
             messages=messages,
             health_context=health_context,
@@ -671,60 +1020,12 @@ async def generate_dspy_meal_plan(request: MealPlanGenerateRequest):
             number_of_days=request.numberOfDays,
             meals_per_day=meals_per_day,
             fasting_option=fasting_option
-        )
-
-        if result.get('error'):
-            return DSPyMealPlanResponse(
-                meals=[],
-                summary=result.get('summary', 'Error generating meal plan'),
-                error=result.get('error')
-            )
-
-        # Convert meals to response format matching RecommendationCard
-        dspy_meals = []
-        for meal in result.get('meals', []):
-            # Process ingredients
-            ingredients = []
-            for ing in meal.get('ingredients', []):
-                if isinstance(ing, dict):
-                    ingredients.append(DSPyIngredient(
-                        name=ing.get('name', ''),
-                        amount=ing.get('amount', ''),
-                        category=ing.get('category', 'Other')
-                    ))
+        ))
 
-            # Process nutrition
-            nutrition_data = meal.get('nutrition', {})
-            nutrition = DSPyNutrition(
-                calories=nutrition_data.get('calories', 400),
-                protein=nutrition_data.get('protein', 25),
-                carbs=nutrition_data.get('carbs', 40),
-                fat=nutrition_data.get('fat', 15)
-            )
-
-            dspy_meals.append(DSPyMeal(
-                id=meal.get('id', ''),
-                name=meal.get('name', 'Delicious Meal'),
-                image=meal.get('image'),
-                cookTime=meal.get('cookTime', '30 mins'),
-                servings=meal.get('servings', 1),
-                difficulty=meal.get('difficulty', 'Easy'),
-                rating=4.5,
-                tags=meal.get('tags', []),
-                description=meal.get('description', ''),
-                ingredients=ingredients,
-                instructions=meal.get('instructions', []),
-                nutrition=nutrition,
-                meal_slot=meal.get('meal_slot', 'lunch'),
-                plan_date=meal.get('plan_date', '')
-            ))
-
-        return DSPyMealPlanResponse(
-            meals=dspy_meals,
-            summary=result.get('summary', f'Created a {request.numberOfDays}-day meal plan'),
-            stats=result.get('stats')
-        )
+        return json_response(DSPyMealPlanResponse, _dspy_meal_plan_payload(result, request.numberOfDays))
 
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error generating DSPy meal plan: {str(e)}")
         import traceback
@@ -732,6 +1033,122 @@ async def generate_dspy_meal_plan(request: MealPlanGenerateRequest):
         raise HTTPException(status_code=500, detail=f"Failed to generate meal plan: {str(e)}")
 
 
+@app.post("/api/meal-plans/dspy-generate/stream")
+async def stream_dspy_meal_plan(request: MealPlanGenerateRequest, http_request: Request):
+    """
+    Streaming variant of /api/meal-plans/dspy-generate.
+
+    Sends each day's validated meals as soon as that day is generated, then a
+    final summary frame, so the first meals arrive after one LLM call instead
+    of after the whole plan. Frames are NDJSON by default, or Server-Sent
+    Events when the client sends `Accept: text/event-stream`.
+
+    Frame types:
+    - day:     {"type": "day", "day": 1, "date": "...", "meals": [DSPyMeal, ...]}
+    - summary: {"type": "summary", "summary": "...", "stats": {...}}
+    - error:   {"type": "error", "error": "..."}
+    """
+    dspy_meal_planner = await require_agent('dspy_meal_planner', "DSPy meal planner")
+
+    messages, health_context, meals_per_day, fasting_option = _dspy_plan_settings(request)
+
+    frames = stream_blocking(
+        meal_plan_pool,
+        dspy_meal_planner.stream_meal_plan,
+        user_id=request.user_id,
+        messages=messages,
+        health_context=health_context,
+        start_date=request.startDate,
+        number_of_days=request.numberOfDays,
+        meals_per_day=meals_per_day,
+        fasting_option=fasting_option
+    )
+
+    use_sse = 'text/event-stream' in http_request.headers.get('accept', '')
+
+    def encode(frame: Dict[str, Any]) -> str:
+        if frame.get('type') == 'day':
+            frame = {**frame, 'meals': to_jsonable(List[DSPyMeal], [_dspy_meal_payload(m) for m in frame['meals']])}
+        data = dumps(frame).decode('utf-8')
+        if use_sse:
+            return f"event: {frame.get('type', 'message')}\ndata: {data}\n\n"
+        return data + "\n"
+
+    async def body():
+        try:
+            async for frame in frames:
+                yield encode(frame)
+        except Exception as e:
+            print(f"Error streaming DSPy meal plan: {str(e)}")
+            yield encode({'type': 'error', 'error': str(e)})
+
+    return StreamingResponse(
+        body(),
+        media_type="text/event-stream" if use_sse else "application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.post("/api/meal-plans/jobs", response_model=MealPlanJobResponse, status_code=202)
+async def submit_meal_plan_job(request: MealPlanGenerateRequest):
+    """
+    Queue a DSPy meal plan generation and return a job id immediately.
+
+    Use this instead of /api/meal-plans/dspy-generate for long plans that
+    would outlive client or proxy timeouts. An identical request that is
+    still queued or running returns the existing job (deduplicated=true).
+    Poll /api/meal-plans/jobs/{job_id} and fetch .../result when done.
+    """
+    if not meal_plan_jobs:
+        raise HTTPException(status_code=503, detail="Meal plan job queue unavailable")
+
+    messages, health_context, meals_per_day, fasting_option = _dspy_plan_settings(request)
+    params = {
+        "user_id": request.user_id,
+        "messages": messages,
+        "health_context": health_context,
+        "start_date": request.startDate,
+        "number_of_days": request.numberOfDays,
+        "meals_per_day": meals_per_day,
+        "fasting_option": fasting_option
+    }
+
+    job = await run_blocking(db_pool, meal_plan_jobs.submit, params)
+    return MealPlanJobResponse(**job)
+
+
+@app.get("/api/meal-plans/jobs/{job_id}", response_model=MealPlanJobResponse)
+async def get_meal_plan_job(job_id: str):
+    """Status and progress (days done / total) of a meal plan job"""
+    if not meal_plan_jobs:
+        raise HTTPException(status_code=503, detail="Meal plan job queue unavailable")
+
+    job = await run_blocking(db_pool, meal_plan_jobs.get, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    return MealPlanJobResponse(**job)
+
+
+@app.get("/api/meal-plans/jobs/{job_id}/result", response_model=DSPyMealPlanResponse)
+async def get_meal_plan_job_result(job_id: str):
+    """The finished meal plan, in the same format as /api/meal-plans/dspy-generate"""
+    if not meal_plan_jobs:
+        raise HTTPException(status_code=503, detail="Meal plan job queue unavailable")
+
+    job = await run_blocking(db_pool, meal_plan_jobs.get, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    if job['status'] == 'failed':
+        raise HTTPException(status_code=500, detail=f"Meal plan job failed: {job['error']}")
+    if job['status'] != 'done':
+        raise HTTPException(status_code=409, detail=f"Job is {job['status']}, result not ready yet")
+
+    result = await run_blocking(db_pool, meal_plan_jobs.result, job_id)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    return json_response(DSPyMealPlanResponse, _dspy_meal_plan_payload(result, job['progress']['days_total']))
+
+
 @app.post("/api/meal-plans/dspy-single-meal")
 async def generate_single_dspy_meal(
     meal_slot: str,
@@ -742,8 +1159,7 @@ async def generate_single_dspy_meal(
     """
     Generate a single meal using DSPy (useful for replacing a meal).
     """
-    if not dspy_meal_planner:
-        raise HTTPException(status_code=503, detail="DSPy meal planner service unavailable")
+    dspy_meal_planner = await require_agent('dspy_meal_planner', "DSPy meal planner")
 
     try:
         health_context = {
@@ -755,7 +1171,9 @@ async def generate_single_dspy_meal(
             "cookingSkill": healthContext.cookingSkill
         }
 
-        meal = dspy_meal_planner.generate_single_meal(
+        meal = await run_blocking(
+            llm_pool,
+            dspy_meal_planner.generate_single_meal,
             health_context=health_context,
             meal_slot=meal_slot,
             plan_date=plan_date,
@@ -764,6 +1182,8 @@ async def generate_single_dspy_meal(
 
         return meal
 
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error generating single meal: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to generate meal: {str(e)}")
@@ -815,11 +1235,17 @@ async def generate_personalized_recipes(request: PersonalizedRecipeRequest):
             "count": request.count
         }
         
-        result = await host_agent.host_agent.route_request(
-            user_id="api_user",
-            request_type="recipe",
-            payload=payload
-        )
+        # HostAgent.route_request is async but the recipe agent underneath is
+        # blocking, so drive it to completion on an LLM pool thread. Identical
+        # requests in flight at the same time share one generation.
+        result = await personalized_recipe_flights.do(flight_key(**payload), lambda: run_blocking(
+            llm_pool,
+            lambda: asyncio.run(registry.get('host_agent').route_request(
+                user_id="api_user",
+                request_type="recipe",
+                payload=payload
+            ))
+        ))
         
         if not result.get("success"):
             return PersonalizedRecipeApiResponse(
@@ -866,6 +1292,8 @@ async def generate_personalized_recipes(request: PersonalizedRecipeRequest):
             recipes=recipe_items
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error generating personalized recipes: {str(e)}")
         import traceback
@@ -892,6 +1320,28 @@ class NutritionGoalsRequest(BaseModel):
     diet_style: Optional[str] = "balanced"
 
 
+class NutritionGoalsBatchRequest(BaseModel):
+    """Request model for calculating goals for many users in one call"""
+    profiles: List[NutritionGoalsRequest]
+
+
+NUTRITION_BATCH_MAX = int(os.getenv('NUTRITION_BATCH_MAX', '50000'))
+# Batches up to this size are computed inline; a thread hop costs more than the math
+NUTRITION_BATCH_INLINE_MAX = int(os.getenv('NUTRITION_BATCH_INLINE_MAX', '100'))
+
+
+def _nutrition_profile_data(request: NutritionGoalsRequest) -> Dict[str, Any]:
+    return {
+        "age": request.age,
+        "sex": request.sex,
+        "weight_kg": request.weight_kg or request.weight,
+        "height_cm": request.height_cm or request.height,
+        "activity_level": request.activity_level,
+        "health_goal": request.health_goal or request.goal or "maintain",
+        "diet_style": request.diet_style
+    }
+
+
 @app.post("/api/nutrition/calculate-goals")
 async def calculate_user_nutrition_goals(request: NutritionGoalsRequest):
     """
@@ -906,15 +1356,7 @@ async def calculate_user_nutrition_goals(request: NutritionGoalsRequest):
         Personalized daily targets for calories, protein, carbs, fat, fiber, and water.
     """
     try:
-        profile_data = {
-            "age": request.age,
-            "sex": request.sex,
-            "weight_kg": request.weight_kg or request.weight,
-            "height_cm": request.height_cm or request.height,
-            "activity_level": request.activity_level,
-            "health_goal": request.health_goal or request.goal or "maintain",
-            "diet_style": request.diet_style
-        }
+        profile_data = _nutrition_profile_data(request)
         
         goals = calculate_nutrition_goals(profile_data)
         
@@ -928,6 +1370,129 @@ async def calculate_user_nutrition_goals(request: NutritionGoalsRequest):
         raise HTTPException(status_code=500, detail=f"Failed to calculate nutrition goals: {str(e)}")
 
 
+@app.post("/api/nutrition/calculate-goals/batch")
+async def calculate_nutrition_goals_for_batch(request: NutritionGoalsBatchRequest):
+    """
+    Calculate nutrition goals for many profiles in one call (e.g. backfilling
+    every user after a formula change).
+
+    Computed in one vectorized NumPy pass; each result is identical to what
+    /api/nutrition/calculate-goals returns for that profile. Small batches run
+    inline, larger ones on the CPU pool (never the db pool's I/O slots).
+    """
+    if len(request.profiles) > NUTRITION_BATCH_MAX:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch too large: {len(request.profiles)} profiles (max {NUTRITION_BATCH_MAX})"
+        )
+    try:
+        profiles_data = [_nutrition_profile_data(profile) for profile in request.profiles]
+        if len(profiles_data) <= NUTRITION_BATCH_INLINE_MAX:
+            goals = calculate_nutrition_goals_batch(profiles_data)
+        else:
+            goals = await run_blocking(cpu_pool, calculate_nutrition_goals_batch, profiles_data)
+        print(f"📊 Calculated nutrition goals for {len(goals)} profiles (batch)")
+
+        return JSONBytesResponse(dumps({
+            "success": True,
+            "count": len(goals),
+            "results": [
+                {"user_id": profile.user_id, "goals": profile_goals}
+                for profile, profile_goals in zip(request.profiles, goals)
+            ]
+        }))
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to calculate nutrition goals: {str(e)}")
+
+
+metrics.register_gauge(
+    'worker_pool_in_flight', 'Calls running or queued per worker pool', ('pool',),
+    lambda: {(name,): stats['in_flight'] for name, stats in pool_stats().items()}
+)
+metrics.register_counter(
+    'worker_pool_rejected_total', 'Calls rejected (503) per worker pool', ('pool',),
+    lambda: {(name,): stats['rejected'] for name, stats in pool_stats().items()}
+)
+metrics.register_counter(
+    'recommendation_cache_lookups_total', 'Recommendation cache lookups by result', ('result',),
+    lambda: {
+        ('hit',): recommendation_cache.stats()['hits'],
+        ('miss',): recommendation_cache.stats()['misses']
+    }
+)
+metrics.register_counter(
+    'single_flight_requests_total', 'Coalesced generation requests by role', ('group', 'role'),
+    lambda: {
+        (group, role): stats[role]
+        for group, stats in flight_stats().items()
+        for role in ('leaders', 'followers')
+    }
+)
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """All service metrics in Prometheus text exposition format"""
+    return PlainTextResponse(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+
+@app.get("/api/cache/stats")
+async def cache_stats():
+    """Hit/miss counters and occupancy for the in-process caches"""
+    return {
+        "recommendations": recommendation_cache.stats(),
+        "user_profiles": profile_cache.stats(),
+        "llm_responses": response_cache.stats(),
+        "single_flight": flight_stats()
+    }
+
+
+@app.get("/api/admission/stats")
+async def admission_stats():
+    """Admission control state: LLM latency trend and estimated wait per endpoint class"""
+    return admission.stats()
+
+
+@app.get("/health/workers")
+async def worker_health_report():
+    """
+    Per-worker health under the prefork launcher (serve.py): each worker's
+    last heartbeat, pid, generation, memory and in-flight work.
+    """
+    run_dir = worker_health.current_run_dir()
+    if not run_dir:
+        return {
+            "mode": "single",
+            "served_by": os.getpid(),
+            "catalog": catalog.stats(),
+            "worker_pools": pool_stats(),
+            "db_pool": db_connections.stats(),
+            "async_db": async_db.stats(),
+            "event_log": event_log.stats()
+        }
+    workers = worker_health.read_heartbeats(run_dir)
+    master = worker_health.read_master(run_dir) or {}
+    return {
+        "mode": "prefork",
+        "served_by": os.getpid(),
+        "master": master,
+        "healthy": bool(workers) and all(w["healthy"] for w in workers)
+                   and len(workers) >= master.get("workers_target", 0),
+        "workers": workers
+    }
+
+
+@app.get("/api/startup-report")
+async def startup_report():
+    """
+    Startup-time report: per-module import ms and per-agent init ms.
+    Agents show initialized=false until their first request (or PRELOAD_AGENTS).
+    """
+    return registry.report()
+
+
 @app.get("/")
 async def root():
     """Root endpoint with API information"""
@@ -948,22 +1513,35 @@ async def root():
         ],
         "endpoints": {
             "health": "/health",
+            "worker_health": "/health/workers",
             "recommendations": "/api/recommendations",
             "feedback": "/api/feedback",
             "personalize_for_cooking": "/api/personalize-for-cooking",
             "meal_plan_chat": "/api/meal-plans/ai-chat",
             "meal_plan_generate": "/api/meal-plans/ai-generate",
             "dspy_meal_plan": "/api/meal-plans/dspy-generate (enhanced with full recipes)",
+            "dspy_meal_plan_stream": "/api/meal-plans/dspy-generate/stream (NDJSON or SSE, one frame per day)",
+            "dspy_meal_plan_jobs": "/api/meal-plans/jobs (submit), /api/meal-plans/jobs/{job_id} (poll), /api/meal-plans/jobs/{job_id}/result",
             "dspy_single_meal": "/api/meal-plans/dspy-single-meal",
             "personalized_recipes": "/api/recipes/personalized",
             "nutrition_goals": "/api/nutrition/calculate-goals",
+            "nutrition_goals_batch": "/api/nutrition/calculate-goals/batch",
+            "startup_report": "/api/startup-report",
+            "cache_stats": "/api/cache/stats",
+            "admission_stats": "/api/admission/stats",
+            "metrics": "/metrics (Prometheus text format)",
             "history": "/api/recommendations/{user_id}/history",
+            "recipe_search": "/api/recipes/search?q=...",
             "safety_profile": "/api/user/{user_id}/safety-profile",
+            "profile_invalidate": "/api/users/{user_id}/profile/invalidate (POST, after a profile update)",
             "recipe_analysis": "/api/recipe/{recipe_id}/safety-analysis",
             "adaptation_options": "/api/adaptations/options"
         }
     }
 
+registry.mark_ready()
+
+
 if __name__ == "__main__":
     port = int(os.getenv("PORT", 8000))
     host = os.getenv("HOST", "0.0.0.0")
@@ -0,0 +1,161 @@
+"""
+Per-User Recommendation Cache
+Location: main-brain/src/recommendation_cache.py
+
+/api/recommendations reruns the LangGraph pipeline (fetch + save) on every
+app open. This module keeps recent recommendation payloads in process so a
+repeat open within the TTL is served from memory.
+
+- Entries are keyed by (user_id, signature), where the signature covers
+  everything else that shapes the payload (request options, profile).
+- The cache is a bounded LRU with a per-entry TTL.
+- invalidate_user() drops every entry for one user without touching anyone
+  else's. The cache is per process, so like/hide/save feedback goes through
+  invalidate_user_async(), which also publishes the user id on the
+  recommendations_changed channel; every worker listening through
+  async_db.listen() drops the user too. Without a LISTEN connection (no
+  asyncpg) other workers serve their copy until the TTL expires.
+- Hit / miss / eviction counters are exposed via stats() for sizing.
+
+Settings (env):
+- RECOMMENDATION_CACHE_SIZE:         max entries (default 1000)
+- RECOMMENDATION_CACHE_TTL_SECONDS:  entry lifetime (default 300), which also
+  bounds how stale another worker's copy can be without LISTEN
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Set, Tuple
+
+import async_db
+
+RECOMMENDATION_CHANNEL = 'recommendations_changed'
+
+
+def make_signature(**parts: Any) -> str:
+    """Short stable hash of the inputs (besides user_id) that shape a payload"""
+    canonical = json.dumps(parts, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()[:16]
+
+
+class RecommendationCache:
+    """Thread-safe bounded LRU + TTL cache keyed by (user_id, signature)"""
+
+    def __init__(self, max_entries: int = 1000, ttl_seconds: float = 300):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, Any]]" = OrderedDict()
+        self._by_user: Dict[str, Set[Tuple[str, str]]] = {}
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+        self._invalidations = 0
+
+    def _remove(self, key: Tuple[str, str]):
+        """Drop one entry (lock must be held)"""
+        self._entries.pop(key, None)
+        user_keys = self._by_user.get(key[0])
+        if user_keys is not None:
+            user_keys.discard(key)
+            if not user_keys:
+                del self._by_user[key[0]]
+
+    def get(self, user_id: str, signature: str) -> Optional[Any]:
+        """Cached payload, or None on miss / expiry"""
+        key = (user_id, signature)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                self._remove(key)
+                self._expirations += 1
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return value
+
+    def put(self, user_id: str, signature: str, value: Any):
+        key = (user_id, signature)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            self._by_user.setdefault(user_id, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self._evictions += 1
+
+    def invalidate_user(self, user_id: str) -> int:
+        """Drop every cached payload for one user; returns how many were dropped"""
+        with self._lock:
+            keys = list(self._by_user.get(user_id, ()))
+            for key in keys:
+                self._remove(key)
+            if keys:
+                self._invalidations += 1
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_user.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'size': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl_seconds,
+                'users': len(self._by_user),
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_rate': round(self._hits / lookups, 4) if lookups else 0.0,
+                'evictions': self._evictions,
+                'expirations': self._expirations,
+                'invalidations': self._invalidations
+            }
+
+
+recommendation_cache = RecommendationCache(
+    max_entries=int(os.getenv('RECOMMENDATION_CACHE_SIZE', '1000')),
+    ttl_seconds=float(os.getenv('RECOMMENDATION_CACHE_TTL_SECONDS', '300'))
+)
+
+
+async def invalidate_user_async(user_id: str) -> int:
+    """
+    Drop a user's cached payloads here and NOTIFY the other workers; returns
+    how many were dropped here. A failed NOTIFY is logged, not raised: the
+    other workers' copies still expire with the TTL.
+    """
+    dropped = recommendation_cache.invalidate_user(str(user_id))
+    if async_db.enabled():
+        try:
+            await async_db.notify(RECOMMENDATION_CHANNEL, str(user_id))
+        except Exception as e:
+            print(f"⚠️ Recommendation invalidation NOTIFY failed for {user_id}: {e}")
+    return dropped
+
+
+def on_recommendations_changed(payload: Optional[str]):
+    """async_db.listen callback: drop one user, or everything after a (re)connect (payload None)"""
+    if payload:
+        recommendation_cache.invalidate_user(payload)
+    else:
+        recommendation_cache.clear()
+
+
+async def listen_for_recommendation_invalidations():
+    """Subscribe this worker's cache to RECOMMENDATION_CHANNEL (FastAPI startup, after async_db.start)"""
+    await async_db.listen(RECOMMENDATION_CHANNEL, on_recommendations_changed)
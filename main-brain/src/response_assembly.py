@@ -0,0 +1,89 @@
+"""
+Fast Response Assembly
+Location: main-brain/src/response_assembly.py
+
+The recommendation and meal plan endpoints used to build every nested
+pydantic object (ingredients, steps, safety info, nutrition) with its own
+constructor call, return the model, and let FastAPI validate it a second
+time against response_model before json.dumps'ing it.
+
+Here a payload is assembled as plain dicts and turned into JSON bytes in
+one step:
+- validated (default): one validate_python() call on a cached TypeAdapter
+  for the whole response, then dump_json(), both in pydantic-core
+- trusted (FAST_RESPONSES_TRUSTED=1): validation is skipped and the dicts
+  are encoded directly; the payload builders already fill every default
+
+JSON encoding uses orjson when it is installed and falls back to json.
+
+Endpoints return the bytes as a JSONBytesResponse, which FastAPI sends
+as-is (response_model is still declared for the OpenAPI schema).
+"""
+
+import datetime as _dt
+import json
+import os
+from functools import lru_cache
+from typing import Any, Optional
+
+from fastapi.responses import Response
+from pydantic import TypeAdapter
+
+try:
+    import orjson
+except ImportError:  # optional dependency
+    orjson = None
+
+
+TRUSTED = os.getenv('FAST_RESPONSES_TRUSTED', '').lower() in ('1', 'true', 'yes')
+
+
+def _default(value: Any) -> Any:
+    # Same ISO format pydantic and orjson use for dates
+    if isinstance(value, (_dt.datetime, _dt.date, _dt.time)):
+        return value.isoformat()
+    return str(value)
+
+
+def dumps(obj: Any) -> bytes:
+    """Compact JSON bytes (orjson when available)"""
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, default=_default, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+@lru_cache(maxsize=None)
+def adapter(schema: Any) -> TypeAdapter:
+    """TypeAdapter for a model or type, built once per process"""
+    return TypeAdapter(schema)
+
+
+def to_jsonable(schema: Any, payload: Any) -> Any:
+    """Validate payload against schema and return JSON-compatible python data"""
+    if TRUSTED:
+        return payload
+    type_adapter = adapter(schema)
+    return type_adapter.dump_python(type_adapter.validate_python(payload), mode='json')
+
+
+def render(schema: Any, payload: Any) -> bytes:
+    """Validate payload against schema (unless trusted) and encode it as JSON"""
+    if TRUSTED:
+        return dumps(payload)
+    type_adapter = adapter(schema)
+    return type_adapter.dump_json(type_adapter.validate_python(payload))
+
+
+class JSONBytesResponse(Response):
+    """application/json response whose body is already-encoded JSON bytes"""
+    media_type = 'application/json'
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, bytes):
+            return content
+        return dumps(content)
+
+
+def json_response(schema: Any, payload: Any, status_code: int = 200,
+                  headers: Optional[dict] = None) -> JSONBytesResponse:
+    return JSONBytesResponse(render(schema, payload), status_code=status_code, headers=headers)
@@ -10,7 +10,6 @@ Uses DSPy for:
 
 import os
 import json
-import psycopg2
 from psycopg2.extras import RealDictCursor
 from typing import Dict, List, Optional
 from datetime import datetime
@@ -20,17 +19,21 @@ import dspy
 from dspy.teleprompt import BootstrapFewShot
 from dotenv import load_dotenv
 
+from db import connection
+from deadline import Deadline
+from event_log import VALID_EVENTS, EventLogFullError, event_log
+from allergens import allergy_exclusions
+from llm_cache import dspy_lm
+from metrics import track_llm_call
+from recipe_cards import CARD_COLUMNS, cards_source
+from recipe_catalog import catalog
+from recipe_sampling import allergen_exclusion_sql, sample_ids_sql
+from user_profiles import get_user_profile
+
 load_dotenv()
 
-# Database config
-DB_CONFIG = {
-    'host': os.getenv('SUPABASE_HOST'),
-    'port': os.getenv('SUPABASE_PORT', 5432),
-    'database': os.getenv('SUPABASE_DB', 'postgres'),
-    'user': os.getenv('SUPABASE_USER', 'postgres'),
-    'password': os.getenv('SUPABASE_PASSWORD'),
-    'sslmode': os.getenv('SUPABASE_SSLMODE', 'require')
-}
+# Per-request time budget for DSPyRecipeAgent.get_recommendations
+DEFAULT_DEADLINE_SECONDS = float(os.getenv('RECOMMENDATION_DEADLINE_SECONDS', '15'))
 
 # ============================================
 # DSPY SIGNATURES - Define Input/Output Types
@@ -52,8 +55,12 @@ class SingleCallValidator(dspy.Module):
         super().__init__()
         self.validate = dspy.Predict(CompactBatchSafety)  # Use Predict, not ChainOfThought (faster)
     
-    def forward(self, recipes: List[Dict], user_profile: Dict) -> List[Dict]:
-        """Validate all recipes in ONE call"""
+    def forward(self, recipes: List[Dict], user_profile: Dict, timeout: Optional[float] = None,
+                usage_call=None) -> List[Dict]:
+        """
+        Validate all recipes in ONE call (timeout: seconds for the LLM request;
+        usage_call: a metrics.LLMCall to record the prediction's token usage on)
+        """
         allergies_str = ', '.join(user_profile.get('allergies', []))
         conditions_str = ', '.join(user_profile.get('medical_conditions', []))
         
@@ -69,8 +76,11 @@ class SingleCallValidator(dspy.Module):
         result = self.validate(
             recipes_summary='\n'.join(compact_summary),
             user_allergies=allergies_str,
-            medical_conditions=conditions_str
+            medical_conditions=conditions_str,
+            config={'timeout': timeout} if timeout else {}
         )
+        if usage_call is not None:
+            usage_call.record_dspy_usage(result)
         
         # Parse results
         try:
@@ -382,8 +392,12 @@ class RecipeAdapter(dspy.Module):
         super().__init__()
         self.adapt = dspy.ChainOfThought(RecipeAdaptation)
     
-    def forward(self, recipe: Dict, user_profile: Dict) -> Dict:
-        """Adapt recipe to user constraints"""
+    def forward(self, recipe: Dict, user_profile: Dict, timeout: Optional[float] = None,
+                usage_call=None) -> Dict:
+        """
+        Adapt recipe to user constraints (timeout: seconds for the LLM request;
+        usage_call: a metrics.LLMCall to record the prediction's token usage on)
+        """
         # Prepare inputs
         ingredients_str = ', '.join([
             f"{ing.get('amount', '')} {ing.get('name', '')}" 
@@ -398,8 +412,11 @@ class RecipeAdapter(dspy.Module):
             original_ingredients=ingredients_str,
             user_diet_style=user_profile.get('diet_style', 'balanced'),
             user_cooking_skill=user_profile.get('cooking_skill', 'beginner'),
-            allergies_to_avoid=allergies_str
+            allergies_to_avoid=allergies_str,
+            config={'timeout': timeout} if timeout else {}
         )
+        if usage_call is not None:
+            usage_call.record_dspy_usage(result)
         
         # Parse adapted ingredients
         adapted_ingredients = self._parse_ingredients(result.adapted_ingredients)
@@ -467,8 +484,11 @@ class InstructionParser(dspy.Module):
         super().__init__()
         self.parse = dspy.ChainOfThought(InstructionStructuring)
     
-    def forward(self, recipe: Dict) -> Dict:
-        """Parse instructions into structured steps"""
+    def forward(self, recipe: Dict, timeout: Optional[float] = None, usage_call=None) -> Dict:
+        """
+        Parse instructions into structured steps (timeout: seconds for the LLM request;
+        usage_call: a metrics.LLMCall to record the prediction's token usage on)
+        """
         instructions_text = recipe.get('instructions', '')
         
         if not instructions_text:
@@ -477,8 +497,11 @@ class InstructionParser(dspy.Module):
         # Run DSPy parsing
         result = self.parse(
             recipe_title=recipe.get('title', 'Recipe'),
-            raw_instructions=instructions_text
+            raw_instructions=instructions_text,
+            config={'timeout': timeout} if timeout else {}
         )
+        if usage_call is not None:
+            usage_call.record_dspy_usage(result)
         
         # Parse structured steps
         steps = self._parse_steps(result.structured_steps)
@@ -618,13 +641,20 @@ class RecipeRanker(dspy.Module):
 class DSPyRecipeAgent:
     """Main agent using DSPy modules"""
     
+    # Expected duration of each LLM stage; a stage runs only if this much budget is left
+    STAGE_ESTIMATES = {
+        'safety_validation': 6.0,
+        'adaptation': 3.0,
+        'instruction_parsing': 3.0
+    }
+    
     def __init__(self, llm_provider: str = None):
         """Initialize with DSPy - auto-detects provider from env if not specified"""
         # Auto-detect provider from environment variables
         if llm_provider is None:
             llm_provider = os.getenv('LLM_PROVIDER', 'openai').lower()
         
-        self._setup_dspy(llm_provider)
+        self.lm = self._setup_dspy(llm_provider)
         
         # Initialize DSPy modules
         self.single_call_validator = SingleCallValidator()  # NEW: 1 call for all 50 recipes
@@ -633,18 +663,25 @@ class DSPyRecipeAgent:
         self.recipe_adapter = RecipeAdapter()
         self.instruction_parser = InstructionParser()
         self.recipe_ranker = RecipeRanker()
+        for module in (self.single_call_validator, self.safety_validator, self.safety_modifier,
+                       self.recipe_adapter, self.instruction_parser, self.recipe_ranker):
+            module.set_lm(self.lm)
         
         print(f"✅ DSPy Agent initialized with {llm_provider}")
     
-    def _setup_dspy(self, provider: str):
-        """Configure DSPy with LLM - using modern DSPy 2.x API"""
+    def _setup_dspy(self, provider: str) -> dspy.LM:
+        """
+        Build the DSPy LM for this agent. It is attached to the agent's modules
+        with set_lm() rather than dspy.settings.configure(), which may only be
+        called from one thread and would also replace other agents' LM.
+        """
         if provider == 'openai':
             api_key = os.getenv('OPENAI_API_KEY')
             if not api_key:
                 raise ValueError("OPENAI_API_KEY not found in .env")
             
             # Increased max_tokens for batch operations
-            lm = dspy.LM('openai/gpt-4o-mini', api_key=api_key, max_tokens=2000)
+            lm = dspy_lm('openai/gpt-4o-mini', api_key=api_key, max_tokens=2000)
             print("✅ Using OpenAI GPT-4o-mini")
         
         elif provider == 'gemini':
@@ -652,26 +689,34 @@ class DSPyRecipeAgent:
             if not api_key:
                 raise ValueError("GOOGLE_API_KEY not found in .env")
             
-            lm = dspy.LM('google/gemini-1.5-flash', api_key=api_key, max_tokens=2000)
+            lm = dspy_lm('google/gemini-1.5-flash', api_key=api_key, max_tokens=2000)
             print("✅ Using Google Gemini 1.5 Flash")
         
         elif provider == 'ollama':
-            lm = dspy.LM('ollama/llama3.2', api_base='http://localhost:11434', max_tokens=2000)
+            lm = dspy_lm('ollama/llama3.2', api_base='http://localhost:11434', max_tokens=2000)
             print("✅ Using Ollama (local llama3.2)")
         
         else:
             raise ValueError(f"Unknown provider: {provider}. Choose: openai, gemini, or ollama")
         
-        dspy.settings.configure(lm=lm)
+        return lm
     
-    def get_recommendations(self, user_id: str) -> Dict:
-        """Get personalized recipe recommendations - optimized for 15s max"""
-        print(f"\n🔍 Getting recommendations for user: {user_id}")
+    def get_recommendations(self, user_id: str, deadline: Optional[Deadline] = None) -> Dict:
+        """
+        Get personalized recipe recommendations within a time budget.
+
+        Every stage checks the deadline (RECOMMENDATION_DEADLINE_SECONDS, 15s
+        by default) and falls back to its rule-based path when the remaining
+        budget is too short; result['deadline'] lists the degraded stages.
+        """
+        deadline = deadline or Deadline(DEFAULT_DEADLINE_SECONDS)
+        print(f"\n🔍 Getting recommendations for user: {user_id} ({deadline.budget_seconds:.0f}s budget)")
         
         # 1. Load user profile
-        user_profile = self._load_user_profile(user_id)
+        with deadline.stage('profile_load'):
+            user_profile = self._load_user_profile(user_id, deadline)
         if not user_profile:
-            return {'error': f'User {user_id} not found', 'recommendations': []}
+            return {'error': f'User {user_id} not found', 'recommendations': [], 'deadline': deadline.report()}
         
         print(f"✅ Loaded profile: {user_profile.get('full_name', user_profile.get('email'))}")
         
@@ -679,54 +724,46 @@ class DSPyRecipeAgent:
         filters = self._create_filters(user_profile)
         print(f"✅ Applied filters: {filters['diet_style']} diet, {len(filters['allergies'])} allergies")
         
-        # 3. Fetch candidate recipes (already pre-filtered by SQL)
-        recipes = self._fetch_recipes(filters)
+        # 3. Fetch candidate recipes (already pre-filtered by the in-memory catalog,
+        #    or by SQL while it is not loaded)
+        with deadline.stage('recipe_fetch'):
+            recipes = self._fetch_recipes(filters, deadline)
         print(f"✅ Found {len(recipes)} candidate recipes")
         
         if not recipes:
             return {
                 'user_id': user_id,
                 'recommendations': [],
-                'message': 'No recipes found matching your criteria'
+                'message': 'No recipes found matching your criteria',
+                'deadline': deadline.report()
             }
         
-        # 4. Validation - OPTIONAL (skip if SKIP_VALIDATION=true in env)
+        # 4. Validation - LLM when the budget allows (and SKIP_VALIDATION is not set),
+        # otherwise the rule-based check
         skip_validation = os.getenv('SKIP_VALIDATION', 'false').lower() == 'true'
         
-        if skip_validation:
-            print("⏩ Skipping LLM validation (using SQL filtering only)...")
-            safe_recipes = recipes
-            for recipe in safe_recipes:
-                recipe['safety_validated'] = True
-                recipe['safety_score'] = 85
-                recipe['safety_warnings'] = []
-                recipe['safety_fixed'] = False
-        else:
-            print("🔒 Validating (1 LLM call)...")
-            validation_results = self.single_call_validator(recipes, user_profile)
-            
-            results_map = {r['recipe_id']: r for r in validation_results}
-            safe_recipes = []
-            
-            for recipe in recipes:
-                recipe_id = str(recipe['id'])
-                safety_data = results_map.get(recipe_id, {'is_safe': True, 'safety_score': 80})
-                
-                is_safe_value = safety_data.get('is_safe', True)
-                is_safe = bool(is_safe_value) if not isinstance(is_safe_value, str) else is_safe_value.lower() == 'true'
-                
-                safety_score = int(safety_data.get('safety_score', 80))
-                
-                warnings = safety_data.get('warnings', [])
-                if not isinstance(warnings, list):
-                    warnings = []
-                
-                if is_safe or safety_score >= 75:
+        with deadline.stage('safety_validation'):
+            if skip_validation:
+                print("⏩ Skipping LLM validation (using SQL filtering only)...")
+                safe_recipes = recipes
+                for recipe in safe_recipes:
                     recipe['safety_validated'] = True
-                    recipe['safety_score'] = safety_score
-                    recipe['safety_warnings'] = warnings
+                    recipe['safety_score'] = 85
+                    recipe['safety_warnings'] = []
                     recipe['safety_fixed'] = False
-                    safe_recipes.append(recipe)
+            elif deadline.allows('safety_validation', self.STAGE_ESTIMATES['safety_validation']):
+                print("🔒 Validating (1 LLM call)...")
+                try:
+                    with track_llm_call('dspy_agent.validate_safety') as call, dspy.context(track_usage=True):
+                        validation_results = self.single_call_validator(
+                            recipes, user_profile, timeout=deadline.timeout(), usage_call=call
+                        )
+                    safe_recipes = self._apply_validation_results(recipes, validation_results)
+                except Exception as e:
+                    deadline.degrade('safety_validation', f"LLM validation failed: {e}")
+                    safe_recipes = self._rule_based_validation(recipes, user_profile)
+            else:
+                safe_recipes = self._rule_based_validation(recipes, user_profile)
         
         print(f"✅ {len(safe_recipes)} safe recipes")
         
@@ -734,7 +771,8 @@ class DSPyRecipeAgent:
             return {
                 'user_id': user_id,
                 'recommendations': [],
-                'message': 'No safe recipes found for your profile'
+                'message': 'No safe recipes found for your profile',
+                'deadline': deadline.report()
             }
         
         # 5. SKIP adaptation for speed (SQL filtering already handles diet)
@@ -744,28 +782,24 @@ class DSPyRecipeAgent:
         print("📊 Quick ranking...")
         top_recipes = self._simple_rank(safe_recipes, user_profile, filters)[:5]
         
-        # 6.5 Adapt ONLY top 5 recipes (not all 50)
-        print("🔧 Adapting top 5 recipes...")
-        for recipe in top_recipes:
-            adaptation = self.recipe_adapter(recipe, user_profile)
-            recipe['adapted_ingredients'] = adaptation.get('adapted_ingredients', [])
-            recipe['substitution_notes'] = adaptation.get('substitution_notes', [])
-            recipe['estimated_difficulty'] = adaptation.get('difficulty', 'medium')
-        
-        # 7. Parse instructions (ONLY for top 5, not all 50)
-        print("📝 Parsing top 5 instructions...")
-        for recipe in top_recipes:
-            instruction_data = self.instruction_parser(recipe)
-            recipe['structured_instructions'] = instruction_data['structured_steps']
-            recipe['total_prep_time'] = instruction_data['total_prep_time']
-            recipe['total_cook_time'] = instruction_data['total_cook_time']
+        # 6.5 Adapt ONLY top 5 recipes (not all 50), while the deadline allows
+        with deadline.stage('adaptation'):
+            top_recipes = self._adapt_top_recipes(top_recipes, user_profile, deadline)
+        
+        # 7. Parse instructions (ONLY for top 5, not all 50), while the deadline allows
+        with deadline.stage('instruction_parsing'):
+            top_recipes = self._parse_top_instructions(top_recipes, deadline)
 
         # 7.5. Save adapted recipes to database
         print("💾 Saving adapted recipes to database...")
-        self._save_adapted_recipes_to_db(top_recipes)
+        self._save_adapted_recipes_to_db(top_recipes, deadline)
 
         # 8. Save events
-        self._save_events(user_id, top_recipes)
+        self._save_events(user_id, top_recipes, deadline)
+        
+        report = deadline.report()
+        if report['degraded_stages']:
+            print(f"⏱️ Degraded stages: {', '.join(report['degraded_stages'])}")
         
         return {
             'user_id': user_id,
@@ -773,9 +807,50 @@ class DSPyRecipeAgent:
             'filters_applied': filters,
             'total_candidates': len(recipes),
             'safe_count': len(safe_recipes),
-            'final_count': len(top_recipes)
+            'final_count': len(top_recipes),
+            'deadline': report
         }
     
+    def _apply_validation_results(self, recipes: List[Dict], validation_results: List[Dict]) -> List[Dict]:
+        """Keep recipes the LLM validator marked safe (or scored >= 75)"""
+        results_map = {r['recipe_id']: r for r in validation_results}
+        safe_recipes = []
+        
+        for recipe in recipes:
+            recipe_id = str(recipe['id'])
+            safety_data = results_map.get(recipe_id, {'is_safe': True, 'safety_score': 80})
+            
+            is_safe_value = safety_data.get('is_safe', True)
+            is_safe = bool(is_safe_value) if not isinstance(is_safe_value, str) else is_safe_value.lower() == 'true'
+            
+            safety_score = int(safety_data.get('safety_score', 80))
+            
+            warnings = safety_data.get('warnings', [])
+            if not isinstance(warnings, list):
+                warnings = []
+            
+            if is_safe or safety_score >= 75:
+                recipe['safety_validated'] = True
+                recipe['safety_score'] = safety_score
+                recipe['safety_warnings'] = warnings
+                recipe['safety_fixed'] = False
+                safe_recipes.append(recipe)
+        
+        return safe_recipes
+    
+    def _rule_based_validation(self, recipes: List[Dict], user_profile: Dict) -> List[Dict]:
+        """Fallback for the LLM validator: keep recipes passing _quick_safety_check"""
+        print("⚡ Validating with rules (no LLM)...")
+        safe_recipes = []
+        for recipe in recipes:
+            if self._quick_safety_check(recipe, user_profile):
+                recipe['safety_validated'] = True
+                recipe['safety_score'] = 80
+                recipe['safety_warnings'] = []
+                recipe['safety_fixed'] = False
+                safe_recipes.append(recipe)
+        return safe_recipes
+    
     def _quick_safety_check(self, recipe: Dict, user_profile: Dict) -> bool:
         """Fast rule-based safety check without LLM"""
         allergies = user_profile.get('allergies', []) or []
@@ -799,7 +874,7 @@ class DSPyRecipeAgent:
             patterns = allergen_patterns.get(allergen, [allergen])
             
             for ingredient in ingredients:
-                ing_name = ingredient.get('name', '').lower()
+                ing_name = (ingredient.get('name') or '').lower()
                 if any(pattern in ing_name for pattern in patterns):
                     return False  # Unsafe
         
@@ -857,77 +932,71 @@ class DSPyRecipeAgent:
         recipes.sort(key=lambda x: x.get('ranking_score', 0), reverse=True)
         return recipes
     
-    def _batch_adapt_top5(self, recipes: List[Dict], user_profile: Dict) -> List[Dict]:
-        """Adapt all 5 recipes in ONE LLM call for speed"""
+    def _adapt_top_recipes(self, recipes: List[Dict], user_profile: Dict,
+                           deadline: Optional[Deadline] = None) -> List[Dict]:
+        """Adapt each top recipe with the LLM; recipes past the deadline keep their original ingredients"""
         if not recipes:
             return recipes
         
-        # Create compact batch request
-        batch_request = []
-        for r in recipes:
-            batch_request.append({
-                'id': str(r['id']),
-                'title': r['title'],
-                'ingredients': [ing.get('name', '') for ing in r.get('ingredients', [])[:5]]
-            })
-        
-        try:
-            # Single LLM call for all 5 recipes
-            result = self.recipe_adapter(
-                recipe_title="Batch of 5 recipes",
-                original_ingredients=json.dumps(batch_request),
-                user_diet_style=user_profile.get('diet_style', 'balanced'),
-                user_cooking_skill=user_profile.get('cooking_skill', 'beginner'),
-                allergies_to_avoid=', '.join(user_profile.get('allergies', []))
-            )
+        print(f"🔧 Adapting top {len(recipes)} recipes...")
+        in_budget = True
+        for recipe in recipes:
+            adaptation = None
+            # Once the budget runs short, the remaining recipes skip the LLM (degraded once)
+            in_budget = in_budget and (
+                deadline is None or deadline.allows('adaptation', self.STAGE_ESTIMATES['adaptation']))
+            if in_budget:
+                try:
+                    with track_llm_call('dspy_agent.adapt_recipes') as call, dspy.context(track_usage=True):
+                        adaptation = self.recipe_adapter(
+                            recipe, user_profile,
+                            timeout=deadline.timeout() if deadline is not None else None,
+                            usage_call=call
+                        )
+                except Exception as e:
+                    if deadline is not None:
+                        deadline.degrade('adaptation', f"LLM adaptation failed: {e}")
             
-            # For now, apply same adaptations to all (quick)
-            for recipe in recipes:
-                recipe['adapted_ingredients'] = []
-                recipe['substitution_notes'] = []
-                recipe['estimated_difficulty'] = 'medium'
-        except:
-            # Fallback: no adaptation
-            for recipe in recipes:
-                recipe['adapted_ingredients'] = []
-                recipe['substitution_notes'] = []
-                recipe['estimated_difficulty'] = 'medium'
+            if adaptation is None:
+                # Fallback: no adaptation
+                adaptation = {}
+            recipe['adapted_ingredients'] = adaptation.get('adapted_ingredients', [])
+            recipe['substitution_notes'] = adaptation.get('substitution_notes', [])
+            recipe['estimated_difficulty'] = adaptation.get('difficulty') or 'medium'
         
         return recipes
     
-    def _batch_parse_instructions(self, recipes: List[Dict]) -> List[Dict]:
-        """Parse all 5 instructions in ONE LLM call for speed"""
+    def _parse_top_instructions(self, recipes: List[Dict], deadline: Optional[Deadline] = None) -> List[Dict]:
+        """Structure each top recipe's instructions with the LLM (regex parsing past the deadline)"""
         if not recipes:
             return recipes
         
-        # Combine all instructions
-        combined = []
-        for i, r in enumerate(recipes, 1):
-            instructions = r.get('instructions', '')
-            if instructions:
-                combined.append(f"Recipe {i} ({r['title']}): {instructions[:200]}")  # First 200 chars
-        
-        combined_text = '\n\n'.join(combined)
-        
-        try:
-            # Single LLM call to parse all
-            result = self.instruction_parser.parse(
-                recipe_title="Batch of 5 recipes",
-                raw_instructions=combined_text
-            )
+        print(f"📝 Parsing top {len(recipes)} instructions...")
+        in_budget = True
+        for recipe in recipes:
+            instruction_data = None
+            # Once the budget runs short, the remaining recipes skip the LLM (degraded once)
+            in_budget = in_budget and (deadline is None or deadline.allows(
+                'instruction_parsing', self.STAGE_ESTIMATES['instruction_parsing']))
+            if in_budget and recipe.get('instructions'):
+                try:
+                    with track_llm_call('dspy_agent.parse_instructions') as call, dspy.context(track_usage=True):
+                        instruction_data = self.instruction_parser(
+                            recipe,
+                            timeout=deadline.timeout() if deadline is not None else None,
+                            usage_call=call
+                        )
+                except Exception as e:
+                    if deadline is not None:
+                        deadline.degrade('instruction_parsing', f"LLM parsing failed: {e}")
             
-            # Parse the response - expect grouped steps
-            # For now, use simple fallback
-            for recipe in recipes:
-                steps = self._simple_instruction_parse(recipe.get('instructions', ''))
-                recipe['structured_instructions'] = steps
-                recipe['total_prep_time'] = '10 min'
-                recipe['total_cook_time'] = '20 min'
-        except:
-            # Fallback: simple parsing
-            for recipe in recipes:
-                steps = self._simple_instruction_parse(recipe.get('instructions', ''))
-                recipe['structured_instructions'] = steps
+            if instruction_data and instruction_data.get('structured_steps'):
+                recipe['structured_instructions'] = instruction_data['structured_steps']
+                recipe['total_prep_time'] = instruction_data.get('total_prep_time') or '10 min'
+                recipe['total_cook_time'] = instruction_data.get('total_cook_time') or '20 min'
+            else:
+                # Fallback: simple parsing
+                recipe['structured_instructions'] = self._simple_instruction_parse(recipe.get('instructions', ''))
                 recipe['total_prep_time'] = '10 min'
                 recipe['total_cook_time'] = '20 min'
         
@@ -970,31 +1039,10 @@ class DSPyRecipeAgent:
         
         return steps
     
-    def _load_user_profile(self, user_id: str) -> Optional[Dict]:
-        """Load user profile from database"""
+    def _load_user_profile(self, user_id: str, deadline: Optional[Deadline] = None) -> Optional[Dict]:
+        """Load user profile (shared cache, user_profiles.py)"""
         try:
-            conn = psycopg2.connect(**DB_CONFIG)
-            cur = conn.cursor(cursor_factory=RealDictCursor)
-            
-            cur.execute("""
-                SELECT 
-                    up.user_id, up.full_name, up.email,
-                    uhp.cooking_skill, uhp.diet_style,
-                    uhp.allergies, uhp.medical_conditions,
-                    uhp.health_goals, uhp.daily_calorie_goal
-                FROM user_profiles up
-                LEFT JOIN user_health_profiles uhp ON up.user_id = uhp.user_id
-                WHERE up.user_id = %s
-            """, (user_id,))
-            
-            profile = cur.fetchone()
-            cur.close()
-            conn.close()
-            
-            if profile:
-                return dict(profile)
-            return None
-            
+            return get_user_profile(user_id, deadline.timeout() if deadline else None)
         except Exception as e:
             print(f"Error loading profile: {e}")
             return None
@@ -1019,78 +1067,37 @@ class DSPyRecipeAgent:
             'meal_period': meal_period
         }
     
-    def _fetch_recipes(self, filters: Dict) -> List[Dict]:
+    def _fetch_recipes(self, filters: Dict, deadline: Optional[Deadline] = None) -> List[Dict]:
         """Fetch candidate recipes from database with STRICT allergen filtering"""
         try:
-            conn = psycopg2.connect(**DB_CONFIG)
-            cur = conn.cursor(cursor_factory=RealDictCursor)
-            
-            # Build strict allergen exclusions
-            allergen_conditions = []
-            for allergen in filters.get('allergies', []):
-                allergen = allergen.lower().strip()
-                if allergen:
-                    # Map common allergen patterns
-                    allergen_patterns = {
-                        'milk': ['milk', 'cream', 'cheese', 'butter', 'dairy'],
-                        'eggs': ['egg'],
-                        'wheat': ['wheat', 'flour', 'bread'],
-                        'nuts': ['nut', 'almond', 'walnut', 'pecan'],
-                        'peanuts': ['peanut'],
-                        'shellfish': ['shrimp', 'lobster', 'crab', 'shellfish'],
-                        'soy': ['soy', 'tofu']
-                    }
-                    
-                    # Get search terms for this allergen
-                    search_terms = allergen_patterns.get(allergen, [allergen])
-                    
-                    # Build SQL condition to exclude recipes with this allergen
-                    term_conditions = []
-                    for term in search_terms:
-                        term_conditions.append(f"LOWER(ri.ingredient_name) LIKE '%{term}%'")
-                    
-                    if term_conditions:
-                        allergen_conditions.append(f"""
-                            NOT EXISTS (
-                                SELECT 1 FROM recipe_ingredients ri 
-                                WHERE ri.recipe_id = r.id 
-                                AND ({' OR '.join(term_conditions)})
-                            )
-                        """)
-            
-            # Build WHERE clause
-            where_clause = "WHERE r.instructions IS NOT NULL"
-            if allergen_conditions:
-                where_clause += " AND " + " AND ".join(allergen_conditions)
+            # Strict allergen exclusions: allergies matching a canonical allergen
+            # (allergens.py) use the precomputed per-recipe mask, anything else
+            # excludes ingredients containing the allergy itself
+            excluded_allergens, excluded_terms = allergy_exclusions(filters.get('allergies', []))
+
+            if catalog.loaded:
+                # Columnar in-memory snapshot, no database round trip
+                return catalog.candidates(50, exclude_allergens=excluded_allergens, exclude_terms=excluded_terms)
+
+            with connection(deadline.timeout() if deadline else None) as conn:
+                cur = conn.cursor(cursor_factory=RealDictCursor)
+
+                # Sample 50 candidates passing the exclusions (indexed random sample
+                # with a parameterized (allergen_mask & %s) = 0 predicate, see
+                # recipe_sampling.py)
+                exclusion, params = allergen_exclusion_sql(cur, excluded_allergens, excluded_terms)
+                sample = sample_ids_sql(cur, 50, exclusion, params)
             
-            query = f"""
-                SELECT 
-                    r.id, r.title, r.category, r.area as cuisine,
-                    r.instructions, r.image_url, r.servings,
-                    COALESCE(rn.per_serving->>'kcal', '300') as calories,
-                    COALESCE(rn.per_serving->>'protein_g', '15') as protein,
-                    COALESCE(rn.per_serving->>'sodium_mg', '400') as sodium,
-                    COALESCE(rn.per_serving->>'sugar_g', '5') as sugar,
-                    json_agg(
-                        json_build_object(
-                            'name', ri.ingredient_name,
-                            'amount', ri.measure_text
-                        ) ORDER BY ri.position
-                    ) as ingredients
-                FROM recipes r
-                LEFT JOIN recipe_nutrients rn ON r.id = rn.recipe_id
-                LEFT JOIN recipe_ingredients ri ON r.id = ri.recipe_id
-                {where_clause}
-                GROUP BY r.id, r.title, r.category, r.area, 
-                         r.instructions, r.image_url, r.servings, rn.per_serving
-                ORDER BY RANDOM()
-                LIMIT 50
-            """
+                query = f"""
+                    WITH sampled AS ({sample})
+                    SELECT {CARD_COLUMNS}
+                    FROM sampled s
+                    JOIN {cards_source(cur)} c ON c.id = s.id
+                """
             
-            cur.execute(query)
-            recipes = cur.fetchall()
-            cur.close()
-            conn.close()
+                cur.execute(query)
+                recipes = cur.fetchall()
+                cur.close()
             
             return [dict(r) for r in recipes]
             
@@ -1098,70 +1105,62 @@ class DSPyRecipeAgent:
             print(f"Error fetching recipes: {e}")
             return []
     
-    def _save_adapted_recipes_to_db(self, recipes: List[Dict]):
+    def _save_adapted_recipes_to_db(self, recipes: List[Dict], deadline: Optional[Deadline] = None):
         """Save adapted recipes to Supabase recipes table"""
         try:
-            conn = psycopg2.connect(**DB_CONFIG)
-            cur = conn.cursor()
+            with connection(deadline.timeout() if deadline else None) as conn:
+                cur = conn.cursor()
 
-            for recipe in recipes:
-                try:
-                    # Check if recipe already exists
-                    cur.execute("SELECT id FROM recipes WHERE id = %s", (recipe['id'],))
-                    exists = cur.fetchone()
+                for recipe in recipes:
+                    try:
+                        # Check if recipe already exists
+                        cur.execute("SELECT id FROM recipes WHERE id = %s", (recipe['id'],))
+                        exists = cur.fetchone()
 
-                    if not exists:
-                        # Insert new adapted recipe
-                        cur.execute("""
-                            INSERT INTO recipes (
-                                id, title, category, area, instructions,
-                                image_url, servings, tags
-                            )
-                            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-                            ON CONFLICT (id) DO NOTHING
-                        """, (
-                            recipe['id'],
-                            recipe.get('title', 'Unknown Recipe'),
-                            recipe.get('category'),
-                            recipe.get('cuisine') or recipe.get('area'),
-                            recipe.get('instructions', ''),
-                            recipe.get('image_url'),
-                            recipe.get('servings'),
-                            recipe.get('tags', [])
-                        ))
-                        print(f"✅ Saved adapted recipe to DB: {recipe.get('title')}")
-                    else:
-                        print(f"ℹ️ Recipe already exists: {recipe.get('title')}")
-                except Exception as e:
-                    print(f"❌ Error saving recipe {recipe.get('title')}: {e}")
-                    import traceback
-                    traceback.print_exc()
+                        if not exists:
+                            # Insert new adapted recipe
+                            cur.execute("""
+                                INSERT INTO recipes (
+                                    id, title, category, area, instructions,
+                                    image_url, servings, tags
+                                )
+                                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                                ON CONFLICT (id) DO NOTHING
+                            """, (
+                                recipe['id'],
+                                recipe.get('title', 'Unknown Recipe'),
+                                recipe.get('category'),
+                                recipe.get('cuisine') or recipe.get('area'),
+                                recipe.get('instructions', ''),
+                                recipe.get('image_url'),
+                                recipe.get('servings'),
+                                recipe.get('tags', [])
+                            ))
+                            print(f"✅ Saved adapted recipe to DB: {recipe.get('title')}")
+                        else:
+                            print(f"ℹ️ Recipe already exists: {recipe.get('title')}")
+                    except Exception as e:
+                        print(f"❌ Error saving recipe {recipe.get('title')}: {e}")
+                        import traceback
+                        traceback.print_exc()
 
-            conn.commit()
-            cur.close()
-            conn.close()
+                conn.commit()
+                cur.close()
 
         except Exception as e:
             print(f"⚠️ Error saving adapted recipes to DB: {e}")
             import traceback
             traceback.print_exc()
 
-    def _save_events(self, user_id: str, recipes: List[Dict]):
+    def _save_events(self, user_id: str, recipes: List[Dict], deadline: Optional[Deadline] = None):
         """Save recommendation events"""
         try:
-            conn = psycopg2.connect(**DB_CONFIG)
-            cur = conn.cursor()
-
-            for recipe in recipes:
-                cur.execute("""
-                    INSERT INTO recipe_events (user_id, recipe_id, event, created_at)
-                    VALUES (%s, %s, 'view', NOW())
-                    ON CONFLICT DO NOTHING
-                """, (user_id, recipe['id']))
-
-            conn.commit()
-            cur.close()
-            conn.close()
+            # Buffered and written in batches in the background (event_log.py);
+            # never blocks past the request deadline
+            event_log.record_many(
+                [(user_id, recipe['id'], 'view') for recipe in recipes],
+                timeout=min(deadline.remaining(), event_log.enqueue_timeout) if deadline else None
+            )
 
         except Exception as e:
             print(f"Error saving events: {e}")
@@ -1169,28 +1168,19 @@ class DSPyRecipeAgent:
     def record_feedback(self, user_id: str, recipe_id: str, event_type: str) -> bool:
         """Record user feedback on a recipe"""
         try:
-            conn = psycopg2.connect(**DB_CONFIG)
-            cur = conn.cursor()
-
             # Validate event type
-            valid_events = {'like', 'hide', 'save', 'view', 'cook_now', 'share_family'}
-            if event_type not in valid_events:
+            if event_type not in VALID_EVENTS:
                 print(f"Invalid event type: {event_type}")
                 return False
 
-            # Insert event
-            cur.execute("""
-                INSERT INTO recipe_events (user_id, recipe_id, event, created_at)
-                VALUES (%s, %s, %s, NOW())
-            """, (user_id, recipe_id, event_type))
-
-            conn.commit()
-            cur.close()
-            conn.close()
+            # Buffered and written in batches in the background (event_log.py)
+            event_log.record(user_id, recipe_id, event_type)
 
             print(f"✅ Recorded {event_type} for recipe {recipe_id}")
             return True
 
+        except EventLogFullError:
+            raise
         except Exception as e:
             print(f"Error recording feedback: {e}")
             return False
@@ -1234,10 +1224,12 @@ class DSPyRecipeAgent:
             max_bootstrapped_demos=5
         )
         
-        optimized_validator = optimizer.compile(
-            self.safety_validator,
-            trainset=dspy_examples
-        )
+        with dspy.context(lm=self.lm):
+            optimized_validator = optimizer.compile(
+                self.safety_validator,
+                trainset=dspy_examples
+            )
+        optimized_validator.set_lm(self.lm)
         
         self.safety_validator = optimized_validator
         print("✅ Safety validator optimized")
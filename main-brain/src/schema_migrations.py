@@ -0,0 +1,258 @@
+"""
+Schema Migrations
+Location: main-brain/src/schema_migrations.py
+
+The brain reads recipes, recipe_ingredients, recipe_nutrients,
+recipe_events, user_profiles and user_health_profiles from the shared
+Supabase database, but the indexes those reads depend on were never part of
+a migration set (main-backend/migrations only covers the wellness tables).
+This module applies main-brain/migrations/*.sql in order and checks that
+every index a hot query needs is there.
+
+- applied files are recorded in brain_schema_migrations (name, applied_at),
+  so each runs once; the files are idempotent (IF NOT EXISTS), so a run
+  that stopped half-way is simply repeated, and files applied by hand
+  before this module existed re-run as no-ops
+- statements run one at a time in autocommit, as CREATE INDEX CONCURRENTLY
+  requires (no transaction block, no lock on writes while it builds);
+  $$-quoted function bodies are kept whole
+- statements needing an extension the server does not offer (pg_trgm's
+  trigram operator classes) are skipped with a warning; the code using
+  them checks db.has_extension
+- HOT_PATH_INDEXES names each hot query's index by table and leading
+  columns, not by index name, so an equivalent index created elsewhere
+  (a primary key, the front-end's Supabase migrations) counts. A
+  CONCURRENTLY build that failed leaves an invalid index behind, which
+  IF NOT EXISTS would then skip forever; verify reports those.
+
+benchmarks/check_query_plans.py migrates a large synthetic dataset with
+this module and fails if any hot query plans a sequential scan.
+
+Usage:
+    python schema_migrations.py status     # applied / pending files, index check
+    python schema_migrations.py migrate    # apply pending files, then verify
+    python schema_migrations.py verify     # exit 1 if a hot-path index is missing
+"""
+
+import os
+import re
+import sys
+from typing import Dict, List, Optional, Set, Tuple
+
+import psycopg2
+
+from db import DB_CONFIG
+
+MIGRATIONS_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    'migrations'
+)
+
+MIGRATIONS_TABLE = 'brain_schema_migrations'
+
+# Operator classes that only exist with an extension installed
+EXTENSION_OPCLASSES = {
+    'pg_trgm': ('gin_trgm_ops', 'gist_trgm_ops'),
+}
+
+# (table, leading key columns, columns it must also carry, partial index allowed, used by)
+HOT_PATH_INDEXES: List[Tuple[str, Tuple[str, ...], Tuple[str, ...], bool, str]] = [
+    ('recipes', ('id',), (), False,
+     'recipe cards, history and safety lookups by recipe id'),
+    ('recipes', ('random_key',), ('allergen_mask',), True,
+     'recipe_sampling.py candidate samples (migrations/002, 003)'),
+    ('recipe_ingredients', ('recipe_id', 'position'), ('ingredient_name', 'measure_text'), False,
+     'live recipe cards, ingredient-term exclusion (migrations/006)'),
+    ('recipe_nutrients', ('recipe_id',), (), False,
+     'recipe cards, history (fetch_recipes.py upsert key)'),
+    ('recipe_events', ('user_id', 'created_at', 'id'), (), False,
+     'recipe_history.py pages (migrations/001)'),
+    ('user_profiles', ('user_id',), (), False,
+     "agents' profile query (migrations/006)"),
+    ('user_health_profiles', ('user_id',), (), False,
+     "agents' profile query, recipe_safety.py (migrations/006)"),
+    ('recipe_cards', ('id',), (), False,
+     'recipe_cards.fetch_card and candidate joins (migrations/004)'),
+    ('recipe_search', ('document',), (), False,
+     'recipe_search.py full-text match (migrations/005)'),
+]
+
+INDEXES_QUERY = """
+    SELECT
+        c.relname AS name,
+        ix.indisvalid AS valid,
+        ix.indpred IS NOT NULL AS partial,
+        ix.indnkeyatts AS key_count,
+        ARRAY(
+            SELECT COALESCE(a.attname, '')
+            FROM unnest(ix.indkey::int2[]) WITH ORDINALITY AS k(attnum, n)
+            LEFT JOIN pg_attribute a ON a.attrelid = ix.indrelid AND a.attnum = k.attnum
+            ORDER BY k.n
+        ) AS columns
+    FROM pg_index ix
+    JOIN pg_class c ON c.oid = ix.indexrelid
+    JOIN pg_class t ON t.oid = ix.indrelid
+    JOIN pg_namespace ns ON ns.oid = t.relnamespace
+    WHERE ns.nspname = %s AND t.relname = %s
+"""
+
+
+def migration_files() -> List[str]:
+    """Numbered migration file names, in order"""
+    return sorted(f for f in os.listdir(MIGRATIONS_DIR) if re.match(r'^\d{3}_.*\.sql$', f))
+
+
+def statements(name: str, schema: str = 'public') -> List[str]:
+    """A migration file's statements, comments stripped, tables moved to schema"""
+    with open(os.path.join(MIGRATIONS_DIR, name)) as f:
+        sql = f.read()
+    if schema != 'public':
+        sql = sql.replace('public.', f'{schema}.')
+    body = '\n'.join(line for line in sql.splitlines() if not line.lstrip().startswith('--'))
+    # Split on semicolons outside $$-quoted bodies (plpgsql functions);
+    # the quoted parts are the odd-numbered pieces between $$ markers
+    found, current = [], ''
+    for i, part in enumerate(body.split('$$')):
+        if i % 2:
+            current += f'$${part}$$'
+            continue
+        first, *rest = part.split(';')
+        current += first
+        for piece in rest:
+            found.append(current)
+            current = piece
+    found.append(current)
+    return [s.strip() for s in found if s.strip()]
+
+
+def connect(schema: str = 'public'):
+    """Direct autocommit connection (CREATE INDEX CONCURRENTLY cannot run in a transaction)"""
+    conn = psycopg2.connect(**DB_CONFIG, options=f'-c search_path={schema},public')
+    conn.autocommit = True
+    return conn
+
+
+def applied(cur, schema: str = 'public') -> Set[str]:
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS {schema}.{MIGRATIONS_TABLE} (
+            name text PRIMARY KEY,
+            applied_at timestamptz NOT NULL DEFAULT now()
+        )
+    """)
+    cur.execute(f"SELECT name FROM {schema}.{MIGRATIONS_TABLE}")
+    return {row[0] for row in cur.fetchall()}
+
+
+def _unavailable_extensions(cur) -> Set[str]:
+    cur.execute("SELECT name FROM pg_available_extensions WHERE name = ANY(%s)", (list(EXTENSION_OPCLASSES),))
+    available = {row[0] for row in cur.fetchall()}
+    return set(EXTENSION_OPCLASSES) - available
+
+
+def _needs(statement: str, extensions: Set[str]) -> Optional[str]:
+    """The unavailable extension a statement depends on, if any"""
+    for extension in extensions:
+        if re.search(rf'\bEXTENSION\b.*\b{extension}\b', statement, re.IGNORECASE):
+            return extension
+        if any(opclass in statement for opclass in EXTENSION_OPCLASSES[extension]):
+            return extension
+    return None
+
+
+def migrate(schema: str = 'public', skip: Tuple[str, ...] = ()) -> List[str]:
+    """Apply pending migration files (except skip) in order; returns the names applied"""
+    conn = connect(schema)
+    try:
+        cur = conn.cursor()
+        done = applied(cur, schema)
+        unavailable = _unavailable_extensions(cur)
+        ran = []
+        for name in migration_files():
+            if name in done or name in skip:
+                continue
+            print(f"🔧 {name}")
+            for statement in statements(name, schema):
+                extension = _needs(statement, unavailable)
+                if extension:
+                    print(f"   ⚠️ {extension} not available, skipped: {statement.splitlines()[0]}")
+                    continue
+                cur.execute(statement)
+            cur.execute(f"INSERT INTO {schema}.{MIGRATIONS_TABLE} (name) VALUES (%s)", (name,))
+            ran.append(name)
+        cur.close()
+        return ran
+    finally:
+        conn.close()
+
+
+def _indexes(cur, schema: str, table: str) -> List[Dict]:
+    cur.execute(INDEXES_QUERY, (schema, table))
+    return [dict(zip(('name', 'valid', 'partial', 'key_count', 'columns'), row)) for row in cur.fetchall()]
+
+
+def verify(schema: str = 'public') -> Tuple[List[str], List[str]]:
+    """
+    (missing, invalid): a line per HOT_PATH_INDEXES entry no valid index
+    answers, and the names of invalid indexes (failed CONCURRENTLY builds)
+    on those tables.
+    """
+    conn = connect(schema)
+    missing, invalid = [], []
+    try:
+        cur = conn.cursor()
+        by_table: Dict[str, List[Dict]] = {}
+        for table, columns, carries, partial_ok, used_by in HOT_PATH_INDEXES:
+            if table not in by_table:
+                by_table[table] = _indexes(cur, schema, table)
+                invalid += [ix['name'] for ix in by_table[table] if not ix['valid']]
+            found = any(
+                ix['valid']
+                and (partial_ok or not ix['partial'])
+                and tuple(ix['columns'][:len(columns)]) == columns
+                and len(columns) <= ix['key_count']
+                and set(carries) <= set(ix['columns'])
+                for ix in by_table[table]
+            )
+            if not found:
+                include = f" carrying ({', '.join(carries)})" if carries else ''
+                missing.append(f"{table} ({', '.join(columns)}){include}: {used_by}")
+        cur.close()
+    finally:
+        conn.close()
+    return missing, invalid
+
+
+def report(schema: str = 'public') -> bool:
+    """Print the index check; True when every hot-path index is in place"""
+    missing, invalid = verify(schema)
+    for line in missing:
+        print(f"❌ missing index on {line}")
+    for name in invalid:
+        print(f"❌ invalid index {name} (a CONCURRENTLY build failed): DROP INDEX it and migrate again")
+    if not missing and not invalid:
+        print(f"✅ all {len(HOT_PATH_INDEXES)} hot-path indexes present")
+    return not missing and not invalid
+
+
+def main():
+    command = sys.argv[1] if len(sys.argv) > 1 else 'status'
+    if command == 'migrate':
+        ran = migrate()
+        print(f"✅ applied {len(ran)} migration(s)" if ran else "✅ nothing to apply")
+    elif command == 'status':
+        conn = connect()
+        cur = conn.cursor()
+        done = applied(cur)
+        cur.close()
+        conn.close()
+        for name in migration_files():
+            print(f"  {'applied' if name in done else 'pending'}  {name}")
+    elif command != 'verify':
+        print(__doc__)
+        sys.exit(2)
+    if not report():
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,342 @@
+"""
+Prefork Production Launcher
+Location: main-brain/src/serve.py
+
+Runs the API as one master process and N uvicorn worker processes sharing a
+single listening socket.
+
+The master does the expensive, read-only setup once before forking:
+- imports the app and the agent modules (langchain, langgraph, dspy)
+- loads the allergen tables and the recipe catalog (recipe_catalog.py)
+- gc.freeze()s the result so the collector never touches (and so never
+  copies) those pages in the workers
+
+Workers then share that memory copy-on-write instead of each loading its
+own copy. Agents (LLM clients) are still built per worker, after the fork.
+
+Supervision:
+- a worker that exits is respawned
+- every worker heartbeats from its event loop (worker_health.py); one that
+  stops heartbeating for WORKER_TIMEOUT_SECONDS is killed and respawned
+- GET /health/workers on any worker reports all of them
+
+Signals (send to the master):
+- SIGHUP           graceful reload: reload the catalog in the master, then
+                   replace workers one at a time (a new worker must be
+                   heartbeating before the old one is told to drain)
+- SIGTERM/SIGINT   graceful shutdown: workers finish in-flight requests
+
+A reload re-forks from the master, so it picks up new data, not new code;
+restart the master to deploy code changes.
+
+Usage:
+    cd main-brain/src && python serve.py --workers 4
+
+Settings (env): WEB_CONCURRENCY (workers), HOST, PORT,
+RECIPE_CATALOG_PRELOAD (default on here), WORKER_BOOT_TIMEOUT_SECONDS,
+WORKER_GRACEFUL_TIMEOUT_SECONDS, WORKER_HEARTBEAT_SECONDS,
+WORKER_TIMEOUT_SECONDS
+"""
+
+import argparse
+import asyncio
+import gc
+import os
+import random
+import shutil
+import signal
+import socket
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, Optional, Set
+
+import uvicorn
+
+import worker_health
+from worker_health import HEARTBEAT_TIMEOUT, RUN_DIR_ENV
+
+
+BOOT_TIMEOUT = float(os.getenv('WORKER_BOOT_TIMEOUT_SECONDS', '60'))
+GRACEFUL_TIMEOUT = float(os.getenv('WORKER_GRACEFUL_TIMEOUT_SECONDS', '30'))
+
+
+def _bind(host: str, port: int, backlog: int = 2048) -> socket.socket:
+    family = socket.AF_INET6 if ':' in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _load_shared_data():
+    """Catalog + allergen tables, loaded in the master before forking"""
+    import allergens  # noqa: F401  (tables are built at import)
+    from db import pool
+    from recipe_catalog import catalog
+
+    if os.getenv('RECIPE_CATALOG_PRELOAD', 'true').lower() not in ('1', 'true', 'yes'):
+        return
+    try:
+        catalog.load()
+    except Exception as e:
+        # Workers fall back to database queries; a later SIGHUP retries
+        print(f"⚠️ Recipe catalog load failed: {e}")
+    finally:
+        # Workers open their own connections; don't fork with sockets in the pool
+        pool.close_all()
+
+
+class Master:
+    """Forks, supervises and reloads the uvicorn workers"""
+
+    def __init__(self, app, host: str, port: int, workers: int, log_level: str):
+        self.app = app
+        self.host = host
+        self.port = port
+        self.worker_count = workers
+        self.log_level = log_level
+        self.generation = 0
+        self.started_at = time.time()
+        self.workers: Dict[int, int] = {}  # pid -> worker index
+        self.spawned_at: Dict[int, float] = {}
+        self.retiring: Set[int] = set()
+        self.sock: Optional[socket.socket] = None
+        self.run_dir = tempfile.mkdtemp(prefix='wellnoosh-brain-')
+        self._reload_requested = False
+        self._stop_requested = False
+
+    # ============================================
+    # WORKER PROCESS
+    # ============================================
+
+    def _run_worker(self, index: int):
+        """Body of a forked worker; never returns"""
+        exit_code = 0
+        try:
+            signal.signal(signal.SIGHUP, signal.SIG_IGN)
+            signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+            # Forked children share the master's PRNG state; reseed so workers
+            # don't all sample the same "random" recipes
+            random.seed()
+
+            from db import pool as db_connections
+            from event_log import event_log
+            from recipe_catalog import catalog
+            from worker_pools import pool_stats
+
+            config = uvicorn.Config(
+                self.app,
+                log_level=self.log_level,
+                timeout_graceful_shutdown=int(GRACEFUL_TIMEOUT)
+            )
+            server = uvicorn.Server(config)
+            started_at = time.time()
+            generation = self.generation
+
+            def collect():
+                return {
+                    'worker': index,
+                    'generation': generation,
+                    'started_at': started_at,
+                    'catalog': catalog.stats(),
+                    'in_flight': {name: s['in_flight'] for name, s in pool_stats().items()},
+                    'db_pool': db_connections.stats(),
+                    'event_log': event_log.stats()
+                }
+
+            def orphaned():
+                print(f"⚠️ Worker {index}: master exited, shutting down")
+                server.should_exit = True
+
+            async def start_heartbeat():
+                asyncio.get_running_loop().create_task(
+                    worker_health.heartbeat_loop(self.run_dir, collect, on_orphaned=orphaned)
+                )
+
+            self.app.router.add_event_handler('startup', start_heartbeat)
+            server.run(sockets=[self.sock])
+        except BaseException as e:
+            print(f"❌ Worker {index} crashed: {e}")
+            exit_code = 1
+        finally:
+            worker_health.remove_heartbeat(self.run_dir, os.getpid())
+            os._exit(exit_code)
+
+    # ============================================
+    # SUPERVISION
+    # ============================================
+
+    def spawn(self, index: int) -> int:
+        pid = os.fork()
+        if pid == 0:
+            self._run_worker(index)
+        self.workers[pid] = index
+        self.spawned_at[pid] = time.time()
+        print(f"👷 Worker {index} started (pid {pid}, generation {self.generation})")
+        return pid
+
+    def _write_master(self):
+        worker_health.write_master(
+            self.run_dir,
+            generation=self.generation,
+            workers_target=self.worker_count,
+            started_at=self.started_at
+        )
+
+    def reap(self):
+        """Collect exited workers; respawn the ones we did not retire"""
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            index = self.workers.pop(pid, None)
+            spawned_at = self.spawned_at.pop(pid, 0)
+            worker_health.remove_heartbeat(self.run_dir, pid)
+            if index is None:
+                continue
+            if pid in self.retiring:
+                self.retiring.discard(pid)
+                print(f"👋 Worker {index} (pid {pid}) drained and exited")
+            elif not self._stop_requested:
+                print(f"⚠️ Worker {index} (pid {pid}) died with status {status}; respawning")
+                if time.time() - spawned_at < 5:
+                    # Crashed during boot: don't fork in a tight loop
+                    time.sleep(1)
+                self.spawn(index)
+
+    def check_heartbeats(self):
+        """Kill workers that never booted or stopped heartbeating"""
+        now = time.time()
+        for pid, index in list(self.workers.items()):
+            if pid in self.retiring:
+                continue
+            heartbeat = worker_health.read_heartbeat(self.run_dir, pid)
+            if heartbeat is None:
+                hung = now - self.spawned_at.get(pid, now) > BOOT_TIMEOUT
+            else:
+                hung = now - heartbeat.get('heartbeat_at', 0) > HEARTBEAT_TIMEOUT
+            if hung:
+                print(f"⚠️ Worker {index} (pid {pid}) is unresponsive; killing")
+                self._kill(pid, signal.SIGKILL)
+
+    def _kill(self, pid: int, sig: int):
+        try:
+            os.kill(pid, sig)
+        except ProcessLookupError:
+            pass
+
+    def _wait_until_serving(self, pid: int) -> bool:
+        deadline = time.time() + BOOT_TIMEOUT
+        while time.time() < deadline:
+            if worker_health.read_heartbeat(self.run_dir, pid) is not None:
+                return True
+            self.reap()
+            if pid not in self.workers:
+                return False
+            time.sleep(0.2)
+        return False
+
+    def reload(self):
+        """Reload shared data, then roll the workers one at a time"""
+        print("🔄 Reloading: refreshing shared data")
+        _load_shared_data()
+        gc.freeze()
+        self.generation += 1
+        self._write_master()
+
+        for old_pid, index in list(self.workers.items()):
+            if self._stop_requested:
+                return
+            new_pid = self.spawn(index)
+            if not self._wait_until_serving(new_pid):
+                print(f"❌ Reload aborted: replacement for worker {index} did not come up")
+                return
+            self.retiring.add(old_pid)
+            self._kill(old_pid, signal.SIGTERM)
+        print(f"✅ Reload complete (generation {self.generation})")
+
+    def shutdown(self):
+        print("🛑 Shutting down workers")
+        for pid in list(self.workers):
+            self.retiring.add(pid)
+            self._kill(pid, signal.SIGTERM)
+        deadline = time.time() + GRACEFUL_TIMEOUT + 5
+        while self.workers and time.time() < deadline:
+            self.reap()
+            time.sleep(0.2)
+        for pid in list(self.workers):
+            self._kill(pid, signal.SIGKILL)
+        self.reap()
+        shutil.rmtree(self.run_dir, ignore_errors=True)
+
+    # ============================================
+    # MAIN LOOP
+    # ============================================
+
+    def _on_reload(self, signum, frame):
+        self._reload_requested = True
+
+    def _on_stop(self, signum, frame):
+        self._stop_requested = True
+
+    def run(self):
+        os.environ[RUN_DIR_ENV] = self.run_dir
+        self.sock = _bind(self.host, self.port)
+
+        _load_shared_data()
+        # Everything allocated so far is read-only from here on; keep the
+        # collector from touching it so the pages stay shared after fork
+        gc.collect()
+        gc.freeze()
+
+        if threading.active_count() > 1:
+            print(f"⚠️ {threading.active_count() - 1} background thread(s) running before fork")
+
+        signal.signal(signal.SIGHUP, self._on_reload)
+        signal.signal(signal.SIGTERM, self._on_stop)
+        signal.signal(signal.SIGINT, self._on_stop)
+
+        self._write_master()
+        print(f"🚀 Master {os.getpid()} serving on {self.host}:{self.port} with {self.worker_count} workers")
+        for index in range(self.worker_count):
+            self.spawn(index)
+
+        try:
+            while not self._stop_requested:
+                self.reap()
+                if self._reload_requested:
+                    self._reload_requested = False
+                    self.reload()
+                self.check_heartbeats()
+                time.sleep(0.5)
+        finally:
+            self.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='WellNoosh AI Brain prefork server')
+    parser.add_argument('--host', default=os.getenv('HOST', '0.0.0.0'))
+    parser.add_argument('--port', type=int, default=int(os.getenv('PORT', 8000)))
+    parser.add_argument('--workers', type=int, default=int(os.getenv('WEB_CONCURRENCY', os.cpu_count() or 2)))
+    parser.add_argument('--log-level', default=os.getenv('LOG_LEVEL', 'info'))
+    args = parser.parse_args()
+
+    from agent_registry import registry
+    from recommendation_api import app
+
+    # Heavy imports happen once here; agents are still constructed per worker
+    registry.import_modules()
+
+    Master(app, args.host, args.port, max(1, args.workers), args.log_level).run()
+    sys.exit(0)
+
+
+if __name__ == '__main__':
+    main()
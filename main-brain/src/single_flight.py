@@ -0,0 +1,84 @@
+"""
+Single-Flight Request Coalescing
+Location: main-brain/src/single_flight.py
+
+When several identical generation requests are in flight at once (a family
+sharing a plan, mobile client retries), each one used to burn its own full
+set of LLM calls. A SingleFlight group runs the work once per key: the first
+caller (the leader) starts it, and every identical caller that arrives while
+it is still running (followers) awaits the same result.
+
+The work runs as its own task, so a leader whose client disconnects does not
+cancel the result its followers are waiting for. Nothing is cached once the
+work finishes; the next request starts a new flight.
+
+Usage:
+    key = flight_key(health_context=..., start_date=...)
+    result = await meal_plan_flights.do(key, lambda: run_blocking(...))
+"""
+
+import asyncio
+import hashlib
+import json
+import threading
+from typing import Any, Awaitable, Callable, Dict
+
+
+def flight_key(**parts: Any) -> str:
+    """Canonical hash of the inputs that determine a generation's output"""
+    canonical = json.dumps(parts, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key onto one running task"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._lock = threading.Lock()
+        self._leaders = 0
+        self._followers = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Run fn() for this key, or join the identical call already running"""
+        with self._lock:
+            task = self._inflight.get(key)
+            if task is None:
+                task = asyncio.ensure_future(fn())
+                self._inflight[key] = task
+                task.add_done_callback(lambda t, k=key: self._done(k, t))
+                self._leaders += 1
+            else:
+                self._followers += 1
+        # shield: one caller being cancelled must not cancel the shared work
+        return await asyncio.shield(task)
+
+    def _done(self, key: str, task: asyncio.Task):
+        with self._lock:
+            if self._inflight.get(key) is task:
+                del self._inflight[key]
+        if not task.cancelled():
+            # Mark the exception retrieved even if every caller went away
+            task.exception()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'in_flight': len(self._inflight),
+                'leaders': self._leaders,
+                'followers': self._followers
+            }
+
+
+meal_plan_flights = SingleFlight('meal_plan')
+personalized_recipe_flights = SingleFlight('personalized_recipe')
+
+FLIGHTS = {
+    group.name: group
+    for group in (meal_plan_flights, personalized_recipe_flights)
+}
+
+
+def flight_stats() -> Dict[str, Dict[str, int]]:
+    return {name: group.stats() for name, group in FLIGHTS.items()}
@@ -0,0 +1,276 @@
+"""
+User Profile Service
+Location: main-brain/src/user_profiles.py
+
+The profile the agents personalize with: user_profiles joined with
+user_health_profiles (cooking skill, diet, allergies, medical conditions,
+health goals), one row per user. Every agent used to run its own copy of
+this query on every request; they now call get_user_profile(), which
+serves repeat loads from a per-process cache with no database round trip.
+
+- the cache is a bounded LRU with a per-entry TTL, like recommendation_cache.py
+- unknown users (and ids that are not uuids) are cached as None for a
+  shorter PROFILE_CACHE_NEGATIVE_TTL_SECONDS, so a bad id cannot force a
+  query per request
+- invalidation: invalidate_user_profile() drops a user here and publishes
+  the user id on the user_profile_changed channel; every worker listening
+  through async_db.listen() drops it too. Recommendations cached for the
+  user (recommendation_cache.py) were built from the old profile (e.g.
+  before an allergy was added), so they are dropped with it. The TS backend calls it through
+  POST /api/users/{user_id}/profile/invalidate after a profile update;
+  migrations/007_user_profile_notify.sql publishes on every write to
+  user_profiles / user_health_profiles, including the app's direct
+  Supabase writes. Without a LISTEN connection (no asyncpg) other workers
+  pick changes up when the entry expires.
+- a load that raced an invalidation is not cached (see ProfileCache.version)
+- callers get a deep copy, so mutating a profile (or its allergy lists)
+  never changes the cached one
+
+fetch_user_profile / fetch_user_profile_async always read the database.
+
+Settings (env):
+- PROFILE_CACHE_SIZE:                   max users cached (default 10000)
+- PROFILE_CACHE_TTL_SECONDS:            profile lifetime (default 300)
+- PROFILE_CACHE_NEGATIVE_TTL_SECONDS:   unknown-user lifetime (default 30)
+
+Usage:
+    profile = get_user_profile(user_id)               # dict, or None
+    profile = await get_user_profile_async(user_id)
+    invalidate_user_profile(user_id)
+
+Metrics: user_profile_cache_lookups_total{result}.
+"""
+
+import copy
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+import psycopg2
+from psycopg2.extras import RealDictCursor
+
+import async_db
+import metrics
+from db import connection
+from metrics import timed_query
+from recommendation_cache import recommendation_cache
+
+USER_PROFILE_QUERY = """
+    SELECT
+        up.user_id, up.full_name, up.email,
+        uhp.cooking_skill, uhp.diet_style,
+        uhp.allergies, uhp.medical_conditions,
+        uhp.health_goals, uhp.daily_calorie_goal
+    FROM user_profiles up
+    LEFT JOIN user_health_profiles uhp ON up.user_id = uhp.user_id
+    WHERE up.user_id = %s
+"""
+
+# NOTIFY channel carrying a changed user's id (migrations/007_user_profile_notify.sql)
+PROFILE_CHANNEL = 'user_profile_changed'
+
+Profile = Optional[Dict[str, Any]]
+
+
+class ProfileCache:
+    """Thread-safe bounded LRU + TTL cache of profiles by user_id, None for unknown users"""
+
+    def __init__(self, max_entries: int = 10000, ttl_seconds: float = 300,
+                 negative_ttl_seconds: float = 30):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.negative_ttl_seconds = negative_ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[float, Profile]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = 0
+        self._hits = 0
+        self._negative_hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+        self._invalidations = 0
+
+    def lookup(self, user_id: str) -> Tuple[bool, Profile]:
+        """(found, profile); a found None is a cached unknown user"""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                self._misses += 1
+                return False, None
+            expires_at, profile = entry
+            if expires_at <= time.monotonic():
+                del self._entries[user_id]
+                self._expirations += 1
+                self._misses += 1
+                return False, None
+            self._entries.move_to_end(user_id)
+            if profile is None:
+                self._negative_hits += 1
+            else:
+                self._hits += 1
+            return True, profile
+
+    def version(self) -> int:
+        """Bumped by every invalidation; take it before a load and pass it to put()"""
+        with self._lock:
+            return self._version
+
+    def put(self, user_id: str, profile: Profile, version: int):
+        """Cache a load, unless an invalidation happened since version was taken"""
+        ttl = self.ttl_seconds if profile is not None else self.negative_ttl_seconds
+        with self._lock:
+            if version != self._version or ttl <= 0:
+                return
+            self._entries[user_id] = (time.monotonic() + ttl, profile)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def invalidate(self, user_id: str) -> bool:
+        """Drop one user; returns whether they were cached"""
+        with self._lock:
+            self._version += 1
+            self._invalidations += 1
+            return self._entries.pop(user_id, None) is not None
+
+    def clear(self):
+        with self._lock:
+            self._version += 1
+            self._entries.clear()
+
+    def on_notify(self, payload: Optional[str]):
+        """async_db.listen callback: a changed user id, or None after a (re)connect"""
+        if payload:
+            self.invalidate(payload)
+        else:
+            self.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            hits = self._hits + self._negative_hits
+            lookups = hits + self._misses
+            return {
+                'size': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl_seconds,
+                'negative_ttl_seconds': self.negative_ttl_seconds,
+                'hits': self._hits,
+                'negative_hits': self._negative_hits,
+                'misses': self._misses,
+                'hit_rate': round(hits / lookups, 4) if lookups else 0.0,
+                'evictions': self._evictions,
+                'expirations': self._expirations,
+                'invalidations': self._invalidations
+            }
+
+
+profile_cache = ProfileCache(
+    max_entries=int(os.getenv('PROFILE_CACHE_SIZE', '10000')),
+    ttl_seconds=float(os.getenv('PROFILE_CACHE_TTL_SECONDS', '300')),
+    negative_ttl_seconds=float(os.getenv('PROFILE_CACHE_NEGATIVE_TTL_SECONDS', '30'))
+)
+
+
+def fetch_user_profile(user_id: str, statement_timeout: Optional[float] = None) -> Profile:
+    """A user's profile from the database, or None (also for an id that is not a uuid)"""
+    try:
+        with connection(statement_timeout) as conn:
+            cur = conn.cursor(cursor_factory=RealDictCursor)
+            with timed_query('user_profile'):
+                cur.execute(USER_PROFILE_QUERY, (user_id,))
+            row = cur.fetchone()
+            cur.close()
+    except psycopg2.DataError:
+        return None
+    return dict(row) if row else None
+
+
+async def fetch_user_profile_async(user_id: str) -> Profile:
+    """fetch_user_profile on the async pool"""
+    try:
+        with timed_query('user_profile'):
+            return await async_db.fetchrow(USER_PROFILE_QUERY, (user_id,))
+    except async_db.DataError:
+        return None
+
+
+def _cached(user_id: str) -> Tuple[bool, Profile]:
+    found, profile = profile_cache.lookup(user_id)
+    profile_lookups.inc('miss' if not found else 'hit' if profile is not None else 'negative_hit')
+    return found, copy.deepcopy(profile)
+
+
+def get_user_profile(user_id: str, statement_timeout: Optional[float] = None) -> Profile:
+    """
+    A user's profile (a deep copy), or None for an unknown user; cached. Database
+    errors propagate and are not cached.
+    """
+    user_id = str(user_id)
+    found, profile = _cached(user_id)
+    if found:
+        return profile
+    version = profile_cache.version()
+    profile = fetch_user_profile(user_id, statement_timeout)
+    profile_cache.put(user_id, profile, version)
+    return copy.deepcopy(profile)
+
+
+async def get_user_profile_async(user_id: str) -> Profile:
+    """get_user_profile on the async pool"""
+    user_id = str(user_id)
+    found, profile = _cached(user_id)
+    if found:
+        return profile
+    version = profile_cache.version()
+    profile = await fetch_user_profile_async(user_id)
+    profile_cache.put(user_id, profile, version)
+    return copy.deepcopy(profile)
+
+
+def invalidate_user_profile(user_id: str) -> bool:
+    """
+    Drop a user's cached profile here and NOTIFY the other workers; returns
+    whether it was cached here. Raises if the NOTIFY could not be sent.
+    """
+    dropped = profile_cache.invalidate(str(user_id))
+    recommendation_cache.invalidate_user(str(user_id))
+    with connection() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT pg_notify(%s, %s)", (PROFILE_CHANNEL, str(user_id)))
+        cur.close()
+    return dropped
+
+
+async def invalidate_user_profile_async(user_id: str) -> bool:
+    """invalidate_user_profile on the async pool"""
+    dropped = profile_cache.invalidate(str(user_id))
+    recommendation_cache.invalidate_user(str(user_id))
+    await async_db.notify(PROFILE_CHANNEL, str(user_id))
+    return dropped
+
+
+def on_profile_changed(payload: Optional[str]):
+    """
+    async_db.listen callback: drop a changed user's profile and cached
+    recommendations, or everything after a (re)connect (payload None)
+    """
+    profile_cache.on_notify(payload)
+    if payload:
+        recommendation_cache.invalidate_user(payload)
+    else:
+        recommendation_cache.clear()
+
+
+async def listen_for_invalidations():
+    """Subscribe this worker's caches to PROFILE_CHANNEL (FastAPI startup, after async_db.start)"""
+    await async_db.listen(PROFILE_CHANNEL, on_profile_changed)
+
+
+profile_lookups = metrics.counter(
+    'user_profile_cache_lookups_total',
+    'User profile loads by cache result (hit, negative_hit, miss)',
+    ('result',)
+)
@@ -0,0 +1,117 @@
+"""
+Per-Worker Health Reporting
+Location: main-brain/src/worker_health.py
+
+Under the prefork launcher (serve.py) every worker writes a small heartbeat
+file into a run directory shared with the master. The heartbeat is written
+from the worker's event loop, so a worker whose loop is stuck stops
+refreshing it. The master uses the files to replace hung workers, and any
+worker can report the health of all of them at /health/workers.
+
+Files in the run directory (BRAIN_RUN_DIR):
+- master.json        master pid, generation (reload count), worker target
+- worker-<pid>.json  one per live worker, rewritten every heartbeat
+"""
+
+import asyncio
+import json
+import os
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+
+RUN_DIR_ENV = 'BRAIN_RUN_DIR'
+HEARTBEAT_INTERVAL = float(os.getenv('WORKER_HEARTBEAT_SECONDS', '5'))
+HEARTBEAT_TIMEOUT = float(os.getenv('WORKER_TIMEOUT_SECONDS', '30'))
+
+
+def current_run_dir() -> Optional[str]:
+    """Run directory when running under serve.py, else None (single process)"""
+    return os.getenv(RUN_DIR_ENV) or None
+
+
+def _write_json(path: str, payload: Dict[str, Any]):
+    """Write via rename so readers never see a half-written file"""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(payload, f, default=str)
+    os.replace(tmp_path, path)
+
+
+def _read_json(path: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def worker_file(run_dir: str, pid: int) -> str:
+    return os.path.join(run_dir, f"worker-{pid}.json")
+
+
+def write_master(run_dir: str, **fields: Any):
+    _write_json(os.path.join(run_dir, 'master.json'), {'pid': os.getpid(), 'updated_at': time.time(), **fields})
+
+
+def read_master(run_dir: str) -> Optional[Dict[str, Any]]:
+    return _read_json(os.path.join(run_dir, 'master.json'))
+
+
+def write_heartbeat(run_dir: str, **fields: Any):
+    _write_json(worker_file(run_dir, os.getpid()), {'pid': os.getpid(), 'heartbeat_at': time.time(), **fields})
+
+
+def read_heartbeat(run_dir: str, pid: int) -> Optional[Dict[str, Any]]:
+    return _read_json(worker_file(run_dir, pid))
+
+
+def remove_heartbeat(run_dir: str, pid: int):
+    try:
+        os.remove(worker_file(run_dir, pid))
+    except OSError:
+        pass
+
+
+def read_heartbeats(run_dir: str, timeout: float = HEARTBEAT_TIMEOUT) -> List[Dict[str, Any]]:
+    """Every worker's last heartbeat, with its age and a healthy flag"""
+    now = time.time()
+    workers = []
+    for name in sorted(os.listdir(run_dir)):
+        if not (name.startswith('worker-') and name.endswith('.json')):
+            continue
+        heartbeat = _read_json(os.path.join(run_dir, name))
+        if not heartbeat:
+            continue
+        age = now - heartbeat.get('heartbeat_at', 0)
+        heartbeat['age_seconds'] = round(age, 1)
+        heartbeat['healthy'] = age <= timeout
+        workers.append(heartbeat)
+    return sorted(workers, key=lambda w: w.get('worker', 0))
+
+
+def rss_mb() -> Optional[float]:
+    """Resident set size of this process (Linux /proc; None elsewhere)"""
+    try:
+        with open('/proc/self/statm') as f:
+            resident_pages = int(f.read().split()[1])
+        return round(resident_pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024), 1)
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+async def heartbeat_loop(run_dir: str, collect: Callable[[], Dict[str, Any]],
+                         interval: float = HEARTBEAT_INTERVAL,
+                         on_orphaned: Optional[Callable[[], None]] = None):
+    """Write this worker's heartbeat every interval until cancelled"""
+    master_pid = os.getppid()
+    while True:
+        try:
+            write_heartbeat(run_dir, rss_mb=rss_mb(), **collect())
+        except Exception as e:
+            print(f"⚠️ Heartbeat write failed: {e}")
+        if on_orphaned and os.getppid() != master_pid:
+            # Master is gone; stop serving instead of lingering unsupervised
+            on_orphaned()
+            return
+        await asyncio.sleep(interval)
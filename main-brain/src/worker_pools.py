@@ -0,0 +1,208 @@
+"""
+Worker Pools for Blocking Agent Calls
+Location: main-brain/src/worker_pools.py
+
+The agents (psycopg2 queries, LangChain / DSPy LLM calls) are synchronous.
+Calling them directly from an `async def` handler blocks the uvicorn event
+loop, so a single 15s meal-plan generation stalls every other request,
+including /health.
+
+This module runs those calls on sized thread pools, one per endpoint class:
+- db:        cheap database reads/writes (recommendation browse, feedback)
+- llm:       single LLM round trips (chat, personalization, single recipes)
+- meal_plan: long multi-call generations (full meal plans)
+- cpu:       CPU-bound batch work (bulk nutrition goals), kept off the db
+             pool so a large batch cannot hold its I/O slots
+
+Each pool has its own concurrency limit and queue-depth limit. When a pool is
+full, new work is rejected immediately with PoolSaturatedError, which the API
+turns into a 503, so one slow endpoint class cannot starve the others.
+"""
+
+import asyncio
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Dict, Iterator
+
+
+class PoolSaturatedError(Exception):
+    """Raised when a pool already has max_workers running and max_queue waiting"""
+
+    def __init__(self, pool_name: str, in_flight: int, capacity: int):
+        self.pool_name = pool_name
+        self.in_flight = in_flight
+        self.capacity = capacity
+        super().__init__(f"Worker pool '{pool_name}' is saturated ({in_flight}/{capacity} in flight)")
+
+
+class WorkerPool:
+    """A bounded thread pool: max_workers running at once, at most max_queue waiting"""
+
+    def __init__(self, name: str, max_workers: int, max_queue: int):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix=f"brain-{name}"
+        )
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._running = 0
+        self._completed = 0
+        self._rejected = 0
+        self._failed = 0
+
+    @property
+    def capacity(self) -> int:
+        return self.max_workers + self.max_queue
+
+    def _acquire(self):
+        with self._lock:
+            if self._in_flight >= self.capacity:
+                self._rejected += 1
+                raise PoolSaturatedError(self.name, self._in_flight, self.capacity)
+            self._in_flight += 1
+
+    def _release(self, failed: bool):
+        with self._lock:
+            self._in_flight -= 1
+            self._completed += 1
+            if failed:
+                self._failed += 1
+
+    def _submit(self, fn: Callable, args, kwargs) -> Future:
+        """
+        Submit an admitted call. Its slot is released when the executor
+        future completes (or is cancelled before starting), not when the
+        awaiting request gives up, so in_flight always counts the threads
+        still busy with it.
+        """
+        try:
+            future = self._executor.submit(self._call, fn, args, kwargs)
+        except BaseException:
+            self._release(True)
+            raise
+        future.add_done_callback(lambda f: self._release(f.cancelled() or f.exception() is not None))
+        return future
+
+    def _call(self, fn: Callable, args, kwargs):
+        with self._lock:
+            self._running += 1
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            with self._lock:
+                self._running -= 1
+
+    async def run(self, fn: Callable, *args, **kwargs) -> Any:
+        """Run fn(*args, **kwargs) on this pool and await its result"""
+        self._acquire()
+        return await asyncio.wrap_future(self._submit(fn, args, kwargs))
+
+    def iterate(self, gen_fn: Callable[..., Iterator[Any]], *args, **kwargs) -> AsyncIterator[Any]:
+        """
+        Run a blocking generator on this pool, yielding each item to the event
+        loop as soon as the worker thread produces it.
+
+        Admission happens immediately (so PoolSaturatedError is raised before a
+        streaming response has started); the returned async iterator then
+        relays items. The pool slot is held until the generator finishes. If
+        the consumer stops early (e.g. the client disconnects), the worker
+        stops after the item it is currently producing and closes the generator.
+        """
+        self._acquire()
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        cancelled = threading.Event()
+        end = object()
+
+        def _put(item, error=None):
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, (item, error))
+            except RuntimeError:
+                # Event loop already closed; nobody is listening any more
+                cancelled.set()
+
+        def _pump():
+            try:
+                gen = gen_fn(*args, **kwargs)
+                try:
+                    for item in gen:
+                        if cancelled.is_set():
+                            break
+                        _put(item)
+                finally:
+                    gen.close()
+                _put(end)
+            except BaseException as e:
+                _put(end, e)
+                raise
+
+        self._submit(_pump, (), {})
+
+        async def _relay():
+            try:
+                while True:
+                    item, error = await queue.get()
+                    if item is end:
+                        if error is not None:
+                            raise error
+                        return
+                    yield item
+            finally:
+                cancelled.set()
+
+        return _relay()
+
+    def stats(self) -> Dict[str, int]:
+        """Snapshot of pool occupancy and counters"""
+        with self._lock:
+            return {
+                'max_workers': self.max_workers,
+                'max_queue': self.max_queue,
+                'running': self._running,
+                'queued': max(self._in_flight - self._running, 0),
+                'in_flight': self._in_flight,
+                'completed': self._completed,
+                'failed': self._failed,
+                'rejected': self._rejected
+            }
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
+
+
+def _pool_from_env(name: str, default_workers: int, default_queue: int) -> WorkerPool:
+    """Build a pool sized by POOL_<NAME>_WORKERS / POOL_<NAME>_QUEUE"""
+    prefix = f"POOL_{name.upper()}"
+    workers = int(os.getenv(f"{prefix}_WORKERS", str(default_workers)))
+    queue = int(os.getenv(f"{prefix}_QUEUE", str(default_queue)))
+    return WorkerPool(name, max_workers=max(workers, 1), max_queue=max(queue, 0))
+
+
+# ============================================
+# POOLS PER ENDPOINT CLASS
+# ============================================
+
+db_pool = _pool_from_env('db', default_workers=16, default_queue=64)
+llm_pool = _pool_from_env('llm', default_workers=8, default_queue=16)
+meal_plan_pool = _pool_from_env('meal_plan', default_workers=4, default_queue=4)
+cpu_pool = _pool_from_env('cpu', default_workers=2, default_queue=8)
+
+POOLS = {
+    pool.name: pool
+    for pool in (db_pool, llm_pool, meal_plan_pool, cpu_pool)
+}
+
+
+def pool_stats() -> Dict[str, Dict[str, int]]:
+    """Stats for every pool, keyed by pool name"""
+    return {name: pool.stats() for name, pool in POOLS.items()}
+
+
+def shutdown_pools(wait: bool = True):
+    """Stop accepting work and (optionally) wait for running calls to finish"""
+    for pool in POOLS.values():
+        pool.shutdown(wait=wait)